@@ -0,0 +1,6 @@
+"""Benchmarks for the archive pipeline on synthetic Maildirs.
+
+Run ``python -m benchmarks --help`` (or ``make bench``) from the repository
+root.  See :mod:`benchmarks.maildir` for the corpus generator and
+:mod:`benchmarks.suite` for the timed stages.
+"""
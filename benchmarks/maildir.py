@@ -0,0 +1,305 @@
+"""Reproducible synthetic Maildir archives.
+
+The same :class:`MaildirSpec` always produces byte-identical files, so
+timings from different commits (or machines) are comparable.  The layout
+matches what mbsync writes for the generated config:
+``<root>/<account>/<folder>/{cur,new,tmp}``, with folder names passed
+through :func:`email_archiver.generate.local_folder_name`.
+
+Message sizes follow a log-normal distribution (most mail is small, a few
+messages are huge), and messages are spread over folders with Zipf-like
+weights so one folder dominates, as ``[Gmail]/All Mail`` or an old
+``Archive`` does in real archives.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import shutil
+import time
+from dataclasses import asdict, dataclass, field
+from email.utils import formatdate
+from pathlib import Path
+
+from email_archiver.generate import local_folder_name
+
+# Marker written once an archive is complete; holds the spec as JSON.
+COMPLETE_MARKER = ".benchmark-complete"
+
+# First and last Date header of generated messages (2005-01-01 .. 2025-01-01).
+_DATE_START = 1104537600
+_DATE_END = 1735689600
+
+# Size of the pre-generated text and attachment pools messages are cut from.
+_POOL_BYTES = 4 << 20
+
+_BASE_FOLDERS = ["INBOX", "Archive", "Sent", "Drafts", "Lists/dev", "Lists/announce"]
+
+_WORDS = (
+    "archive backup folder index mail message notmuch sync verify server client "
+    "invoice meeting schedule report review release patch thread reply forward "
+    "the a of to and in is for on with as at by from that this be are was it"
+).split()
+
+
+@dataclass(frozen=True)
+class MaildirSpec:
+    """Shape of a synthetic archive.
+
+    Attributes:
+        messages: Total number of message files (duplicates included).
+        accounts: Number of accounts, named ``acct00``, ``acct01``, ...
+        folders: Folders per account.
+        median_size: Median size of a plain-text body, in bytes.
+        size_sigma: Spread of the log-normal body size distribution.
+        max_size: Upper bound on a single body or attachment, in bytes.
+        attachment_ratio: Fraction of messages with a base64 attachment.
+        attachment_size: Median attachment size (before base64), in bytes.
+        new_ratio: Fraction of messages left in ``new/`` rather than ``cur/``.
+        duplicate_ratio: Fraction of messages that are byte-identical copies
+            of an earlier message, as Gmail labels produce.
+        seed: Random seed; same spec and seed give the same files.
+    """
+
+    messages: int
+    accounts: int = 1
+    folders: int = 6
+    median_size: int = 4096
+    size_sigma: float = 1.0
+    max_size: int = 1 << 20
+    attachment_ratio: float = 0.05
+    attachment_size: int = 128 * 1024
+    new_ratio: float = 0.01
+    duplicate_ratio: float = 0.0
+    seed: int = 0
+
+    def key(self) -> str:
+        """A short stable identifier, used to cache generated archives."""
+        raw = json.dumps(asdict(self), sort_keys=True).encode()
+        return hashlib.sha256(raw).hexdigest()[:12]
+
+    def account_names(self) -> list[str]:
+        return [f"acct{i:02d}" for i in range(self.accounts)]
+
+    def folder_names(self) -> list[str]:
+        names = list(_BASE_FOLDERS[: self.folders])
+        names.extend(f"Folder{i:03d}" for i in range(len(names), self.folders))
+        return names
+
+
+@dataclass
+class GeneratedArchive:
+    """Where an archive was written and what is in it."""
+
+    root: Path
+    spec: MaildirSpec
+    folders: dict[str, list[str]] = field(default_factory=dict)
+    messages: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    cached: bool = False
+
+
+def _split(total: int, weights: list[float]) -> list[int]:
+    """Split ``total`` into integer parts proportional to ``weights``."""
+    scale = total / sum(weights)
+    parts = [int(w * scale) for w in weights]
+    remainders = sorted(range(len(weights)), key=lambda i: parts[i] - weights[i] * scale)
+    for i in remainders[: total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+class _Writer:
+    """Build and write message files for one spec."""
+
+    def __init__(self, spec: MaildirSpec) -> None:
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        words = [self.rng.choice(_WORDS) for _ in range(_POOL_BYTES // 5)]
+        lines: list[str] = []
+        line: list[str] = []
+        width = 0
+        for word in words:
+            if width + len(word) > 72:
+                lines.append(" ".join(line))
+                line, width = [], 0
+            line.append(word)
+            width += len(word) + 1
+        self.text = ("\n".join(lines) + "\n").encode()
+        self.blob = base64.encodebytes(self.rng.randbytes(_POOL_BYTES * 3 // 4))
+        # Earlier messages that duplicates are copied from.
+        self.recent: list[bytes] = []
+
+    def _size(self, median: int) -> int:
+        size = int(self.rng.lognormvariate(math.log(median), self.spec.size_sigma))
+        return max(64, min(size, self.spec.max_size, _POOL_BYTES // 2))
+
+    def _slice(self, pool: bytes, size: int, line: int) -> bytes:
+        start = self.rng.randrange(0, len(pool) - size) // line * line
+        chunk = pool[start : start + size]
+        return chunk if chunk.endswith(b"\n") else chunk + b"\n"
+
+    def message(self, account: str, index: int) -> bytes:
+        spec = self.spec
+        rng = self.rng
+        date = formatdate(rng.randrange(_DATE_START, _DATE_END), localtime=False)
+        headers = [
+            f"From: sender{rng.randrange(500)}@example.org",
+            f"To: {account}@example.com",
+            f"Subject: Benchmark message {index}",
+            f"Date: {date}",
+            f"Message-ID: <{spec.seed}.{account}.{index}@bench.invalid>",
+            "MIME-Version: 1.0",
+        ]
+        body = self._slice(self.text, self._size(spec.median_size), 1)
+        if rng.random() >= spec.attachment_ratio:
+            headers.append("Content-Type: text/plain; charset=us-ascii")
+            return ("\n".join(headers) + "\n\n").encode() + body
+
+        boundary = f"bench-{index}"
+        attachment = self._slice(self.blob, self._size(spec.attachment_size) * 4 // 3, 77)
+        headers.append(f'Content-Type: multipart/mixed; boundary="{boundary}"')
+        parts = [
+            ("\n".join(headers) + "\n\n").encode(),
+            f"--{boundary}\nContent-Type: text/plain; charset=us-ascii\n\n".encode(),
+            body,
+            f"--{boundary}\nContent-Type: application/octet-stream\n".encode(),
+            f'Content-Disposition: attachment; filename="file{index}.bin"\n'.encode(),
+            b"Content-Transfer-Encoding: base64\n\n",
+            attachment,
+            f"--{boundary}--\n".encode(),
+        ]
+        return b"".join(parts)
+
+    def write(self, folder_dir: Path, index: int, data: bytes) -> Path:
+        """Write one message into ``cur/`` (or ``new/``); return its path."""
+        unique = f"{_DATE_START + index}.B{index}.bench"
+        if self.rng.random() < self.spec.new_ratio:
+            path = folder_dir / "new" / unique
+        else:
+            path = folder_dir / "cur" / f"{unique}:2,S"
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+
+def generate_maildir(root: Path, spec: MaildirSpec) -> GeneratedArchive:
+    """Write the archive described by ``spec`` under ``root``.
+
+    ``root`` should be empty or missing; existing files are left in place
+    and may be overwritten.
+    """
+    started = time.perf_counter()
+    archive = GeneratedArchive(root=root, spec=spec)
+    writer = _Writer(spec)
+    folders = spec.folder_names()
+    weights = [1.0 / (i + 1) for i in range(len(folders))]
+
+    dirs: list[tuple[str, Path, int]] = []
+    per_account = _split(spec.messages, [1.0] * spec.accounts)
+    for account, count in zip(spec.account_names(), per_account):
+        archive.folders[account] = folders
+        for folder, n in zip(folders, _split(count, weights)):
+            folder_dir = root / account / local_folder_name(folder)
+            for sub in ("cur", "new", "tmp"):
+                (folder_dir / sub).mkdir(parents=True, exist_ok=True)
+            dirs.append((account, folder_dir, n))
+
+    index = 0
+    for account, folder_dir, n in dirs:
+        for _ in range(n):
+            if writer.recent and writer.rng.random() < spec.duplicate_ratio:
+                data = writer.rng.choice(writer.recent)
+            else:
+                data = writer.message(account, index)
+                if spec.duplicate_ratio and len(writer.recent) < 1024:
+                    writer.recent.append(data)
+            writer.write(folder_dir, index, data)
+            archive.bytes += len(data)
+            archive.messages += 1
+            index += 1
+
+    archive.seconds = time.perf_counter() - started
+    return archive
+
+
+def add_messages(archive: GeneratedArchive, count: int, *, folder: str | None = None) -> list[Path]:
+    """Deliver ``count`` more messages into one folder, as a sync would.
+
+    The archive's counters are not changed, so callers can delete the
+    returned files afterwards to restore a cached archive.
+
+    Returns:
+        The paths written.
+    """
+    spec = archive.spec
+    account = spec.account_names()[0]
+    folder_dir = archive.root / account / local_folder_name(folder or spec.folder_names()[0])
+    writer = _Writer(MaildirSpec(**{**asdict(spec), "seed": spec.seed + 1}))
+    return [
+        writer.write(folder_dir, index, writer.message(account, index))
+        for index in range(archive.messages, archive.messages + count)
+    ]
+
+
+def age_dirs(root: Path, seconds: float = 10.0) -> int:
+    """Backdate directories modified in the last ``seconds`` by that much.
+
+    The manifest doesn't trust a directory modified within its racy window
+    (2 s) and rescans it every time, so timings taken right after writing
+    a tree would measure rescans rather than the steady state.
+
+    Returns:
+        The number of directories backdated.
+    """
+    cutoff = time.time_ns() - int(seconds * 1e9)
+    aged = 0
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != ".notmuch"]
+        st = os.stat(dirpath)
+        if st.st_mtime_ns > cutoff:
+            os.utime(dirpath, ns=(st.st_atime_ns, cutoff))
+            aged += 1
+    return aged
+
+
+def cached_maildir(workdir: Path, spec: MaildirSpec) -> GeneratedArchive:
+    """Return the archive for ``spec`` under ``workdir``, generating it once.
+
+    Large archives take minutes to write, so a complete archive is marked
+    and reused by later runs with the same spec.
+    """
+    root = workdir / f"maildir-{spec.messages}-{spec.key()}"
+    marker = root / COMPLETE_MARKER
+    if marker.exists():
+        info = json.loads(marker.read_text(encoding="utf-8"))
+        return GeneratedArchive(
+            root=root,
+            spec=spec,
+            folders={a: spec.folder_names() for a in spec.account_names()},
+            messages=info["messages"],
+            bytes=info["bytes"],
+            seconds=info["seconds"],
+            cached=True,
+        )
+    if root.exists():
+        shutil.rmtree(root)  # left over from an interrupted run
+    archive = generate_maildir(root, spec)
+    marker.write_text(
+        json.dumps(
+            {
+                "spec": asdict(spec),
+                "messages": archive.messages,
+                "bytes": archive.bytes,
+                "seconds": archive.seconds,
+            }
+        ),
+        encoding="utf-8",
+    )
+    return archive
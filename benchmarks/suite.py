@@ -0,0 +1,559 @@
+"""Timed pipeline stages on synthetic archives.
+
+Each stage runs the real command code against a generated Maildir and is
+reported as one JSON object per line on stdout (and in ``--output``), so
+results can be appended to a history file and diffed between commits:
+
+.. code-block:: console
+
+    $ python -m benchmarks --sizes 10k,100k --output results.jsonl
+    $ python -m benchmarks --sizes 10k,100k --baseline results.jsonl
+
+Stages that need an external tool (``notmuch`` for index and verify) are
+reported as ``skipped`` when it isn't installed.  Progress goes to stderr.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import resource
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from benchmarks.maildir import (
+    GeneratedArchive,
+    MaildirSpec,
+    add_messages,
+    age_dirs,
+    cached_maildir,
+)
+from email_archiver.commands.backup import run_backup
+from email_archiver.commands.index import run_index
+from email_archiver.commands.verify import STATUS_PASS, run_verify
+from email_archiver.config import (
+    AccountConfig,
+    BackupConfig,
+    Config,
+    DaemonConfig,
+    OrchestrationConfig,
+    PathsConfig,
+    SyncConfig,
+    WatchConfig,
+)
+from email_archiver.generate import write_generated_configs
+from email_archiver.manifest import MANIFEST_FILENAME, Manifest
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+STAGES = (
+    "generate",
+    "manifest-cold",
+    "manifest-noop",
+    "manifest-delta",
+    "index",
+    "index-noop",
+    "verify",
+    "verify-noop",
+    "backup",
+)
+
+DEFAULT_SIZES = "10k,100k"
+DEFAULT_BACKUP_COMMAND = "tar -cf {workdir}/backup.tar -C {maildir} ."
+
+# Slower than the baseline by less than this is noise, whatever the ratio.
+_NOISE_SECONDS = 0.05
+
+_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+@dataclass
+class BenchResult:
+    """The timing of one stage at one archive size."""
+
+    stage: str
+    messages: int
+    status: str = STATUS_OK
+    seconds: float = 0.0
+    bytes: int = 0
+    max_rss_kib: int = 0
+    children_max_rss_kib: int = 0
+    detail: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def rate(self) -> float | None:
+        """Messages per second, or None if the stage didn't run."""
+        if self.status != STATUS_OK or self.seconds <= 0:
+            return None
+        return self.messages / self.seconds
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "rate": self.rate}
+
+
+def parse_size(text: str) -> int:
+    """Parse a message count such as ``10000``, ``10k`` or ``1m``."""
+    text = text.strip().lower()
+    scale = _SUFFIXES.get(text[-1:], 1)
+    if scale != 1:
+        text = text[:-1]
+    try:
+        value = int(float(text) * scale)
+    except ValueError:
+        raise ValueError(f"Invalid size '{text}'") from None
+    if value <= 0:
+        raise ValueError(f"Size must be positive, got {value}")
+    return value
+
+
+def benchmark_config(archive: GeneratedArchive, state_dir: Path, backup_command: str) -> Config:
+    """A config whose accounts and folders match the generated archive."""
+    paths = PathsConfig(
+        maildir_root=archive.root,
+        state_dir=state_dir,
+        logs_dir=state_dir / "logs",
+        verification_dir=state_dir / "verification",
+    )
+    accounts = {
+        name: AccountConfig(
+            name=name,
+            email=f"{name}@example.com",
+            imap_host="imap.example.com",
+            imap_user=f"{name}@example.com",
+            folders=list(folders),
+        )
+        for name, folders in archive.folders.items()
+    }
+    return Config(
+        accounts=accounts,
+        paths=paths,
+        sync=SyncConfig(),
+        backup=BackupConfig(command=backup_command),
+        orchestration=OrchestrationConfig(),
+        daemon=DaemonConfig(socket_path=state_dir / "daemon.sock"),
+        watch=WatchConfig(),
+    )
+
+
+def _timed(
+    result: BenchResult, fn: Callable[[], Any], ok: Callable[[Any], bool], verbose: bool
+) -> Any:
+    """Run ``fn`` and record its wall-clock time and peak memory in ``result``."""
+    out = sys.stderr if verbose else io.StringIO()
+    with contextlib.redirect_stdout(out):
+        started = time.perf_counter()
+        value = fn()
+        result.seconds = time.perf_counter() - started
+    result.max_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result.children_max_rss_kib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if not ok(value):
+        result.status = STATUS_FAILED
+    return value
+
+
+class _SizeRun:
+    """All stages for one archive size, sharing the generated archive.
+
+    Stages may be run in any subset: one that needs earlier state (a warm
+    manifest, an index) prepares it untimed first.
+    """
+
+    def __init__(
+        self,
+        workdir: Path,
+        spec: MaildirSpec,
+        *,
+        backup_command: str,
+        verbose: bool,
+    ) -> None:
+        self.workdir = workdir
+        self.spec = spec
+        self.backup_command = backup_command
+        self.verbose = verbose
+        self.base = workdir / f"run-{spec.messages}-{spec.key()}"
+        self.archive: GeneratedArchive | None = None
+        self.notmuch = shutil.which("notmuch") is not None
+        self.indexed = False
+
+    def run(self, stages: list[str], on_result: Callable[[BenchResult], None]) -> None:
+        self.archive = cached_maildir(self.workdir, self.spec)
+        # A just-written tree is in the manifest's racy window: no-op stages
+        # would rescan every directory.
+        age_dirs(self.archive.root)
+        for stage in stages:
+            result = BenchResult(stage, self.archive.messages, bytes=self.archive.bytes)
+            getattr(self, "stage_" + stage.replace("-", "_"))(result)
+            on_result(result)
+
+    def _fresh_dir(self, name: str) -> Path:
+        path = self.base / name
+        if path.exists():
+            shutil.rmtree(path)
+        path.mkdir(parents=True)
+        return path
+
+    def _config(self, state_dir: Path) -> Config:
+        assert self.archive is not None
+        command = self.backup_command.format(
+            workdir=shlex.quote(str(state_dir)), maildir=shlex.quote(str(self.archive.root))
+        )
+        return benchmark_config(self.archive, state_dir, command)
+
+    # -- manifest ---------------------------------------------------------
+
+    def _update_manifest(self, result: BenchResult, state_dir: Path) -> None:
+        assert self.archive is not None
+        root = self.archive.root
+
+        def update() -> Any:
+            with Manifest.open(state_dir, root) as manifest:
+                return manifest.update()
+
+        delta = _timed(result, update, lambda _: True, self.verbose)
+        result.detail = {
+            "added": len(delta.added),
+            "removed": len(delta.removed),
+            "dirs_scanned": delta.dirs_scanned,
+            "dirs_total": delta.dirs_total,
+        }
+
+    def _warm_manifest(self) -> Path:
+        state_dir = self.base / "manifest"
+        if not (state_dir / MANIFEST_FILENAME).exists():
+            self._update_manifest(BenchResult("warmup", 0), self._fresh_dir("manifest"))
+        return state_dir
+
+    def stage_generate(self, result: BenchResult) -> None:
+        assert self.archive is not None
+        result.seconds = self.archive.seconds
+        result.detail = {"cached": self.archive.cached}
+        result.max_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def stage_manifest_cold(self, result: BenchResult) -> None:
+        """Scan and hash every file into an empty manifest."""
+        self._update_manifest(result, self._fresh_dir("manifest"))
+
+    def stage_manifest_noop(self, result: BenchResult) -> None:
+        """Rescan with nothing changed on disk."""
+        self._update_manifest(result, self._warm_manifest())
+
+    def stage_manifest_delta(self, result: BenchResult) -> None:
+        """Rescan after one folder received 1% new mail."""
+        assert self.archive is not None
+        state_dir = self._warm_manifest()
+        added = add_messages(self.archive, max(1, self.archive.messages // 100))
+        try:
+            self._update_manifest(result, state_dir)
+        finally:
+            for path in added:
+                path.unlink()
+            # Forget the delivery so the next run sees the same starting state.
+            age_dirs(self.archive.root)
+            self._update_manifest(BenchResult("cleanup", 0), state_dir)
+        result.detail["delivered"] = len(added)
+
+    # -- notmuch ----------------------------------------------------------
+
+    def _skip_without_notmuch(self, result: BenchResult) -> bool:
+        if not self.notmuch:
+            result.status = STATUS_SKIPPED
+            result.detail = {"reason": "notmuch not installed"}
+        return not self.notmuch
+
+    def _index(self, result: BenchResult) -> None:
+        config = self._config(self.base / "pipeline")
+        _, notmuch_config_path = write_generated_configs(config)
+        _timed(
+            result,
+            lambda: run_index(config, notmuch_config_path=notmuch_config_path),
+            lambda r: r.ok,
+            self.verbose,
+        )
+        self.indexed = result.status == STATUS_OK
+
+    def _ensure_indexed(self) -> None:
+        if not self.indexed:
+            self._fresh_dir("pipeline")
+            self._index(BenchResult("warmup", 0))
+
+    def _verify(self, result: BenchResult) -> None:
+        config = self._config(self.base / "pipeline")
+        _, notmuch_config_path = write_generated_configs(config)
+        summary = _timed(
+            result,
+            lambda: run_verify(config, notmuch_config_path=notmuch_config_path),
+            lambda s: s["status"] == STATUS_PASS,
+            self.verbose,
+        )
+        result.detail = {"status": summary["status"]}
+
+    def stage_index(self, result: BenchResult) -> None:
+        """First ``notmuch new`` over the whole archive."""
+        if self._skip_without_notmuch(result):
+            return
+        assert self.archive is not None
+        shutil.rmtree(self.archive.root / ".notmuch", ignore_errors=True)
+        self._fresh_dir("pipeline")
+        self._index(result)
+
+    def stage_index_noop(self, result: BenchResult) -> None:
+        """``notmuch new`` with nothing new to index."""
+        if self._skip_without_notmuch(result):
+            return
+        self._ensure_indexed()
+        self._index(result)
+
+    def stage_verify(self, result: BenchResult) -> None:
+        """Verification with an empty manifest, so every file is hashed."""
+        if self._skip_without_notmuch(result):
+            return
+        self._ensure_indexed()
+        for path in (self.base / "pipeline").glob(MANIFEST_FILENAME + "*"):
+            path.unlink()
+        self._verify(result)
+
+    def stage_verify_noop(self, result: BenchResult) -> None:
+        """Verification with nothing changed since the last run."""
+        if self._skip_without_notmuch(result):
+            return
+        self._ensure_indexed()
+        self._verify(result)
+
+    # -- backup -----------------------------------------------------------
+
+    def stage_backup(self, result: BenchResult) -> None:
+        """The backup command over the whole archive."""
+        state_dir = self._fresh_dir("backup")
+        config = self._config(state_dir)
+        try:
+            _timed(result, lambda: run_backup(config), lambda r: r.ok, self.verbose)
+        finally:
+            shutil.rmtree(state_dir)
+
+
+def run_suite(
+    sizes: list[int],
+    stages: list[str],
+    workdir: Path,
+    *,
+    spec: MaildirSpec | None = None,
+    backup_command: str = DEFAULT_BACKUP_COMMAND,
+    verbose: bool = False,
+    on_result: Callable[[BenchResult], None] | None = None,
+) -> list[BenchResult]:
+    """Run ``stages`` at every size and return the results in order.
+
+    Args:
+        spec: Archive shape; its ``messages`` is replaced by each size.
+        backup_command: Backup command for the backup stage; ``{workdir}``
+            and ``{maildir}`` are replaced by a scratch dir and the archive.
+        on_result: Called as soon as each stage finishes.
+    """
+    base = spec or MaildirSpec(messages=1)
+    results: list[BenchResult] = []
+    for size in sizes:
+        size_spec = MaildirSpec(**{**asdict(base), "messages": size})
+        run = _SizeRun(workdir, size_spec, backup_command=backup_command, verbose=verbose)
+
+        def record(result: BenchResult) -> None:
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+
+        run.run(stages, record)
+    return results
+
+
+def environment() -> dict[str, Any]:
+    """Where the results came from, recorded with every result line."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def load_results(path: Path, spec: str | None = None) -> dict[tuple[str, int], dict[str, Any]]:
+    """Read a results file, keeping the last line for each (stage, size).
+
+    Args:
+        spec: Only keep lines for archives of this shape
+            (:meth:`MaildirSpec.key` of the spec before sizing), since
+            timings on a different archive aren't comparable.
+    """
+    latest: dict[tuple[str, int], dict[str, Any]] = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            row = json.loads(line)
+            if spec is None or row.get("spec") == spec:
+                latest[(row["stage"], row["messages"])] = row
+    return latest
+
+
+def find_regressions(
+    results: list[BenchResult],
+    baseline: dict[tuple[str, int], dict[str, Any]],
+    threshold: float,
+) -> list[str]:
+    """Describe every stage that got slower than the baseline by ``threshold``.
+
+    Args:
+        threshold: Allowed slowdown as a fraction (0.25 = 25% slower).
+    """
+    regressions = []
+    for result in results:
+        before = baseline.get((result.stage, result.messages))
+        if result.status != STATUS_OK or not before or before.get("status") != STATUS_OK:
+            continue
+        old = before["seconds"]
+        if result.seconds > old * (1 + threshold) and result.seconds - old > _NOISE_SECONDS:
+            regressions.append(
+                f"{result.stage} @ {result.messages}: {old:.2f}s → {result.seconds:.2f}s"
+                f" (+{(result.seconds / old - 1) * 100 if old else float('inf'):.0f}%)"
+            )
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Time email-archiver pipeline stages on synthetic Maildirs.",
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"Comma-separated message counts, e.g. 10k,100k,1m (default: {DEFAULT_SIZES})",
+    )
+    parser.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help="Comma-separated stages to run (default: all): " + ", ".join(STAGES),
+    )
+    parser.add_argument(
+        "--workdir",
+        type=Path,
+        default=Path(tempfile.gettempdir()) / "email-archiver-bench",
+        help="Where archives are generated and cached (default: %(default)s)",
+    )
+    parser.add_argument("--output", type=Path, help="Append result lines to this JSONL file")
+    parser.add_argument("--baseline", type=Path, help="JSONL results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Slowdown vs. --baseline that counts as a regression (default: 0.25)",
+    )
+    parser.add_argument("--accounts", type=int, default=1, help="Accounts in the archive")
+    parser.add_argument("--folders", type=int, default=6, help="Folders per account")
+    parser.add_argument(
+        "--median-size", type=int, default=4096, help="Median message body size in bytes"
+    )
+    parser.add_argument(
+        "--attachment-ratio", type=float, default=0.05, help="Fraction of messages with attachments"
+    )
+    parser.add_argument(
+        "--duplicate-ratio", type=float, default=0.0, help="Fraction of duplicated messages"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the archive")
+    parser.add_argument(
+        "--backup-command",
+        default=DEFAULT_BACKUP_COMMAND,
+        help="Command for the backup stage; {workdir} and {maildir} are substituted",
+    )
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Show the commands' own output on stderr"
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = sorted(set(stages) - set(STAGES))
+    if unknown:
+        print(f"Error: unknown stage(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    spec = MaildirSpec(
+        messages=1,
+        accounts=args.accounts,
+        folders=args.folders,
+        median_size=args.median_size,
+        attachment_ratio=args.attachment_ratio,
+        duplicate_ratio=args.duplicate_ratio,
+        seed=args.seed,
+    )
+    env = environment()
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+    output = args.output.open("a", encoding="utf-8") if args.output else None
+
+    def emit(result: BenchResult) -> None:
+        rate = f"{result.rate:,.0f} msg/s" if result.rate else result.status
+        print(
+            f"  {result.stage:<15} {result.messages:>9,}  {result.seconds:8.2f}s  {rate}",
+            file=sys.stderr,
+        )
+        line = json.dumps({**env, **result.to_dict(), "spec": spec.key()})
+        print(line, flush=True)
+        if output is not None:
+            output.write(line + "\n")
+            output.flush()
+
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    print(f"Benchmarking {', '.join(stages)} in {args.workdir}", file=sys.stderr)
+    try:
+        results = run_suite(
+            sizes,
+            stages,
+            args.workdir,
+            spec=spec,
+            backup_command=args.backup_command,
+            verbose=args.verbose,
+            on_result=emit,
+        )
+    finally:
+        if output is not None:
+            output.close()
+
+    failed = [r for r in results if r.status == STATUS_FAILED]
+    for r in failed:
+        print(f"FAILED: {r.stage} @ {r.messages}", file=sys.stderr)
+    if args.baseline:
+        baseline = load_results(args.baseline, spec.key())
+        regressions = find_regressions(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 1 if failed else 0
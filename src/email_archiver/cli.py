@@ -3,7 +3,9 @@
 from __future__ import annotations
 
 import argparse
+import json
 import sys
+from pathlib import Path
 
 from email_archiver import __version__
 from email_archiver.config import ConfigError, load_config
@@ -35,21 +37,79 @@ def build_parser() -> argparse.ArgumentParser:
     _add_common_flags(p_sync)
 
     # index
-    p_index = sub.add_parser("index", help="Run notmuch new to index the Maildir")
+    p_index = sub.add_parser("index", help="Index new and removed Maildir files with notmuch")
     _add_common_flags(p_index)
+    p_index.add_argument(
+        "--full", action="store_true", help="Run a full notmuch new instead of a targeted pass"
+    )
 
     # verify
     p_verify = sub.add_parser("verify", help="Run verification checks and write a report")
     _add_common_flags(p_verify)
+    p_verify.add_argument(
+        "--deep", action="store_true", help="Also read every file and check its size and hash"
+    )
+    p_verify.add_argument(
+        "--strict", action="store_true", help="With --deep, also check RFC 5322 well-formedness"
+    )
+    p_verify.add_argument(
+        "--restart", action="store_true", help="With --deep, don't resume an interrupted check"
+    )
+    p_verify.add_argument(
+        "--remote",
+        action="store_true",
+        default=None,
+        help="Also compare every folder's UIDs with the server",
+    )
+
+    # dedupe
+    p_dedupe = sub.add_parser("dedupe", help="Report duplicate messages across folders")
+    _add_common_flags(p_dedupe)
+    p_dedupe.add_argument(
+        "--link", action="store_true", help="Replace identical copies with hardlinks"
+    )
 
     # backup
     p_backup = sub.add_parser("backup", help="Run the configured backup command")
     _add_common_flags(p_backup)
 
+    # restore
+    p_restore = sub.add_parser("restore", help="Restore a snapshot of the native backup store")
+    _add_common_flags(p_restore)
+    p_restore.add_argument("target", nargs="?", type=Path, help="Directory to restore into")
+    p_restore.add_argument("--snapshot", metavar="ID", help="Snapshot to restore (default: latest)")
+    p_restore.add_argument("--list", action="store_true", help="List snapshots and exit")
+
+    # import-mbox
+    p_import = sub.add_parser(
+        "import-mbox", help="Import mbox files (e.g. Gmail Takeout) into an account's Maildir"
+    )
+    _add_common_flags(p_import)
+    p_import.add_argument("mbox", nargs="+", type=Path, help="mbox files to import")
+    p_import.add_argument(
+        "--folder", default="Imported", help="Maildir folder to import into (default: Imported)"
+    )
+
     # run
     p_run = sub.add_parser("run", help="Orchestrated: sync → index → verify → backup")
     _add_common_flags(p_run)
 
+    # watch
+    p_watch = sub.add_parser(
+        "watch", help="Sync folders as soon as the IMAP server reports changes"
+    )
+    _add_common_flags(p_watch)
+
+    # daemon
+    p_daemon = sub.add_parser("daemon", help="Run the pipeline on a schedule (long-running)")
+    _add_common_flags(p_daemon)
+    control = p_daemon.add_mutually_exclusive_group()
+    control.add_argument(
+        "--trigger", action="store_true", help="Ask a running daemon to run now (see --account)"
+    )
+    control.add_argument("--status", action="store_true", help="Show a running daemon's schedule")
+    control.add_argument("--stop", action="store_true", help="Ask a running daemon to shut down")
+
     # doctor
     p_doctor = sub.add_parser("doctor", help="Validate prerequisites, config, and paths")
     _add_common_flags(p_doctor)
@@ -88,21 +148,95 @@ def main(argv: list[str] | None = None) -> int:
     elif args.command == "index":
         from email_archiver.commands.index import run_index
 
-        result = run_index(config, verbose=args.verbose, dry_run=args.dry_run)
+        result = run_index(
+            config,
+            verbose=args.verbose,
+            dry_run=args.dry_run,
+            accounts=[args.account] if args.account else None,
+            full=args.full,
+        )
         return 0 if result.ok else result.exit_code
 
     elif args.command == "verify":
         from email_archiver.commands.verify import run_verify
 
-        report = run_verify(config, account=args.account, verbose=args.verbose)
+        report = run_verify(
+            config,
+            account=args.account,
+            verbose=args.verbose,
+            deep=args.deep,
+            strict=args.strict,
+            restart=args.restart,
+            remote=args.remote,
+        )
         return 0 if report["status"] == "PASS" else 1
 
+    elif args.command == "dedupe":
+        from email_archiver.commands.dedupe import run_dedupe
+
+        report = run_dedupe(
+            config,
+            account=args.account,
+            link=args.link,
+            verbose=args.verbose,
+            dry_run=args.dry_run,
+        )
+        return 0 if report.ok else 1
+
     elif args.command == "backup":
         from email_archiver.commands.backup import run_backup
 
-        result = run_backup(config, verbose=args.verbose, dry_run=args.dry_run)
+        result = run_backup(
+            config, verbose=args.verbose, dry_run=args.dry_run, account=args.account
+        )
         return 0 if result.ok else result.exit_code
 
+    elif args.command == "restore":
+        from email_archiver.commands.restore import run_restore
+
+        return run_restore(
+            config,
+            args.target,
+            snapshot=args.snapshot,
+            account=args.account,
+            list_only=args.list,
+            verbose=args.verbose,
+            dry_run=args.dry_run,
+        )
+
+    elif args.command == "import-mbox":
+        from email_archiver.commands.import_mbox import run_import_mbox
+
+        return run_import_mbox(
+            config,
+            args.mbox,
+            account=args.account,
+            folder=args.folder,
+            verbose=args.verbose,
+            dry_run=args.dry_run,
+        )
+
+    elif args.command == "watch":
+        from email_archiver.commands.watch import run_watch
+
+        return run_watch(config, account=args.account, verbose=args.verbose, dry_run=args.dry_run)
+
+    elif args.command == "daemon":
+        from email_archiver.commands.daemon import CONTROL_COMMANDS, run_daemon, send_control
+
+        command = next((c for c in CONTROL_COMMANDS if getattr(args, c)), None)
+        if command is None:
+            return run_daemon(config, verbose=args.verbose, dry_run=args.dry_run)
+        assert config.daemon is not None
+        assert config.daemon.socket_path is not None
+        try:
+            response = send_control(config.daemon.socket_path, command, account=args.account)
+        except OSError as e:
+            print(f"Could not reach daemon at {config.daemon.socket_path}: {e}", file=sys.stderr)
+            return 1
+        print(json.dumps(response, indent=2))
+        return 0 if response.get("ok") else 1
+
     elif args.command == "run":
         from email_archiver.commands.run import run_all
 
@@ -1,33 +1,172 @@
-"""Backup command: invoke the configured backup tool."""
+"""Backup command: invoke the configured backup tool.
+
+In ``incremental`` mode the tool is not pointed at the whole Maildir.
+Instead the manifest journals every file added, renamed or removed, and
+each backup hands the tool only what changed since the last successful
+backup: ``{files_from}`` is replaced by a file listing the new paths and
+``{removed_from}`` by one listing the removed ones, one path per line,
+relative to ``maildir_root`` (the command runs there).  The position
+reached is kept as a manifest watermark, which only moves when the
+command succeeds; the first backup lists every file.  Each run is thus a
+delta, meant for mirrors that copy the new files and delete the removed
+ones (e.g. ``rsync --files-from=- --delete-missing-args``); snapshotting
+tools are rejected in this mode by the config parser.
+
+In ``native`` mode no tool runs at all: messages are written to the
+built-in deduplicating pack store (:mod:`email_archiver.packstore`).
+
+``[backup.target.<name>]`` tables define several destinations (say a
+restic repository and an rsync mirror).  They run concurrently, each with
+its own mode, incremental watermark, bandwidth limit, timeout and retries,
+and one target failing does not stop the others.
+
+With ``snapshot = "hardlink"`` or ``"hook"`` every target backs up a
+point-in-time view of ``maildir_root`` (:mod:`email_archiver.snapshot`, or
+e.g. a btrfs snapshot taken by ``snapshot_create``) instead of the live
+tree, so syncs can carry on during the backup.  ``{source}`` in a command
+is the directory to back up: the snapshot, or ``maildir_root`` without one.
+"""
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import os
 import shlex
+import sqlite3
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
 
-from email_archiver.config import Config
-from email_archiver.runner import RunResult, run_command
+from email_archiver import metrics
+from email_archiver.concurrency import RateLimiter
+from email_archiver.config import BackupConfig, Config
+from email_archiver.manifest import Manifest
+from email_archiver.packstore import PackStore, Snapshot, StoreError, new_snapshot
+from email_archiver.runner import AggregateResult, RunResult, async_run_command, run_command
+from email_archiver.snapshot import link_tree, remove_tree
 
+INCREMENTAL = "incremental"
+NATIVE = "native"
+HARDLINK = "hardlink"
 
-def run_backup(
-    config: Config,
-    *,
-    verbose: bool = False,
-    dry_run: bool = False,
-) -> RunResult:
-    """Run the configured backup command.
+# Messages read and compressed ahead of the pack writer, per worker thread.
+_READ_AHEAD = 8
 
-    Args:
-        config: Validated configuration.
-        verbose: Print verbose output.
-        dry_run: If True, only print what would be run.
+# Targets run in threads; their manifest updates and watermark moves take
+# turns so each target's journal position matches the changes it listed.
+_MANIFEST_LOCK = threading.Lock()
 
-    Returns:
-        RunResult from the backup execution.
-    """
+
+@dataclass
+class _Incremental:
+    """The change lists of an incremental backup, until its command finishes."""
+
+    watermark: str
+    head: int
+    files_from: Path
+    removed_from: Path
+    files: int
+    removed: int
+    full: bool
+
+
+@dataclass
+class _Outcome:
+    """One target's result, with its metric values; None if nothing ran."""
+
+    result: RunResult
+    values: dict[str, float] | None
+
+
+def backup_targets(config: Config) -> dict[str, BackupConfig]:
+    """The configured ``[backup.target.<name>]`` tables, or ``[backup]`` itself as ``""``."""
     assert config.backup is not None
+    return config.backup.targets or {"": config.backup}
+
+
+def uses_account_placeholder(config: Config) -> bool:
+    """True if the backup commands back up one account at a time."""
+    return any(
+        t.mode != NATIVE and "{account}" in t.command for t in backup_targets(config).values()
+    )
+
+
+def _label(name: str) -> str:
+    return f"[{name}] " if name else ""
+
+
+def _write_list(path: Path, paths: Iterable[str]) -> int:
+    count = 0
+    with path.open("w", encoding="utf-8") as f:
+        for rel in paths:
+            f.write(rel + "\n")
+            count += 1
+    return count
+
+
+def _prepare_incremental(config: Config, name: str, account: str | None) -> _Incremental:
+    """Update the manifest and write the files changed since the target's last backup."""
+    assert config.paths is not None
+    scope = account or metrics.ALL_ACCOUNTS
+    if name:
+        scope = f"{name}-{scope}"
+    watermark = f"backup:{scope}"
+    files_from = config.paths.state_dir / f"backup-{scope}.files"
+    removed_from = config.paths.state_dir / f"backup-{scope}.removed"
+    with (
+        _MANIFEST_LOCK,
+        Manifest.open(config.paths.state_dir, config.paths.maildir_root) as manifest,
+    ):
+        manifest.register_watermark(watermark)
+        manifest.update(account)
+        head = manifest.journal_head()
+        delta = manifest.changes_since(watermark, head, account)
+        if delta is None:
+            files = _write_list(files_from, manifest.paths(account))
+            removed = _write_list(removed_from, [])
+        else:
+            files = _write_list(files_from, delta.added)
+            removed = _write_list(removed_from, delta.removed)
+    return _Incremental(watermark, head, files_from, removed_from, files, removed, delta is None)
+
+
+def _finish_incremental(config: Config, incremental: _Incremental, ok: bool) -> None:
+    """Advance the watermark after a successful backup and remove the lists."""
+    assert config.paths is not None
+    if ok:
+        with (
+            _MANIFEST_LOCK,
+            Manifest.open(config.paths.state_dir, config.paths.maildir_root) as manifest,
+        ):
+            manifest.set_watermark(incremental.watermark, incremental.head)
+    incremental.files_from.unlink(missing_ok=True)
+    incremental.removed_from.unlink(missing_ok=True)
+
 
-    if not config.backup.command:
-        print("No backup command configured. Skipping backup.")
+def _plan(
+    config: Config,
+    name: str,
+    backup: BackupConfig,
+    *,
+    dry_run: bool,
+    account: str | None = None,
+) -> RunResult | tuple[list[str], _Incremental | None]:
+    """Return the target's backup command, or the final result if nothing will run.
+
+    ``{account}`` in the configured command is replaced by ``account``,
+    ``{bwlimit}`` by the target's ``bandwidth_limit`` and ``{source}`` by
+    ``maildir_root``.  In incremental mode
+    the change lists are written first and returned with the command; pass
+    them to :func:`_finish_incremental` afterwards.
+    """
+    label = _label(name)
+    if not backup.command:
+        print(f"{label}No backup command configured. Skipping backup.")
         return RunResult(
             command=["(none)"],
             exit_code=0,
@@ -36,20 +175,534 @@ def run_backup(
             duration_seconds=0.0,
         )
 
-    cmd = shlex.split(config.backup.command)
+    assert config.paths is not None
+    cmd = [
+        arg.replace("{bwlimit}", str(backup.bandwidth_limit)).replace(
+            "{source}", str(config.paths.maildir_root)
+        )
+        for arg in shlex.split(backup.command)
+    ]
+    if account is not None:
+        cmd = [arg.replace("{account}", account) for arg in cmd]
 
     if dry_run:
-        print(f"[dry-run] Would execute: {' '.join(cmd)}")
+        print(f"{label}[dry-run] Would execute: {' '.join(cmd)}")
+        if backup.mode == INCREMENTAL:
+            print(f"{label}[dry-run] with only the files changed since the last backup")
         return RunResult(command=cmd, exit_code=0, stdout="", stderr="", duration_seconds=0.0)
 
-    print(f"Running backup: {' '.join(cmd)}")
-    result = run_command(cmd, stream=verbose)
+    incremental = None
+    if backup.mode == INCREMENTAL:
+        incremental = _prepare_incremental(config, name, account)
+        if not incremental.full and not incremental.files and not incremental.removed:
+            print(f"{label}Nothing changed since the last backup. Skipping backup.")
+            _finish_incremental(config, incremental, ok=True)
+            return RunResult(command=cmd, exit_code=0, stdout="", stderr="", duration_seconds=0.0)
+        cmd = [
+            arg.replace("{files_from}", str(incremental.files_from)).replace(
+                "{removed_from}", str(incremental.removed_from)
+            )
+            for arg in cmd
+        ]
+        what = "all" if incremental.full else "changed"
+        print(
+            f"{label}Backing up {what} files:"
+            f" {incremental.files} new, {incremental.removed} removed"
+        )
+
+    print(f"{label}Running backup: {' '.join(cmd)}")
+    return cmd, incremental
+
+
+def _cwd(config: Config, incremental: _Incremental | None) -> str | None:
+    """Incremental lists are relative to maildir_root, so the command runs there."""
+    if incremental is None:
+        return None
+    assert config.paths is not None
+    return str(config.paths.maildir_root)
+
+
+def _values(incremental: _Incremental | None) -> dict[str, float]:
+    if incremental is None:
+        return {}
+    return {"files": incremental.files, "removed_files": incremental.removed}
+
+
+def _record_metrics(
+    config: Config,
+    account: str | None,
+    outcomes: dict[str, _Outcome],
+    duration_seconds: float,
+) -> None:
+    """Record one backup sample: the target's own, or a summary of all targets."""
+    ran = [o for o in outcomes.values() if o.values is not None]
+    if not ran:
+        return
+    if len(outcomes) == 1:
+        ok, values = ran[0].result.ok, ran[0].values
+        duration_seconds = ran[0].result.duration_seconds
+    else:
+        failed = sum(not o.result.ok for o in outcomes.values())
+        ok, values = not failed, {"targets": len(outcomes), "failed_targets": failed}
+    metrics.record(
+        config,
+        [
+            metrics.StageSample(
+                "backup",
+                account or metrics.ALL_ACCOUNTS,
+                ok=ok,
+                duration_seconds=duration_seconds,
+                values=values or {},
+            )
+        ],
+    )
+
 
+def _read_compressed(store: PackStore, path: Path) -> tuple[str, int, bytes] | None:
+    """Read and compress one message; None if it vanished since the manifest update."""
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    return hashlib.sha256(data).hexdigest(), len(data), store.compress(data)
+
+
+def _store_files(
+    store: PackStore,
+    root: Path,
+    entries: Iterable[tuple[str, int, str]],
+    snapshot: Snapshot,
+    workers: int,
+    *,
+    limiter: RateLimiter | None = None,
+    deadline: float | None = None,
+) -> Iterator[tuple[str, int, str]]:
+    """Add the messages the store lacks, yielding each file's snapshot entry.
+
+    Reading and compressing (zlib and zstd release the GIL) run in
+    ``workers`` threads; the pack is written by the caller's thread.
+    Reads are paced by ``limiter``, and :class:`StoreError` is raised once
+    ``time.monotonic()`` passes ``deadline``.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        inflight: deque[tuple[str, Future]] = deque()
+
+        def drain() -> Iterator[tuple[str, int, str]]:
+            rel, future = inflight.popleft()
+            result = future.result()
+            if result is None:
+                snapshot.vanished += 1
+                return
+            sha256, size, compressed = result
+            if not store.has(sha256):
+                store.add(sha256, compressed, size)
+                snapshot.new_files += 1
+                snapshot.new_bytes += size
+                snapshot.stored_bytes += len(compressed)
+            snapshot.files += 1
+            snapshot.bytes += size
+            yield rel, size, sha256
+
+        for rel, size, sha256 in entries:
+            if store.has(sha256):
+                snapshot.files += 1
+                snapshot.bytes += size
+                yield rel, size, sha256
+                continue
+            if deadline is not None and time.monotonic() > deadline:
+                raise StoreError("Backup timed out")
+            if limiter is not None:
+                limiter.acquire(size)
+            inflight.append((rel, pool.submit(_read_compressed, store, root / rel)))
+            if len(inflight) >= _READ_AHEAD * workers:
+                yield from drain()
+        while inflight:
+            yield from drain()
+
+
+def _run_native(config: Config, name: str, backup: BackupConfig, account: str | None) -> _Outcome:
+    """Back up the archive (or one account) into the target's native pack store."""
+    assert config.paths is not None and backup.repository is not None
+    label = _label(name)
+    cmd = ["native", str(backup.repository)]
+    started = time.monotonic()
+    snapshot = new_snapshot(account or metrics.ALL_ACCOUNTS)
+    print(f"{label}Running backup: native snapshot {snapshot.id} to {backup.repository}")
+    prefix = account + os.sep if account else ""
+    try:
+        with Manifest.open(config.paths.state_dir, config.paths.maildir_root) as manifest:
+            with _MANIFEST_LOCK:
+                manifest.update(account)
+            entries = (e for e in manifest.entries() if e[0].startswith(prefix))
+            with PackStore(
+                backup.repository,
+                pack_size=backup.pack_size * 1024 * 1024,
+                level=backup.compression_level,
+            ) as store:
+                files = _store_files(
+                    store,
+                    config.paths.maildir_root,
+                    entries,
+                    snapshot,
+                    os.cpu_count() or 1,
+                    limiter=RateLimiter(backup.bandwidth_limit * 1024),
+                    deadline=started + backup.timeout if backup.timeout else None,
+                )
+                store.write_snapshot(snapshot, files)
+    except (OSError, sqlite3.Error, StoreError) as e:
+        result = RunResult(cmd, 1, "", str(e), time.monotonic() - started)
+        return _Outcome(result, {})
+
+    mib = 1024 * 1024
+    summary = (
+        f"Snapshot {snapshot.id}: {snapshot.files} files ({snapshot.bytes / mib:.1f} MiB),"
+        f" {snapshot.new_files} new ({snapshot.new_bytes / mib:.1f} MiB,"
+        f" {snapshot.stored_bytes / mib:.1f} MiB stored)"
+    )
+    if snapshot.vanished:
+        summary += f", {snapshot.vanished} renamed or removed meanwhile"
+    print(label + summary)
+    result = RunResult(cmd, 0, summary + "\n", "", time.monotonic() - started)
+    values = {
+        "files": snapshot.files,
+        "new_files": snapshot.new_files,
+        "new_bytes": snapshot.new_bytes,
+        "stored_bytes": snapshot.stored_bytes,
+    }
+    return _Outcome(result, values)
+
+
+def _native_dry_run(name: str, backup: BackupConfig) -> _Outcome:
+    print(f"{_label(name)}[dry-run] Would write a native snapshot to {backup.repository}")
+    return _Outcome(RunResult(["native"], 0, "", "", 0.0), None)
+
+
+def _attempt(
+    config: Config,
+    name: str,
+    backup: BackupConfig,
+    account: str | None,
+    *,
+    verbose: bool,
+    dry_run: bool,
+) -> _Outcome:
+    if backup.mode == NATIVE:
+        if dry_run:
+            return _native_dry_run(name, backup)
+        return _run_native(config, name, backup, account)
+    plan = _plan(config, name, backup, dry_run=dry_run, account=account)
+    if isinstance(plan, RunResult):
+        return _Outcome(plan, None)
+    cmd, incremental = plan
+    ok = False
+    try:
+        result = run_command(
+            cmd,
+            cwd=_cwd(config, incremental),
+            stream=verbose,
+            timeout=backup.timeout or None,
+        )
+        ok = result.ok
+    finally:
+        if incremental is not None:
+            _finish_incremental(config, incremental, ok)
+    return _Outcome(result, _values(incremental))
+
+
+async def _async_attempt(
+    config: Config,
+    name: str,
+    backup: BackupConfig,
+    account: str | None,
+    *,
+    verbose: bool,
+    dry_run: bool,
+    timeout: float | None,
+) -> _Outcome:
+    if backup.mode == NATIVE:
+        if dry_run:
+            return _native_dry_run(name, backup)
+        return await asyncio.to_thread(_run_native, config, name, backup, account)
+    plan = await asyncio.to_thread(_plan, config, name, backup, dry_run=dry_run, account=account)
+    if isinstance(plan, RunResult):
+        return _Outcome(plan, None)
+    cmd, incremental = plan
+    ok = False
+    try:
+        result = await async_run_command(
+            cmd,
+            cwd=_cwd(config, incremental),
+            stream=verbose,
+            timeout=backup.timeout or timeout,
+        )
+        ok = result.ok
+    finally:
+        if incremental is not None:
+            await asyncio.to_thread(_finish_incremental, config, incremental, ok)
+    return _Outcome(result, _values(incremental))
+
+
+def _retry_delay(name: str, backup: BackupConfig, result: RunResult, attempt: int) -> float:
+    """Announce a retry after the ``attempt``-th failure and return the wait."""
+    delay = backup.retry_delay * 2 ** (attempt - 1)
+    print(
+        f"{_label(name)}Backup failed (exit {result.exit_code});"
+        f" retrying in {delay}s ({attempt}/{backup.retries})"
+    )
+    return delay
+
+
+def _report(result: RunResult, name: str = "") -> RunResult:
+    label = _label(name)
     if result.ok:
-        print(f"Backup completed successfully ({result.duration_seconds:.1f}s)")
+        print(f"{label}Backup completed successfully ({result.duration_seconds:.1f}s)")
     else:
-        print(f"Backup failed (exit {result.exit_code})")
+        print(f"{label}Backup failed (exit {result.exit_code})")
         if result.stderr:
-            print(f"stderr: {result.stderr[:500]}")
+            print(f"{label}stderr: {result.stderr[:500]}")
+    return result
+
+
+def _backup_target(
+    config: Config,
+    name: str,
+    backup: BackupConfig,
+    account: str | None,
+    *,
+    verbose: bool,
+    dry_run: bool,
+) -> _Outcome:
+    """Back up to one target, retrying failed attempts."""
+    for attempt in range(backup.retries + 1):
+        outcome = _attempt(config, name, backup, account, verbose=verbose, dry_run=dry_run)
+        if outcome.result.ok or attempt == backup.retries:
+            break
+        time.sleep(_retry_delay(name, backup, outcome.result, attempt + 1))
+    if outcome.values is not None:
+        _report(outcome.result, name)
+    return outcome
+
+
+async def _async_backup_target(
+    config: Config,
+    name: str,
+    backup: BackupConfig,
+    account: str | None,
+    *,
+    verbose: bool,
+    dry_run: bool,
+    timeout: float | None,
+) -> _Outcome:
+    for attempt in range(backup.retries + 1):
+        outcome = await _async_attempt(
+            config, name, backup, account, verbose=verbose, dry_run=dry_run, timeout=timeout
+        )
+        if outcome.result.ok or attempt == backup.retries:
+            break
+        await asyncio.sleep(_retry_delay(name, backup, outcome.result, attempt + 1))
+    if outcome.values is not None:
+        _report(outcome.result, name)
+    return outcome
+
+
+def _combine(
+    outcomes: dict[str, _Outcome], duration_seconds: float, account: str | None = None
+) -> RunResult | AggregateResult:
+    """One target's result as is, or an AggregateResult keyed by target."""
+    if len(outcomes) == 1:
+        return next(iter(outcomes.values())).result
+    prefix = f"{account}:" if account else ""
+    return AggregateResult(
+        results={prefix + name: o.result for name, o in outcomes.items()},
+        duration_seconds=duration_seconds,
+    )
+
+
+def _hook(command: str, source: Path, snapshot: Path) -> list[str]:
+    return [
+        arg.replace("{source}", str(source)).replace("{snapshot}", str(snapshot))
+        for arg in shlex.split(command)
+    ]
+
+
+def _take_snapshot(
+    config: Config, account: str | None, *, dry_run: bool
+) -> tuple[Config, Path | None] | RunResult:
+    """Take the configured point-in-time view of the scope's Maildir.
+
+    Returns:
+        The config to back up with, its ``maildir_root`` pointing at the
+        snapshot, and the snapshot to release afterwards (None if there is
+        none); or the failed result.
+    """
+    assert config.backup is not None and config.paths is not None
+    backup = config.backup
+    if backup.snapshot == "none":
+        return config, None
+    assert backup.snapshot_dir is not None
+    source = config.paths.maildir_root
+    path = backup.snapshot_dir / (account or metrics.ALL_ACCOUNTS)
+    if dry_run:
+        print(f"[dry-run] Would snapshot {source} to {path}")
+        return config, None
+
+    started = time.monotonic()
+    if backup.snapshot == HARDLINK:
+        try:
+            if account:
+                linked = link_tree(source / account, path / account)
+            else:
+                linked = link_tree(source, path)
+        except OSError as e:
+            _release_snapshot(config, path)
+            return RunResult(
+                ["link", str(path)], 1, "", f"Snapshot failed: {e}", time.monotonic() - started
+            )
+        print(f"Snapshot of {source}: {linked} files linked ({time.monotonic() - started:.1f}s)")
+    else:
+        backup.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        result = run_command(_hook(backup.snapshot_create, source, path))
+        if not result.ok:
+            print(f"Snapshot failed (exit {result.exit_code})")
+            return result
+        print(f"Snapshot of {source} taken at {path}")
+    return replace(config, paths=replace(config.paths, maildir_root=path)), path
 
+
+def _release_snapshot(config: Config, path: Path) -> None:
+    """Drop a snapshot; a failure is reported but doesn't fail the backup."""
+    assert config.backup is not None and config.paths is not None
+    backup = config.backup
+    if backup.snapshot == HARDLINK:
+        try:
+            remove_tree(path)
+        except OSError as e:
+            print(f"Releasing snapshot {path} failed: {e}")
+        return
+    if backup.snapshot_release:
+        result = run_command(_hook(backup.snapshot_release, config.paths.maildir_root, path))
+        if not result.ok:
+            print(f"Releasing snapshot {path} failed (exit {result.exit_code}): {result.stderr}")
+
+
+def _snapshot_failed(config: Config, account: str | None, result: RunResult) -> RunResult:
+    _report(result)
+    _record_metrics(config, account, {"": _Outcome(result, {})}, result.duration_seconds)
     return result
+
+
+def _backup_scope(
+    config: Config, account: str | None, *, verbose: bool, dry_run: bool
+) -> RunResult | AggregateResult:
+    """Back up one scope (an account or the whole archive) to every target at once."""
+    taken = _take_snapshot(config, account, dry_run=dry_run)
+    if isinstance(taken, RunResult):
+        return _snapshot_failed(config, account, taken)
+    view, snapshot = taken
+    targets = backup_targets(config)
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            futures = {
+                name: pool.submit(
+                    _backup_target, view, name, backup, account, verbose=verbose, dry_run=dry_run
+                )
+                for name, backup in targets.items()
+            }
+            outcomes = {name: future.result() for name, future in futures.items()}
+    finally:
+        if snapshot is not None:
+            _release_snapshot(config, snapshot)
+    duration = time.monotonic() - started
+    _record_metrics(config, account, outcomes, duration)
+    return _combine(outcomes, duration, account)
+
+
+def run_backup(
+    config: Config,
+    *,
+    verbose: bool = False,
+    dry_run: bool = False,
+    account: str | None = None,
+) -> RunResult | AggregateResult:
+    """Run the configured backup.
+
+    With ``[backup.target.<name>]`` tables every target is backed up
+    concurrently, each with its own ``bandwidth_limit``, ``timeout`` and
+    ``retries``.  If the commands contain ``{account}`` they are run once
+    per account (or only for ``account``), with the placeholder replaced by
+    the name.  In incremental mode each run only gets the files changed
+    since the last successful backup of the same target and scope.
+
+    Args:
+        config: Validated configuration.
+        verbose: Print verbose output.
+        dry_run: If True, only print what would be run.
+        account: Only back up this account (``{account}`` commands and
+            native mode only).
+
+    Returns:
+        RunResult from a single target's backup, or an AggregateResult keyed
+        by target, by account for per-account commands, or by
+        ``account:target`` for both.
+    """
+    if uses_account_placeholder(config):
+        started = time.monotonic()
+        names = [account] if account else list(config.accounts)
+        results: dict[str, RunResult] = {}
+        for name in names:
+            scope = _backup_scope(config, name, verbose=verbose, dry_run=dry_run)
+            if isinstance(scope, AggregateResult):
+                results.update(scope.results)
+            else:
+                results[name] = scope
+        return AggregateResult(results=results, duration_seconds=time.monotonic() - started)
+    return _backup_scope(config, account, verbose=verbose, dry_run=dry_run)
+
+
+async def async_run_backup(
+    config: Config,
+    *,
+    verbose: bool = False,
+    dry_run: bool = False,
+    timeout: float | None = None,
+    account: str | None = None,
+) -> RunResult | AggregateResult:
+    """Coroutine version of :func:`run_backup` for one scope.
+
+    Cancelling it sends SIGTERM to the backup tools (restic, borg, … all
+    checkpoint or roll back cleanly on SIGTERM).
+
+    Args:
+        timeout: Time limit in seconds for each backup command, unless
+            its target sets its own ``timeout``.
+        account: Substituted for ``{account}`` in the backup commands.
+    """
+    taken = await asyncio.to_thread(_take_snapshot, config, account, dry_run=dry_run)
+    if isinstance(taken, RunResult):
+        return await asyncio.to_thread(_snapshot_failed, config, account, taken)
+    view, snapshot = taken
+    targets = backup_targets(config)
+    started = time.monotonic()
+    try:
+        results = await asyncio.gather(
+            *(
+                _async_backup_target(
+                    view,
+                    name,
+                    backup,
+                    account,
+                    verbose=verbose,
+                    dry_run=dry_run,
+                    timeout=timeout,
+                )
+                for name, backup in targets.items()
+            )
+        )
+    finally:
+        if snapshot is not None:
+            await asyncio.to_thread(_release_snapshot, config, snapshot)
+    outcomes = dict(zip(targets, results))
+    duration = time.monotonic() - started
+    await asyncio.to_thread(_record_metrics, config, account, outcomes, duration)
+    return _combine(outcomes, duration, account)
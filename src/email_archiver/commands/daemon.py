@@ -0,0 +1,410 @@
+"""Daemon command: run the pipeline on a schedule from one long-lived process.
+
+Replaces re-executing ``email-archiver run`` from a shell loop.  The config
+is parsed, the mbsync/notmuch configs are generated and the notmuch
+database is checked once at startup; after that each account runs
+``sync → index → verify → backup`` on its own interval.
+
+- Each account is due every ``sync_interval`` seconds (default
+  ``[daemon] interval``), measured from the start of its previous run, plus
+  up to ``jitter`` seconds of random delay.
+- A run is never started for an account that is still running; slots
+  missed while it ran are skipped rather than queued.
+- After a failure the next run is delayed by ``interval * 2**failures``,
+  capped at ``max_backoff``; one success resets it.
+- A whole-archive backup (a backup command without ``{account}``) is
+  not run by each account's pipeline: it runs once, after successful
+  runs, as soon as no account is running (right away with a ``[backup]
+  snapshot``, which isolates it from running syncs).  Every backup the
+  daemon starts takes one shared lock, so backups never overlap.
+- A Unix socket (``[daemon] socket_path``) accepts one JSON request per
+  connection: ``{"command": "trigger", "account": "name"}``, ``status``
+  or ``stop``.  A second daemon refuses to start while the first one
+  listens on it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import socket
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from email_archiver.commands.backup import async_run_backup, uses_account_placeholder
+from email_archiver.commands.run import IndexCoalescer, async_run_all
+from email_archiver.config import Config
+from email_archiver.generate import ensure_notmuch_init, write_generated_configs
+from email_archiver.runner import run_async
+
+CONTROL_COMMANDS = ("trigger", "status", "stop")
+
+
+class DaemonRunning(Exception):
+    """Raised when another daemon is listening on the control socket."""
+
+
+@dataclass
+class AccountSchedule:
+    """Scheduling state of one account."""
+
+    account: str
+    interval: float
+    next_due: float
+    failures: int = 0
+    running: bool = False
+    runs: int = 0
+    last_exit_code: int | None = None
+    last_duration: float | None = None
+
+    def finish(
+        self,
+        started: float,
+        now: float,
+        exit_code: int,
+        *,
+        jitter: float,
+        max_backoff: float,
+        rng: random.Random,
+    ) -> None:
+        """Record a finished run and compute when the next one is due."""
+        self.running = False
+        self.runs += 1
+        self.last_exit_code = exit_code
+        self.last_duration = now - started
+        if exit_code == 0:
+            self.failures = 0
+            # Keep the cadence anchored to start times, skipping slots that
+            # passed while this run was still going.
+            due = started + self.interval
+            while due <= now:
+                due += self.interval
+        else:
+            self.failures += 1
+            delay = self.interval * 2**self.failures
+            due = now + min(delay, max(max_backoff, self.interval))
+        self.next_due = due + rng.uniform(0, jitter)
+
+
+class Scheduler:
+    """In-process scheduler driving :func:`async_run_all` per account."""
+
+    def __init__(
+        self,
+        config: Config,
+        *,
+        verbose: bool = False,
+        dry_run: bool = False,
+        clock: Callable[[], float] = time.monotonic,
+        rng: random.Random | None = None,
+        run_account: Callable[[str], Any] | None = None,
+        run_backup: Callable[[], Any] | None = None,
+    ) -> None:
+        assert config.daemon is not None
+        assert config.sync is not None
+        self.config = config
+        self.verbose = verbose
+        self.dry_run = dry_run
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._run_account = run_account or self._run_pipeline
+        self._run_backup = run_backup
+        assert config.orchestration is not None
+        if run_account is None and run_backup is None:
+            if config.orchestration.backup_after_verify and not uses_account_placeholder(config):
+                self._run_backup = self._backup_archive
+        self._backup_lock = asyncio.Lock()
+        self._backup_pending = False
+        self._backup_task: asyncio.Task[None] | None = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._tasks: dict[str, asyncio.Task[None]] = {}
+        self._slots = asyncio.Semaphore(config.sync.concurrency)
+        # Shared with every run's sync stage: mbsync processes per IMAP host.
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+        self._generated: tuple[Path, Path] | None = None
+        self._indexer: IndexCoalescer | None = None
+
+        now = clock()
+        self.schedules = {
+            name: AccountSchedule(
+                account=name,
+                interval=acct.sync_interval or config.daemon.interval,
+                # Stagger the first round so accounts don't all start at once.
+                next_due=now + self._rng.uniform(0, config.daemon.jitter),
+            )
+            for name, acct in config.accounts.items()
+        }
+
+    # -- control ----------------------------------------------------------
+
+    def trigger(self, account: str | None = None) -> dict[str, Any]:
+        """Make ``account`` (or every account) due now."""
+        if account is not None and account not in self.schedules:
+            return {"ok": False, "error": f"Unknown account '{account}'"}
+        names = [account] if account else list(self.schedules)
+        now = self._clock()
+        triggered, busy = [], []
+        for name in names:
+            sched = self.schedules[name]
+            if sched.running:
+                busy.append(name)
+            else:
+                sched.next_due = now
+                triggered.append(name)
+        self._wake.set()
+        return {"ok": True, "triggered": triggered, "running": busy}
+
+    def status(self) -> dict[str, Any]:
+        now = self._clock()
+        return {
+            "ok": True,
+            "accounts": {
+                name: {
+                    "running": s.running,
+                    "due_in": None if s.running else max(0.0, round(s.next_due - now, 1)),
+                    "runs": s.runs,
+                    "failures": s.failures,
+                    "last_exit_code": s.last_exit_code,
+                    "last_duration": s.last_duration,
+                }
+                for name, s in self.schedules.items()
+            },
+            "backup": {
+                "pending": self._backup_pending,
+                "running": self._backup_task is not None,
+            },
+        }
+
+    def stop(self) -> dict[str, Any]:
+        self._stopping = True
+        self._wake.set()
+        return {"ok": True}
+
+    def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        command = request.get("command")
+        if command == "trigger":
+            return self.trigger(request.get("account"))
+        if command == "status":
+            return self.status()
+        if command == "stop":
+            return self.stop()
+        return {"ok": False, "error": f"Unknown command {command!r}"}
+
+    # -- scheduling -------------------------------------------------------
+
+    async def _run_pipeline(self, account: str) -> int:
+        return await async_run_all(
+            self.config,
+            account=account,
+            verbose=self.verbose,
+            dry_run=self.dry_run,
+            generated=self._generated,
+            indexer=self._indexer,
+            backup_lock=self._backup_lock,
+            archive_backup=False,
+            host_slots=self._host_slots,
+        )
+
+    async def _backup_archive(self) -> int:
+        print("[daemon] Starting backup of the whole archive")
+        result = await async_run_backup(self.config, verbose=self.verbose, dry_run=self.dry_run)
+        return result.exit_code
+
+    async def _backup(self) -> None:
+        assert self._run_backup is not None
+        self._backup_pending = False
+        exit_code = 1
+        try:
+            async with self._backup_lock:
+                exit_code = await self._run_backup()
+        except Exception as e:
+            print(f"[daemon] Backup crashed: {e}")
+        finally:
+            self._backup_task = None
+            self._wake.set()
+        print(
+            "[daemon] Backup ok" if exit_code == 0 else f"[daemon] Backup failed (exit {exit_code})"
+        )
+
+    async def _run(self, sched: AccountSchedule) -> None:
+        assert self.config.daemon is not None
+        started = self._clock()
+        exit_code = 1
+        try:
+            async with self._slots:
+                print(f"[daemon] Starting run for '{sched.account}'")
+                exit_code = await self._run_account(sched.account)
+        except Exception as e:
+            print(f"[daemon] Run for '{sched.account}' crashed: {e}")
+        finally:
+            sched.finish(
+                started,
+                self._clock(),
+                exit_code,
+                jitter=self.config.daemon.jitter,
+                max_backoff=self.config.daemon.max_backoff,
+                rng=self._rng,
+            )
+            self._tasks.pop(sched.account, None)
+            if exit_code == 0 and self._run_backup is not None:
+                self._backup_pending = True
+            self._wake.set()
+        status = "ok" if exit_code == 0 else f"failed (exit {exit_code})"
+        print(
+            f"[daemon] Run for '{sched.account}' {status};"
+            f" next in {sched.next_due - self._clock():.0f}s"
+        )
+
+    def _start_due(self) -> float | None:
+        """Start every due account; return seconds until the next one is due."""
+        now = self._clock()
+        waits: list[float] = []
+        for sched in self.schedules.values():
+            if sched.running:
+                continue
+            if sched.next_due <= now:
+                sched.running = True
+                self._tasks[sched.account] = asyncio.ensure_future(self._run(sched))
+            else:
+                waits.append(sched.next_due - now)
+        # One backup covers every run that finished before it started.  It
+        # waits for running accounts unless it backs up a snapshot.
+        assert self.config.backup is not None
+        quiet = not self._tasks or self.config.backup.snapshot != "none"
+        if self._backup_pending and self._backup_task is None and quiet:
+            self._backup_task = asyncio.ensure_future(self._backup())
+        return min(waits) if waits else None
+
+    async def run_forever(self) -> None:
+        """Run until :meth:`stop` is called or the task is cancelled."""
+        if self._run_account == self._run_pipeline:
+            self._generated = write_generated_configs(self.config)
+            if not self.dry_run:
+                await asyncio.to_thread(ensure_notmuch_init, self.config, self._generated[1])
+            self._indexer = IndexCoalescer(
+                self.config, self._generated[1], verbose=self.verbose, dry_run=self.dry_run
+            )
+        try:
+            while not self._stopping:
+                self._wake.clear()
+                timeout = self._start_due()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            tasks = list(self._tasks.values())
+            if self._backup_task is not None:
+                tasks.append(self._backup_task)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _listening(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+async def _serve_control(scheduler: Scheduler, socket_path: Path) -> asyncio.AbstractServer:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            line = await reader.readline()
+            if not line:
+                # A client that only checked whether we are listening.
+                return
+            try:
+                request = json.loads(line)
+                response = scheduler.handle(request if isinstance(request, dict) else {})
+            except json.JSONDecodeError:
+                response = {"ok": False, "error": "Invalid JSON request"}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        if await asyncio.to_thread(_listening, socket_path):
+            raise DaemonRunning(f"a daemon is already listening on {socket_path}")
+        # Left behind by a daemon that did not shut down cleanly.
+        socket_path.unlink()
+    server = await asyncio.start_unix_server(handle, path=str(socket_path))
+    os.chmod(socket_path, 0o600)
+    return server
+
+
+async def async_run_daemon(config: Config, *, verbose: bool = False, dry_run: bool = False) -> None:
+    """Coroutine version of :func:`run_daemon`."""
+    assert config.daemon is not None
+    assert config.daemon.socket_path is not None
+    scheduler = Scheduler(config, verbose=verbose, dry_run=dry_run)
+    server = await _serve_control(scheduler, config.daemon.socket_path)
+    print(
+        f"email-archiver daemon started ({len(scheduler.schedules)} account(s),"
+        f" control socket {config.daemon.socket_path})"
+    )
+    try:
+        await scheduler.run_forever()
+    finally:
+        server.close()
+        await server.wait_closed()
+        config.daemon.socket_path.unlink(missing_ok=True)
+
+
+def run_daemon(config: Config, *, verbose: bool = False, dry_run: bool = False) -> int:
+    """Run the scheduler until stopped by SIGTERM/SIGINT or a ``stop`` request.
+
+    Returns:
+        Exit code (0 on a clean shutdown, 1 if another daemon is running).
+    """
+    try:
+        run_async(async_run_daemon(config, verbose=verbose, dry_run=dry_run))
+    except asyncio.CancelledError:
+        pass
+    except DaemonRunning as e:
+        print(f"Not starting: {e}")
+        return 1
+    print("email-archiver daemon stopped.")
+    return 0
+
+
+def send_control(
+    socket_path: Path, command: str, *, account: str | None = None, timeout: float = 10.0
+) -> dict[str, Any]:
+    """Send one request to a running daemon and return its response.
+
+    Raises:
+        OSError: If the daemon is not running or doesn't answer with a
+            JSON object.
+    """
+    request: dict[str, Any] = {"command": command}
+    if account is not None:
+        request["account"] = account
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    try:
+        response = json.loads(data)
+    except ValueError as e:
+        raise ConnectionError(f"invalid reply {data[:200]!r} ({e})") from e
+    if not isinstance(response, dict):
+        raise ConnectionError(f"invalid reply {data[:200]!r}")
+    return response
@@ -0,0 +1,320 @@
+"""Dedupe command: find duplicate messages across accounts and folders.
+
+The same message often ends up in several Maildir folders (Gmail labels
+exposed as folders, INBOX and Archive on other servers, mail shared
+between our own accounts).  ``dedupe`` hashes every file under
+``maildir_root`` and groups files by Message-ID and body hash.
+
+Within a group, files whose bytes are identical can share one inode:
+``dedupe --link`` replaces every redundant copy with a hardlink to the
+one kept.  Maildir files are never modified in place (flag changes are
+renames), so a hardlinked copy behaves exactly like the original, and
+tools that understand hardlinks (restic, rsync -H, tar) store it once.
+Linking holds the sync lock exclusively (see :mod:`email_archiver.synclock`),
+so mbsync can't rename a file between its check and its replacement;
+``--link`` refuses to run while a sync is running.  Copies that differ
+in some header (e.g. ``Received`` lines added by another server) are
+reported but left alone.
+
+Hashes come from the shared hash index (``<state_dir>/hashes.sqlite3``),
+so only files new since the last run are read, through ``mmap`` by a pool
+of worker processes.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from email_archiver import metrics, synclock
+from email_archiver.config import Config
+from email_archiver.hashindex import HashIndex, MessageHash, unique_name
+from email_archiver.manifest import iter_mail_dirs
+
+
+@dataclass
+class FileDigest:
+    """What ``dedupe`` knows about one message file."""
+
+    path: str
+    size: int
+    mtime_ns: int
+    dev: int
+    ino: int
+    nlink: int
+    message_id: str | None
+    body_sha256: str
+    sha256: str
+
+
+@dataclass
+class DuplicateGroup:
+    """Files holding the same message (same Message-ID and body)."""
+
+    message_id: str | None
+    files: list[FileDigest]
+
+    @property
+    def redundant_files(self) -> int:
+        return len(self.files) - 1
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        """Bytes freed by hardlinking the byte-identical copies together."""
+        total = 0
+        for copies in self.linkable().values():
+            inodes = {(f.dev, f.ino) for f in copies}
+            total += copies[0].size * (len(inodes) - 1)
+        return total
+
+    def linkable(self) -> dict[tuple[int, str], list[FileDigest]]:
+        """Byte-identical copies per filesystem, keyed by ``(dev, sha256)``."""
+        sets: dict[tuple[int, str], list[FileDigest]] = {}
+        for f in self.files:
+            sets.setdefault((f.dev, f.sha256), []).append(f)
+        return {key: copies for key, copies in sets.items() if len(copies) > 1}
+
+
+@dataclass
+class DedupeReport:
+    files: int = 0
+    groups: list[DuplicateGroup] = field(default_factory=list)
+    linked: int = 0
+    linked_bytes: int = 0
+    skipped: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def redundant_files(self) -> int:
+        return sum(g.redundant_files for g in self.groups)
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        return sum(g.reclaimable_bytes for g in self.groups)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _list_files(root: Path, account: str | None) -> list[tuple[str, os.stat_result]]:
+    scan_root = root / account if account else root
+    files: list[tuple[str, os.stat_result]] = []
+    for rel_dir, _ in iter_mail_dirs(scan_root):
+        if account:
+            rel_dir = os.path.join(account, rel_dir)
+        try:
+            with os.scandir(root / rel_dir) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            files.append((os.path.join(rel_dir, entry.name), st))
+                    except FileNotFoundError:
+                        continue
+        except FileNotFoundError:
+            continue
+    files.sort(key=lambda item: item[0])
+    return files
+
+
+def _digest_all(
+    hashes: HashIndex, root: Path, files: list[tuple[str, os.stat_result]], workers: int
+) -> list[FileDigest]:
+    """Digests of ``files``, hashing only those the hash index doesn't know."""
+    known = hashes.hashes(root, files, workers=workers)
+    return [
+        FileDigest(
+            path,
+            st.st_size,
+            st.st_mtime_ns,
+            st.st_dev,
+            st.st_ino,
+            st.st_nlink,
+            h.message_id,
+            h.body_sha256,
+            h.sha256,
+        )
+        for path, st in files
+        if (h := known.get(path)) is not None
+    ]
+
+
+def find_duplicates(digests: list[FileDigest]) -> list[DuplicateGroup]:
+    """Group files by Message-ID and body hash.
+
+    Messages without a Message-ID are only grouped with byte-identical
+    files, since an empty body or a one-line note is not unique enough.
+    """
+    by_key: dict[tuple[str, str], list[FileDigest]] = {}
+    for d in digests:
+        key = (d.message_id, d.body_sha256) if d.message_id else ("", d.sha256)
+        by_key.setdefault(key, []).append(d)
+    return [
+        DuplicateGroup(files[0].message_id, files) for files in by_key.values() if len(files) > 1
+    ]
+
+
+def _link_group(
+    root: Path, group: DuplicateGroup, report: DedupeReport, hashes: HashIndex, dry_run: bool
+) -> None:
+    for copies in group.linkable().values():
+        # Keep the copy that already has the most links, so earlier runs'
+        # links are extended rather than replaced.
+        keep = min(copies, key=lambda f: (-f.nlink, f.path))
+        freed: set[int] = set()
+        for dup in copies:
+            if dup.ino == keep.ino:
+                continue
+            if dry_run:
+                print(f"[dry-run] Would link {dup.path} -> {keep.path}")
+            else:
+                try:
+                    _replace_with_link(root, keep, dup)
+                except (FileNotFoundError, ValueError):
+                    report.skipped += 1  # renamed or expunged by a sync since hashing
+                    continue
+                except OSError as e:
+                    report.errors.append(f"{dup.path}: {e}")
+                    continue
+                # The link carries the kept file's mtime; record it so the
+                # copy isn't taken for a changed file and hashed again.
+                hashes.store(
+                    [
+                        (
+                            dup.path,
+                            MessageHash(
+                                keep.size,
+                                keep.mtime_ns,
+                                keep.sha256,
+                                dup.body_sha256,
+                                dup.message_id,
+                            ),
+                        )
+                    ]
+                )
+            report.linked += 1
+            if dup.ino not in freed:
+                freed.add(dup.ino)
+                report.linked_bytes += dup.size
+
+
+def _replace_with_link(root: Path, keep: FileDigest, dup: FileDigest) -> None:
+    """Replace ``dup`` by a hardlink to ``keep``.
+
+    Both files are checked to still be the ones that were hashed, so a
+    copy renamed or expunged by a sync that ran since is skipped rather
+    than resurrected.  The check and the replacement are two steps: the
+    caller holds the sync lock exclusively so that no sync runs between
+    them.
+    """
+    keep_path = root / keep.path
+    dup_path = root / dup.path
+    for path, digest in ((keep_path, keep), (dup_path, dup)):
+        st = os.stat(path)
+        if (st.st_ino, st.st_size) != (digest.ino, digest.size):
+            raise ValueError("changed since it was hashed")
+    tmp = dup_path.with_name(f".{dup_path.name}.dedupe-tmp")
+    os.link(keep_path, tmp)
+    try:
+        os.replace(tmp, dup_path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _human(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def _print_report(report: DedupeReport, *, link: bool, verbose: bool) -> None:
+    print(
+        f"Scanned {report.files} files: {len(report.groups)} duplicate groups, "
+        f"{report.redundant_files} redundant copies, "
+        f"{_human(report.reclaimable_bytes)} reclaimable by hardlinking."
+    )
+    if verbose:
+        for group in sorted(report.groups, key=lambda g: -g.reclaimable_bytes):
+            print(f"  <{group.message_id or '(no Message-ID)'}>")
+            for f in group.files:
+                print(f"    {f.path} ({f.size} bytes, inode {f.ino})")
+    if link:
+        print(f"Linked {report.linked} files ({_human(report.linked_bytes)} freed).")
+        if report.skipped:
+            print(f"Skipped {report.skipped} files that changed while dedupe ran.")
+    for error in report.errors:
+        print(f"Could not link {error}")
+
+
+def run_dedupe(
+    config: Config,
+    *,
+    account: str | None = None,
+    link: bool = False,
+    verbose: bool = False,
+    dry_run: bool = False,
+    workers: int | None = None,
+) -> DedupeReport:
+    """Report duplicate messages and optionally hardlink identical copies.
+
+    Args:
+        config: Validated configuration.
+        account: Only look under ``maildir_root/<account>``.
+        link: Replace byte-identical copies with hardlinks to one of them.
+        verbose: List every duplicate group.
+        dry_run: With ``link``, only print the links that would be made.
+        workers: Hashing processes (default: one per CPU).
+
+    Returns:
+        The duplicate groups found and what was linked.
+    """
+    assert config.paths is not None
+    root = config.paths.maildir_root
+    started = time.monotonic()
+
+    files = _list_files(root, account)
+    with HashIndex.open(config.paths.state_dir) as hashes:
+        digests = _digest_all(hashes, root, files, workers or os.cpu_count() or 1)
+        if verbose:
+            print(f"Hashed {hashes.hashed} new files, {len(digests) - hashes.hashed} known.")
+        if account is None:
+            hashes.prune(unique_name(os.path.basename(path)) for path, _ in files)
+        report = DedupeReport(files=len(digests), groups=find_duplicates(digests))
+        if link and dry_run:
+            for group in report.groups:
+                _link_group(root, group, report, hashes, dry_run)
+        elif link:
+            try:
+                with synclock.exclusive(config.paths.state_dir):
+                    for group in report.groups:
+                        _link_group(root, group, report, hashes, dry_run)
+            except synclock.SyncRunning as e:
+                report.errors.append(f"files: {e}; run dedupe --link once it has finished")
+    _print_report(report, link=link, verbose=verbose)
+
+    if not dry_run:
+        metrics.record(
+            config,
+            [
+                metrics.StageSample(
+                    "dedupe",
+                    account or metrics.ALL_ACCOUNTS,
+                    ok=report.ok,
+                    duration_seconds=time.monotonic() - started,
+                    values={
+                        "files": report.files,
+                        "duplicate_groups": len(report.groups),
+                        "redundant_files": report.redundant_files,
+                        "reclaimable_bytes": report.reclaimable_bytes,
+                        "linked_files": report.linked,
+                    },
+                )
+            ],
+        )
+    return report
@@ -0,0 +1,318 @@
+"""Import-mbox command: convert mbox files (e.g. Gmail Takeout) into Maildir.
+
+Takeout delivers one mbox file per export, often tens of gigabytes, so
+the file is never read whole.  It is memory-mapped and split on
+``\\nFrom `` boundaries; each message is copied out of the mapping on its
+own, and pages already consumed are dropped from memory, so memory use
+stays bounded by the messages in flight (at most ``_READ_AHEAD_BYTES``),
+whatever the size of the file.
+``>From `` lines are unescaped following the mboxrd convention Gmail
+uses.
+
+Messages whose Message-ID is already in the account's Maildir (per the
+manifest) or earlier in the import are skipped, which also makes an
+interrupted import safe to run again.  A message without a Message-ID
+is known by the id notmuch gives it, a SHA-1 of its content, so only
+byte-identical copies are skipped.  The rest are written to
+``maildir_root/<account>/<folder>/`` by a pool of threads: each file
+goes to ``tmp/`` and is fsynced there, in parallel so the filesystem
+can group the commits, and every batch is renamed into ``cur/`` with a
+single directory fsync.  A write that fails stops the import; the
+batches already in ``cur/`` are kept.  A targeted index of the account
+follows.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import re
+import socket
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.parser import BytesHeaderParser
+from email.policy import compat32
+from pathlib import Path
+
+from email_archiver import metrics
+from email_archiver.commands.index import run_index
+from email_archiver.config import Config
+from email_archiver.hashindex import parse_message_id
+from email_archiver.manifest import Manifest
+from email_archiver.packstore import fsync_dir
+
+DEFAULT_FOLDER = "Imported"
+
+# Messages renamed into cur/ (and the directory fsynced) at a time.
+_BATCH = 256
+
+# Messages being written ahead of the reader: at most this many per worker
+# thread, and this many bytes in all, so large messages stay bounded too.
+_READ_AHEAD = 8
+_READ_AHEAD_BYTES = 64 * 1024 * 1024
+
+# Consumed pages are released from the mapping in steps of this size.
+_RELEASE_STEP = 64 * 1024 * 1024
+
+_HEADER_LIMIT = 256 * 1024
+
+# mboxrd: a body line ">From ", ">>From ", … lost one ">" when written.
+_ESCAPED_FROM = re.compile(rb"^>(>*From )", re.MULTILINE)
+
+
+def _release(mm: mmap.mmap, end: int) -> None:
+    """Drop the pages before ``end`` from memory; they are read back on demand."""
+    if hasattr(mm, "madvise"):
+        mm.madvise(mmap.MADV_DONTNEED, 0, end - end % mmap.PAGESIZE)
+
+
+def iter_mbox(path: Path) -> Iterator[bytes]:
+    """Yield each message of an mbox file, without its ``From `` line.
+
+    Raises:
+        ValueError: If the file doesn't start with a ``From `` line.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            if mm[:5] != b"From ":
+                raise ValueError(f"{path} is not an mbox file")
+            start, released = 0, 0
+            while start < len(mm):
+                end = mm.find(b"\nFrom ", start)
+                end = len(mm) if end < 0 else end + 1
+                body = mm.find(b"\n", start, end) + 1 or end
+                data = mm[body:end]
+                # The blank line before the next From line belongs to the mbox.
+                if data.endswith(b"\r\n\r\n"):
+                    data = data[:-2]
+                elif data.endswith(b"\n\n"):
+                    data = data[:-1]
+                if b"\n>" in data or data.startswith(b">"):
+                    data = _ESCAPED_FROM.sub(rb"\1", data)
+                yield data
+                start = end
+                if start - released >= _RELEASE_STEP:
+                    _release(mm, start)
+                    released = start
+
+
+def _headers(data: bytes) -> tuple[str | None, bool]:
+    """The Message-ID (without angle brackets) and whether the message was read."""
+    end = data.find(b"\n\n")
+    if end < 0:
+        end = data.find(b"\r\n\r\n")
+    head = data[: end if 0 <= end < _HEADER_LIMIT else _HEADER_LIMIT]
+    # Parsed like the manifest parses files, so both agree on the key.
+    message_id = parse_message_id(head)
+    if b"Unread" not in head:
+        return message_id, True
+    # Takeout lists Gmail's labels, including "Unread".
+    headers = BytesHeaderParser(policy=compat32).parsebytes(head)
+    labels = [label.strip() for label in str(headers.get("X-Gmail-Labels", "")).split(",")]
+    return message_id, "Unread" not in labels
+
+
+def _write(path: Path, data: bytes) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DeliveryError(Exception):
+    """Writing a message into the Maildir failed."""
+
+
+class _MaildirWriter:
+    """Delivers messages to one Maildir folder in fsynced batches."""
+
+    def __init__(self, folder: Path, workers: int) -> None:
+        self.folder = folder
+        for sub in ("cur", "new", "tmp"):
+            (folder / sub).mkdir(parents=True, exist_ok=True)
+        host = socket.gethostname().replace("/", "\\057").replace(":", "\\072")
+        self.prefix = f"{int(time.time())}.P{os.getpid()}Q"
+        self.suffix = f".{host}"
+        self.count = 0
+        self.delivered = 0
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.limit = _READ_AHEAD * workers
+        self.inflight: deque[tuple[Future, str, str, int]] = deque()
+        self.inflight_bytes = 0
+        self.batch: list[tuple[str, str]] = []
+
+    def add(self, data: bytes, seen: bool) -> None:
+        """Queue one message.
+
+        Raises:
+            DeliveryError: If writing this or an earlier message failed.
+        """
+        self.count += 1
+        name = f"{self.prefix}{self.count}{self.suffix}"
+        final = f"{name}:2,S" if seen else f"{name}:2,"
+        future = self.pool.submit(_write, self.folder / "tmp" / name, data)
+        self.inflight.append((future, name, final, len(data)))
+        self.inflight_bytes += len(data)
+        while self.inflight and (
+            len(self.inflight) > self.limit or self.inflight_bytes > _READ_AHEAD_BYTES
+        ):
+            self._collect()
+
+    def _collect(self) -> None:
+        future, name, final, size = self.inflight[0]
+        try:
+            future.result()
+        except OSError as e:
+            raise DeliveryError(f"Writing to {self.folder} failed: {e}") from e
+        self.inflight.popleft()
+        self.inflight_bytes -= size
+        self.batch.append((name, final))
+        if len(self.batch) >= _BATCH:
+            self._commit()
+
+    def _commit(self) -> None:
+        try:
+            while self.batch:
+                name, final = self.batch[0]
+                os.rename(self.folder / "tmp" / name, self.folder / "cur" / final)
+                self.batch.pop(0)
+                self.delivered += 1
+            fsync_dir(self.folder / "cur")
+        except OSError as e:
+            raise DeliveryError(f"Delivering to {self.folder} failed: {e}") from e
+
+    def close(self) -> None:
+        """Finish every write and move the last batch into ``cur/``.
+
+        Raises:
+            DeliveryError: If a write failed; see :meth:`abort`.
+        """
+        while self.inflight:
+            self._collect()
+        if self.batch:
+            self._commit()
+        self.pool.shutdown()
+
+    def abort(self) -> None:
+        """Stop writing and remove the messages not yet moved into ``cur/``."""
+        self.pool.shutdown(cancel_futures=True)
+        names = [name for _, name, _, _ in self.inflight] + [name for name, _ in self.batch]
+        for name in names:
+            (self.folder / "tmp" / name).unlink(missing_ok=True)
+        self.inflight.clear()
+        self.batch.clear()
+
+
+def _known_ids(config: Config, account: str) -> set[str]:
+    assert config.paths is not None
+    with Manifest.open(config.paths.state_dir, config.paths.maildir_root) as manifest:
+        manifest.update(account)
+        return set(manifest.message_ids(account))
+
+
+def run_import_mbox(
+    config: Config,
+    mboxes: list[Path],
+    *,
+    account: str | None = None,
+    folder: str = DEFAULT_FOLDER,
+    verbose: bool = False,
+    dry_run: bool = False,
+) -> int:
+    """Import mbox files into an account's Maildir, then index them.
+
+    Args:
+        mboxes: The mbox files, imported in order.
+        account: Account to import into (required with several accounts).
+        folder: Maildir folder under the account to deliver to.
+
+    Returns:
+        A process exit code: 0 if every file was imported and indexed.
+    """
+    assert config.paths is not None
+    if account is None and len(config.accounts) == 1:
+        account = next(iter(config.accounts))
+    if account not in config.accounts:
+        print(f"Unknown account: {account}" if account else "Choose an account with --account")
+        return 1
+
+    started = time.monotonic()
+    known = _known_ids(config, account)
+    target = config.paths.maildir_root / account / folder
+    writer = None if dry_run else _MaildirWriter(target, min(32, (os.cpu_count() or 1) * 4))
+    imported = duplicates = 0
+    failed = False
+    try:
+        for path in mboxes:
+            before = (imported, duplicates)
+            try:
+                for data in iter_mbox(path):
+                    message_id, seen = _headers(data)
+                    if message_id is None:
+                        # As recorded in the manifest, after notmuch.
+                        message_id = f"notmuch-sha1-{hashlib.sha1(data).hexdigest()}"
+                    if message_id in known:
+                        duplicates += 1
+                        continue
+                    known.add(message_id)
+                    imported += 1
+                    if writer is not None:
+                        writer.add(data, seen)
+            except (OSError, ValueError) as e:
+                print(f"Import of {path} failed: {e}")
+                failed = True
+                continue
+            if verbose or len(mboxes) > 1:
+                print(
+                    f"  {path}: {imported - before[0]} messages,"
+                    f" {duplicates - before[1]} duplicates skipped"
+                )
+        if writer is not None:
+            writer.close()
+    except DeliveryError as e:
+        print(f"Import stopped: {e}")
+        failed = True
+    finally:
+        if writer is not None:
+            writer.abort()
+
+    duration = time.monotonic() - started
+    if writer is not None:
+        imported = writer.delivered
+    if dry_run:
+        print(f"[dry-run] Would import {imported} messages into {target}")
+        print(f"[dry-run] {duplicates} duplicates would be skipped")
+        return 1 if failed else 0
+    print(
+        f"Imported {imported} messages into {target} ({duplicates} duplicates skipped,"
+        f" {duration:.1f}s)"
+    )
+    metrics.record(
+        config,
+        [
+            metrics.StageSample(
+                "import",
+                account,
+                ok=not failed,
+                duration_seconds=duration,
+                values={"messages": imported, "duplicates": duplicates},
+            )
+        ],
+    )
+
+    if imported:
+        result = run_index(config, verbose=verbose, accounts=[account])
+        if not result.ok:
+            return result.exit_code or 1
+    return 1 if failed else 0
@@ -1,13 +1,288 @@
-"""Index command: run notmuch new to index the Maildir."""
+"""Index command: add new Maildir files to the notmuch index.
+
+With ``[index] targeted`` (the default) only ``cur``/``new`` directories
+whose mtime changed since the last run are listed, optionally only under
+the accounts that just synced (see :mod:`email_archiver.index_state`), and
+their new and removed files are applied through the ``notmuch2`` bindings.
+A full ``notmuch new`` runs instead when the bindings are missing or fail,
+and every ``full_interval`` seconds.  Without the bindings the directory
+state isn't kept at all, since every run is a full ``notmuch new``.
+
+The in-process indexer also handles the initial import (``[index] bulk``):
+the database is created empty and every file is added in transactions of
+``batch_size`` files.  notmuch parses each file itself, so a process pool
+reads the next batches ahead of the single writer, which then indexes
+from the page cache; the readers also sniff the headers so non-mail files
+are skipped as ``notmuch new`` would.
+"""
 
 from __future__ import annotations
 
+import asyncio
 import os
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from email.parser import BytesHeaderParser
+from email.policy import compat32
+from functools import partial
 from pathlib import Path
+from types import ModuleType
 
+from email_archiver import metrics
 from email_archiver.config import Config
-from email_archiver.generate import ensure_notmuch_init, write_generated_configs
-from email_archiver.runner import RunResult, run_command
+from email_archiver.generate import NEW_TAGS, ensure_notmuch_init, write_generated_configs
+from email_archiver.index_state import IndexPlan, IndexState
+from email_archiver.runner import RunResult, async_run_command, run_command
+
+# Command recorded in the RunResult of an in-process (bindings) index run.
+TARGETED_COMMAND = ["notmuch2", "index"]
+
+# Below this many new files, starting reader processes costs more than it saves.
+_POOL_MIN_FILES = 2000
+
+# Batches read ahead of the writer.
+_READ_AHEAD = 2
+
+_READ_CHUNK = 1 << 20
+_HEADER_LIMIT = 256 * 1024
+
+
+def _report(result: RunResult) -> RunResult:
+    if result.ok:
+        print(f"Index completed successfully ({result.duration_seconds:.1f}s)")
+        if result.stdout.strip():
+            print(f"  {result.stdout.strip()}")
+    else:
+        print(f"Index failed (exit {result.exit_code})")
+        if result.stderr:
+            print(f"stderr: {result.stderr[:500]}")
+    return result
+
+
+def _record_metrics(config: Config, result: RunResult) -> None:
+    """Record the run with the counts parsed from notmuch's summary."""
+    metrics.record(
+        config,
+        [
+            metrics.StageSample(
+                "index",
+                metrics.ALL_ACCOUNTS,
+                ok=result.ok,
+                duration_seconds=result.duration_seconds,
+                values=metrics.parse_notmuch_new(result.stdout),
+            )
+        ],
+    )
+
+
+def _load_bindings() -> ModuleType | None:
+    try:
+        import notmuch2
+    except ImportError:
+        return None
+    return notmuch2
+
+
+def _targeted(config: Config) -> bool:
+    return config.index is not None and config.index.targeted
+
+
+@dataclass
+class _Pass:
+    """How one index run will go."""
+
+    # None when the bindings are missing: nothing to plan or commit.
+    plan: IndexPlan | None
+    bindings: ModuleType | None
+    # Run ``notmuch new`` for this reason instead of indexing in-process.
+    full_reason: str | None
+    # The plan covers all of maildir_root: record the run as a full pass.
+    covers_all: bool
+
+
+def _plan(config: Config, accounts: list[str] | None, full: bool) -> _Pass:
+    """Plan the run and decide whether it must be a full ``notmuch new``."""
+    assert config.index is not None
+    assert config.paths is not None
+    bindings = _load_bindings()
+    if bindings is None:
+        return _Pass(None, None, "notmuch2 bindings not installed", True)
+    with IndexState.open(config.paths.state_dir, config.paths.maildir_root) as state:
+        last_full = state.last_full
+        reason = None
+        if full:
+            reason = "full pass requested"
+        elif last_full is None and not config.index.bulk:
+            reason = "first run"
+        elif last_full is not None and time.time() - last_full >= config.index.full_interval:
+            reason = "periodic full pass"
+        covers_all = reason is not None or last_full is None
+        plan = state.plan(None if covers_all else accounts)
+    return _Pass(plan, bindings, reason, covers_all)
+
+
+def _read_ahead(root: Path, rel: str) -> bool:
+    """Read one file into the page cache; return whether it looks like mail."""
+    with open(root / rel, "rb") as f:
+        head = f.read(_HEADER_LIMIT)
+        while f.read(_READ_CHUNK):
+            pass
+    if not head.strip():
+        return False
+    end = head.find(b"\n\n")
+    headers = BytesHeaderParser(policy=compat32).parsebytes(head[: end + 1] if end >= 0 else head)
+    # Lenient on purpose: a skipped message would fail verification.
+    return bool(headers.keys())
+
+
+def _safe_read_ahead(root: Path, rel: str) -> bool | None:
+    try:
+        return _read_ahead(root, rel)
+    except FileNotFoundError:
+        return None  # moved again since it was listed; the next run sees it
+
+
+def _batches(
+    root: Path, paths: list[str], batch_size: int, workers: int
+) -> Iterator[list[tuple[str, bool | None]]]:
+    """Yield ``(path, is_mail)`` batches, read by ``workers`` processes ahead of the caller."""
+    chunks = [paths[i : i + batch_size] for i in range(0, len(paths), batch_size)]
+    read = partial(_safe_read_ahead, root)
+    if workers <= 1 or len(paths) < _POOL_MIN_FILES:
+        for chunk in chunks:
+            yield list(zip(chunk, map(read, chunk)))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        ahead: deque[tuple[list[str], Iterator[bool | None]]] = deque()
+        for chunk in chunks:
+            ahead.append((chunk, pool.map(read, chunk, chunksize=64)))
+            if len(ahead) > _READ_AHEAD:
+                done, results = ahead.popleft()
+                yield list(zip(done, results))
+        while ahead:
+            done, results = ahead.popleft()
+            yield list(zip(done, results))
+
+
+def _workers(config: Config) -> int:
+    assert config.index is not None
+    return config.index.workers or os.cpu_count() or 1
+
+
+def _apply(
+    bindings: ModuleType,
+    notmuch_config_path: Path,
+    root: Path,
+    plan: IndexPlan,
+    *,
+    batch_size: int,
+    workers: int,
+) -> str:
+    """Apply ``plan`` to the index as ``notmuch new`` would.
+
+    Files are added in transactions of ``batch_size``, so an interrupted
+    import keeps what it committed.  New files are added before removed
+    ones so a renamed file (flag change, ``new/`` → ``cur/``) keeps its
+    message and tags.
+
+    Returns:
+        A ``notmuch new``-style summary of what changed.
+    """
+    if not (plan.added or plan.removed):
+        return "No new mail."
+    added = ignored = 0
+    db = bindings.Database(mode=bindings.Database.MODE.READ_WRITE, config=str(notmuch_config_path))
+    with db:
+        for batch in _batches(root, plan.added, batch_size, workers):
+            with db.atomic():
+                for rel, is_mail in batch:
+                    if is_mail is None:
+                        continue
+                    if not is_mail:
+                        ignored += 1
+                        continue
+                    msg, duplicate = db.add(str(root / rel))
+                    if not duplicate:
+                        added += 1
+                        for tag in NEW_TAGS:
+                            msg.tags.add(tag)
+                    msg.tags.from_maildir_flags()
+        with db.atomic():
+            for rel in plan.removed:
+                db.remove(str(root / rel))
+    renamed = plan.renamed
+    summary = (
+        f"Added {added} new messages to the database. "
+        f"Removed {len(plan.removed) - renamed} messages. Detected {renamed} file renames."
+    )
+    if ignored:
+        summary += f" Ignored {ignored} non-mail files."
+    return summary
+
+
+def _index_in_process(config: Config, notmuch_config_path: Path, run: _Pass) -> RunResult | None:
+    """Index ``run.plan`` through the bindings; None if they failed and a full pass is needed."""
+    assert config.index is not None
+    assert config.paths is not None
+    assert run.bindings is not None
+    assert run.plan is not None
+    plan = run.plan
+    start = time.monotonic()
+    print(f"Indexing {len(plan.added)} new and {len(plan.removed)} removed file(s)")
+    try:
+        summary = _apply(
+            run.bindings,
+            notmuch_config_path,
+            config.paths.maildir_root,
+            plan,
+            batch_size=config.index.batch_size,
+            workers=_workers(config),
+        )
+    except Exception as e:  # any binding failure falls back to notmuch new
+        print(f"  notmuch bindings failed ({e}); falling back to notmuch new")
+        return None
+    return RunResult(TARGETED_COMMAND, 0, summary + "\n", "", time.monotonic() - start)
+
+
+def _init_db(config: Config, notmuch_config_path: Path) -> None:
+    """Create the notmuch database if needed.
+
+    When the first index will be in-process the database is created empty
+    through the bindings; otherwise ``notmuch new`` creates and fills it.
+    """
+    assert config.paths is not None
+    bindings = _load_bindings()
+    fresh = not (config.paths.maildir_root / ".notmuch").is_dir()
+    bulk = config.index is not None and config.index.targeted and config.index.bulk
+    if fresh and bulk and bindings is not None:
+        try:
+            config.paths.maildir_root.mkdir(parents=True, exist_ok=True)
+            bindings.Database.create(
+                path=str(config.paths.maildir_root), config=str(notmuch_config_path)
+            ).close()
+        except Exception as e:
+            print(f"  notmuch bindings failed ({e}); initializing with notmuch new")
+        else:
+            print("Initialized notmuch database.")
+            return
+    ensure_notmuch_init(config, notmuch_config_path)
+
+
+def _commit(config: Config, plan: IndexPlan, *, full: bool) -> None:
+    assert config.paths is not None
+    with IndexState.open(config.paths.state_dir, config.paths.maildir_root) as state:
+        state.commit(plan, full=full)
+
+
+def _dry_run(config: Config, cmd: list[str]) -> RunResult:
+    if _targeted(config):
+        print("[dry-run] Would index changed directories (full `notmuch new` when due)")
+    else:
+        print(f"[dry-run] Would execute: {' '.join(cmd)}")
+    return RunResult(command=cmd, exit_code=0, stdout="", stderr="", duration_seconds=0.0)
 
 
 def run_index(
@@ -16,14 +291,19 @@ def run_index(
     verbose: bool = False,
     dry_run: bool = False,
     notmuch_config_path: Path | None = None,
+    accounts: list[str] | None = None,
+    full: bool = False,
 ) -> RunResult:
-    """Run notmuch new to index the local Maildir.
+    """Index the local Maildir with notmuch.
 
     Args:
         config: Validated configuration.
         verbose: Print verbose output.
         dry_run: If True, only print what would be run.
         notmuch_config_path: Path to generated notmuch config (generated if not provided).
+        accounts: Only look for changes under these accounts' Maildirs
+            (targeted runs only; a full pass covers everything).
+        full: Run a full ``notmuch new`` even if a targeted run would do.
 
     Returns:
         RunResult from notmuch execution.
@@ -35,22 +315,79 @@ def run_index(
     cmd = ["notmuch", "new"]
 
     if dry_run:
-        print(f"[dry-run] Would execute: {' '.join(cmd)}")
-        return RunResult(command=cmd, exit_code=0, stdout="", stderr="", duration_seconds=0.0)
+        return _dry_run(config, cmd)
 
     # Auto-initialize notmuch database if needed
-    ensure_notmuch_init(config, notmuch_config_path)
+    _init_db(config, notmuch_config_path)
 
-    print(f"Running: {' '.join(cmd)}")
-    result = run_command(cmd, env=env, stream=verbose)
+    if not _targeted(config):
+        print(f"Running: {' '.join(cmd)}")
+        result = run_command(cmd, env=env, stream=verbose)
+        _record_metrics(config, result)
+        return _report(result)
 
-    if result.ok:
-        print(f"Index completed successfully ({result.duration_seconds:.1f}s)")
-        if result.stdout.strip():
-            print(f"  {result.stdout.strip()}")
-    else:
-        print(f"Index failed (exit {result.exit_code})")
-        if result.stderr:
-            print(f"stderr: {result.stderr[:500]}")
+    run = _plan(config, accounts, full)
+    result = None
+    if run.full_reason is None:
+        result = _index_in_process(config, notmuch_config_path, run)
+        if result is None:
+            run = _plan(config, None, True)
+            run.full_reason = "bindings failed"
+    if result is None:
+        print(f"Running: {' '.join(cmd)} ({run.full_reason})")
+        result = run_command(cmd, env=env, stream=verbose)
+    if result.ok and run.plan is not None:
+        _commit(config, run.plan, full=run.covers_all)
+    _record_metrics(config, result)
+    return _report(result)
 
-    return result
+
+async def async_run_index(
+    config: Config,
+    *,
+    verbose: bool = False,
+    dry_run: bool = False,
+    notmuch_config_path: Path | None = None,
+    timeout: float | None = None,
+    accounts: list[str] | None = None,
+    full: bool = False,
+) -> RunResult:
+    """Coroutine version of :func:`run_index`.
+
+    Cancelling it terminates ``notmuch new``, which leaves the database
+    consistent (notmuch commits in transactions) and resumes next run.
+
+    Args:
+        timeout: Time limit in seconds for ``notmuch new``.
+    """
+    if notmuch_config_path is None:
+        _, notmuch_config_path = write_generated_configs(config)
+
+    env = {**os.environ, "NOTMUCH_CONFIG": str(notmuch_config_path)}
+    cmd = ["notmuch", "new"]
+
+    if dry_run:
+        return _dry_run(config, cmd)
+
+    await asyncio.to_thread(_init_db, config, notmuch_config_path)
+
+    if not _targeted(config):
+        print(f"Running: {' '.join(cmd)}")
+        result = await async_run_command(cmd, env=env, stream=verbose, timeout=timeout)
+        await asyncio.to_thread(_record_metrics, config, result)
+        return _report(result)
+
+    run = await asyncio.to_thread(_plan, config, accounts, full)
+    result = None
+    if run.full_reason is None:
+        result = await asyncio.to_thread(_index_in_process, config, notmuch_config_path, run)
+        if result is None:
+            run = await asyncio.to_thread(_plan, config, None, True)
+            run.full_reason = "bindings failed"
+    if result is None:
+        print(f"Running: {' '.join(cmd)} ({run.full_reason})")
+        result = await async_run_command(cmd, env=env, stream=verbose, timeout=timeout)
+    if result.ok and run.plan is not None:
+        await asyncio.to_thread(_commit, config, run.plan, full=run.covers_all)
+    await asyncio.to_thread(_record_metrics, config, result)
+    return _report(result)
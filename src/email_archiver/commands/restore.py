@@ -0,0 +1,118 @@
+"""Restore command: list and restore snapshots of the native backup store."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from email_archiver import metrics
+from email_archiver.config import Config
+from email_archiver.packstore import PackStore, Snapshot, StoreError
+
+
+def _find(snapshots: list[Snapshot], wanted: str | None, account: str | None) -> Snapshot | None:
+    """Return snapshot ``wanted``, or the newest one that covers ``account``.
+
+    An account's own snapshot holds only that account, so without
+    ``account`` the latest whole-archive snapshot is chosen.
+    """
+    if wanted is not None:
+        return next((s for s in snapshots if s.id == wanted), None)
+    scopes = {metrics.ALL_ACCOUNTS} if account is None else {metrics.ALL_ACCOUNTS, account}
+    return next((s for s in reversed(snapshots) if s.scope in scopes), None)
+
+
+def run_restore(
+    config: Config,
+    target: Path | None,
+    *,
+    snapshot: str | None = None,
+    account: str | None = None,
+    list_only: bool = False,
+    verbose: bool = False,
+    dry_run: bool = False,
+) -> int:
+    """List snapshots, or restore one (default: the latest) under ``target``.
+
+    The latest snapshot is the newest one of all accounts or, with
+    ``account``, the newest one of all accounts or of that account.
+
+    Files are written to ``target/<path>`` with their Maildir ``tmp/``
+    siblings, so ``target`` can be used as a ``maildir_root``.  Existing
+    files are never overwritten.
+
+    Args:
+        account: Only restore this account's files.
+
+    Returns:
+        A process exit code: 0 if every file was restored, 1 if no file of
+        the snapshot belongs to ``account``.
+    """
+    assert config.backup is not None
+    # With several targets, restore from the first one with a repository.
+    repository = config.backup.repository or next(
+        (t.repository for t in config.backup.targets.values() if t.repository), None
+    )
+    if repository is None or not (repository / "index.sqlite3").exists():
+        print(f"No native backup repository at {repository}")
+        return 1
+    try:
+        with PackStore(repository, read_only=True) as store:
+            snapshots = store.snapshots()
+            if list_only:
+                for s in snapshots:
+                    print(f"{s.id}  {s.scope:<12} {s.files} files, {s.bytes / 1024 / 1024:.1f} MiB")
+                return 0
+            chosen = _find(snapshots, snapshot, account)
+            if chosen is None:
+                if snapshot is not None:
+                    print(f"Snapshot {snapshot} not found")
+                else:
+                    scope = f"account '{account}'" if account else "all accounts"
+                    print(f"No snapshot of {scope} found")
+                return 1
+            if target is None:
+                print("A target directory is required to restore")
+                return 1
+            return _restore(store, chosen, target, account, verbose=verbose, dry_run=dry_run)
+    except (OSError, StoreError) as e:
+        print(f"Restore failed: {e}")
+        return 1
+
+
+def _restore(
+    store: PackStore,
+    snapshot: Snapshot,
+    target: Path,
+    account: str | None,
+    *,
+    verbose: bool,
+    dry_run: bool,
+) -> int:
+    prefix = account + os.sep if account else ""
+    matched = restored = skipped = 0
+    print(f"Restoring snapshot {snapshot.id} to {target}...")
+    for rel, _, sha256 in store.snapshot_entries(snapshot.id):
+        if not rel.startswith(prefix):
+            continue
+        matched += 1
+        path = target / rel
+        if path.exists():
+            skipped += 1
+            continue
+        if dry_run:
+            print(f"[dry-run] Would restore {rel}")
+            continue
+        data = store.read(sha256)
+        if not path.parent.is_dir():
+            path.parent.mkdir(parents=True)
+            (path.parent.parent / "tmp").mkdir(exist_ok=True)
+        path.write_bytes(data)
+        restored += 1
+        if verbose:
+            print(f"  {rel}")
+    if not matched:
+        print(f"Snapshot {snapshot.id} has no files of account '{account}'")
+        return 1
+    print(f"Restored {restored} files ({skipped} already present)")
+    return 0
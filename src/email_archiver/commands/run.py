@@ -1,83 +1,242 @@
-"""Run command: orchestrated sync → index → verify → (optional) backup."""
+"""Run command: orchestrated sync → index → verify → (optional) backup.
+
+Stages are overlapped per account rather than run as global barriers:
+
+    sync(acct) ──► index ──► verify(acct) ──► backup(acct)
+
+Each account moves on to indexing as soon as its own sync finishes, so a
+small account is indexed, verified and (with a per-account backup command)
+backed up while a large one is still syncing.  The notmuch database is
+single-writer, so index runs are serialized and coalesced: one run that
+starts after several accounts finished syncing covers all of them, looking
+for changes only under those accounts' Maildirs.
+"""
 
 from __future__ import annotations
 
-from email_archiver.commands.backup import run_backup
-from email_archiver.commands.index import run_index
-from email_archiver.commands.sync import run_sync
-from email_archiver.commands.verify import run_verify
+import asyncio
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from email_archiver.commands.backup import async_run_backup, uses_account_placeholder
+from email_archiver.commands.index import async_run_index
+from email_archiver.commands.sync import async_run_sync
+from email_archiver.commands.verify import async_run_verify
 from email_archiver.config import Config
 from email_archiver.generate import write_generated_configs
+from email_archiver.runner import AggregateResult, RunResult, run_async
 
 
-def run_all(
-    config: Config,
-    *,
-    account: str | None = None,
-    verbose: bool = False,
-    dry_run: bool = False,
-) -> int:
-    """Run the full orchestration pipeline: sync → index → verify → backup.
+@dataclass
+class AccountOutcome:
+    """How far one account got through the pipeline."""
 
-    Returns:
-        Exit code (0 for success, non-zero for failure).
+    account: str
+    stage: str
+    exit_code: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+class IndexCoalescer:
+    """Serialize ``notmuch new`` runs and let one run serve many requests.
+
+    A request made at time *t* is satisfied by any index run that started
+    after *t*, because that run sees every file on disk at *t* under the
+    accounts requested so far (or the whole Maildir, if any request named
+    no account).
     """
-    # Generate configs once for the whole pipeline
-    mbsyncrc_path, notmuch_config_path = write_generated_configs(config)
 
-    # Step 1: Sync
-    print("=" * 60)
-    print("Step 1/3: Sync")
-    print("=" * 60)
-    sync_result = run_sync(
-        config,
-        account=account,
-        verbose=verbose,
-        dry_run=dry_run,
-        mbsyncrc_path=mbsyncrc_path,
-    )
-    if not sync_result.ok:
-        print("\nSync failed — aborting pipeline.")
-        return sync_result.exit_code
+    def __init__(
+        self,
+        config: Config,
+        notmuch_config_path: Path,
+        *,
+        verbose: bool,
+        dry_run: bool,
+    ) -> None:
+        self.config = config
+        self.notmuch_config_path = notmuch_config_path
+        self.verbose = verbose
+        self.dry_run = dry_run
+        self._lock = asyncio.Lock()
+        self._last_start: float | None = None
+        self._last_result: RunResult | None = None
+        # Accounts requested since the last run started; None means all.
+        self._pending: set[str] | None = set()
+
+    async def index_since(
+        self, requested_at: float, accounts: Iterable[str] | None = None
+    ) -> RunResult:
+        """Index changes made before ``requested_at`` under ``accounts`` (default: all)."""
+        if accounts is None or self._pending is None:
+            self._pending = None
+        else:
+            self._pending.update(accounts)
+        async with self._lock:
+            if self._last_start is not None and self._last_start >= requested_at:
+                assert self._last_result is not None
+                return self._last_result
+            self._last_start = time.monotonic()
+            pending, self._pending = self._pending, set()
+            self._last_result = await async_run_index(
+                self.config,
+                verbose=self.verbose,
+                dry_run=self.dry_run,
+                notmuch_config_path=self.notmuch_config_path,
+                accounts=sorted(pending) if pending is not None else None,
+            )
+            return self._last_result
 
-    # Step 2: Index
+
+def _banner(text: str) -> None:
     print()
     print("=" * 60)
-    print("Step 2/3: Index")
+    print(text)
     print("=" * 60)
-    index_result = run_index(
-        config,
-        verbose=verbose,
-        dry_run=dry_run,
-        notmuch_config_path=notmuch_config_path,
-    )
+
+
+async def _account_pipeline(
+    config: Config,
+    account: str,
+    sync_result: AggregateResult,
+    indexer: IndexCoalescer,
+    backup_lock: asyncio.Lock,
+    *,
+    notmuch_config_path: Path,
+    verbose: bool,
+    dry_run: bool,
+    per_account_backup: bool,
+) -> AccountOutcome:
+    """Index, verify and optionally back up one account after its sync."""
+    if not sync_result.ok:
+        print(f"\n[{account}] Sync failed — skipping index and verify.")
+        return AccountOutcome(account, "sync", sync_result.exit_code)
+
+    index_result = await indexer.index_since(time.monotonic(), [account])
     if not index_result.ok:
-        print("\nIndex failed — aborting pipeline.")
-        return index_result.exit_code
+        print(f"\n[{account}] Index failed — skipping verify.")
+        return AccountOutcome(account, "index", index_result.exit_code)
 
-    # Step 3: Verify
-    print()
-    print("=" * 60)
-    print("Step 3/3: Verify")
-    print("=" * 60)
-    report = run_verify(
+    _banner(f"Verify: {account}")
+    report = await async_run_verify(
         config,
         account=account,
         verbose=verbose,
         notmuch_config_path=notmuch_config_path,
     )
     if report["status"] != "PASS":
-        print("\nVerification FAILED — skipping backup.")
-        return 1
+        print(f"\n[{account}] Verification FAILED — skipping backup.")
+        return AccountOutcome(account, "verify", 1)
 
-    # Optional Step 4: Backup (only if verify passed and configured)
     assert config.orchestration is not None
-    if config.orchestration.backup_after_verify:
+    if config.orchestration.backup_after_verify and per_account_backup:
+        # Backup tools generally lock their repository: one at a time.
+        async with backup_lock:
+            _banner(f"Backup: {account} (verify passed)")
+            backup_result = await async_run_backup(
+                config, verbose=verbose, dry_run=dry_run, account=account
+            )
+        if not backup_result.ok:
+            print(f"\n[{account}] Backup failed.")
+            return AccountOutcome(account, "backup", backup_result.exit_code)
+    return AccountOutcome(account, "done")
+
+
+async def async_run_all(
+    config: Config,
+    *,
+    account: str | None = None,
+    verbose: bool = False,
+    dry_run: bool = False,
+    generated: tuple[Path, Path] | None = None,
+    indexer: IndexCoalescer | None = None,
+    backup_lock: asyncio.Lock | None = None,
+    archive_backup: bool = True,
+    host_slots: dict[str, asyncio.Semaphore] | None = None,
+) -> int:
+    """Coroutine version of :func:`run_all`.
+
+    Long-running callers (the daemon) pass ``generated`` — the
+    ``(mbsyncrc, notmuch config)`` paths — and a shared ``indexer`` so
+    configs are written once and concurrent runs share index passes.
+    They also pass a shared ``backup_lock``, so backups of concurrent runs
+    never overlap, and ``archive_backup=False`` to leave a whole-archive
+    backup to the caller instead of running one per call.  Shared
+    ``host_slots`` cap the mbsync processes of all runs per IMAP host (see
+    :func:`~email_archiver.commands.sync.async_run_sync`).
+    """
+    # Generate configs once for the whole pipeline
+    if generated is None:
+        generated = write_generated_configs(config)
+    mbsyncrc_path, notmuch_config_path = generated
+
+    if indexer is None:
+        indexer = IndexCoalescer(config, notmuch_config_path, verbose=verbose, dry_run=dry_run)
+    if backup_lock is None:
+        backup_lock = asyncio.Lock()
+    per_account_backup = uses_account_placeholder(config)
+    downstream: dict[str, asyncio.Task[AccountOutcome]] = {}
+
+    def on_synced(name: str, result: AggregateResult) -> None:
+        downstream[name] = asyncio.ensure_future(
+            _account_pipeline(
+                config,
+                name,
+                result,
+                indexer,
+                backup_lock,
+                notmuch_config_path=notmuch_config_path,
+                verbose=verbose,
+                dry_run=dry_run,
+                per_account_backup=per_account_backup,
+            )
+        )
+
+    _banner("Sync → index → verify (per account, overlapped)")
+    try:
+        sync_result = await async_run_sync(
+            config,
+            account=account,
+            verbose=verbose,
+            dry_run=dry_run,
+            mbsyncrc_path=mbsyncrc_path,
+            on_account_done=on_synced,
+            host_slots=host_slots,
+        )
+        outcomes = await asyncio.gather(*downstream.values())
+    finally:
+        pending = [t for t in downstream.values() if not t.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if not downstream:
+        if sync_result.ok:
+            # The STATUS probe found nothing to sync: nothing new to verify.
+            print("\nNo folder changed since the last run; nothing to do.")
+            return 0
+        # Nothing reached the downstream stages (e.g. unknown account).
+        print("\nSync failed — aborting pipeline.")
+        return sync_result.exit_code or 1
+
+    failed = [o for o in outcomes if not o.ok]
+    if failed:
         print()
-        print("=" * 60)
-        print("Bonus: Backup (verify passed)")
-        print("=" * 60)
-        backup_result = run_backup(config, verbose=verbose, dry_run=dry_run)
+        for o in failed:
+            print(f"  {o.account}: failed at {o.stage} (exit {o.exit_code})")
+        return failed[0].exit_code if failed[0].exit_code > 0 else 1
+
+    # A single backup of the whole archive runs once every account passed.
+    assert config.orchestration is not None
+    if config.orchestration.backup_after_verify and not per_account_backup and archive_backup:
+        async with backup_lock:
+            _banner("Backup (verify passed)")
+            backup_result = await async_run_backup(config, verbose=verbose, dry_run=dry_run)
         if not backup_result.ok:
             print("\nBackup failed.")
             return backup_result.exit_code
@@ -85,3 +244,27 @@ def run_all(
     print()
     print("Pipeline completed successfully.")
     return 0
+
+
+def run_all(
+    config: Config,
+    *,
+    account: str | None = None,
+    verbose: bool = False,
+    dry_run: bool = False,
+) -> int:
+    """Run the full orchestration pipeline: sync → index → verify → backup.
+
+    Accounts flow through the stages independently (see the module
+    docstring).  If the backup command contains ``{account}``, each account
+    is backed up as soon as it verifies; otherwise one backup runs after
+    every account has passed.  SIGTERM/SIGINT stop every running child.
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    try:
+        return run_async(async_run_all(config, account=account, verbose=verbose, dry_run=dry_run))
+    except asyncio.CancelledError:
+        print("\nPipeline interrupted.")
+        return 130
@@ -2,31 +2,336 @@
 
 from __future__ import annotations
 
+import asyncio
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
 
+from email_archiver import metrics, synclock
+from email_archiver.concurrency import AdaptiveLimiter, Task, async_run_scheduled, run_scheduled
 from email_archiver.config import Config
-from email_archiver.generate import write_generated_configs
-from email_archiver.runner import RunResult, run_command
+from email_archiver.generate import channel_name, local_folder_name, write_generated_configs
+from email_archiver.history import SyncHistory
+from email_archiver.probe import ProbeResult, StatusCache, probe_changes
+from email_archiver.progress import ProgressBoard, ProgressSink, TransferStats, board_for
+from email_archiver.runner import AggregateResult, RunResult, async_run_command, run_command
+from email_archiver.sinks import ConsoleSink, OutputSink, RotatingFileSink
 
 
-def _write_log(config: Config, result: RunResult, account: str) -> Path:
-    """Write a sync run log to the logs directory."""
-    assert config.paths is not None
-    log_dir = config.paths.logs_dir / account
-    log_dir.mkdir(parents=True, exist_ok=True)
+@dataclass
+class SyncTarget:
+    """One mbsync invocation: an account Group or a single folder Channel."""
+
+    name: str
+    account: str
+    host: str
+    folders: list[str] = field(default_factory=list)
 
+
+def _open_log(config: Config, account: str, label: str | None = None) -> RotatingFileSink:
+    """Open a sync log in the logs directory that mbsync output streams into."""
+    assert config.paths is not None
     ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    log_path = log_dir / f"sync-{ts}.log"
-    log_path.write_text(
-        f"command: {' '.join(result.command)}\n"
-        f"exit_code: {result.exit_code}\n"
-        f"duration: {result.duration_seconds:.1f}s\n"
-        f"--- stdout ---\n{result.stdout}\n"
-        f"--- stderr ---\n{result.stderr}\n",
-        encoding="utf-8",
+    suffix = f"-{label}" if label else ""
+    return RotatingFileSink(config.paths.logs_dir / account / f"sync-{ts}{suffix}.log")
+
+
+def build_targets(
+    config: Config,
+    account: str | None = None,
+    *,
+    folders: dict[str, list[str]] | None = None,
+) -> list[SyncTarget]:
+    """List the mbsync targets to run, one per account or per folder Channel.
+
+    Args:
+        folders: Only sync these folders, keyed by account; accounts that
+            are missing or map to no folders are skipped.  Folders are synced
+            as individual Channels unless the whole account is listed.
+
+    Raises:
+        KeyError: If ``account`` is not a configured account name.
+    """
+    assert config.sync is not None
+    names = [account] if account else list(config.accounts)
+    targets: list[SyncTarget] = []
+    for name in names:
+        acct = config.accounts[name]
+        wanted = acct.folders
+        if folders is not None:
+            wanted = [f for f in acct.folders if f in folders.get(name, ())]
+        if config.sync.per_channel or len(wanted) < len(acct.folders):
+            for folder in wanted:
+                targets.append(
+                    SyncTarget(channel_name(name, folder), name, acct.imap_host, [folder])
+                )
+        elif wanted:
+            targets.append(SyncTarget(name, name, acct.imap_host, list(wanted)))
+    return targets
+
+
+def _mbsync_command(mbsyncrc_path: Path, target: SyncTarget, *, verbose: bool) -> list[str]:
+    cmd = ["mbsync", "-c", str(mbsyncrc_path)]
+    if verbose:
+        cmd.append("-V")
+    cmd.append(target.name)
+    return cmd
+
+
+def _start_log(
+    config: Config, target: SyncTarget, cmd: list[str], board: ProgressBoard, *, verbose: bool
+) -> tuple[RotatingFileSink, list[OutputSink], TransferStats]:
+    """Announce ``cmd`` and open the sinks its output streams into."""
+    stats = board.start(target.name, target.account)
+    print(f"Running: {' '.join(cmd)}")
+    label = target.name if target.name != target.account else None
+    log = _open_log(config, target.account, label)
+    log.write_raw(f"command: {' '.join(cmd)}\n--- output ---\n")
+    downstream: list[OutputSink] = [log]
+    if verbose:
+        downstream.append(ConsoleSink(prefix=f"[{target.name}] "))
+    return log, [ProgressSink(stats, board, downstream)], stats
+
+
+def _measure(config: Config, target: SyncTarget, stats: TransferStats) -> None:
+    """Count the files and bytes ``target`` delivered to the Maildir."""
+    assert config.paths is not None
+    root = config.paths.maildir_root / target.account
+    for folder in target.folders:
+        messages, size = metrics.delivered_since(root / local_folder_name(folder), stats.started_ns)
+        stats.delivered += messages
+        stats.bytes += size
+
+
+def _finish(
+    target: SyncTarget,
+    result: RunResult,
+    log: RotatingFileSink,
+    history: SyncHistory,
+    board: ProgressBoard,
+    stats: TransferStats,
+    *,
+    verbose: bool,
+) -> RunResult:
+    board.finish(stats)
+    log.write_raw(
+        f"--- end ---\nexit_code: {result.exit_code}\nduration: {result.duration_seconds:.1f}s\n"
+        f"transfer: {stats.summary()}\n"
+    )
+    log.close()
+    history.record(target.name, result.duration_seconds, result.exit_code)
+    if verbose:
+        print(f"Log written to {log.path}")
+
+    if result.ok:
+        print(
+            f"Sync of '{target.name}' completed ({result.duration_seconds:.1f}s; {stats.summary()})"
+        )
+    else:
+        print(f"Sync of '{target.name}' failed (exit {result.exit_code})")
+        if result.stderr:
+            print(f"stderr: {result.stderr[:500]}")
+    return result
+
+
+def _sync_one(
+    config: Config,
+    target: SyncTarget,
+    mbsyncrc_path: Path,
+    history: SyncHistory,
+    board: ProgressBoard,
+    *,
+    verbose: bool,
+) -> RunResult:
+    assert config.sync is not None
+    cmd = _mbsync_command(mbsyncrc_path, target, verbose=verbose)
+    log, sinks, stats = _start_log(config, target, cmd, board, verbose=verbose)
+    try:
+        result = run_command(cmd, sinks=sinks, pty=config.sync.progress)
+    except BaseException:
+        log.close()
+        raise
+    _measure(config, target, stats)
+    return _finish(target, result, log, history, board, stats, verbose=verbose)
+
+
+async def _async_sync_one(
+    config: Config,
+    target: SyncTarget,
+    mbsyncrc_path: Path,
+    history: SyncHistory,
+    board: ProgressBoard,
+    *,
+    verbose: bool,
+    timeout: float | None,
+) -> RunResult:
+    assert config.sync is not None
+    cmd = _mbsync_command(mbsyncrc_path, target, verbose=verbose)
+    log, sinks, stats = _start_log(config, target, cmd, board, verbose=verbose)
+    try:
+        result = await async_run_command(
+            cmd, sinks=sinks, timeout=timeout, pty=config.sync.progress
+        )
+        await asyncio.to_thread(_measure, config, target, stats)
+    except BaseException:
+        log.close()
+        raise
+    return _finish(target, result, log, history, board, stats, verbose=verbose)
+
+
+def _crashed(name: str, error: Exception) -> RunResult:
+    """A failed result for a target whose sync raised instead of finishing."""
+    print(f"  [{name}] Sync crashed: {error!r}")
+    return RunResult(["mbsync", name], 1, "", repr(error), 0.0)
+
+
+def _plan(
+    config: Config,
+    account: str | None,
+    mbsyncrc_path: Path,
+    *,
+    verbose: bool,
+    dry_run: bool,
+    folders: dict[str, list[str]] | None = None,
+) -> AggregateResult | list[SyncTarget]:
+    """Resolve the targets to sync, or the final result if nothing will run."""
+    try:
+        targets = build_targets(config, account, folders=folders)
+    except KeyError:
+        print(f"Unknown account '{account}'")
+        cmd = ["mbsync", "-c", str(mbsyncrc_path), str(account)]
+        result = RunResult(cmd, 2, "", f"Unknown account: {account}", 0.0)
+        return AggregateResult(results={str(account): result})
+
+    if dry_run:
+        results: dict[str, RunResult] = {}
+        for target in targets:
+            cmd = _mbsync_command(mbsyncrc_path, target, verbose=verbose)
+            print(f"[dry-run] Would execute: {' '.join(cmd)}")
+            results[target.name] = RunResult(cmd, 0, "", "", 0.0)
+        return AggregateResult(results=results)
+    return targets
+
+
+def _probe(config: Config, account: str | None) -> tuple[StatusCache, ProbeResult]:
+    """Run the STATUS probe and report what it found."""
+    assert config.paths is not None
+    cache = StatusCache.load(config.paths.state_dir)
+    probe = probe_changes(config, cache, account=account)
+    for name, error in probe.errors.items():
+        print(f"Probe of '{name}' failed ({error}); syncing all of its folders")
+    changed = sum(len(f) for f in probe.changed.values())
+    print(f"Probe: {changed} folder(s) changed, {probe.unchanged} unchanged")
+    return cache, probe
+
+
+def _record_probe(
+    cache: StatusCache,
+    probe: ProbeResult,
+    targets: list[SyncTarget],
+    results: dict[str, RunResult],
+) -> None:
+    """Remember the probed STATUS of every folder that synced successfully."""
+    now = time.time()
+    for target in targets:
+        result = results.get(target.name)
+        if result is None or not result.ok:
+            continue
+        for folder in target.folders:
+            status = probe.statuses.get((target.account, folder))
+            if status is not None:
+                cache.record(target.account, folder, status, now)
+    cache.save()
+
+
+def _wants_probe(
+    config: Config, account: str | None, folders: dict[str, list[str]] | None, dry_run: bool
+) -> bool:
+    assert config.sync is not None
+    known = account is None or account in config.accounts
+    return config.sync.probe and folders is None and not dry_run and known
+
+
+def _record_metrics(
+    config: Config,
+    targets: list[SyncTarget],
+    results: dict[str, RunResult],
+    board: ProgressBoard,
+    started_ns: int,
+    duration_seconds: float,
+) -> None:
+    """Record per-account sync samples (time in mbsync, files delivered)."""
+    if not metrics.enabled(config):
+        return
+    assert config.paths is not None
+    by_account: dict[str, list[RunResult]] = {}
+    for target in targets:
+        if target.name in results:
+            by_account.setdefault(target.account, []).append(results[target.name])
+
+    samples = []
+    for name, runs in by_account.items():
+        messages, size = metrics.delivered_since(config.paths.maildir_root / name, started_ns)
+        duration = sum(r.duration_seconds for r in runs)
+        pulled = sum(s.pulled for s in board.stats.values() if s.account == name)
+        samples.append(
+            metrics.StageSample(
+                "sync",
+                name,
+                ok=all(r.ok for r in runs),
+                duration_seconds=duration,
+                values={
+                    "targets": len(runs),
+                    "failed_targets": sum(1 for r in runs if not r.ok),
+                    "messages_added": messages,
+                    "bytes_added": size,
+                    "messages_pulled": pulled,
+                    "messages_per_second": round(pulled / duration, 3) if duration else 0,
+                },
+            )
+        )
+    runs = list(results.values())
+    pulled = sum(s.values["messages_pulled"] for s in samples)
+    samples.append(
+        metrics.StageSample(
+            "sync",
+            metrics.ALL_ACCOUNTS,
+            ok=all(r.ok for r in runs),
+            duration_seconds=duration_seconds,
+            values={
+                "targets": len(runs),
+                "failed_targets": sum(1 for r in runs if not r.ok),
+                "messages_added": sum(s.values["messages_added"] for s in samples),
+                "bytes_added": sum(s.values["bytes_added"] for s in samples),
+                "messages_pulled": pulled,
+                "messages_per_second": (
+                    round(pulled / duration_seconds, 3) if duration_seconds else 0
+                ),
+            },
+        )
     )
-    return log_path
+    metrics.record(config, samples)
+
+
+def _limiter(config: Config) -> AdaptiveLimiter:
+    assert config.sync is not None
+    if config.sync.adaptive:
+        return AdaptiveLimiter(
+            config.sync.concurrency,
+            maximum=max(config.sync.max_concurrency, config.sync.concurrency),
+        )
+    return AdaptiveLimiter.fixed(config.sync.concurrency)
+
+
+def _report(aggregate: AggregateResult) -> AggregateResult:
+    if aggregate.ok:
+        print(f"Sync completed successfully ({aggregate.duration_seconds:.1f}s)")
+    else:
+        print(f"Sync failed for: {', '.join(aggregate.failed)}")
+    return aggregate
 
 
 def run_sync(
@@ -36,8 +341,31 @@ def run_sync(
     verbose: bool = False,
     dry_run: bool = False,
     mbsyncrc_path: Path | None = None,
-) -> RunResult:
-    """Run mbsync for configured accounts/channels.
+    folders: dict[str, list[str]] | None = None,
+) -> AggregateResult:
+    """Run mbsync for configured accounts/channels on a bounded worker pool.
+
+    One mbsync process is started per account (or per folder Channel when
+    ``[sync] per_channel`` is set).  At most ``[sync] concurrency`` processes
+    run at once, and at most ``max_connections_per_host`` against any single
+    IMAP host.
+
+    Targets are started longest-first according to the durations recorded in
+    ``<state_dir>/sync-history.json``, so big folders don't dominate the tail
+    of the run.  With ``[sync] adaptive`` the concurrency limit moves between
+    1 and ``max_concurrency`` based on throughput and error rate.
+
+    With ``[sync] probe`` each account's folders are first checked with IMAP
+    STATUS over one connection (see :mod:`email_archiver.probe`) and only
+    folders that changed since their last successful sync are passed to
+    mbsync.
+
+    With ``[sync] progress`` mbsync runs under a pty so it reports its
+    counters, which are shown live and written to the sync logs and
+    metrics (see :mod:`email_archiver.progress`).
+
+    mbsync runs under the shared sync lock (see :mod:`email_archiver.synclock`),
+    waiting while ``dedupe --link`` holds it.
 
     Args:
         config: Validated configuration.
@@ -45,38 +373,181 @@ def run_sync(
         verbose: Print verbose output.
         dry_run: If True, only print what would be run.
         mbsyncrc_path: Path to generated mbsyncrc (generated if not provided).
+        folders: Only sync these folders, keyed by account (see build_targets).
 
     Returns:
-        RunResult from mbsync execution.
+        AggregateResult keyed by target (account or channel) name.
     """
+    assert config.sync is not None
+    assert config.paths is not None
     if mbsyncrc_path is None:
         mbsyncrc_path, _ = write_generated_configs(config)
 
-    # Determine which group to sync
-    target_account = account or next(iter(config.accounts))
-    cmd = ["mbsync", "-c", str(mbsyncrc_path)]
-    if verbose:
-        cmd.append("-V")
-    cmd.append(target_account)
+    probe = None
+    if _wants_probe(config, account, folders, dry_run):
+        cache, probe = _probe(config, account)
+        folders = probe.changed
 
-    if dry_run:
-        print(f"[dry-run] Would execute: {' '.join(cmd)}")
-        return RunResult(command=cmd, exit_code=0, stdout="", stderr="", duration_seconds=0.0)
+    targets = _plan(
+        config, account, mbsyncrc_path, verbose=verbose, dry_run=dry_run, folders=folders
+    )
+    if isinstance(targets, AggregateResult):
+        return targets
 
-    print(f"Running: {' '.join(cmd)}")
-    result = run_command(cmd, stream=verbose)
+    history = SyncHistory.load(config.paths.state_dir)
+    board = board_for(config.paths.state_dir, enabled=config.sync.progress, verbose=verbose)
+    by_name = {t.name: t for t in targets}
+    ordered = [by_name[name] for name in history.order(list(by_name))]
+    tasks = [
+        Task(
+            name=t.name,
+            key=t.host,
+            fn=lambda t=t: _sync_one(config, t, mbsyncrc_path, history, board, verbose=verbose),
+            cost=history.expected_duration(t.name) or 1.0,
+        )
+        for t in ordered
+    ]
 
-    # Write log
-    acct_name = account or "default"
-    log_path = _write_log(config, result, acct_name)
-    if verbose:
-        print(f"Log written to {log_path}")
+    start = time.monotonic()
+    started_ns = time.time_ns()
+    try:
+        with synclock.shared(config.paths.state_dir):
+            results = run_scheduled(
+                tasks,
+                limiter=_limiter(config),
+                per_key_limit=config.sync.max_connections_per_host,
+                is_ok=lambda r: r.ok,
+                on_error=lambda task, e: _crashed(task.name, e),
+            )
+    finally:
+        board.close()
+    aggregate = AggregateResult(
+        results={t.name: results[t.name] for t in targets},
+        duration_seconds=time.monotonic() - start,
+    )
+    history.save()
+    if probe is not None:
+        _record_probe(cache, probe, targets, results)
+    _record_metrics(config, targets, results, board, started_ns, aggregate.duration_seconds)
+    return _report(aggregate)
 
-    if result.ok:
-        print(f"Sync completed successfully ({result.duration_seconds:.1f}s)")
-    else:
-        print(f"Sync failed (exit {result.exit_code})")
-        if result.stderr:
-            print(f"stderr: {result.stderr[:500]}")
 
-    return result
+async def async_run_sync(
+    config: Config,
+    *,
+    account: str | None = None,
+    verbose: bool = False,
+    dry_run: bool = False,
+    mbsyncrc_path: Path | None = None,
+    timeout: float | None = None,
+    folders: dict[str, list[str]] | None = None,
+    on_account_done: Callable[[str, AggregateResult], None] | None = None,
+    host_slots: dict[str, asyncio.Semaphore] | None = None,
+) -> AggregateResult:
+    """Coroutine version of :func:`run_sync`.
+
+    Scheduling is identical, but each mbsync runs as an asyncio subprocess
+    rather than on a worker thread.  Cancelling the coroutine terminates
+    every running mbsync; history for targets that already finished is
+    still saved.
+
+    Args:
+        timeout: Per-target time limit in seconds; a target that exceeds it
+            is terminated and reported as failed (exit -1).
+        folders: Only sync these folders, keyed by account (see build_targets).
+        on_account_done: Called with an account's own results as soon as
+            all of its targets have finished, while other accounts may
+            still be syncing.  Also called for each account on dry runs.
+        host_slots: Semaphores keyed by IMAP host, shared by syncs that run
+            at the same time (the daemon's accounts), so that together they
+            keep to ``max_connections_per_host``.  Each is held only while
+            mbsync runs.
+    """
+    assert config.sync is not None
+    assert config.paths is not None
+    if mbsyncrc_path is None:
+        mbsyncrc_path, _ = write_generated_configs(config)
+
+    probe = None
+    if _wants_probe(config, account, folders, dry_run):
+        cache, probe = await asyncio.to_thread(_probe, config, account)
+        folders = probe.changed
+
+    targets = _plan(
+        config, account, mbsyncrc_path, verbose=verbose, dry_run=dry_run, folders=folders
+    )
+    if isinstance(targets, AggregateResult):
+        if dry_run and on_account_done is not None:
+            for name in [account] if account else list(config.accounts):
+                on_account_done(name, targets)
+        return targets
+
+    history = SyncHistory.load(config.paths.state_dir)
+    board = board_for(config.paths.state_dir, enabled=config.sync.progress, verbose=verbose)
+    by_name = {t.name: t for t in targets}
+    ordered = [by_name[name] for name in history.order(list(by_name))]
+
+    remaining = Counter(t.account for t in targets)
+    finished: dict[str, dict[str, RunResult]] = {}
+
+    async def sync_one(target: SyncTarget) -> RunResult:
+        if host_slots is None:
+            return await _async_sync_one(
+                config, target, mbsyncrc_path, history, board, verbose=verbose, timeout=timeout
+            )
+        assert config.sync is not None
+        slot = host_slots.setdefault(
+            target.host, asyncio.Semaphore(config.sync.max_connections_per_host)
+        )
+        async with slot:
+            return await _async_sync_one(
+                config, target, mbsyncrc_path, history, board, verbose=verbose, timeout=timeout
+            )
+
+    async def sync_target(target: SyncTarget) -> RunResult:
+        try:
+            result = await sync_one(target)
+        except Exception as e:
+            # Still count the target as finished, so its account moves on.
+            result = _crashed(target.name, e)
+        finished.setdefault(target.account, {})[target.name] = result
+        remaining[target.account] -= 1
+        if remaining[target.account] == 0 and on_account_done is not None:
+            on_account_done(target.account, AggregateResult(results=finished[target.account]))
+        return result
+
+    tasks = [
+        Task(
+            name=t.name,
+            key=t.host,
+            fn=lambda t=t: sync_target(t),
+            cost=history.expected_duration(t.name) or 1.0,
+        )
+        for t in ordered
+    ]
+
+    start = time.monotonic()
+    started_ns = time.time_ns()
+    try:
+        async with synclock.async_shared(config.paths.state_dir):
+            results = await async_run_scheduled(
+                tasks,
+                limiter=_limiter(config),
+                per_key_limit=config.sync.max_connections_per_host,
+                is_ok=lambda r: r.ok,
+                on_error=lambda task, e: _crashed(task.name, e),
+            )
+    finally:
+        board.close()
+        history.save()
+        if probe is not None:
+            done = {name: r for per_account in finished.values() for name, r in per_account.items()}
+            _record_probe(cache, probe, targets, done)
+    aggregate = AggregateResult(
+        results={t.name: results[t.name] for t in targets},
+        duration_seconds=time.monotonic() - start,
+    )
+    await asyncio.to_thread(
+        _record_metrics, config, targets, results, board, started_ns, aggregate.duration_seconds
+    )
+    return _report(aggregate)
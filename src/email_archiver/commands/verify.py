@@ -2,61 +2,89 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
-from email_archiver.config import Config
-from email_archiver.generate import ensure_notmuch_init, write_generated_configs
-from email_archiver.runner import RunResult, run_command
+from email_archiver import metrics
+from email_archiver.config import Config, VerifyConfig
+from email_archiver.generate import (
+    ensure_notmuch_init,
+    local_folder_name,
+    write_generated_configs,
+)
+from email_archiver.integrity import deep_check
+from email_archiver.manifest import Manifest
+from email_archiver.notmuch_query import (
+    QueryFacts,
+    present_message_ids,
+    query_facts,
+    quote_term,
+)
+from email_archiver.reconcile import reconcile_account
+from email_archiver.runner import RunResult
 
 # Verification MUST fail closed: if checks cannot run, status is FAIL.
 STATUS_PASS = "PASS"
 STATUS_FAIL = "FAIL"
 
+# Upper bound on accounts verified concurrently.
+_MAX_WORKERS = 8
 
-def _notmuch_env(notmuch_config_path: Path) -> dict[str, str]:
-    return {**os.environ, "NOTMUCH_CONFIG": str(notmuch_config_path)}
 
+def _folder_of(path: str) -> str:
+    """Map a manifest path ``acct/Folder/cur/file`` to its folder ``acct/Folder``."""
+    return os.path.dirname(os.path.dirname(path))
 
-def _get_message_count(notmuch_config_path: Path) -> tuple[RunResult, int | None]:
-    """Get total message count from notmuch."""
-    env = _notmuch_env(notmuch_config_path)
-    result = run_command(["notmuch", "count", "*"], env=env)
-    if result.ok:
-        try:
-            count = int(result.stdout.strip())
-            return result, count
-        except ValueError:
-            return result, None
-    return result, None
 
+def _check_manifest(
+    config: Config, notmuch_config_path: Path, account: str | None = None
+) -> dict[str, Any]:
+    """Update the Maildir manifest and confirm every new file is indexed.
 
-def _get_date_boundary(notmuch_config_path: Path, sort: str) -> tuple[RunResult, str | None]:
-    """Get oldest or newest message date.
+    Only files not yet confirmed by a previous run are looked up, so the
+    cost follows the delta since the last verification.
 
     Args:
-        sort: 'oldest-first' or 'newest-first'
+        account: Restrict the scan to ``maildir_root/<account>``.
     """
-    env = _notmuch_env(notmuch_config_path)
-    result = run_command(
-        ["notmuch", "search", "--format=json", f"--sort={sort}", "--limit=1", "*"],
-        env=env,
-    )
-    if result.ok and result.stdout.strip():
-        try:
-            messages = json.loads(result.stdout)
-            if messages and isinstance(messages, list):
-                ts = messages[0].get("timestamp", 0)
-                if ts:
-                    return result, datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
-                # Fall back to date_relative
-                return result, messages[0].get("date_relative", "unknown")
-        except (json.JSONDecodeError, KeyError, IndexError):
-            pass
-    return result, None
+    assert config.paths is not None
+    with Manifest.open(config.paths.state_dir, config.paths.maildir_root) as manifest:
+        delta = manifest.update(account)
+        pending = manifest.unindexed(account)
+        ids = sorted({mid for _, mid in pending if mid})
+        found = present_message_ids(notmuch_config_path, ids)
+
+        error = None
+        missing: list[str] = []
+        if found is None:
+            error = "could not query notmuch for new files"
+            missing = [path for path, _ in pending]
+        else:
+            manifest.mark_indexed([path for path, mid in pending if mid in found])
+            missing = [path for path, mid in pending if mid not in found]
+
+        by_folder: dict[str, int] = {}
+        for path in missing:
+            by_folder[_folder_of(path)] = by_folder.get(_folder_of(path), 0) + 1
+
+        return {
+            "files": manifest.count(account),
+            "added": len(delta.added),
+            "removed": len(delta.removed),
+            "renamed": delta.renamed,
+            "dirs_total": delta.dirs_total,
+            "dirs_scanned": delta.dirs_scanned,
+            "unindexed": len(missing),
+            "unindexed_by_folder": by_folder,
+            "unindexed_sample": sorted(missing)[:20],
+            "error": error,
+        }
 
 
 def _build_report(
@@ -66,17 +94,26 @@ def _build_report(
     message_count: int | None,
     oldest_date: str | None,
     newest_date: str | None,
+    manifest: dict[str, Any] | None = None,
+    folders: dict[str, dict[str, Any]] | None = None,
 ) -> dict[str, Any]:
-    """Build the verification report dict."""
+    """Build the verification report dict.
+
+    When ``manifest`` is given, every file on disk must also be confirmed
+    present in the index for the report to PASS; when ``folders`` is given,
+    every folder must PASS too.
+    """
     now = datetime.now(timezone.utc).isoformat()
     status = STATUS_FAIL  # fail closed
 
     # Determine pass/fail
     checks_ran = count_result.ok and message_count is not None
-    if checks_ran and message_count > 0 and oldest_date and newest_date:
+    files_ok = manifest is None or (manifest["error"] is None and manifest["unindexed"] == 0)
+    folders_ok = folders is None or all(f["status"] == STATUS_PASS for f in folders.values())
+    if checks_ran and message_count > 0 and oldest_date and newest_date and files_ok and folders_ok:
         status = STATUS_PASS
 
-    return {
+    report: dict[str, Any] = {
         "timestamp": now,
         "account": account,
         "notmuch": {
@@ -88,6 +125,53 @@ def _build_report(
         },
         "status": status,
     }
+    if manifest is not None:
+        report["manifest"] = manifest
+    if folders is not None:
+        report["folders"] = folders
+    return report
+
+
+def _error_report(account: str, error: Exception) -> dict[str, Any]:
+    """Build a FAIL report for an account whose checks raised ``error``."""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "account": account,
+        "notmuch": {"total_message_count": None},
+        "coverage": {"oldest_message": None, "newest_message": None},
+        "status": STATUS_FAIL,
+        "error": f"{type(error).__name__}: {error}",
+    }
+
+
+def _build_folder_reports(
+    config: Config,
+    account: str,
+    facts: QueryFacts,
+    manifest: dict[str, Any],
+    remote: dict[str, dict[str, Any]] | None = None,
+) -> dict[str, dict[str, Any]]:
+    """Per-folder message counts and unindexed files for one account.
+
+    With ``remote`` (from :func:`reconcile_account`), each folder also gets
+    its server reconciliation and fails if it found a problem.
+    """
+    folders: dict[str, dict[str, Any]] = {}
+    for folder in config.accounts[account].folders:
+        rel = f"{account}/{local_folder_name(folder)}"
+        count = facts.scopes[rel].count
+        unindexed = manifest["unindexed_by_folder"].get(rel, 0)
+        ok = count is not None and manifest["error"] is None and unindexed == 0
+        folders[folder] = {
+            "path": rel,
+            "message_count": count,
+            "unindexed": unindexed,
+        }
+        if remote is not None:
+            folders[folder]["remote"] = remote[folder]
+            ok = ok and not remote[folder]["problems"]
+        folders[folder]["status"] = STATUS_PASS if ok else STATUS_FAIL
+    return folders
 
 
 def _write_report(config: Config, report: dict[str, Any], account: str) -> tuple[Path, Path]:
@@ -110,22 +194,219 @@ def _write_report(config: Config, report: dict[str, Any], account: str) -> tuple
         f"Oldest:   {report['coverage']['oldest_message']}",
         f"Newest:   {report['coverage']['newest_message']}",
     ]
+    if "manifest" in report:
+        m = report["manifest"]
+        text_lines.append(f"Files:    {m['files']} (+{m['added']} -{m['removed']})")
+        text_lines.append(f"Unindexed: {m['unindexed']}")
+        text_lines.extend(f"  {path}" for path in m["unindexed_sample"])
+    if "folders" in report:
+        text_lines.append("Folders:")
+        for name, f in report["folders"].items():
+            text_lines.append(
+                f"  {f['status']}  {name}: {f['message_count']} messages,"
+                f" {f['unindexed']} unindexed"
+            )
+            remote = f.get("remote")
+            if remote:
+                text_lines.extend(f"    {problem}" for problem in remote["problems"])
+                if remote.get("missing_uids"):
+                    text_lines.append(f"    missing UIDs: {remote['missing_uids']}")
+    text_path.write_text("\n".join(text_lines) + "\n", encoding="utf-8")
+
+    return json_path, text_path
+
+
+def _write_consolidated_report(
+    config: Config, report: dict[str, Any], account: str | None = None
+) -> tuple[Path, Path]:
+    """Write the summary to the top of verification_dir.
+
+    A run limited to one account names its summary after the account, so
+    concurrent per-account runs (as in ``run``) don't overwrite each other.
+    """
+    assert config.paths is not None
+    report_dir = config.paths.verification_dir
+    report_dir.mkdir(parents=True, exist_ok=True)
+
+    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    stem = f"verify-{account}-{ts}" if account else f"verify-{ts}"
+
+    json_path = report_dir / f"{stem}.json"
+    json_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    text_path = report_dir / f"{stem}.txt"
+    text_lines = [
+        f"Verification Summary — {report['timestamp']}",
+        f"Status:   {report['status']}",
+    ]
+    for name, acct in report["accounts"].items():
+        text_lines.append(
+            f"  {acct['status']}  {name}: {acct['notmuch']['total_message_count']} messages"
+        )
+        if acct.get("error"):
+            text_lines.append(f"    error: {acct['error']}")
+    if "deep" in report:
+        deep = report["deep"]
+        text_lines.append(
+            f"Deep:     {deep['status']}, {deep['files_checked']} files checked,"
+            f" {deep['problem_files']} with problems"
+        )
+        for path, problems in deep["problems"].items():
+            text_lines.append(f"  {path}: {'; '.join(problems)}")
     text_path.write_text("\n".join(text_lines) + "\n", encoding="utf-8")
 
     return json_path, text_path
 
 
+def _verify_account(
+    config: Config,
+    account: str,
+    facts: QueryFacts,
+    notmuch_config_path: Path,
+    verbose: bool,
+    remote: bool = False,
+) -> dict[str, Any]:
+    """Verify one account: scoped counts, coverage, and per-file presence.
+
+    With ``remote``, also reconcile each folder's UIDs with the server.
+    """
+    assert facts.result is not None
+    started = time.monotonic()
+    scope = facts.scopes[account]
+    manifest = _check_manifest(config, notmuch_config_path, account)
+    reconciled = reconcile_account(config, account) if remote else None
+    folders = _build_folder_reports(config, account, facts, manifest, reconciled)
+    report = _build_report(
+        config,
+        account,
+        facts.result,
+        scope.count,
+        scope.oldest,
+        scope.newest,
+        manifest,
+        folders,
+    )
+    report["duration_seconds"] = round(time.monotonic() - started, 3)
+    json_path, _ = _write_report(config, report, account)
+
+    lines = [f"  [{report['status']}] {account}: {scope.count} messages"]
+    if scope.count:
+        lines[0] += f", {scope.oldest} → {scope.newest}"
+    if verbose:
+        lines.append(
+            f"    manifest: {manifest['files']} files, +{manifest['added']}"
+            f" -{manifest['removed']} ({manifest['dirs_scanned']}/{manifest['dirs_total']}"
+            " dirs rescanned)"
+        )
+        lines.append(f"    report: {json_path}")
+    if report["status"] != STATUS_PASS:
+        if scope.count is None:
+            lines.append("    Could not determine message count (notmuch may not be configured).")
+        elif scope.count == 0:
+            lines.append("    No messages found in the index.")
+        if manifest["error"]:
+            lines.append(f"    Manifest check failed: {manifest['error']}.")
+        for name, f in folders.items():
+            if f["status"] != STATUS_PASS:
+                if f["unindexed"]:
+                    lines.append(f"    Folder '{name}': {f['unindexed']} file(s) not in the index.")
+                for problem in f.get("remote", {}).get("problems", ()):
+                    lines.append(f"    Folder '{name}': {problem}.")
+                if f.get("remote", {}).get("missing_uids"):
+                    lines.append(f"      missing UIDs: {f['remote']['missing_uids']}")
+    print("\n".join(lines))
+    return report
+
+
+def _print_deep(deep: dict[str, Any]) -> None:
+    lines = [
+        f"  [{deep['status']}] deep: {deep['files_checked']} files,"
+        f" {deep['bytes_checked'] / 1024 / 1024:.1f} MiB checked"
+        f" in {deep['sessions']} session(s)"
+    ]
+    if deep["problem_files"]:
+        lines.append(f"    {deep['problem_files']} file(s) with problems:")
+        for path, problems in deep["problems"].items():
+            lines.append(f"    {path}: {'; '.join(problems)}")
+    print("\n".join(lines))
+
+
+def _record_metrics(config: Config, summary: dict[str, Any], duration_seconds: float) -> None:
+    samples = []
+    for name, report in summary["accounts"].items():
+        manifest = report.get("manifest", {})
+        values = {
+            "files": manifest.get("files"),
+            "files_added": manifest.get("added"),
+            "unindexed_files": manifest.get("unindexed"),
+            "messages": report["notmuch"]["total_message_count"],
+        }
+        remote = [f["remote"] for f in report.get("folders", {}).values() if "remote" in f]
+        if remote:
+            values["remote_missing_uids"] = sum(r.get("missing", 0) for r in remote)
+        samples.append(
+            metrics.StageSample(
+                "verify",
+                name,
+                ok=report["status"] == STATUS_PASS,
+                duration_seconds=report.get("duration_seconds", 0.0),
+                values={k: v for k, v in values.items() if v is not None},
+            )
+        )
+    deep = summary.get("deep")
+    samples.append(
+        metrics.StageSample(
+            "verify",
+            metrics.ALL_ACCOUNTS,
+            ok=summary["status"] == STATUS_PASS,
+            duration_seconds=duration_seconds,
+            values=(
+                {
+                    "deep_files_checked": deep["files_checked"],
+                    "deep_bytes_checked": deep["bytes_checked"],
+                    "deep_problem_files": deep["problem_files"],
+                }
+                if deep
+                else {}
+            ),
+        )
+    )
+    metrics.record(config, samples)
+
+
 def run_verify(
     config: Config,
     *,
     account: str | None = None,
     verbose: bool = False,
     notmuch_config_path: Path | None = None,
+    deep: bool = False,
+    strict: bool = False,
+    restart: bool = False,
+    remote: bool | None = None,
 ) -> dict[str, Any]:
-    """Run verification checks and write a report.
+    """Run verification checks for each account and write reports.
+
+    Every account (or only ``account``) is checked against its own slice of
+    the archive — ``maildir_root/<account>`` and each configured folder
+    beneath it — so one account's failure cannot hide behind another's
+    messages.  Accounts are verified concurrently.  A report is written per
+    account under ``verification_dir/<account>/`` plus a consolidated
+    summary in ``verification_dir/`` (``verify-<account>-<time>`` when
+    only ``account`` is checked).
+
+    Args:
+        deep: Also read every file and check it against its recorded size
+            and hash (see :mod:`email_archiver.integrity`).
+        strict: With ``deep``, also check RFC 5322 well-formedness.
+        restart: With ``deep``, start over instead of resuming an
+            interrupted deep check.
+        remote: Also reconcile every folder's UIDs with the server (see
+            :mod:`email_archiver.reconcile`); defaults to ``[verify] remote``.
 
     Returns:
-        The verification report dict (with 'status' of PASS or FAIL).
+        The consolidated report dict: 'status' is PASS only if every
+        verified account passed, and 'accounts' holds the per-account reports.
     """
     if notmuch_config_path is None:
         _, notmuch_config_path = write_generated_configs(config)
@@ -133,39 +414,92 @@ def run_verify(
     # Auto-initialize notmuch database if needed
     ensure_notmuch_init(config, notmuch_config_path)
 
-    acct_name = account or "default"
-    print(f"Running verification for account '{acct_name}'...")
-
-    # 1. Get message count
-    count_result, message_count = _get_message_count(notmuch_config_path)
+    if account is not None and account not in config.accounts:
+        print(f"Unknown account '{account}'")
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "status": STATUS_FAIL,
+            "accounts": {},
+        }
+    accounts = [account] if account else list(config.accounts)
+    if remote is None:
+        remote = (config.verify or VerifyConfig()).remote
+    started = time.monotonic()
+    print(f"Running verification for {', '.join(repr(a) for a in accounts)}...")
+
+    # All counts and date boundaries for every account and folder, in one batch
+    queries: dict[str, str] = {}
+    for name in accounts:
+        queries[name] = quote_term("path", f"{name}/**")
+        for folder in config.accounts[name].folders:
+            rel = f"{name}/{local_folder_name(folder)}"
+            queries[rel] = quote_term("folder", rel)
+    facts = query_facts(notmuch_config_path, queries, boundaries=accounts)
     if verbose:
-        print(f"  notmuch count: {message_count}")
-
-    # 2. Get date boundaries
-    _, oldest_date = _get_date_boundary(notmuch_config_path, "oldest-first")
-    _, newest_date = _get_date_boundary(notmuch_config_path, "newest-first")
-    if verbose:
-        print(f"  oldest message: {oldest_date}")
-        print(f"  newest message: {newest_date}")
-
-    # 3. Build report
-    report = _build_report(config, acct_name, count_result, message_count, oldest_date, newest_date)
+        print(f"  queried {len(queries)} scopes via {facts.backend}")
 
-    # 4. Write report
-    json_path, text_path = _write_report(config, report, acct_name)
+    # Create the manifest schema once before workers open their own connections
+    assert config.paths is not None
+    Manifest.open(config.paths.state_dir, config.paths.maildir_root).close()
+
+    workers = max(1, min(_MAX_WORKERS, len(accounts)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            name: pool.submit(
+                _verify_account, config, name, facts, notmuch_config_path, verbose, remote
+            )
+            for name in accounts
+        }
+        reports: dict[str, dict[str, Any]] = {}
+        for name, fut in futures.items():
+            # One account's crash must not cost the others their summary.
+            try:
+                reports[name] = fut.result()
+            except Exception as e:
+                reports[name] = _error_report(name, e)
+                print(f"  [{STATUS_FAIL}] {name}: verification failed: {reports[name]['error']}")
+
+    ok = all(r["status"] == STATUS_PASS for r in reports.values())
+    summary = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "status": STATUS_FAIL,
+        "accounts": reports,
+    }
+    if deep:
+        print("  Deep check: reading every file...")
+        summary["deep"] = deep_check(
+            config, accounts, strict=strict, restart=restart, verbose=verbose
+        )
+        ok = ok and summary["deep"]["status"] == STATUS_PASS
+        _print_deep(summary["deep"])
+    summary["status"] = STATUS_PASS if ok else STATUS_FAIL
+    json_path, text_path = _write_consolidated_report(config, summary, account)
+    _record_metrics(config, summary, time.monotonic() - started)
     print("  Report written to:")
     print(f"    JSON: {json_path}")
     print(f"    Text: {text_path}")
+    print(f"  Verification: {summary['status']}")
+    return summary
 
-    # 5. Print summary
-    status = report["status"]
-    if status == STATUS_PASS:
-        print(f"  Verification: PASS ({message_count} messages, {oldest_date} → {newest_date})")
-    else:
-        print("  Verification: FAIL")
-        if message_count is None:
-            print("    Could not determine message count (notmuch may not be configured).")
-        elif message_count == 0:
-            print("    No messages found in the index.")
 
-    return report
+async def async_run_verify(
+    config: Config,
+    *,
+    account: str | None = None,
+    verbose: bool = False,
+    notmuch_config_path: Path | None = None,
+    deep: bool = False,
+) -> dict[str, Any]:
+    """Coroutine version of :func:`run_verify`.
+
+    Verification is database and filesystem reads rather than child
+    processes, so it runs on a worker thread to keep the event loop free.
+    """
+    return await asyncio.to_thread(
+        run_verify,
+        config,
+        account=account,
+        verbose=verbose,
+        notmuch_config_path=notmuch_config_path,
+        deep=deep,
+    )
@@ -0,0 +1,325 @@
+"""Watch command: sync folders as soon as the IMAP server reports changes.
+
+Instead of walking every folder on a timer, the watcher keeps IMAP
+connections open and runs mbsync only for the Channels whose folder
+changed:
+
+- folders listed in ``[watch] idle_folders`` (INBOX by default) each hold
+  an IDLE connection, up to ``max_connections_per_host`` per account, and
+  wake up as soon as the server pushes new mail;
+- every other folder is polled with ``STATUS (MESSAGES UIDNEXT
+  UIDVALIDITY)`` over one connection per account every ``poll_interval``
+  seconds (``[watch] mode = "poll"`` polls everything).
+
+Changes are collected for ``debounce`` seconds, then synced in one batch
+and indexed; folders whose sync fails are retried with backoff.  Dropped
+connections are re-established with backoff, and the folder's STATUS is
+compared against the last known value so nothing that arrived while
+disconnected is missed.  At startup the last known value is the one saved
+by the last successful sync (see :class:`~email_archiver.probe.StatusCache`),
+so mail that arrived while nothing was watching is synced right away.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import imaplib
+import socket
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from email_archiver import imap
+from email_archiver.commands.run import IndexCoalescer
+from email_archiver.commands.sync import async_run_sync, build_targets
+from email_archiver.config import AccountConfig, Config
+from email_archiver.generate import write_generated_configs
+from email_archiver.imap import FolderStatus, ImapError
+from email_archiver.probe import StatusCache
+from email_archiver.runner import RunResult, run_async
+
+T = TypeVar("T")
+
+# Reconnect delays after a connection error, in seconds.
+_RECONNECT_MIN = 5.0
+_RECONNECT_MAX = 300.0
+
+# First delay before syncing folders again after their sync failed.
+_RESYNC_MIN = 30.0
+
+
+class Watcher:
+    """Hold IDLE/poll connections and report changed ``(account, folder)`` pairs.
+
+    Args:
+        on_change: Called on the event loop for every detected change.
+        password: IMAP password (default: read from the secrets file).
+        reconnect_min: First delay before reconnecting after an error.
+        cache: Statuses saved by earlier syncs.  A folder whose first STATUS
+            differs from its cached one (or that was never synced) is
+            reported as changed; without a cache the first STATUS is only
+            the baseline.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        on_change: Callable[[str, str], None],
+        *,
+        account: str | None = None,
+        password: str | None = None,
+        reconnect_min: float = _RECONNECT_MIN,
+        cache: StatusCache | None = None,
+    ) -> None:
+        assert config.watch is not None
+        self.config = config
+        self.on_change = on_change
+        self.password = password
+        self.reconnect_min = reconnect_min
+        self.known: dict[tuple[str, str], FolderStatus | None] = {}
+        self.plan: dict[str, tuple[list[str], list[str]]] = {}
+        self._conns: set[imaplib.IMAP4] = set()
+        self._executor: ThreadPoolExecutor | None = None
+
+        names = [account] if account else list(config.accounts)
+        for name in names:
+            acct = config.accounts[name]
+            idle: list[str] = []
+            if config.watch.mode == "idle":
+                assert config.sync is not None
+                cap = config.sync.max_connections_per_host
+                idle = [f for f in acct.folders if f in config.watch.idle_folders][:cap]
+            polled = [f for f in acct.folders if f not in idle]
+            self.plan[name] = (idle, polled)
+            if cache is not None:
+                for folder in acct.folders:
+                    self.known[(name, folder)] = cache.get(name, folder)[0]
+
+    async def run(self) -> None:
+        """Watch until cancelled."""
+        loops = []
+        for name, (idle, polled) in self.plan.items():
+            acct = self.config.accounts[name]
+            loops.extend(self._idle_loop(acct, folder) for folder in idle)
+            if polled:
+                loops.append(self._poll_loop(acct, polled))
+        if not loops:
+            return
+        # IDLE blocks a thread for up to idle_timeout: give each loop its own.
+        self._executor = ThreadPoolExecutor(max_workers=len(loops), thread_name_prefix="imap")
+        try:
+            await asyncio.gather(*loops)
+        finally:
+            for conn in list(self._conns):
+                # Wake any thread blocked in select() on this socket.
+                try:
+                    conn.socket().shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _call(self, fn: Callable[..., T], *args: Any) -> T:
+        assert self._executor is not None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _connect(self, acct: AccountConfig) -> imaplib.IMAP4:
+        conn = await self._call(lambda: imap.connect(acct, password=self.password))
+        self._conns.add(conn)
+        return conn
+
+    async def _close(self, conn: imaplib.IMAP4 | None) -> None:
+        if conn is not None:
+            self._conns.discard(conn)
+            await self._call(imap.close, conn)
+
+    async def _check(self, conn: imaplib.IMAP4, account: str, folder: str) -> None:
+        """Compare a folder's STATUS with the last known value."""
+        status = await self._call(imap.folder_status, conn, folder)
+        key = (account, folder)
+        first = key not in self.known
+        previous = self.known.get(key)
+        self.known[key] = status
+        if not first and previous != status:
+            self.on_change(account, folder)
+
+    async def _backoff(self, acct: AccountConfig, what: str, failures: int, e: Exception) -> None:
+        delay = min(self.reconnect_min * 2 ** (failures - 1), _RECONNECT_MAX)
+        print(f"[watch] {acct.name}: {what} failed ({e}); reconnecting in {delay:.0f}s")
+        await asyncio.sleep(delay)
+
+    async def _idle_loop(self, acct: AccountConfig, folder: str) -> None:
+        assert self.config.watch is not None
+        failures = 0
+        while True:
+            conn = None
+            try:
+                conn = await self._connect(acct)
+                await self._check(conn, acct.name, folder)
+                await self._call(imap.examine, conn, folder)
+                failures = 0
+                while True:
+                    events = await self._call(imap.idle, conn, self.config.watch.idle_timeout)
+                    if events:
+                        self.on_change(acct.name, folder)
+            except ImapError as e:
+                failures += 1
+                await self._close(conn)
+                await self._backoff(acct, f"IDLE on {folder}", failures, e)
+
+    async def _poll_loop(self, acct: AccountConfig, folders: list[str]) -> None:
+        assert self.config.watch is not None
+        failures = 0
+        while True:
+            conn = None
+            try:
+                conn = await self._connect(acct)
+                while True:
+                    for folder in folders:
+                        await self._check(conn, acct.name, folder)
+                    failures = 0
+                    await asyncio.sleep(self.config.watch.poll_interval)
+            except ImapError as e:
+                failures += 1
+                await self._close(conn)
+                await self._backoff(acct, "STATUS poll", failures, e)
+
+
+async def async_run_watch(
+    config: Config,
+    *,
+    account: str | None = None,
+    verbose: bool = False,
+    dry_run: bool = False,
+) -> None:
+    """Coroutine version of :func:`run_watch`.
+
+    Returns when there is nothing to watch.
+
+    Raises:
+        Exception: Whatever stopped the watcher itself (connection errors
+            are retried inside it), rather than waiting forever.
+    """
+    assert config.watch is not None
+    assert config.paths is not None
+    mbsyncrc_path, notmuch_config_path = write_generated_configs(config)
+    indexer = IndexCoalescer(config, notmuch_config_path, verbose=verbose, dry_run=dry_run)
+    pending: dict[str, set[str]] = {}
+    changed = asyncio.Event()
+
+    def on_change(name: str, folder: str) -> None:
+        if verbose:
+            print(f"[watch] change in {name}/{folder}")
+        pending.setdefault(name, set()).add(folder)
+        changed.set()
+
+    cache = StatusCache.load(config.paths.state_dir)
+    watcher = Watcher(config, on_change, account=account, cache=cache)
+    for name, (idle, polled) in watcher.plan.items():
+        print(f"[watch] {name}: IDLE {idle or '-'}, polling {polled or '-'}")
+    watch_task = asyncio.ensure_future(watcher.run())
+    retry: asyncio.TimerHandle | None = None
+    failures = 0
+    try:
+        while True:
+            waiting = asyncio.ensure_future(changed.wait())
+            await asyncio.wait({watch_task, waiting}, return_when=asyncio.FIRST_COMPLETED)
+            if watch_task.done():
+                waiting.cancel()
+                watch_task.result()
+                return
+            await asyncio.sleep(config.watch.debounce)
+            if retry is not None:
+                retry.cancel()
+                retry = None
+            batch = {name: sorted(folders) for name, folders in pending.items()}
+            pending.clear()
+            changed.clear()
+            seen = {
+                (a, f): watcher.known.get((a, f)) for a, folders in batch.items() for f in folders
+            }
+            result = await async_run_sync(
+                config,
+                verbose=verbose,
+                dry_run=dry_run,
+                mbsyncrc_path=mbsyncrc_path,
+                folders=batch,
+            )
+            if result.results:
+                await indexer.index_since(time.monotonic(), batch)
+            # The watcher already knows the new STATUS, so it will not report
+            # these folders again: retry them here until they sync.
+            failed = _failed_folders(config, batch, result.results)
+            if not dry_run:
+                await asyncio.to_thread(_record_synced, config, seen, failed)
+            if not failed:
+                failures = 0
+                continue
+            failures += 1
+            delay = min(_RESYNC_MIN * 2 ** (failures - 1), _RECONNECT_MAX)
+            names = ", ".join(f"{a}/{f}" for a, folders in failed.items() for f in folders)
+            print(f"[watch] sync failed for {names}; retrying in {delay:.0f}s")
+            for name, folders in failed.items():
+                pending.setdefault(name, set()).update(folders)
+            retry = asyncio.get_running_loop().call_later(delay, changed.set)
+    finally:
+        if retry is not None:
+            retry.cancel()
+        watch_task.cancel()
+        await asyncio.gather(watch_task, return_exceptions=True)
+
+
+def _failed_folders(
+    config: Config, batch: dict[str, list[str]], results: dict[str, RunResult]
+) -> dict[str, list[str]]:
+    """Return the folders of ``batch``, keyed by account, that did not sync."""
+    failed: dict[str, list[str]] = {}
+    for target in build_targets(config, folders=batch):
+        result = results.get(target.name)
+        if result is None or not result.ok:
+            failed.setdefault(target.account, []).extend(target.folders)
+    return failed
+
+
+def _record_synced(
+    config: Config,
+    seen: dict[tuple[str, str], FolderStatus | None],
+    failed: dict[str, list[str]],
+) -> None:
+    """Save the STATUS seen before a sync for every folder that synced."""
+    assert config.paths is not None
+    # Reload: other syncs may have saved statuses since watch started.
+    cache = StatusCache.load(config.paths.state_dir)
+    now = time.time()
+    for (account, folder), status in seen.items():
+        if status is not None and folder not in failed.get(account, ()):
+            cache.record(account, folder, status, now)
+    cache.save()
+
+
+def run_watch(
+    config: Config,
+    *,
+    account: str | None = None,
+    verbose: bool = False,
+    dry_run: bool = False,
+) -> int:
+    """Sync and index changed folders as the server reports them, until stopped.
+
+    Returns:
+        Exit code (0 on a clean shutdown by SIGTERM/SIGINT, 1 if the
+        watcher failed).
+    """
+    if account is not None and account not in config.accounts:
+        print(f"Unknown account '{account}'")
+        return 2
+    try:
+        run_async(async_run_watch(config, account=account, verbose=verbose, dry_run=dry_run))
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        print(f"Watch failed: {e!r}")
+        return 1
+    print("Watch stopped.")
+    return 0
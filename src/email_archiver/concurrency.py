@@ -0,0 +1,221 @@
+"""Bounded, host-aware task scheduling with an adaptive concurrency limit."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class AdaptiveLimiter:
+    """A concurrency limit that ramps up or down from observed outcomes.
+
+    Works like TCP congestion control (additive increase, multiplicative
+    decrease).  After every ``window`` completed tasks the limiter looks at:
+
+    - the error rate in that window — above ``error_threshold`` the limit is
+      halved, since providers usually answer overload with IMAP errors;
+    - the work rate, i.e. the sum of each completed task's *expected* cost
+      divided by the window's wall-clock time.  If it held up (within 10%)
+      since the last adjustment the limit grows by one, otherwise it shrinks
+      by one.
+
+    With ``minimum == maximum`` the limit is fixed.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        *,
+        minimum: int = 1,
+        maximum: int | None = None,
+        window: int = 4,
+        error_threshold: float = 0.25,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum if maximum is not None else initial)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.window = window
+        self.error_threshold = error_threshold
+        self._clock = clock
+        self._outcomes: list[tuple[bool, float]] = []
+        self._window_start = clock()
+        self._last_rate: float | None = None
+
+    @classmethod
+    def fixed(cls, limit: int) -> AdaptiveLimiter:
+        return cls(limit, minimum=limit, maximum=limit)
+
+    def record(self, ok: bool, expected_cost: float = 1.0) -> None:
+        """Record one finished task and adjust the limit at window boundaries."""
+        self._outcomes.append((ok, expected_cost))
+        if len(self._outcomes) < self.window:
+            return
+
+        now = self._clock()
+        elapsed = max(now - self._window_start, 1e-6)
+        errors = sum(1 for good, _ in self._outcomes if not good)
+        rate = sum(cost for good, cost in self._outcomes if good) / elapsed
+        self._outcomes.clear()
+        self._window_start = now
+
+        if errors / self.window > self.error_threshold:
+            self.limit = max(self.minimum, self.limit // 2)
+        elif self._last_rate is None or rate >= self._last_rate * 0.9:
+            self.limit = min(self.maximum, self.limit + 1)
+        else:
+            self.limit = max(self.minimum, self.limit - 1)
+        self._last_rate = rate
+
+
+class RateLimiter:
+    """Paces work to ``rate`` units (e.g. bytes) per second.
+
+    :meth:`acquire` blocks until the caller may go ahead with ``amount``
+    units.  The first call never waits; each later one waits until the
+    previous amounts have been paid for at ``rate``.  A ``rate`` of 0
+    disables the limit.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = rate
+        self._clock = clock
+        self._sleep = sleep
+        self._next = clock()
+
+    def acquire(self, amount: float) -> None:
+        if self.rate <= 0:
+            return
+        now = self._clock()
+        start = max(now, self._next)
+        self._next = start + amount / self.rate
+        if start > now:
+            self._sleep(start - now)
+
+
+@dataclass
+class Task(Generic[T]):
+    """A unit of work for :func:`run_scheduled`.
+
+    ``key`` groups tasks that share a per-key cap (e.g. the IMAP host);
+    ``cost`` is the expected relative cost fed to the adaptive limiter.
+    """
+
+    name: str
+    key: str
+    fn: Callable[[], T]
+    cost: float = 1.0
+
+
+def run_scheduled(
+    tasks: list[Task[T]],
+    *,
+    limiter: AdaptiveLimiter,
+    per_key_limit: int,
+    is_ok: Callable[[T], bool],
+    on_error: Callable[[Task[T], Exception], T],
+) -> dict[str, T]:
+    """Run tasks on a thread pool, in list order, under both limits.
+
+    Whenever a slot frees up, the first pending task whose key is below
+    ``per_key_limit`` is started, so a capped host never blocks work for
+    other hosts and priority order is kept within each host.
+
+    A task that raises doesn't stop the others: ``on_error`` turns the
+    exception into that task's (failed) result.
+
+    Returns:
+        Results keyed by task name, in completion order.
+    """
+    results: dict[str, T] = {}
+    pending = list(tasks)
+    running: dict[Future[T], Task[T]] = {}
+    per_key: Counter[str] = Counter()
+
+    with ThreadPoolExecutor(max_workers=limiter.maximum) as pool:
+        while pending or running:
+            i = 0
+            while i < len(pending) and len(running) < limiter.limit:
+                task = pending[i]
+                if per_key[task.key] < per_key_limit:
+                    pending.pop(i)
+                    per_key[task.key] += 1
+                    running[pool.submit(task.fn)] = task
+                else:
+                    i += 1
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                task = running.pop(fut)
+                per_key[task.key] -= 1
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    result = on_error(task, e)
+                results[task.name] = result
+                limiter.record(is_ok(result), task.cost)
+
+    return results
+
+
+async def async_run_scheduled(
+    tasks: list[Task[Awaitable[T]]],
+    *,
+    limiter: AdaptiveLimiter,
+    per_key_limit: int,
+    is_ok: Callable[[T], bool],
+    on_error: Callable[[Task[Awaitable[T]], Exception], T],
+) -> dict[str, T]:
+    """Coroutine version of :func:`run_scheduled`; ``fn`` returns an awaitable.
+
+    Tasks run as asyncio tasks instead of threads.  If this coroutine is
+    cancelled, every running task is cancelled and awaited before the
+    cancellation propagates.
+    """
+    results: dict[str, T] = {}
+    pending = list(tasks)
+    running: dict[asyncio.Future[T], Task[Awaitable[T]]] = {}
+    per_key: Counter[str] = Counter()
+
+    try:
+        while pending or running:
+            i = 0
+            while i < len(pending) and len(running) < limiter.limit:
+                task = pending[i]
+                if per_key[task.key] < per_key_limit:
+                    pending.pop(i)
+                    per_key[task.key] += 1
+                    running[asyncio.ensure_future(task.fn())] = task
+                else:
+                    i += 1
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                task = running.pop(fut)
+                per_key[task.key] -= 1
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    result = on_error(task, e)
+                results[task.name] = result
+                limiter.record(is_ok(result), task.cost)
+    finally:
+        for fut in running:
+            fut.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    return results
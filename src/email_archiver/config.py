@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import os
+import re
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
@@ -26,7 +27,10 @@ class AccountConfig:
     imap_host: str
     imap_user: str
     tls_type: str = "IMAPS"
+    imap_port: int | None = None
     folders: list[str] = field(default_factory=lambda: ["INBOX"])
+    # Seconds between daemon runs for this account (default: [daemon] interval).
+    sync_interval: int | None = None
 
 
 @dataclass
@@ -42,10 +46,72 @@ class PathsConfig:
             self.generated_config_dir = self.state_dir / "generated"
 
 
+@dataclass
+class SyncConfig:
+    concurrency: int = 4
+    max_connections_per_host: int = 2
+    per_channel: bool = False
+    adaptive: bool = False
+    max_concurrency: int = 8
+    probe: bool = False
+    probe_max_age: int = 24 * 3600
+    progress: bool = True
+
+
+@dataclass
+class IndexConfig:
+    # Index only changed directories (needs the notmuch2 bindings).
+    targeted: bool = True
+    # Seconds between full `notmuch new` passes when indexing is targeted.
+    full_interval: int = 24 * 3600
+    # Index the first run in-process too, rather than with `notmuch new`.
+    bulk: bool = True
+    # Files added per database transaction by the in-process indexer.
+    batch_size: int = 1000
+    # Processes reading files ahead of the indexer (0 = one per CPU).
+    workers: int = 0
+
+
+@dataclass
+class VerifyConfig:
+    # Processes reading and hashing files for `verify --deep` (0 = one per CPU).
+    deep_workers: int = 0
+    # Read rate limit for `verify --deep`, in MiB/s (0 = unlimited).
+    deep_rate_limit: int = 0
+    # Seconds between `verify --deep` checkpoints.
+    checkpoint_interval: int = 30
+    # Also reconcile every folder's UIDs with the server (`verify --remote`).
+    remote: bool = False
+
+
 @dataclass
 class BackupConfig:
+    # "incremental" passes only the files changed since the last backup
+    # to the command, through the {files_from} and {removed_from} lists
+    # (for mirrors that copy new files and delete removed ones);
+    # "native" writes to the built-in pack store at `repository`.
     mode: str = "command"
     command: str = ""
+    repository: Path | None = None
+    # Target size of native pack files, in MiB.
+    pack_size: int = 64
+    compression_level: int = 3
+    # Per-target limits: KiB/s (0 = unlimited; substituted for {bwlimit} in
+    # commands), seconds per attempt (0 = none), and retries after a failure,
+    # waiting retry_delay seconds, doubled after each attempt.
+    bandwidth_limit: int = 0
+    timeout: int = 0
+    retries: int = 0
+    retry_delay: int = 30
+    # [backup.target.<name>] tables, run concurrently instead of [backup] itself.
+    targets: dict[str, BackupConfig] = field(default_factory=dict)
+    # Back up from a point-in-time view of maildir_root: "none", "hardlink"
+    # (a hard-link copy under snapshot_dir) or "hook" (snapshot_create and
+    # snapshot_release commands, e.g. btrfs or LVM snapshots).
+    snapshot: str = "none"
+    snapshot_dir: Path | None = None
+    snapshot_create: str = ""
+    snapshot_release: str = ""
 
 
 @dataclass
@@ -53,12 +119,42 @@ class OrchestrationConfig:
     backup_after_verify: bool = True
 
 
+@dataclass
+class WatchConfig:
+    mode: str = "idle"
+    idle_folders: list[str] = field(default_factory=lambda: ["INBOX"])
+    poll_interval: int = 60
+    idle_timeout: int = 29 * 60
+    debounce: int = 5
+
+
+@dataclass
+class DaemonConfig:
+    interval: int = 3600
+    jitter: int = 60
+    max_backoff: int = 6 * 3600
+    socket_path: Path | None = None
+
+
+@dataclass
+class MetricsConfig:
+    enabled: bool = True
+    # Prometheus node_exporter textfile (default: <state_dir>/metrics/email_archiver.prom).
+    textfile: Path | None = None
+
+
 @dataclass
 class Config:
     accounts: dict[str, AccountConfig] = field(default_factory=dict)
     paths: PathsConfig | None = None
+    sync: SyncConfig | None = None
+    index: IndexConfig | None = None
+    verify: VerifyConfig | None = None
     backup: BackupConfig | None = None
     orchestration: OrchestrationConfig | None = None
+    daemon: DaemonConfig | None = None
+    watch: WatchConfig | None = None
+    metrics: MetricsConfig | None = None
 
 
 def expand_path(p: str) -> Path:
@@ -87,6 +183,12 @@ def _parse_accounts(raw: dict[str, Any]) -> dict[str, AccountConfig]:
             tls_type=data.get("tls_type", "IMAPS"),
             folders=data.get("folders", ["INBOX"]),
         )
+        if "imap_port" in data:
+            accounts[name].imap_port = _parse_positive_int(data, "imap_port", 0, f"account.{name}")
+        if "sync_interval" in data:
+            accounts[name].sync_interval = _parse_positive_int(
+                data, "sync_interval", 0, f"account.{name}"
+            )
     return accounts
 
 
@@ -105,11 +207,142 @@ def _parse_paths(raw: dict[str, Any]) -> PathsConfig:
     return paths
 
 
-def _parse_backup(raw: dict[str, Any]) -> BackupConfig:
-    return BackupConfig(
+def _parse_positive_int(raw: dict[str, Any], key: str, default: int, section_name: str) -> int:
+    """Read an optional integer key that must be >= 1."""
+    value = raw.get(key, default)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ConfigError(f"'{key}' in [{section_name}] must be a positive integer")
+    return value
+
+
+def _parse_non_negative_int(raw: dict[str, Any], key: str, default: int, section_name: str) -> int:
+    """Read an optional integer key that must be >= 0."""
+    value = raw.get(key, default)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise ConfigError(f"'{key}' in [{section_name}] must be a non-negative integer")
+    return value
+
+
+def _parse_sync(raw: dict[str, Any]) -> SyncConfig:
+    return SyncConfig(
+        concurrency=_parse_positive_int(raw, "concurrency", 4, "sync"),
+        max_connections_per_host=_parse_positive_int(raw, "max_connections_per_host", 2, "sync"),
+        per_channel=raw.get("per_channel", False),
+        adaptive=raw.get("adaptive", False),
+        max_concurrency=_parse_positive_int(raw, "max_concurrency", 8, "sync"),
+        probe=raw.get("probe", False),
+        probe_max_age=_parse_positive_int(raw, "probe_max_age", 24 * 3600, "sync"),
+        progress=raw.get("progress", True),
+    )
+
+
+def _parse_index(raw: dict[str, Any]) -> IndexConfig:
+    return IndexConfig(
+        targeted=raw.get("targeted", True),
+        full_interval=_parse_positive_int(raw, "full_interval", 24 * 3600, "index"),
+        bulk=raw.get("bulk", True),
+        batch_size=_parse_positive_int(raw, "batch_size", 1000, "index"),
+        workers=_parse_non_negative_int(raw, "workers", 0, "index"),
+    )
+
+
+def _parse_verify(raw: dict[str, Any]) -> VerifyConfig:
+    return VerifyConfig(
+        deep_workers=_parse_non_negative_int(raw, "deep_workers", 0, "verify"),
+        deep_rate_limit=_parse_non_negative_int(raw, "deep_rate_limit", 0, "verify"),
+        checkpoint_interval=_parse_positive_int(raw, "checkpoint_interval", 30, "verify"),
+        remote=raw.get("remote", False),
+    )
+
+
+def _parse_backup_target(raw: dict[str, Any], section: str, *, validate: bool) -> BackupConfig:
+    repository = raw.get("repository")
+    backup = BackupConfig(
         mode=raw.get("mode", "command"),
         command=raw.get("command", ""),
+        repository=expand_path(repository) if repository else None,
+        pack_size=_parse_positive_int(raw, "pack_size", 64, section),
+        compression_level=_parse_positive_int(raw, "compression_level", 3, section),
+        bandwidth_limit=_parse_non_negative_int(raw, "bandwidth_limit", 0, section),
+        timeout=_parse_non_negative_int(raw, "timeout", 0, section),
+        retries=_parse_non_negative_int(raw, "retries", 0, section),
+        retry_delay=_parse_non_negative_int(raw, "retry_delay", 30, section),
     )
+    if not validate:
+        return backup
+    if backup.mode == "incremental":
+        for placeholder in ("{files_from}", "{removed_from}"):
+            if placeholder not in backup.command:
+                raise ConfigError(
+                    f"'command' in [{section}] must contain {placeholder} in incremental mode"
+                )
+        if tool := _SNAPSHOT_TOOLS.search(backup.command):
+            raise ConfigError(
+                f"'command' in [{section}] can't use {tool[1]} in incremental mode:"
+                " each run only lists the changed files, which would make every"
+                f' {tool[1]} snapshot a partial one; use mode = "command" instead'
+            )
+    if backup.mode == "native" and backup.repository is None:
+        raise ConfigError(f"'repository' in [{section}] is required in native mode")
+    if backup.mode != "native" and backup.bandwidth_limit and "{bwlimit}" not in backup.command:
+        raise ConfigError(
+            f"'command' in [{section}] must contain {{bwlimit}} to apply 'bandwidth_limit'"
+        )
+    return backup
+
+
+# Snapshotting backup tools: an incremental file list would become a partial snapshot.
+_SNAPSHOT_TOOLS = re.compile(r"\b(restic|borg|kopia|duplicity)\b")
+
+_SNAPSHOT_MODES = ("none", "hardlink", "hook")
+_SNAPSHOT_KEYS = ("snapshot", "snapshot_dir", "snapshot_create", "snapshot_release")
+
+
+def _parse_backup(raw: dict[str, Any], paths: PathsConfig) -> BackupConfig:
+    """Parse [backup] and its [backup.target.<name>] tables.
+
+    Targets inherit every key they don't set from [backup] itself, except
+    the snapshot settings, which apply to all targets at once.
+    """
+    tables = raw.get("target", {})
+    if not isinstance(tables, dict) or not all(isinstance(t, dict) for t in tables.values()):
+        raise ConfigError("[backup.target.<name>] entries must be tables")
+    defaults = {
+        key: value for key, value in raw.items() if key != "target" and key not in _SNAPSHOT_KEYS
+    }
+    backup = _parse_backup_target(defaults, "backup", validate=not tables)
+    for name, table in tables.items():
+        backup.targets[name] = _parse_backup_target(
+            {**defaults, **table}, f"backup.target.{name}", validate=True
+        )
+    commands = [t.command for t in backup.targets.values() if t.mode != "native"]
+    if len({"{account}" in command for command in commands}) > 1:
+        raise ConfigError("Either all backup targets or none may use {account}")
+    _parse_backup_snapshot(raw, paths, backup)
+    return backup
+
+
+def _parse_backup_snapshot(raw: dict[str, Any], paths: PathsConfig, backup: BackupConfig) -> None:
+    backup.snapshot = raw.get("snapshot", "none")
+    if backup.snapshot not in _SNAPSHOT_MODES:
+        raise ConfigError(f"'snapshot' in [backup] must be one of {', '.join(_SNAPSHOT_MODES)}")
+    if backup.snapshot == "none":
+        return
+    root = paths.maildir_root
+    default = root.parent / f".{root.name}-snapshots"
+    backup.snapshot_dir = expand_path(raw["snapshot_dir"]) if "snapshot_dir" in raw else default
+    if backup.snapshot_dir.resolve().is_relative_to(root.resolve()):
+        raise ConfigError("'snapshot_dir' in [backup] must be outside maildir_root")
+    backup.snapshot_create = raw.get("snapshot_create", "")
+    backup.snapshot_release = raw.get("snapshot_release", "")
+    if backup.snapshot == "hook" and not backup.snapshot_create:
+        raise ConfigError("'snapshot_create' in [backup] is required with snapshot = \"hook\"")
+    for name, target in (backup.targets or {"": backup}).items():
+        if target.mode == "command" and target.command and "{source}" not in target.command:
+            section = f"backup.target.{name}" if name else "backup"
+            raise ConfigError(
+                f"'command' in [{section}] must back up {{source}} to use the snapshot"
+            )
 
 
 def _parse_orchestration(raw: dict[str, Any]) -> OrchestrationConfig:
@@ -118,6 +351,41 @@ def _parse_orchestration(raw: dict[str, Any]) -> OrchestrationConfig:
     )
 
 
+def _parse_daemon(raw: dict[str, Any], paths: PathsConfig) -> DaemonConfig:
+    socket_path = raw.get("socket_path")
+    return DaemonConfig(
+        interval=_parse_positive_int(raw, "interval", 3600, "daemon"),
+        jitter=_parse_non_negative_int(raw, "jitter", 60, "daemon"),
+        max_backoff=_parse_positive_int(raw, "max_backoff", 6 * 3600, "daemon"),
+        socket_path=expand_path(socket_path) if socket_path else paths.state_dir / "daemon.sock",
+    )
+
+
+def _parse_watch(raw: dict[str, Any]) -> WatchConfig:
+    mode = raw.get("mode", "idle")
+    if mode not in ("idle", "poll"):
+        raise ConfigError('\'mode\' in [watch] must be "idle" or "poll"')
+    return WatchConfig(
+        mode=mode,
+        idle_folders=raw.get("idle_folders", ["INBOX"]),
+        poll_interval=_parse_positive_int(raw, "poll_interval", 60, "watch"),
+        idle_timeout=_parse_positive_int(raw, "idle_timeout", 29 * 60, "watch"),
+        debounce=_parse_non_negative_int(raw, "debounce", 5, "watch"),
+    )
+
+
+def _parse_metrics(raw: dict[str, Any], paths: PathsConfig) -> MetricsConfig:
+    textfile = raw.get("textfile")
+    return MetricsConfig(
+        enabled=raw.get("enabled", True),
+        textfile=(
+            expand_path(textfile)
+            if textfile
+            else paths.state_dir / "metrics" / "email_archiver.prom"
+        ),
+    )
+
+
 def load_config(path: str | Path | None = None) -> Config:
     """Load and validate the email-archiver configuration file.
 
@@ -156,8 +424,16 @@ def load_config(path: str | Path | None = None) -> Config:
         raise ConfigError("[paths] section is required")
     config.paths = _parse_paths(raw["paths"])
 
+    if "sync" in raw:
+        config.sync = _parse_sync(raw["sync"])
+    else:
+        config.sync = SyncConfig()
+
+    config.index = _parse_index(raw.get("index", {}))
+    config.verify = _parse_verify(raw.get("verify", {}))
+
     if "backup" in raw:
-        config.backup = _parse_backup(raw["backup"])
+        config.backup = _parse_backup(raw["backup"], config.paths)
     else:
         config.backup = BackupConfig()
 
@@ -166,4 +442,8 @@ def load_config(path: str | Path | None = None) -> Config:
     else:
         config.orchestration = OrchestrationConfig()
 
+    config.daemon = _parse_daemon(raw.get("daemon", {}), config.paths)
+    config.watch = _parse_watch(raw.get("watch", {}))
+    config.metrics = _parse_metrics(raw.get("metrics", {}), config.paths)
+
     return config
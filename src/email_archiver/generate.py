@@ -9,12 +9,25 @@ from pathlib import Path
 from email_archiver.config import PASSWORD_FILE, Config
 from email_archiver.runner import run_command
 
+# Tags notmuch gives newly indexed messages ([new] tags).
+NEW_TAGS = ("unread", "inbox")
+
 
 def _sanitize_name(name: str) -> str:
     """Sanitize a folder name for use as an mbsync channel identifier."""
     return re.sub(r"[^a-zA-Z0-9_-]", "-", name).strip("-")
 
 
+def channel_name(account: str, folder: str) -> str:
+    """Return the mbsync Channel name used for an account's folder."""
+    return f"{account}-{_sanitize_name(folder)}"
+
+
+def local_folder_name(folder: str) -> str:
+    """Return the Maildir directory (under ``maildir_root/<account>``) for an IMAP folder."""
+    return _sanitize_name(folder)
+
+
 def generate_mbsyncrc(config: Config) -> str:
     """Generate mbsyncrc content from the unified config.
 
@@ -30,6 +43,8 @@ def generate_mbsyncrc(config: Config) -> str:
         # IMAPAccount
         lines.append(f"IMAPAccount {acct_name}")
         lines.append(f"Host {acct.imap_host}")
+        if acct.imap_port is not None:
+            lines.append(f"Port {acct.imap_port}")
         lines.append(f"User {acct.imap_user}")
         lines.append(f'PassCmd "cat {PASSWORD_FILE}"')
         lines.append(f"TLSType {acct.tls_type}")
@@ -51,12 +66,12 @@ def generate_mbsyncrc(config: Config) -> str:
         # One channel per folder
         channel_names: list[str] = []
         for folder in acct.folders:
-            chan = f"{acct_name}-{_sanitize_name(folder)}"
+            chan = channel_name(acct_name, folder)
             channel_names.append(chan)
 
             lines.append(f"Channel {chan}")
             lines.append(f'Far :{acct_name}-remote:"{folder}"')
-            lines.append(f"Near :{acct_name}-local:{_sanitize_name(folder)}")
+            lines.append(f"Near :{acct_name}-local:{local_folder_name(folder)}")
             lines.append("Create Near")
             lines.append("Expunge None")
             lines.append("SyncState *")
@@ -92,7 +107,7 @@ def generate_notmuch_config(config: Config) -> str:
         f"primary_email={first_acct.email}",
         "",
         "[new]",
-        "tags=unread;inbox;",
+        "tags=" + "".join(f"{tag};" for tag in NEW_TAGS),
         "ignore=.mbsyncstate;.uidvalidity;",
         "",
         "[search]",
@@ -0,0 +1,231 @@
+"""Persistent content hashes of Maildir messages, shared between commands.
+
+Hashing the whole archive on every run is not viable, but Maildir makes it
+unnecessary: a delivered file is never modified, only renamed (flag
+changes, ``new/`` → ``cur/``), and a rename keeps both the unique part of
+its name (before ``:2,``) and its size and mtime.  ``<state_dir>/hashes.sqlite3``
+therefore maps each unique name to the size and mtime it had when hashed,
+with its SHA-256, body SHA-256 and Message-ID.  A lookup whose size and
+mtime still match is trusted; anything else is hashed again and replaced.
+
+The table is ``WITHOUT ROWID`` with binary digests, about 100 bytes a
+message.  Several processes may use it at once (SQLite WAL); every writer
+commits in small batches.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import sqlite3
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from email.parser import BytesHeaderParser
+from email.policy import compat32
+from pathlib import Path
+
+HASH_INDEX_FILENAME = "hashes.sqlite3"
+
+# Below this many files to hash, a process pool costs more than it saves.
+_POOL_MIN_FILES = 2000
+_CHUNKSIZE = 64
+_COMMIT_EVERY = 500
+_HEADER_LIMIT = 256 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 BLOB NOT NULL,
+    body_sha256 BLOB NOT NULL,
+    message_id TEXT
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(frozen=True)
+class MessageHash:
+    """Content digests of one message file (hex), and the stat they belong to."""
+
+    size: int
+    mtime_ns: int
+    sha256: str
+    body_sha256: str
+    message_id: str | None
+
+
+def unique_name(filename: str) -> str:
+    """Return the Maildir unique part of a filename (before the ``:2,`` info)."""
+    return filename.split(":", 1)[0]
+
+
+def parse_message_id(head: bytes) -> str | None:
+    """Extract the Message-ID, without angle brackets, from a message's header bytes."""
+    headers = BytesHeaderParser(policy=compat32).parsebytes(head)
+    value = headers.get("Message-ID")
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.startswith("<") and ">" in value:
+        value = value[1 : value.index(">")]
+    return value or None
+
+
+def body_offset(mm: mmap.mmap) -> int:
+    """Offset of the first body byte (just past the blank line after the headers)."""
+    ends = [
+        pos + len(sep)
+        for sep in (b"\n\n", b"\r\n\r\n")
+        if (pos := mm.find(sep, 0, _HEADER_LIMIT)) != -1
+    ]
+    return min(ends) if ends else len(mm)
+
+
+def hash_message(path: str) -> MessageHash | None:
+    """Hash one message file through ``mmap``.
+
+    Returns:
+        The digests, or None if the file vanished (renamed or expunged).
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        st = os.fstat(fd)
+        if st.st_size == 0:
+            empty = hashlib.sha256().hexdigest()
+            return MessageHash(0, st.st_mtime_ns, empty, empty, None)
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            offset = body_offset(mm)
+            message_id = parse_message_id(mm[:offset])
+            with memoryview(mm) as view, view[offset:] as body:
+                sha256 = hashlib.sha256(view).hexdigest()
+                body_sha256 = hashlib.sha256(body).hexdigest()
+    finally:
+        os.close(fd)
+    return MessageHash(st.st_size, st.st_mtime_ns, sha256, body_sha256, message_id)
+
+
+class HashIndex:
+    """SQLite store of :class:`MessageHash` by Maildir unique name.
+
+    Use as a context manager.
+    """
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = db_path
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.hashed = 0  # files actually read by this instance
+
+    @classmethod
+    def open(cls, state_dir: Path) -> HashIndex:
+        return cls(state_dir / HASH_INDEX_FILENAME)
+
+    def __enter__(self) -> HashIndex:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def stored(self, path: str) -> MessageHash | None:
+        """The hash recorded for ``path``'s unique name, whatever the file looks like now."""
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, sha256, body_sha256, message_id FROM hashes WHERE name = ?",
+            (unique_name(os.path.basename(path)),),
+        ).fetchone()
+        if row is None:
+            return None
+        return MessageHash(row[0], row[1], row[2].hex(), row[3].hex(), row[4])
+
+    def lookup(self, path: str, st: os.stat_result) -> MessageHash | None:
+        """The stored hash of ``path`` if its size and mtime still match ``st``."""
+        h = self.stored(path)
+        if h is None or (h.size, h.mtime_ns) != (st.st_size, st.st_mtime_ns):
+            return None
+        return h
+
+    def store(self, items: Iterable[tuple[str, MessageHash]]) -> None:
+        """Record ``(path, hash)`` pairs, committing every few hundred."""
+        rows = 0
+        for path, h in items:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO hashes "
+                "(name, size, mtime_ns, sha256, body_sha256, message_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    unique_name(os.path.basename(path)),
+                    h.size,
+                    h.mtime_ns,
+                    bytes.fromhex(h.sha256),
+                    bytes.fromhex(h.body_sha256),
+                    h.message_id,
+                ),
+            )
+            rows += 1
+            if rows % _COMMIT_EVERY == 0:
+                self.conn.commit()
+        self.conn.commit()
+
+    def get(self, root: Path, path: str, st: os.stat_result) -> MessageHash | None:
+        """The hash of one file, read and stored only if not already known."""
+        return self.hashes(root, [(path, st)]).get(path)
+
+    def hashes(
+        self, root: Path, files: list[tuple[str, os.stat_result]], *, workers: int = 1
+    ) -> dict[str, MessageHash]:
+        """Hashes of ``files`` (paths relative to ``root`` with their stat).
+
+        Known files are looked up; the rest are hashed, in ``workers``
+        processes for large batches, and stored.  Files that vanish
+        before they are read are left out of the result.
+        """
+        found: dict[str, MessageHash] = {}
+        missing: list[str] = []
+        for path, st in files:
+            h = self.lookup(path, st)
+            if h is None:
+                missing.append(path)
+            else:
+                found[path] = h
+
+        full = [str(root / path) for path in missing]
+        if workers <= 1 or len(missing) < _POOL_MIN_FILES:
+            fresh = zip(missing, map(hash_message, full))
+            self.store(self._collect(fresh, found))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                fresh = zip(missing, pool.map(hash_message, full, chunksize=_CHUNKSIZE))
+                self.store(self._collect(fresh, found))
+        return found
+
+    def _collect(self, fresh, found: dict[str, MessageHash]):
+        for path, h in fresh:
+            if h is not None:
+                self.hashed += 1
+                found[path] = h
+                yield path, h
+
+    def prune(self, names: Iterable[str]) -> int:
+        """Forget every unique name not in ``names``; returns how many were dropped."""
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS live (name TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM live")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO live (name) VALUES (?)", ((n,) for n in names)
+            )
+            cur = self.conn.execute("DELETE FROM hashes WHERE name NOT IN (SELECT name FROM live)")
+            self.conn.execute("DELETE FROM live")
+        return cur.rowcount
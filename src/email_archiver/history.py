@@ -0,0 +1,90 @@
+"""Persisted per-target sync history used to schedule the slowest work first."""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from email_archiver.state import load_json, save_json
+
+HISTORY_FILENAME = "sync-history.json"
+
+# Weight of the newest observation in the moving average of durations.
+_EWMA_ALPHA = 0.5
+
+
+@dataclass
+class TargetStats:
+    """Historical observations for one sync target (account or channel)."""
+
+    duration_seconds: float = 0.0
+    runs: int = 0
+    failures: int = 0
+    last_exit_code: int = 0
+
+
+class SyncHistory:
+    """Durations of previous sync runs, keyed by target name.
+
+    Stored as JSON in ``<state_dir>/sync-history.json``.  Safe to update from
+    multiple worker threads.
+    """
+
+    def __init__(self, path: Path, stats: dict[str, TargetStats] | None = None) -> None:
+        self.path = path
+        self.stats: dict[str, TargetStats] = stats or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, state_dir: Path) -> SyncHistory:
+        path = state_dir / HISTORY_FILENAME
+        raw = load_json(path, {})
+        stats: dict[str, TargetStats] = {}
+        if isinstance(raw, dict):
+            for name, data in raw.items():
+                try:
+                    stats[name] = TargetStats(**data)
+                except TypeError:
+                    continue  # ignore entries written by an incompatible version
+        return cls(path, stats)
+
+    def save(self) -> None:
+        with self._lock:
+            save_json(self.path, {name: asdict(s) for name, s in self.stats.items()})
+
+    def expected_duration(self, name: str) -> float | None:
+        """Return the smoothed duration of ``name``, or None if never run."""
+        s = self.stats.get(name)
+        return s.duration_seconds if s and s.runs else None
+
+    def record(self, name: str, duration_seconds: float, exit_code: int) -> None:
+        with self._lock:
+            s = self.stats.setdefault(name, TargetStats())
+            if exit_code == 0:
+                if s.runs:
+                    s.duration_seconds = (
+                        _EWMA_ALPHA * duration_seconds + (1 - _EWMA_ALPHA) * s.duration_seconds
+                    )
+                else:
+                    s.duration_seconds = duration_seconds
+                s.runs += 1
+            else:
+                s.failures += 1
+            s.last_exit_code = exit_code
+
+    def order(self, names: list[str]) -> list[str]:
+        """Sort names longest-expected-first.
+
+        Targets with no history go first: they may well be large (e.g. a
+        first sync of ``[Gmail]/All Mail``) and we'd rather find out early.
+        The sort is stable so config order breaks ties.
+        """
+
+        def key(name: str) -> tuple[int, float]:
+            expected = self.expected_duration(name)
+            if expected is None:
+                return (0, 0.0)
+            return (1, -expected)
+
+        return sorted(names, key=key)
@@ -0,0 +1,330 @@
+"""Minimal IMAP client helpers for change detection and reconciliation.
+
+mbsync does the actual syncing; this module only needs to log in, ask
+``STATUS`` for folder counters, list a folder's UIDs and sit in ``IDLE``
+waiting for new mail, so it is built on :mod:`imaplib` rather than a full
+client library.
+"""
+
+from __future__ import annotations
+
+import base64
+import imaplib
+import re
+import select
+import socket
+import ssl
+import time
+from array import array
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from email_archiver.config import PASSWORD_FILE, AccountConfig
+
+# Untagged responses during IDLE that mean the mailbox changed.
+_IDLE_EVENT = re.compile(rb"^\* (\d+ (EXISTS|EXPUNGE|RECENT|FETCH)|BYE)\b", re.IGNORECASE)
+
+# Seconds to wait for the server to acknowledge IDLE / DONE.
+_IDLE_REPLY_TIMEOUT = 30.0
+
+# UIDs per UID SEARCH, which keeps each reply line well under imaplib's
+# 1 MB limit even for folders with millions of UIDs.  ESEARCH replies are
+# usually compact ranges, but a fragmented folder (every other UID
+# expunged) lists each UID on its own.
+_SEARCH_CHUNK = 50_000
+
+_ESEARCH_ALL = re.compile(rb"\bALL\s+([\d:,]+)", re.IGNORECASE)
+
+
+class ImapError(Exception):
+    """Raised when an IMAP connection or command fails."""
+
+
+@dataclass(frozen=True)
+class FolderStatus:
+    """The counters from ``STATUS (MESSAGES UIDNEXT UIDVALIDITY)``.
+
+    Any new, expunged or re-created message changes at least one of them.
+    """
+
+    messages: int
+    uidnext: int
+    uidvalidity: int
+
+    def to_dict(self) -> dict[str, int]:
+        return {"messages": self.messages, "uidnext": self.uidnext, "uidvalidity": self.uidvalidity}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, int]) -> FolderStatus:
+        return cls(int(data["messages"]), int(data["uidnext"]), int(data["uidvalidity"]))
+
+
+def read_password() -> str:
+    """Read the IMAP password from the fixed secrets file."""
+    try:
+        return PASSWORD_FILE.read_text(encoding="utf-8").rstrip("\r\n")
+    except OSError as e:
+        raise ImapError(f"Cannot read password file {PASSWORD_FILE}: {e}") from e
+
+
+def encode_mailbox(name: str) -> str:
+    """Encode a folder name in IMAP modified UTF-7 (RFC 3501 §5.1.3)."""
+    out: list[str] = []
+    pending: list[str] = []
+
+    def flush() -> None:
+        if pending:
+            raw = "".join(pending).encode("utf-16-be")
+            out.append("&" + base64.b64encode(raw).decode().rstrip("=").replace("/", ",") + "-")
+            pending.clear()
+
+    for ch in name:
+        if 0x20 <= ord(ch) <= 0x7E:
+            flush()
+            out.append("&-" if ch == "&" else ch)
+        else:
+            pending.append(ch)
+    flush()
+    return "".join(out)
+
+
+def quote_mailbox(name: str) -> str:
+    """Encode and quote a folder name for use as an IMAP command argument."""
+    encoded = encode_mailbox(name)
+    return '"' + encoded.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def connect(
+    account: AccountConfig, *, password: str | None = None, timeout: float = 30.0
+) -> imaplib.IMAP4:
+    """Open an authenticated connection using the account's TLS settings.
+
+    ``tls_type`` follows mbsync: ``IMAPS`` (implicit TLS, port 993),
+    ``STARTTLS`` or ``None`` (both port 143), unless ``imap_port`` is set.
+
+    Raises:
+        ImapError: If the connection or login fails.
+    """
+    tls = account.tls_type.upper()
+    context = ssl.create_default_context()
+    try:
+        if tls == "IMAPS":
+            conn: imaplib.IMAP4 = imaplib.IMAP4_SSL(
+                account.imap_host, account.imap_port or 993, ssl_context=context, timeout=timeout
+            )
+        else:
+            conn = imaplib.IMAP4(account.imap_host, account.imap_port or 143, timeout=timeout)
+            if tls == "STARTTLS":
+                conn.starttls(context)
+    except (OSError, imaplib.IMAP4.error) as e:
+        raise ImapError(f"Cannot connect to {account.imap_host}: {e}") from e
+
+    try:
+        conn.login(account.imap_user, password if password is not None else read_password())
+    except (OSError, imaplib.IMAP4.error) as e:
+        close(conn)
+        raise ImapError(f"Login to {account.imap_host} as {account.imap_user} failed: {e}") from e
+    return conn
+
+
+def close(conn: imaplib.IMAP4) -> None:
+    """Log out, ignoring errors from an already broken connection."""
+    try:
+        conn.logout()
+    except (OSError, imaplib.IMAP4.error):
+        pass
+
+
+def _parse_status(data: list[bytes | tuple[bytes, bytes] | None]) -> FolderStatus:
+    for item in data:
+        line = item[-1] if isinstance(item, tuple) else item
+        if not line:
+            continue
+        m = re.search(rb"\(([^()]*)\)\s*$", line)
+        if not m:
+            continue
+        fields = m.group(1).split()
+        values = {k.upper(): int(v) for k, v in zip(fields[::2], fields[1::2])}
+        try:
+            return FolderStatus(values[b"MESSAGES"], values[b"UIDNEXT"], values[b"UIDVALIDITY"])
+        except KeyError:
+            break
+    raise ImapError(f"Unexpected STATUS response: {data!r}")
+
+
+def folder_status(conn: imaplib.IMAP4, folder: str) -> FolderStatus:
+    """Return the STATUS counters of ``folder``.
+
+    Raises:
+        ImapError: If the folder doesn't exist or the reply can't be parsed.
+    """
+    try:
+        typ, data = conn.status(quote_mailbox(folder), "(MESSAGES UIDNEXT UIDVALIDITY)")
+    except (OSError, imaplib.IMAP4.error) as e:
+        raise ImapError(f"STATUS {folder} failed: {e}") from e
+    if typ != "OK":
+        raise ImapError(f"STATUS {folder} failed: {data!r}")
+    return _parse_status(data)
+
+
+def parse_sequence_set(text: str | bytes) -> array:
+    """Expand an IMAP sequence set such as ``1:4,7`` into an array of UIDs."""
+    if isinstance(text, bytes):
+        text = text.decode("ascii")
+    uids = array("I")
+    for part in text.split(","):
+        if not part:
+            continue
+        lo, _, hi = part.partition(":")
+        first, last = int(lo), int(hi or lo)
+        uids.extend(range(min(first, last), max(first, last) + 1))
+    return uids
+
+
+def format_sequence_set(uids: Iterable[int]) -> str:
+    """Collapse sorted UIDs into an IMAP sequence set: ``[1, 2, 3, 7]`` → ``1:3,7``."""
+    parts: list[str] = []
+    start = prev = None
+    for uid in uids:
+        if prev is not None and uid == prev + 1:
+            prev = uid
+            continue
+        if start is not None:
+            parts.append(str(start) if start == prev else f"{start}:{prev}")
+        start = prev = uid
+    if start is not None:
+        parts.append(str(start) if start == prev else f"{start}:{prev}")
+    return ",".join(parts)
+
+
+def folder_uids(conn: imaplib.IMAP4, folder: str) -> tuple[FolderStatus, array]:
+    """Return the STATUS of ``folder`` and all of its UIDs, sorted.
+
+    Searches in chunks of UID ranges, with ``UID SEARCH RETURN (ALL)``
+    (ESEARCH, RFC 4731) when the server supports it, which answers with a
+    compact sequence set, and plain ``UID SEARCH`` otherwise.
+
+    Raises:
+        ImapError: If the folder can't be examined or searched.
+    """
+    status = folder_status(conn, folder)
+    if status.messages == 0:
+        return status, array("I")
+    examine(conn, folder)
+    esearch = "ESEARCH" in conn.capabilities
+    uids = array("I")
+    try:
+        for lo in range(1, status.uidnext, _SEARCH_CHUNK):
+            hi = min(lo + _SEARCH_CHUNK, status.uidnext) - 1
+            if esearch:
+                typ, data = conn.uid("SEARCH", "RETURN", "(ALL)", "UID", f"{lo}:{hi}")
+                if typ != "OK":
+                    raise ImapError(f"UID SEARCH {folder} failed: {data!r}")
+                _, replies = conn.response("ESEARCH")
+                for reply in replies:
+                    m = _ESEARCH_ALL.search(reply or b"")
+                    if m:
+                        uids.extend(parse_sequence_set(m.group(1)))
+            else:
+                typ, data = conn.uid("SEARCH", "UID", f"{lo}:{hi}")
+                if typ != "OK":
+                    raise ImapError(f"UID SEARCH {folder} failed: {data!r}")
+                for line in data:
+                    if line:
+                        uids.extend(int(uid) for uid in line.split())
+    except (OSError, imaplib.IMAP4.error) as e:
+        raise ImapError(f"UID SEARCH {folder} failed: {e}") from e
+    return status, array("I", sorted(uids))
+
+
+def examine(conn: imaplib.IMAP4, folder: str) -> None:
+    """Select ``folder`` read-only, as needed before IDLE."""
+    try:
+        typ, data = conn.select(quote_mailbox(folder), readonly=True)
+    except (OSError, imaplib.IMAP4.error) as e:
+        raise ImapError(f"EXAMINE {folder} failed: {e}") from e
+    if typ != "OK":
+        raise ImapError(f"EXAMINE {folder} failed: {data!r}")
+
+
+class _LineReader:
+    """Read CRLF-terminated lines straight from the socket with a deadline.
+
+    imaplib's buffered file can't be polled without blocking, and a read
+    timeout on it poisons the connection, so IDLE reads bypass it.
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.buf = b""
+
+    def readline(self, deadline: float) -> bytes | None:
+        """Return the next line, or None if ``deadline`` passes first."""
+        while b"\r\n" not in self.buf:
+            pending = isinstance(self.sock, ssl.SSLSocket) and self.sock.pending() > 0
+            if not pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                ready, _, _ = select.select([self.sock], [], [], remaining)
+                if not ready:
+                    return None
+            try:
+                chunk = self.sock.recv(65536)
+            except ssl.SSLWantReadError:
+                continue
+            except OSError as e:
+                raise ImapError(f"Connection lost during IDLE: {e}") from e
+            if not chunk:
+                raise ImapError("Connection closed by server during IDLE")
+            self.buf += chunk
+        line, _, self.buf = self.buf.partition(b"\r\n")
+        return line
+
+
+def idle(conn: imaplib.IMAP4, timeout: float) -> list[bytes]:
+    """Wait in IDLE (RFC 2177) until the selected folder changes or ``timeout``.
+
+    Servers drop IDLE after 30 minutes, so callers should loop with a
+    ``timeout`` a little below that.
+
+    Returns:
+        The untagged responses that signalled a change; empty on timeout.
+
+    Raises:
+        ImapError: If the server refuses IDLE or the connection breaks.
+    """
+    reader = _LineReader(conn.socket())
+    tag = conn._new_tag()
+    try:
+        conn.send(tag + b" IDLE\r\n")
+    except OSError as e:
+        raise ImapError(f"IDLE failed: {e}") from e
+    first = reader.readline(time.monotonic() + _IDLE_REPLY_TIMEOUT)
+    if first is None or not first.startswith(b"+"):
+        raise ImapError(f"Server refused IDLE: {first!r}")
+
+    events: list[bytes] = []
+    deadline = time.monotonic() + timeout
+    while not events:
+        line = reader.readline(deadline)
+        if line is None:
+            break
+        if _IDLE_EVENT.match(line):
+            events.append(line)
+
+    try:
+        conn.send(b"DONE\r\n")
+    except OSError as e:
+        raise ImapError(f"IDLE failed: {e}") from e
+    done_by = time.monotonic() + _IDLE_REPLY_TIMEOUT
+    while True:
+        line = reader.readline(done_by)
+        if line is None:
+            raise ImapError("No reply to IDLE DONE")
+        if line.startswith(tag + b" "):
+            if not line[len(tag) + 1 :].upper().startswith(b"OK"):
+                raise ImapError(f"IDLE ended with {line!r}")
+            return events
+        if _IDLE_EVENT.match(line):
+            events.append(line)
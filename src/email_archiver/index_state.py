@@ -0,0 +1,190 @@
+"""Which Maildir files the notmuch index has been given, per directory.
+
+``notmuch new`` walks every directory under ``maildir_root`` on each run.
+For targeted indexing this module keeps its own record in
+``<state_dir>/index-state.sqlite3``: the mtime of every ``cur``/``new``
+directory when it was last indexed, and the file names it held.  A
+:meth:`IndexState.plan` lists only directories whose mtime changed (and
+only under the accounts asked for), and diffs them against the record to
+find the files to add to and remove from the index.  The manifest's own
+``dirs`` table can't stand in for it: it records when the manifest last
+scanned a directory, which says nothing about the index.
+
+The record is committed only after the index accepted the plan, so an
+interrupted run is simply planned again.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from email_archiver.manifest import RACY_WINDOW_NS, escape_like, iter_mail_dirs, unique_name
+
+INDEX_STATE_FILENAME = "index-state.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class IndexPlan:
+    """Files to add to and remove from the index, relative to maildir_root.
+
+    ``listings`` holds the current file names of every changed directory
+    and ``mtimes`` the directory mtimes to record once the plan is applied.
+    """
+
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    vanished_dirs: list[str] = field(default_factory=list)
+    listings: dict[str, set[str]] = field(default_factory=dict)
+    mtimes: dict[str, int] = field(default_factory=dict)
+    dirs_total: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not (self.added or self.removed or self.mtimes or self.vanished_dirs)
+
+    @property
+    def renamed(self) -> int:
+        """Removed files whose unique name reappears among the added ones."""
+        added = {unique_name(os.path.basename(p)) for p in self.added}
+        return sum(1 for p in self.removed if unique_name(os.path.basename(p)) in added)
+
+
+class IndexState:
+    """SQLite record of indexed Maildir directories.  Use as a context manager."""
+
+    def __init__(self, db_path: Path, maildir_root: Path) -> None:
+        self.db_path = db_path
+        self.root = maildir_root
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    @classmethod
+    def open(cls, state_dir: Path, maildir_root: Path) -> IndexState:
+        return cls(state_dir / INDEX_STATE_FILENAME, maildir_root)
+
+    def __enter__(self) -> IndexState:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @property
+    def last_full(self) -> float | None:
+        """Unix time of the last full ``notmuch new`` pass, if any."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_full'").fetchone()
+        return float(row[0]) if row else None
+
+    def plan(self, accounts: list[str] | None = None) -> IndexPlan:
+        """Diff the changed directories on disk against the record.
+
+        Args:
+            accounts: Only look under these accounts' Maildirs (default: all
+                of ``maildir_root``).
+        """
+        plan = IndexPlan()
+        prefixes = sorted(set(accounts)) if accounts is not None else [None]
+        for prefix in prefixes:
+            self._plan_prefix(prefix, plan)
+        plan.added.sort()
+        plan.removed.sort()
+        return plan
+
+    def _plan_prefix(self, prefix: str | None, plan: IndexPlan) -> None:
+        if prefix:
+            known = dict(
+                self.conn.execute(
+                    "SELECT path, mtime_ns FROM dirs WHERE path LIKE ? ESCAPE '\\'",
+                    (escape_like(prefix + os.sep) + "%",),
+                ).fetchall()
+            )
+            scan_root = self.root / prefix
+        else:
+            known = dict(self.conn.execute("SELECT path, mtime_ns FROM dirs").fetchall())
+            scan_root = self.root
+
+        seen: set[str] = set()
+        for rel_dir, mtime_ns in iter_mail_dirs(scan_root):
+            if prefix:
+                rel_dir = os.path.join(prefix, rel_dir)
+            seen.add(rel_dir)
+            plan.dirs_total += 1
+            if known.get(rel_dir) == mtime_ns:
+                continue
+            listing = self._list(rel_dir)
+            before = self._recorded(rel_dir)
+            plan.added.extend(listing - before)
+            plan.removed.extend(before - listing)
+            plan.listings[rel_dir] = listing
+            recent = time.time_ns() - mtime_ns < RACY_WINDOW_NS
+            plan.mtimes[rel_dir] = -1 if recent else mtime_ns
+
+        for rel_dir in set(known) - seen:
+            plan.vanished_dirs.append(rel_dir)
+            plan.removed.extend(self._recorded(rel_dir))
+
+    def _list(self, rel_dir: str) -> set[str]:
+        names: set[str] = set()
+        try:
+            with os.scandir(self.root / rel_dir) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        names.add(os.path.join(rel_dir, entry.name))
+        except FileNotFoundError:
+            pass
+        return names
+
+    def _recorded(self, rel_dir: str) -> set[str]:
+        rows = self.conn.execute("SELECT path FROM files WHERE dir = ?", (rel_dir,))
+        return {path for (path,) in rows}
+
+    def commit(self, plan: IndexPlan, *, full: bool = False) -> None:
+        """Record ``plan`` as applied to the index.
+
+        Args:
+            full: The plan was applied by a full ``notmuch new`` pass.
+        """
+        with self.conn:
+            for rel_dir in plan.vanished_dirs:
+                self.conn.execute("DELETE FROM files WHERE dir = ?", (rel_dir,))
+                self.conn.execute("DELETE FROM dirs WHERE path = ?", (rel_dir,))
+            for rel_dir, listing in plan.listings.items():
+                self.conn.execute("DELETE FROM files WHERE dir = ?", (rel_dir,))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, dir) VALUES (?, ?)",
+                    ((path, rel_dir) for path in listing),
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)",
+                    (rel_dir, plan.mtimes[rel_dir]),
+                )
+            if full:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_full', ?)",
+                    (str(time.time()),),
+                )
@@ -0,0 +1,273 @@
+"""Deep integrity check of every message file (``verify --deep``).
+
+The regular verification only proves that each file on disk is indexed; a
+truncated or bit-rotted file passes.  The deep check reads every file in
+the manifest and confirms that:
+
+- its size and SHA-256 still match what the hash index recorded when the
+  file was first seen (Maildir files are never modified);
+- its headers parse;
+- with ``strict``, it is a well-formed RFC 5322 message: ``From`` and
+  ``Date`` present, no line over 998 octets, no MIME structure defects.
+
+Files are checked in batches by a process pool, in manifest (path) order,
+paced by a read-rate limit so a long check doesn't starve a concurrent
+sync.  Progress is checkpointed to ``<state_dir>/verify-deep.json``; an
+interrupted check resumes after the last checkpointed path.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import re
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from email.parser import BytesHeaderParser, BytesParser
+from email.policy import compat32
+from pathlib import Path
+from typing import Any
+
+from email_archiver.concurrency import RateLimiter
+from email_archiver.config import Config, VerifyConfig
+from email_archiver.hashindex import body_offset
+from email_archiver.manifest import Manifest
+from email_archiver.state import load_json, save_json
+
+DEEP_CHECKPOINT_FILENAME = "verify-deep.json"
+
+# Files per batch handed to a worker, and a cap on a batch's total bytes.
+_BATCH_FILES = 64
+_BATCH_BYTES = 8 * 1024 * 1024
+
+# Below this many files a process pool costs more than it saves.
+_POOL_MIN_FILES = 2000
+
+# Problem files listed in reports (all of them are counted).
+_REPORT_SAMPLE = 100
+
+# Anchored at line starts so each line is scanned once.
+_LONG_LINE = re.compile(rb"^[^\r\n]{999}", re.MULTILINE)
+
+
+@dataclass
+class DeepCheckpoint:
+    """Progress of a deep check, saved so an interrupted check can resume."""
+
+    accounts: list[str]
+    strict: bool
+    started: str
+    position: str = ""
+    checked: int = 0
+    bytes: int = 0
+    vanished: int = 0
+    sessions: int = 1
+    problems: dict[str, list[str]] = field(default_factory=dict)
+
+
+def check_file(path: str, size: int, sha256: str, strict: bool = False) -> list[str] | None:
+    """Check one message file against its recorded size and hash.
+
+    Returns:
+        The problems found (empty if the file is fine), or None if the file
+        vanished (renamed or expunged since the manifest was updated).
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    problems: list[str] = []
+    try:
+        actual = os.fstat(fd).st_size
+        if actual != size:
+            problems.append(f"size is {actual} bytes, recorded {size}")
+        if actual == 0:
+            return problems + ["file is empty"]
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mm) as view:
+                if hashlib.sha256(view).hexdigest() != sha256:
+                    problems.append("content differs from the recorded SHA-256")
+            offset = body_offset(mm)
+            headers = BytesHeaderParser(policy=compat32).parsebytes(mm[:offset])
+            if not headers.keys():
+                problems.append("no parseable headers")
+            elif strict:
+                problems.extend(_rfc5322_problems(mm, headers))
+    finally:
+        os.close(fd)
+    return problems
+
+
+def _rfc5322_problems(mm: mmap.mmap, headers: Any) -> list[str]:
+    problems = [f"missing {name} header" for name in ("From", "Date") if name not in headers]
+    if _LONG_LINE.search(mm):
+        problems.append("line longer than 998 octets")
+    message = BytesParser(policy=compat32).parsebytes(mm[:])
+    defects = {type(d).__name__ for part in message.walk() for d in part.defects}
+    problems.extend(f"MIME defect: {name}" for name in sorted(defects))
+    return problems
+
+
+def _check_batch(
+    root: str, batch: list[tuple[str, int, str]], strict: bool
+) -> list[list[str] | None]:
+    return [check_file(os.path.join(root, p), size, sha, strict) for p, size, sha in batch]
+
+
+def _pending(manifest: Manifest, accounts: set[str], after: str) -> Iterator[tuple[str, int, str]]:
+    """Files of ``accounts`` after ``after``, with the size and hash to expect."""
+    for path, size, sha256 in manifest.entries(after):
+        if path.split(os.sep, 1)[0] not in accounts:
+            continue
+        stored = manifest.hashes.stored(path)
+        if stored is not None:
+            size, sha256 = stored.size, stored.sha256
+        yield path, size, sha256
+
+
+def _batches(
+    files: Iterable[tuple[str, int, str]],
+) -> Iterator[list[tuple[str, int, str]]]:
+    batch: list[tuple[str, int, str]] = []
+    size = 0
+    for item in files:
+        batch.append(item)
+        size += item[1]
+        if len(batch) >= _BATCH_FILES or size >= _BATCH_BYTES:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def _results(
+    root: Path,
+    batches: Iterator[list[tuple[str, int, str]]],
+    *,
+    strict: bool,
+    workers: int,
+    limiter: RateLimiter,
+) -> Iterator[tuple[list[tuple[str, int, str]], list[list[str] | None]]]:
+    """Check ``batches`` in order, in a process pool when ``workers > 1``.
+
+    Each batch's bytes are paid to ``limiter`` before it is read.  Results
+    come back in submission order, so everything before the last yielded
+    batch is done and the checkpoint can simply record its last path.
+    """
+    if workers <= 1:
+        for batch in batches:
+            limiter.acquire(sum(size for _, size, _ in batch))
+            yield batch, _check_batch(str(root), batch, strict)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    inflight: deque[tuple[list[tuple[str, int, str]], Future]] = deque()
+    try:
+        for batch in batches:
+            limiter.acquire(sum(size for _, size, _ in batch))
+            inflight.append((batch, pool.submit(_check_batch, str(root), batch, strict)))
+            if len(inflight) >= 2 * workers:
+                done, fut = inflight.popleft()
+                yield done, fut.result()
+        while inflight:
+            done, fut = inflight.popleft()
+            yield done, fut.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _load_checkpoint(path: Path, accounts: list[str], strict: bool) -> DeepCheckpoint | None:
+    data = load_json(path, None)
+    if not isinstance(data, dict):
+        return None
+    try:
+        checkpoint = DeepCheckpoint(**data)
+    except TypeError:
+        return None
+    if checkpoint.accounts != accounts or checkpoint.strict != strict:
+        return None
+    checkpoint.sessions += 1
+    return checkpoint
+
+
+def deep_check(
+    config: Config,
+    accounts: list[str],
+    *,
+    strict: bool = False,
+    restart: bool = False,
+    verbose: bool = False,
+) -> dict[str, Any]:
+    """Read and check every manifest file of ``accounts``.
+
+    Resumes from ``<state_dir>/verify-deep.json`` when a previous check of
+    the same accounts and strictness was interrupted, unless ``restart``.
+    The manifest must be up to date (``run_verify`` updates it first).
+
+    Returns:
+        The deep-check section of the verification report; ``status`` is
+        PASS only if no file has a problem.
+    """
+    assert config.paths is not None
+    settings = config.verify or VerifyConfig()
+    checkpoint_path = config.paths.state_dir / DEEP_CHECKPOINT_FILENAME
+    accounts = sorted(accounts)
+
+    checkpoint = None if restart else _load_checkpoint(checkpoint_path, accounts, strict)
+    if checkpoint is not None:
+        print(f"  deep: resuming after {checkpoint.checked} files ({checkpoint.position})")
+    else:
+        checkpoint = DeepCheckpoint(accounts, strict, datetime.now(timezone.utc).isoformat())
+
+    workers = settings.deep_workers or os.cpu_count() or 1
+    limiter = RateLimiter(settings.deep_rate_limit * 1024 * 1024)
+    started = time.monotonic()
+    last_saved = started
+
+    with Manifest.open(config.paths.state_dir, config.paths.maildir_root) as manifest:
+        if manifest.count() < _POOL_MIN_FILES:
+            workers = 1
+        batches = _batches(_pending(manifest, set(accounts), checkpoint.position))
+        try:
+            for batch, results in _results(
+                config.paths.maildir_root, batches, strict=strict, workers=workers, limiter=limiter
+            ):
+                for (path, size, _), problems in zip(batch, results):
+                    if problems is None:
+                        checkpoint.vanished += 1
+                        continue
+                    checkpoint.checked += 1
+                    checkpoint.bytes += size
+                    if problems:
+                        checkpoint.problems[path] = problems
+                checkpoint.position = batch[-1][0]
+                if time.monotonic() - last_saved >= settings.checkpoint_interval:
+                    save_json(checkpoint_path, asdict(checkpoint))
+                    last_saved = time.monotonic()
+                    if verbose:
+                        print(f"  deep: {checkpoint.checked} files checked ({checkpoint.position})")
+        except BaseException:
+            save_json(checkpoint_path, asdict(checkpoint))
+            raise
+    checkpoint_path.unlink(missing_ok=True)
+
+    problems = checkpoint.problems
+    return {
+        "status": "PASS" if not problems else "FAIL",
+        "strict": strict,
+        "started": checkpoint.started,
+        "sessions": checkpoint.sessions,
+        "files_checked": checkpoint.checked,
+        "bytes_checked": checkpoint.bytes,
+        "vanished": checkpoint.vanished,
+        "problem_files": len(problems),
+        "problems": {p: problems[p] for p in sorted(problems)[:_REPORT_SAMPLE]},
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
@@ -0,0 +1,474 @@
+"""Persistent manifest of every message file under ``maildir_root``.
+
+The manifest lives in ``<state_dir>/manifest.sqlite3`` and records, per
+Maildir file, its size, mtime, Message-ID and SHA-256.  It is updated
+incrementally: only ``cur/`` and ``new/`` directories whose mtime changed
+since the last scan are listed, so the cost of an update scales with the
+number of changed folders rather than the size of the archive.  Content
+hashes come from the shared :class:`~email_archiver.hashindex.HashIndex`,
+so a message moved to another folder is not read again.
+
+Consumers that need to know what changed between two of their own runs
+(the incremental backup) register a *watermark*.  While any watermark
+exists, every update also appends the paths it added and removed to a
+change journal, which is pruned once every watermark has moved past it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from email_archiver.hashindex import (
+    HASH_INDEX_FILENAME,
+    HashIndex,
+    parse_message_id,
+    unique_name,
+)
+
+MANIFEST_FILENAME = "manifest.sqlite3"
+
+# Directories under maildir_root that never contain mail.
+_SKIP_DIRS = {".notmuch", "tmp"}
+
+# A directory modified this recently may still change within the same mtime
+# tick (ext4 timestamps are jiffy-granular), so it is not trusted as clean.
+RACY_WINDOW_NS = 2_000_000_000
+
+# Rows written per transaction while rescanning, so concurrent per-account
+# updates don't hold the SQLite write lock for a whole large folder.
+_COMMIT_EVERY = 500
+
+_HASH_CHUNK = 1 << 20
+_HEADER_LIMIT = 256 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    message_id TEXT,
+    sha256 TEXT NOT NULL,
+    indexed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE INDEX IF NOT EXISTS files_unindexed ON files(indexed) WHERE indexed = 0;
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    removed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS watermarks (
+    name TEXT PRIMARY KEY,
+    seq INTEGER
+);
+"""
+
+
+@dataclass
+class ManifestEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    message_id: str | None
+    sha256: str
+
+
+@dataclass
+class ManifestDelta:
+    """What changed on disk since the previous :meth:`Manifest.update`."""
+
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    renamed: int = 0
+    dirs_total: int = 0
+    dirs_scanned: int = 0
+
+
+def read_message_id(path: Path) -> str | None:
+    """Read the Message-ID header from a message file, without angle brackets."""
+    with open(path, "rb") as f:
+        head = bytearray()
+        for line in f:
+            head += line
+            if line in (b"\n", b"\r\n") or len(head) > _HEADER_LIMIT:
+                break
+    return parse_message_id(bytes(head))
+
+
+def scan_file(path: Path) -> tuple[str, str, str | None]:
+    """Return a file's (sha256, sha1, Message-ID), reading it once in 1 MiB chunks."""
+    sha256 = hashlib.sha256()
+    sha1 = hashlib.sha1()
+    head = b""
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            sha256.update(chunk)
+            sha1.update(chunk)
+            if len(head) < _HEADER_LIMIT:
+                head += chunk[: _HEADER_LIMIT - len(head)]
+    return sha256.hexdigest(), sha1.hexdigest(), parse_message_id(head)
+
+
+def describe_file(
+    root: Path, rel: str, st: os.stat_result, hashes: HashIndex | None = None
+) -> ManifestEntry:
+    """Build a manifest entry for one message file.
+
+    The file is read at most once: not at all if ``hashes`` already knows
+    it, unless it has no Message-ID and its SHA-1 is needed.
+
+    Raises:
+        FileNotFoundError: The file vanished (renamed or expunged).
+    """
+    full = root / rel
+    known = hashes.get(root, rel, st) if hashes is not None else None
+    sha1 = None
+    if known is not None:
+        sha256, message_id = known.sha256, known.message_id
+    else:
+        sha256, sha1, message_id = scan_file(full)
+    if message_id is None:
+        if sha1 is None:
+            sha1 = scan_file(full)[1]
+        # notmuch indexes messages without a Message-ID under this synthetic id.
+        message_id = f"notmuch-sha1-{sha1}"
+    return ManifestEntry(rel, st.st_size, st.st_mtime_ns, message_id, sha256)
+
+
+def iter_mail_dirs(root: Path) -> Iterator[tuple[str, int]]:
+    """Yield ``(relative_path, mtime_ns)`` for every Maildir ``cur``/``new`` dir.
+
+    Only folder directories are listed; ``cur``/``new`` themselves are
+    stat'ed but never opened, which keeps discovery cheap for huge folders.
+    """
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        names = {e.name for e in entries if e.is_dir(follow_symlinks=False)}
+        is_maildir = "cur" in names and "new" in names
+        for entry in entries:
+            if entry.name not in names or entry.name in _SKIP_DIRS:
+                continue
+            if is_maildir and entry.name in ("cur", "new"):
+                rel = os.path.relpath(entry.path, root)
+                yield rel, entry.stat(follow_symlinks=False).st_mtime_ns
+            else:
+                stack.append(Path(entry.path))
+
+
+class Manifest:
+    """SQLite-backed manifest of Maildir files.  Use as a context manager."""
+
+    def __init__(self, db_path: Path, maildir_root: Path) -> None:
+        self.db_path = db_path
+        self.root = maildir_root
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.hashes = HashIndex(db_path.parent / HASH_INDEX_FILENAME)
+        self._journal = self.conn.execute("SELECT 1 FROM watermarks LIMIT 1").fetchone() is not None
+
+    @classmethod
+    def open(cls, state_dir: Path, maildir_root: Path) -> Manifest:
+        return cls(state_dir / MANIFEST_FILENAME, maildir_root)
+
+    def __enter__(self) -> Manifest:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+        self.hashes.close()
+
+    def update(self, prefix: str | None = None) -> ManifestDelta:
+        """Rescan changed Maildir directories and record the differences.
+
+        Args:
+            prefix: Optional relative sub-tree (e.g. an account name) to
+                restrict the scan to.
+
+        Returns:
+            The files added and removed, and how many directories were rescanned.
+        """
+        delta = ManifestDelta()
+        scan_root = self.root / prefix if prefix else self.root
+        known = dict(
+            self.conn.execute(
+                "SELECT path, mtime_ns FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                _prefix_args(prefix),
+            ).fetchall()
+            if prefix
+            else self.conn.execute("SELECT path, mtime_ns FROM dirs").fetchall()
+        )
+
+        seen: set[str] = set()
+        stale: list[tuple[str, int]] = []
+        for rel_dir, mtime_ns in iter_mail_dirs(scan_root):
+            if prefix:
+                rel_dir = os.path.join(prefix, rel_dir)
+            seen.add(rel_dir)
+            delta.dirs_total += 1
+            if known.get(rel_dir) != mtime_ns:
+                stale.append((rel_dir, mtime_ns))
+
+        # Process cur/ before new/ so new/ → cur/ moves are seen as renames.
+        stale.sort(key=lambda item: os.path.basename(item[0]) != "cur")
+        for rel_dir, mtime_ns in stale:
+            delta.dirs_scanned += 1
+            self._rescan_dir(rel_dir, delta)
+            if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+                mtime_ns = -1  # force a rescan next time
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)", (rel_dir, mtime_ns)
+            )
+
+        # Folders that vanished entirely.
+        for rel_dir in set(known) - seen:
+            rows = self.conn.execute("SELECT path FROM files WHERE dir = ?", (rel_dir,)).fetchall()
+            for (path,) in rows:
+                delta.removed.append(path)
+                self._log(path, removed=True)
+            self.conn.execute("DELETE FROM files WHERE dir = ?", (rel_dir,))
+            self.conn.execute("DELETE FROM dirs WHERE path = ?", (rel_dir,))
+
+        self.conn.commit()
+        return delta
+
+    def _rescan_dir(self, rel_dir: str, delta: ManifestDelta) -> None:
+        """Diff one ``cur``/``new`` directory listing against the manifest.
+
+        Maildir files are immutable once delivered, so already-known names
+        are not stat'ed again; only new names are read and hashed.
+        """
+        before = {
+            row[0]: row
+            for row in self.conn.execute(
+                "SELECT path, size, mtime_ns, message_id, sha256, indexed FROM files WHERE dir = ?",
+                (rel_dir,),
+            )
+        }
+
+        on_disk: set[str] = set()
+        try:
+            with os.scandir(self.root / rel_dir) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        on_disk.add(os.path.join(rel_dir, entry.name))
+        except FileNotFoundError:
+            pass
+
+        gone = {p: before[p] for p in before.keys() - on_disk}
+        # Flag changes rename "<unique>:2,S" → "<unique>:2,RS", and delivery
+        # moves files from new/ to cur/.  Match by unique name so the content
+        # hash and indexed state are carried over instead of recomputed.
+        by_unique = {unique_name(os.path.basename(p)): row for p, row in gone.items()}
+        by_unique.update(self._moved_from_new(rel_dir))
+
+        for n, path in enumerate(sorted(on_disk - before.keys()), 1):
+            if n % _COMMIT_EVERY == 0:
+                self.conn.commit()
+            try:
+                st = os.stat(self.root / path)
+            except FileNotFoundError:
+                continue  # renamed again while we were scanning
+            moved = by_unique.get(unique_name(os.path.basename(path)))
+            if moved is not None and moved[1] == st.st_size:
+                entry = ManifestEntry(path, st.st_size, st.st_mtime_ns, moved[3], moved[4])
+                indexed = moved[5]
+                self.conn.execute("DELETE FROM files WHERE path = ?", (moved[0],))
+                gone.pop(moved[0], None)
+                delta.renamed += 1
+                self._log(moved[0], removed=True)
+            else:
+                try:
+                    entry = describe_file(self.root, path, st, self.hashes)
+                except FileNotFoundError:
+                    continue
+                delta.added.append(path)
+                indexed = 0
+            self._log(path, removed=False)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files "
+                "(path, dir, size, mtime_ns, message_id, sha256, indexed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry.path,
+                    rel_dir,
+                    entry.size,
+                    entry.mtime_ns,
+                    entry.message_id,
+                    entry.sha256,
+                    indexed,
+                ),
+            )
+
+        for path in gone:
+            self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            delta.removed.append(path)
+            self._log(path, removed=True)
+
+    def _log(self, path: str, *, removed: bool) -> None:
+        if self._journal:
+            self.conn.execute(
+                "INSERT INTO journal (path, removed) VALUES (?, ?)", (path, int(removed))
+            )
+
+    def _moved_from_new(self, rel_dir: str) -> dict[str, tuple]:
+        """Rows of the sibling ``new/`` whose files are gone (moved into ``cur/``)."""
+        parent, leaf = os.path.split(rel_dir)
+        if leaf != "cur":
+            return {}
+        sibling = os.path.join(parent, "new")
+        found: dict[str, tuple] = {}
+        for row in self.conn.execute(
+            "SELECT path, size, mtime_ns, message_id, sha256, indexed FROM files WHERE dir = ?",
+            (sibling,),
+        ).fetchall():
+            if not (self.root / row[0]).exists():
+                found[unique_name(os.path.basename(row[0]))] = row
+        return found
+
+    def unindexed(self, prefix: str | None = None) -> list[tuple[str, str]]:
+        """Return ``(path, message_id)`` for files not yet confirmed as indexed."""
+        if prefix:
+            return self.conn.execute(
+                "SELECT path, message_id FROM files WHERE indexed = 0 AND path LIKE ? ESCAPE '\\'",
+                (escape_like(prefix + os.sep) + "%",),
+            ).fetchall()
+        return self.conn.execute("SELECT path, message_id FROM files WHERE indexed = 0").fetchall()
+
+    def entries(self, after: str = "") -> Iterator[tuple[str, int, str]]:
+        """``(path, size, sha256)`` of every file sorting after ``after``, in path order."""
+        return iter(
+            self.conn.execute(
+                "SELECT path, size, sha256 FROM files WHERE path > ? ORDER BY path", (after,)
+            )
+        )
+
+    def paths(self, prefix: str | None = None) -> Iterator[str]:
+        """Every file path (under ``prefix``), in path order."""
+        if prefix:
+            rows = self.conn.execute(
+                "SELECT path FROM files WHERE path LIKE ? ESCAPE '\\' ORDER BY path",
+                (escape_like(prefix + os.sep) + "%",),
+            )
+        else:
+            rows = self.conn.execute("SELECT path FROM files ORDER BY path")
+        return (path for (path,) in rows)
+
+    def message_ids(self, prefix: str | None = None) -> Iterator[str]:
+        """The Message-ID of every file (under ``prefix``) that has one."""
+        if prefix:
+            rows = self.conn.execute(
+                "SELECT message_id FROM files WHERE message_id IS NOT NULL"
+                " AND path LIKE ? ESCAPE '\\'",
+                (escape_like(prefix + os.sep) + "%",),
+            )
+        else:
+            rows = self.conn.execute("SELECT message_id FROM files WHERE message_id IS NOT NULL")
+        return (message_id for (message_id,) in rows)
+
+    def register_watermark(self, name: str) -> None:
+        """Start journaling changes for consumer ``name`` (a no-op if already registered).
+
+        A new watermark has no position: :meth:`changes_since` returns None
+        until :meth:`set_watermark` records the first complete run.
+        """
+        self.conn.execute("INSERT OR IGNORE INTO watermarks (name, seq) VALUES (?, NULL)", (name,))
+        self.conn.commit()
+        self._journal = True
+
+    def journal_head(self) -> int:
+        """Sequence number of the newest journal entry (0 if empty)."""
+        (seq,) = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM journal").fetchone()
+        return int(seq)
+
+    def changes_since(
+        self, name: str, head: int, prefix: str | None = None
+    ) -> ManifestDelta | None:
+        """Net files added and removed (under ``prefix``) after watermark ``name``, up to ``head``.
+
+        A file renamed in between shows up as its old path removed and its
+        new path added.
+
+        Returns:
+            The delta, or None if ``name`` has no position yet.
+        """
+        row = self.conn.execute("SELECT seq FROM watermarks WHERE name = ?", (name,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        query = "SELECT path, removed FROM journal WHERE seq > ? AND seq <= ?"
+        args: tuple = (row[0], head)
+        if prefix:
+            query += " AND path LIKE ? ESCAPE '\\'"
+            args += (escape_like(prefix + os.sep) + "%",)
+        last: dict[str, int] = {}
+        for path, removed in self.conn.execute(query + " ORDER BY seq", args):
+            last[path] = removed
+        delta = ManifestDelta()
+        for path in sorted(last):
+            (delta.removed if last[path] else delta.added).append(path)
+        return delta
+
+    def set_watermark(self, name: str, seq: int) -> None:
+        """Move watermark ``name`` to ``seq`` and drop journal entries no watermark needs."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO watermarks (name, seq) VALUES (?, ?)", (name, seq)
+            )
+            self.conn.execute(
+                "DELETE FROM journal WHERE seq <= "
+                "(SELECT MIN(seq) FROM watermarks WHERE seq IS NOT NULL)"
+            )
+        self._journal = True
+
+    def folder_paths(self, folder: str) -> list[str]:
+        """Paths of the files in the ``cur/`` and ``new/`` of Maildir ``folder``."""
+        rows = self.conn.execute(
+            "SELECT path FROM files WHERE dir IN (?, ?)",
+            (os.path.join(folder, "cur"), os.path.join(folder, "new")),
+        )
+        return [path for (path,) in rows]
+
+    def mark_indexed(self, paths: list[str]) -> None:
+        self.conn.executemany("UPDATE files SET indexed = 1 WHERE path = ?", ((p,) for p in paths))
+        self.conn.commit()
+
+    def count(self, prefix: str | None = None) -> int:
+        if prefix:
+            (n,) = self.conn.execute(
+                "SELECT COUNT(*) FROM files WHERE path LIKE ? ESCAPE '\\'",
+                (escape_like(prefix + os.sep) + "%",),
+            ).fetchone()
+        else:
+            (n,) = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()
+        return int(n)
+
+
+def escape_like(value: str) -> str:
+    """Escape ``value`` for a SQL ``LIKE ... ESCAPE '\\'`` pattern."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _prefix_args(prefix: str | None) -> tuple[str, str]:
+    assert prefix is not None
+    return prefix, escape_like(prefix + os.sep) + "%"
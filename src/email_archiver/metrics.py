@@ -0,0 +1,250 @@
+"""Per-stage timings and counters, exported for monitoring.
+
+Every sync, index, verify and backup records one :class:`StageSample` per
+account (plus an ``all`` sample for the whole stage).  Samples are:
+
+- appended to ``<state_dir>/metrics.jsonl``, one JSON object per line, as
+  a history to find slow accounts and throughput regressions;
+- folded into ``<state_dir>/metrics-latest.json``, the last sample of each
+  stage and account, from which a Prometheus node_exporter textfile
+  (``[metrics] textfile``) is rewritten atomically.
+
+Writing metrics never fails a command: errors are printed and ignored.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from email_archiver.config import Config
+from email_archiver.manifest import iter_mail_dirs
+from email_archiver.state import atomic_write_text, load_json, save_json
+
+HISTORY_FILENAME = "metrics.jsonl"
+LATEST_FILENAME = "metrics-latest.json"
+_LOCK_FILENAME = "metrics.lock"
+
+# Label value of the sample that covers a whole stage rather than one account.
+ALL_ACCOUNTS = "all"
+
+# metrics.jsonl is rotated to metrics.jsonl.1 beyond this size.
+_HISTORY_MAX_BYTES = 10 * 1024 * 1024
+
+# Filesystem timestamps come from a coarse clock that can lag time.time_ns()
+# by a tick, so files written right after a stage started may look older.
+_MTIME_SLACK_NS = 20_000_000
+
+_PREFIX = "email_archiver"
+
+_HELP = {
+    "stage_duration_seconds": "Duration of the last run of a stage, in seconds.",
+    "stage_success": "1 if the last run of a stage succeeded, 0 otherwise.",
+    "stage_last_run_timestamp_seconds": "Unix time the last run of a stage finished.",
+    "stage_last_success_timestamp_seconds": "Unix time a stage last finished successfully.",
+    "sync_messages_added": "Message files delivered to the Maildir by the last sync.",
+    "sync_bytes_added": "Bytes of message files delivered by the last sync.",
+    "sync_messages_pulled": "New messages mbsync reported pulling in the last sync.",
+    "sync_messages_per_second": "Messages pulled per second of mbsync time in the last sync.",
+    "sync_targets": "mbsync targets (accounts or channels) run by the last sync.",
+    "sync_failed_targets": "mbsync targets that failed in the last sync.",
+    "index_messages_added": "Messages added to the notmuch database by the last index.",
+    "index_messages_removed": "Messages removed from the notmuch database by the last index.",
+    "index_files_renamed": "File renames detected by the last index.",
+    "index_files_processed": "Files processed by the last index.",
+    "verify_messages": "Messages in the index for the account at the last verify.",
+    "verify_files": "Maildir files in the manifest at the last verify.",
+    "verify_files_added": "Maildir files that were new at the last verify.",
+    "verify_unindexed_files": "Maildir files missing from the index at the last verify.",
+    "verify_remote_missing_uids": "Server messages missing locally at the last remote verify.",
+    "verify_deep_files_checked": "Files read by the last deep verify.",
+    "verify_deep_bytes_checked": "Bytes read by the last deep verify.",
+    "verify_deep_problem_files": "Files that failed the last deep verify.",
+    "backup_files": "Files handed to the last incremental backup.",
+    "backup_removed_files": "Removed files listed for the last incremental backup.",
+    "backup_new_files": "Messages added to the native store by the last backup.",
+    "backup_new_bytes": "Bytes of messages added to the native store by the last backup.",
+    "backup_stored_bytes": "Compressed bytes written to the native store by the last backup.",
+    "backup_targets": "Backup targets run by the last backup.",
+    "backup_failed_targets": "Backup targets that failed in the last backup.",
+    "import_messages": "Messages written to the Maildir by the last mbox import.",
+    "import_duplicates": "Messages skipped by the last mbox import as already archived.",
+    "dedupe_files": "Maildir files hashed by the last dedupe.",
+    "dedupe_duplicate_groups": "Messages stored more than once at the last dedupe.",
+    "dedupe_redundant_files": "Extra copies of duplicated messages at the last dedupe.",
+    "dedupe_reclaimable_bytes": "Bytes hardlinking identical copies would free at the last dedupe.",
+    "dedupe_linked_files": "Duplicate files replaced by hardlinks in the last dedupe.",
+}
+
+_NOTMUCH_COUNTS = {
+    "files_processed": re.compile(r"Processed (\d+) (?:total )?files?"),
+    "messages_added": re.compile(r"Added (\d+) new messages?"),
+    "messages_removed": re.compile(r"Removed (\d+) messages?"),
+    "files_renamed": re.compile(r"Detected (\d+) file renames?"),
+}
+
+_lock = threading.Lock()
+
+
+@dataclass
+class StageSample:
+    """One stage's outcome for one account (or :data:`ALL_ACCOUNTS`)."""
+
+    stage: str
+    account: str
+    ok: bool
+    duration_seconds: float
+    values: dict[str, float] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+
+def parse_notmuch_new(output: str) -> dict[str, float]:
+    """Extract the counts from the summary ``notmuch new`` prints.
+
+    ``No new mail.`` yields zero added messages; unknown output yields {}.
+    """
+    counts: dict[str, float] = {}
+    for key, pattern in _NOTMUCH_COUNTS.items():
+        m = pattern.search(output)
+        if m:
+            counts[key] = int(m.group(1))
+    if "No new mail" in output:
+        counts.setdefault("messages_added", 0)
+    return counts
+
+
+def delivered_since(root: Path, since_ns: int) -> tuple[int, int]:
+    """Count message files written under ``root`` since ``since_ns``.
+
+    Only ``cur``/``new`` directories modified since then are listed, so a
+    sync that touched a few folders costs a few directory reads.
+
+    Returns:
+        ``(messages, bytes)``.
+    """
+    since_ns -= _MTIME_SLACK_NS
+    messages = size = 0
+    for rel, mtime_ns in iter_mail_dirs(root):
+        if mtime_ns < since_ns:
+            continue
+        try:
+            with os.scandir(root / rel) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    if entry.is_file(follow_symlinks=False) and st.st_mtime_ns >= since_ns:
+                        messages += 1
+                        size += st.st_size
+        except FileNotFoundError:
+            continue
+    return messages, size
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_textfile(latest: dict[str, dict[str, dict[str, Any]]]) -> str:
+    """Render the latest samples in the Prometheus text exposition format."""
+    series: dict[str, list[str]] = {}
+
+    def add(name: str, labels: str, value: float) -> None:
+        series.setdefault(name, []).append(f"{_PREFIX}_{name}{{{labels}}} {_number(value)}")
+
+    for stage in sorted(latest):
+        for account in sorted(latest[stage]):
+            sample = latest[stage][account]
+            labels = f'stage="{_escape(stage)}",account="{_escape(account)}"'
+            add("stage_duration_seconds", labels, sample["duration_seconds"])
+            add("stage_success", labels, 1 if sample["ok"] else 0)
+            add("stage_last_run_timestamp_seconds", labels, sample["timestamp"])
+            if sample.get("last_success") is not None:
+                add("stage_last_success_timestamp_seconds", labels, sample["last_success"])
+            account_label = f'account="{_escape(account)}"'
+            for key, value in sorted(sample.get("values", {}).items()):
+                add(f"{stage}_{key}", account_label, value)
+
+    lines: list[str] = []
+    for name, rows in series.items():
+        help_text = _HELP.get(name, f"{name.replace('_', ' ')} reported by the last run.")
+        lines.append(f"# HELP {_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {_PREFIX}_{name} gauge")
+        lines.extend(rows)
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def _locked(state_dir: Path) -> Iterator[None]:
+    """Serialize writers in this process and across processes (daemon + cron)."""
+    with _lock:
+        state_dir.mkdir(parents=True, exist_ok=True)
+        with open(state_dir / _LOCK_FILENAME, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _append_history(path: Path, samples: list[StageSample]) -> None:
+    try:
+        if path.stat().st_size > _HISTORY_MAX_BYTES:
+            os.replace(path, path.with_name(path.name + ".1"))
+    except FileNotFoundError:
+        pass
+    with open(path, "a", encoding="utf-8") as f:
+        for sample in samples:
+            f.write(json.dumps(asdict(sample), sort_keys=True) + "\n")
+
+
+def enabled(config: Config) -> bool:
+    """True if samples should be recorded for ``config``."""
+    return config.metrics is not None and config.metrics.enabled
+
+
+def record(config: Config, samples: list[StageSample]) -> None:
+    """Append ``samples`` to the history and re-export the textfile.
+
+    Does nothing when ``[metrics] enabled = false`` or the config has no
+    metrics section (e.g. configs built in code rather than loaded).
+    """
+    if not enabled(config) or not samples:
+        return
+    assert config.metrics is not None
+    assert config.paths is not None
+    state_dir = config.paths.state_dir
+    try:
+        with _locked(state_dir):
+            _append_history(state_dir / HISTORY_FILENAME, samples)
+            latest_path = state_dir / LATEST_FILENAME
+            latest = load_json(latest_path, {})
+            if not isinstance(latest, dict):
+                latest = {}
+            for sample in samples:
+                previous = latest.setdefault(sample.stage, {}).get(sample.account, {})
+                entry = asdict(sample)
+                entry["last_success"] = (
+                    sample.timestamp if sample.ok else previous.get("last_success")
+                )
+                latest[sample.stage][sample.account] = entry
+            save_json(latest_path, latest)
+            if config.metrics.textfile is not None:
+                atomic_write_text(config.metrics.textfile, render_textfile(latest))
+    except OSError as e:
+        print(f"Warning: could not write metrics: {e}")
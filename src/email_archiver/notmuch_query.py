@@ -0,0 +1,257 @@
+"""Batched read-only queries against the notmuch index.
+
+Verification needs message counts and oldest/newest dates for several
+scopes (the whole archive, each account, each folder).  Spawning one
+``notmuch`` process per fact dominates verify's wall-clock on small
+accounts, so this module gathers them in bulk:
+
+- with the ``notmuch2`` Python bindings (when importable) everything is
+  answered in-process from a single read-only database handle;
+- otherwise all counts come from one ``notmuch count --batch`` process and
+  the per-scope date lookups run concurrently.
+
+Excluded tags (``search.exclude_tags``) are ignored by both backends: a
+message tagged ``spam`` is still part of the archive.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from types import ModuleType
+
+from email_archiver.runner import RunResult, run_command
+
+BACKEND_BINDINGS = "bindings"
+BACKEND_SUBPROCESS = "subprocess"
+
+# Concurrent `notmuch search` processes used by the subprocess backend.
+_SEARCH_WORKERS = 8
+
+
+@dataclass
+class ScopeFacts:
+    """Count and date coverage of one notmuch query."""
+
+    count: int | None = None
+    oldest: str | None = None
+    newest: str | None = None
+
+
+@dataclass
+class QueryFacts:
+    """All facts gathered by :func:`query_facts`.
+
+    ``result`` describes the count step so callers can fail closed on it.
+    """
+
+    scopes: dict[str, ScopeFacts] = field(default_factory=dict)
+    backend: str = BACKEND_SUBPROCESS
+    result: RunResult | None = None
+
+
+def _load_bindings() -> ModuleType | None:
+    try:
+        import notmuch2
+    except ImportError:
+        return None
+    return notmuch2
+
+
+def _notmuch_env(notmuch_config_path: Path) -> dict[str, str]:
+    return {**os.environ, "NOTMUCH_CONFIG": str(notmuch_config_path)}
+
+
+def _iso(ts: int | float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def quote_term(prefix: str, value: str) -> str:
+    """Quote ``value`` for a notmuch ``prefix:`` term (``"`` is doubled)."""
+    return f'{prefix}:"' + value.replace('"', '""') + '"'
+
+
+# -- subprocess backend ----------------------------------------------------
+
+
+def _count_batch(
+    notmuch_config_path: Path, queries: list[str]
+) -> tuple[RunResult, list[int] | None]:
+    """Count every query with a single ``notmuch count --batch`` process."""
+    with tempfile.NamedTemporaryFile("w", suffix=".queries", encoding="utf-8") as f:
+        f.write("".join(q + "\n" for q in queries))
+        f.flush()
+        result = run_command(
+            ["notmuch", "count", "--batch", "--exclude=false", f"--input={f.name}"],
+            env=_notmuch_env(notmuch_config_path),
+        )
+    if not result.ok:
+        return result, None
+    lines = result.stdout.split()
+    if len(lines) != len(queries):
+        return result, None
+    try:
+        return result, [int(n) for n in lines]
+    except ValueError:
+        return result, None
+
+
+def _search_boundary(notmuch_config_path: Path, query: str, sort: str) -> str | None:
+    """Return the oldest or newest message date matching ``query``.
+
+    Args:
+        sort: 'oldest-first' or 'newest-first'
+    """
+    result = run_command(
+        [
+            "notmuch",
+            "search",
+            "--format=json",
+            "--output=summary",
+            f"--sort={sort}",
+            "--limit=1",
+            "--exclude=false",
+            query,
+        ],
+        env=_notmuch_env(notmuch_config_path),
+    )
+    if result.ok and result.stdout.strip():
+        try:
+            threads = json.loads(result.stdout)
+            if threads and isinstance(threads, list):
+                ts = threads[0].get("timestamp", 0)
+                if ts:
+                    return _iso(ts)
+                return threads[0].get("date_relative", "unknown")
+        except (json.JSONDecodeError, AttributeError):
+            pass
+    return None
+
+
+def _facts_subprocess(
+    notmuch_config_path: Path, queries: dict[str, str], boundaries: list[str]
+) -> QueryFacts:
+    names = list(queries)
+    result, counts = _count_batch(notmuch_config_path, [queries[n] for n in names])
+    facts = QueryFacts(backend=BACKEND_SUBPROCESS, result=result)
+    for i, name in enumerate(names):
+        facts.scopes[name] = ScopeFacts(count=counts[i] if counts is not None else None)
+
+    # Date lookups are only worth doing for scopes that have messages.
+    wanted = [n for n in boundaries if facts.scopes[n].count]
+    if wanted:
+        workers = min(_SEARCH_WORKERS, 2 * len(wanted))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            oldest = {
+                n: pool.submit(_search_boundary, notmuch_config_path, queries[n], "oldest-first")
+                for n in wanted
+            }
+            newest = {
+                n: pool.submit(_search_boundary, notmuch_config_path, queries[n], "newest-first")
+                for n in wanted
+            }
+            for n in wanted:
+                facts.scopes[n].oldest = oldest[n].result()
+                facts.scopes[n].newest = newest[n].result()
+    return facts
+
+
+# -- bindings backend ------------------------------------------------------
+
+
+def _open_db(bindings: ModuleType, notmuch_config_path: Path):
+    return bindings.Database(mode=bindings.Database.MODE.READ_ONLY, config=str(notmuch_config_path))
+
+
+def _facts_bindings(
+    bindings: ModuleType,
+    notmuch_config_path: Path,
+    queries: dict[str, str],
+    boundaries: list[str],
+) -> QueryFacts:
+    start = time.monotonic()
+    facts = QueryFacts(backend=BACKEND_BINDINGS)
+    sort = bindings.Database.SORT
+    # No exclude_tags are passed, so nothing is excluded (unlike the CLI,
+    # which reads search.exclude_tags from the config).
+    with _open_db(bindings, notmuch_config_path) as db:
+        for name, query in queries.items():
+            scope = ScopeFacts(count=db.count_messages(query))
+            if name in boundaries and scope.count:
+                for msg in db.messages(query, sort=sort.OLDEST_FIRST):
+                    scope.oldest = _iso(msg.date)
+                    break
+                for msg in db.messages(query, sort=sort.NEWEST_FIRST):
+                    scope.newest = _iso(msg.date)
+                    break
+            facts.scopes[name] = scope
+    facts.result = RunResult(
+        ["notmuch2", "count", *queries.values()], 0, "", "", time.monotonic() - start
+    )
+    return facts
+
+
+# -- public API ------------------------------------------------------------
+
+
+def query_facts(
+    notmuch_config_path: Path,
+    queries: dict[str, str],
+    *,
+    boundaries: Iterable[str] | None = None,
+) -> QueryFacts:
+    """Gather counts and date coverage for several named queries at once.
+
+    Args:
+        notmuch_config_path: Generated notmuch config.
+        queries: Scope name → notmuch query string.
+        boundaries: Scope names that also need oldest/newest dates
+            (default: all of them).
+
+    Returns:
+        QueryFacts with one ScopeFacts per query.  Counts are None if the
+        index could not be queried.
+    """
+    wanted = list(queries) if boundaries is None else [b for b in boundaries if b in queries]
+    bindings = _load_bindings()
+    if bindings is not None:
+        try:
+            return _facts_bindings(bindings, notmuch_config_path, queries, wanted)
+        except Exception as e:  # any binding failure falls back to the CLI
+            print(f"  notmuch bindings unavailable ({e}); falling back to the notmuch CLI")
+    return _facts_subprocess(notmuch_config_path, queries, wanted)
+
+
+def present_message_ids(notmuch_config_path: Path, message_ids: list[str]) -> set[str] | None:
+    """Return the subset of ``message_ids`` present in the notmuch index.
+
+    Returns None if the index could not be queried.
+    """
+    if not message_ids:
+        return set()
+    bindings = _load_bindings()
+    if bindings is not None:
+        try:
+            found: set[str] = set()
+            with _open_db(bindings, notmuch_config_path) as db:
+                for mid in message_ids:
+                    try:
+                        db.find(mid)
+                    except LookupError:
+                        continue
+                    found.add(mid)
+            return found
+        except Exception as e:
+            print(f"  notmuch bindings unavailable ({e}); falling back to the notmuch CLI")
+
+    _, counts = _count_batch(notmuch_config_path, [quote_term("id", m) for m in message_ids])
+    if counts is None:
+        return None
+    return {mid for mid, n in zip(message_ids, counts) if n > 0}
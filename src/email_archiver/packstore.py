@@ -0,0 +1,372 @@
+"""Content-addressed pack store for ``[backup] mode = "native"``.
+
+Maildir messages are immutable and often stored more than once (the same
+mail in several folders or accounts), so the store deduplicates whole
+messages by SHA-256 rather than chunking files like a generic backup
+tool.  A repository looks like::
+
+    packs/<aa>/<id>.pack    compressed messages back to back, after a header
+    index.sqlite3           SHA-256 → pack, offset, compressed and raw length
+    snapshots/<id>.json     when, what, and how many files
+    snapshots/<id>.snap     compressed "sha256 size path" line per file
+    lock
+
+Packs are filled to ``pack_size`` with large buffered writes, fsynced,
+renamed into place and only then added to the index, so an interrupted
+backup leaves at most an unreferenced pack behind.  Messages are
+compressed with zstd when the ``zstandard`` package is installed, and
+with zlib otherwise; each pack and snapshot records its codec.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import zlib
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from types import ModuleType
+from typing import IO, Any
+
+from email_archiver.state import save_json
+
+PACK_MAGIC = b"EAPACK1"
+_CODECS = {"zstd": 1, "zlib": 2}
+
+# Buffer for pack and snapshot writes, so packs go out in large sequential I/O.
+_WRITE_BUFFER = 8 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 BLOB PRIMARY KEY,
+    pack TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class StoreError(Exception):
+    """Raised when a repository is locked, damaged or can't be read."""
+
+
+def _load_zstd() -> ModuleType | None:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def default_codec() -> str:
+    """``zstd`` if the ``zstandard`` package is available, else ``zlib``."""
+    return "zstd" if _load_zstd() is not None else "zlib"
+
+
+class _Codec:
+    """One-shot and streaming (de)compression for a codec name."""
+
+    def __init__(self, name: str, level: int = 3) -> None:
+        self.name = name
+        self.level = level
+        self.zstd = _load_zstd() if name == "zstd" else None
+        if name == "zstd" and self.zstd is None:
+            raise StoreError("This repository uses zstd; install the 'zstandard' package")
+        if name not in _CODECS:
+            raise StoreError(f"Unknown codec '{name}'")
+
+    @classmethod
+    def from_id(cls, codec_id: int) -> _Codec:
+        for name, value in _CODECS.items():
+            if value == codec_id:
+                return cls(name)
+        raise StoreError(f"Unknown codec id {codec_id}")
+
+    @property
+    def id(self) -> int:
+        return _CODECS[self.name]
+
+    def compress(self, data: bytes) -> bytes:
+        if self.zstd is not None:
+            return self.zstd.ZstdCompressor(level=self.level).compress(data)
+        return zlib.compress(data, min(self.level, 9))
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.zstd is not None:
+            return self.zstd.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def compressobj(self) -> Any:
+        if self.zstd is not None:
+            return self.zstd.ZstdCompressor(level=self.level).compressobj()
+        return zlib.compressobj(min(self.level, 9))
+
+    def decompressobj(self) -> Any:
+        if self.zstd is not None:
+            return self.zstd.ZstdDecompressor().decompressobj()
+        return zlib.decompressobj()
+
+
+@dataclass
+class Snapshot:
+    """Summary of one snapshot, stored as ``snapshots/<id>.json``."""
+
+    id: str
+    time: str
+    scope: str
+    files: int = 0
+    bytes: int = 0
+    new_files: int = 0
+    new_bytes: int = 0
+    stored_bytes: int = 0
+    vanished: int = 0
+
+
+def fsync_dir(path: Path) -> None:
+    """Make renames and new entries in directory ``path`` durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _PackWriter:
+    """Appends compressed blobs to one pack file until it is sealed."""
+
+    def __init__(self, root: Path, codec: _Codec) -> None:
+        self.id = secrets.token_hex(16)
+        self.root = root
+        self.tmp = root / "packs" / f".{self.id}.pack.tmp"
+        self.f = open(self.tmp, "wb", buffering=_WRITE_BUFFER)
+        self.f.write(PACK_MAGIC + bytes([codec.id]))
+        self.offset = len(PACK_MAGIC) + 1
+        self.rows: dict[bytes, tuple[int, int, int]] = {}
+
+    def add(self, digest: bytes, compressed: bytes, size: int) -> None:
+        self.f.write(compressed)
+        self.rows[digest] = (self.offset, len(compressed), size)
+        self.offset += len(compressed)
+
+    def seal(self) -> Path:
+        """Flush, fsync and move the pack into place; returns its final path."""
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        final = self.root / "packs" / self.id[:2] / f"{self.id}.pack"
+        final.parent.mkdir(exist_ok=True)
+        os.replace(self.tmp, final)
+        fsync_dir(final.parent)
+        return final
+
+    def abort(self) -> None:
+        self.f.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+class PackStore:
+    """A native backup repository.  Use as a context manager.
+
+    Only one process may write to a repository at a time; opening a
+    locked repository raises :class:`StoreError`.  A store opened with
+    ``read_only`` takes no lock, so it can list and read snapshots while a
+    backup writes: packs and snapshots only become visible once complete.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        pack_size: int = 64 * 1024 * 1024,
+        codec: str | None = None,
+        level: int = 3,
+        read_only: bool = False,
+    ) -> None:
+        self.root = root
+        self.pack_size = pack_size
+        self.codec = _Codec(codec or default_codec(), level)
+        self.read_only = read_only
+        self._pack: _PackWriter | None = None
+        self._readers: dict[str, tuple[Any, _Codec]] = {}
+        self._lock: IO[str] | None = None
+        if read_only:
+            uri = (root / "index.sqlite3").resolve().as_uri() + "?mode=ro"
+            try:
+                self.conn = sqlite3.connect(uri, uri=True, timeout=60)
+            except sqlite3.OperationalError as e:
+                raise StoreError(f"Cannot open repository {root}: {e}") from e
+            return
+        (root / "packs").mkdir(parents=True, exist_ok=True)
+        (root / "snapshots").mkdir(exist_ok=True)
+        lock = open(root / "lock", "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            raise StoreError(f"Repository {root} is in use by another backup") from None
+        self._lock = lock
+        self.conn = sqlite3.connect(root / "index.sqlite3", timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> PackStore:
+        return self
+
+    def __exit__(self, exc_type: object, *exc: object) -> None:
+        if exc_type is None:
+            self.flush()
+        elif self._pack is not None:
+            self._pack.abort()
+            self._pack = None
+        self.close()
+
+    def close(self) -> None:
+        for f, _ in self._readers.values():
+            f.close()
+        self._readers.clear()
+        self.conn.close()
+        if self._lock is not None:
+            self._lock.close()
+
+    def has(self, sha256: str) -> bool:
+        digest = bytes.fromhex(sha256)
+        if self._pack is not None and digest in self._pack.rows:
+            return True
+        row = self.conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (digest,)).fetchone()
+        return row is not None
+
+    def add(self, sha256: str, compressed: bytes, size: int) -> None:
+        """Append one already-compressed message (see :meth:`compress`)."""
+        if self.read_only:
+            raise StoreError(f"Repository {self.root} is open read-only")
+        if self._pack is None:
+            self._pack = _PackWriter(self.root, self.codec)
+        self._pack.add(bytes.fromhex(sha256), compressed, size)
+        if self._pack.offset >= self.pack_size:
+            self.flush()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.codec.compress(data)
+
+    def flush(self) -> None:
+        """Seal the open pack and add its messages to the index."""
+        if self._pack is None:
+            return
+        pack, self._pack = self._pack, None
+        pack.seal()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO blobs (sha256, pack, offset, length, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((digest, pack.id, *row) for digest, row in pack.rows.items()),
+            )
+
+    def read(self, sha256: str) -> bytes:
+        """Return one message by hash, checking its content.
+
+        Raises:
+            StoreError: If the message is unknown or its pack is damaged.
+        """
+        row = self.conn.execute(
+            "SELECT pack, offset, length, size FROM blobs WHERE sha256 = ?",
+            (bytes.fromhex(sha256),),
+        ).fetchone()
+        if row is None:
+            raise StoreError(f"Message {sha256} is not in the repository")
+        pack_id, offset, length, size = row
+        f, codec = self._reader(pack_id)
+        f.seek(offset)
+        try:
+            data = codec.decompress(f.read(length))
+        except Exception as e:  # zlib.error, zstandard.ZstdError
+            raise StoreError(f"Message {sha256} in pack {pack_id} is damaged: {e}") from e
+        if len(data) != size or hashlib.sha256(data).hexdigest() != sha256:
+            raise StoreError(f"Message {sha256} in pack {pack_id} is damaged")
+        return data
+
+    def _reader(self, pack_id: str) -> tuple[Any, _Codec]:
+        if pack_id not in self._readers:
+            path = self.root / "packs" / pack_id[:2] / f"{pack_id}.pack"
+            try:
+                f = open(path, "rb")
+            except OSError as e:
+                raise StoreError(f"Cannot open pack {pack_id}: {e}") from e
+            header = f.read(len(PACK_MAGIC) + 1)
+            if header[:-1] != PACK_MAGIC:
+                f.close()
+                raise StoreError(f"{path} is not a pack file")
+            self._readers[pack_id] = (f, _Codec.from_id(header[-1]))
+        return self._readers[pack_id]
+
+    def write_snapshot(self, snapshot: Snapshot, entries: Iterable[tuple[str, int, str]]) -> None:
+        """Record a snapshot of ``(path, size, sha256)`` entries.
+
+        ``entries`` may be a generator that adds the messages as it goes;
+        the snapshot only becomes visible once they are all in the index.
+        """
+        path = self.root / "snapshots" / f"{snapshot.id}.snap"
+        tmp = path.with_name(f".{path.name}.tmp")
+        comp = self.codec.compressobj()
+        try:
+            with open(tmp, "wb", buffering=_WRITE_BUFFER) as f:
+                f.write(bytes([self.codec.id]))
+                for rel, size, sha256 in entries:
+                    line = f"{sha256} {size} ".encode() + os.fsencode(rel) + b"\n"
+                    f.write(comp.compress(line))
+                f.write(comp.flush())
+                f.flush()
+                os.fsync(f.fileno())
+            self.flush()
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        # The summary is written last: a snapshot without one never finished.
+        save_json(path.with_suffix(".json"), asdict(snapshot))
+        fsync_dir(path.parent)
+
+    def snapshots(self) -> list[Snapshot]:
+        """Finished snapshots, oldest first."""
+        found = []
+        for path in (self.root / "snapshots").glob("*.json"):
+            try:
+                found.append(Snapshot(**json.loads(path.read_text(encoding="utf-8"))))
+            except (OSError, ValueError, TypeError):
+                continue
+        return sorted(found, key=lambda s: (s.time, s.id))
+
+    def snapshot_entries(self, snapshot_id: str) -> Iterator[tuple[str, int, str]]:
+        """``(path, size, sha256)`` of every file in a snapshot."""
+        path = self.root / "snapshots" / f"{snapshot_id}.snap"
+        try:
+            f = open(path, "rb")
+        except OSError as e:
+            raise StoreError(f"Cannot open snapshot {snapshot_id}: {e}") from e
+        with f:
+            header = f.read(1)
+            if not header:
+                raise StoreError(f"Snapshot {snapshot_id} is empty")
+            decomp = _Codec.from_id(header[0]).decompressobj()
+            rest = b""
+            while chunk := f.read(1 << 20):
+                rest += decomp.decompress(chunk)
+                *lines, rest = rest.split(b"\n")
+                for line in lines:
+                    sha256, size, rel = line.split(b" ", 2)
+                    yield os.fsdecode(rel), int(size), sha256.decode()
+
+
+def new_snapshot(scope: str) -> Snapshot:
+    now = datetime.now(timezone.utc)
+    return Snapshot(
+        id=f"{now.strftime('%Y%m%dT%H%M%SZ')}-{secrets.token_hex(4)}",
+        time=now.isoformat(),
+        scope=scope,
+    )
@@ -0,0 +1,159 @@
+"""Pre-sync IMAP STATUS probe: find the folders that actually changed.
+
+Before mbsync walks every folder, one connection per account asks each
+folder for ``STATUS (MESSAGES UIDNEXT UIDVALIDITY)`` and compares the
+answer with the values recorded after the last successful sync.  A new or
+expunged message, or a re-created folder, changes at least one counter, so
+unchanged folders can be skipped.
+
+STATUS does not reveal flag changes made on the server (e.g. a message
+read on a phone), so every folder is still synced at least once per
+``[sync] probe_max_age`` seconds.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from email_archiver import imap
+from email_archiver.config import AccountConfig, Config
+from email_archiver.imap import FolderStatus, ImapError
+from email_archiver.state import load_json, save_json
+
+STATUS_CACHE_FILENAME = "imap-status.json"
+
+
+class StatusCache:
+    """Folder STATUS values as of the last successful sync.
+
+    Stored as JSON in ``<state_dir>/imap-status.json`` as
+    ``{account: {folder: {messages, uidnext, uidvalidity, synced_at}}}``.
+    Safe to update from multiple worker threads.
+    """
+
+    def __init__(self, path: Path, data: dict[str, dict[str, dict[str, Any]]] | None = None):
+        self.path = path
+        self.data = data or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, state_dir: Path) -> StatusCache:
+        path = state_dir / STATUS_CACHE_FILENAME
+        raw = load_json(path, {})
+        return cls(path, raw if isinstance(raw, dict) else {})
+
+    def save(self) -> None:
+        with self._lock:
+            save_json(self.path, self.data)
+
+    def get(self, account: str, folder: str) -> tuple[FolderStatus | None, float]:
+        """Return the cached status and when it was synced (0 if never)."""
+        entry = self.data.get(account, {}).get(folder)
+        if not isinstance(entry, dict):
+            return None, 0.0
+        try:
+            return FolderStatus.from_dict(entry), float(entry.get("synced_at", 0))
+        except (KeyError, TypeError, ValueError):
+            return None, 0.0
+
+    def record(self, account: str, folder: str, status: FolderStatus, synced_at: float) -> None:
+        with self._lock:
+            self.data.setdefault(account, {})[folder] = {
+                **status.to_dict(),
+                "synced_at": synced_at,
+            }
+
+
+@dataclass
+class ProbeResult:
+    """What the probe found for the probed accounts.
+
+    ``changed`` lists, per account, the folders that need syncing;
+    ``statuses`` the fresh STATUS of every folder that answered.
+    """
+
+    changed: dict[str, list[str]] = field(default_factory=dict)
+    statuses: dict[tuple[str, str], FolderStatus] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def unchanged(self) -> int:
+        return len(self.statuses) - sum(
+            1 for (acct, folder) in self.statuses if folder in self.changed.get(acct, ())
+        )
+
+
+def _probe_account(
+    acct: AccountConfig,
+    cache: StatusCache,
+    *,
+    max_age: float,
+    now: float,
+    password: str | None,
+) -> tuple[list[str], dict[str, FolderStatus]]:
+    """STATUS every folder of one account over a single connection."""
+    statuses: dict[str, FolderStatus] = {}
+    changed: list[str] = []
+    conn = imap.connect(acct, password=password)
+    try:
+        for folder in acct.folders:
+            try:
+                status = imap.folder_status(conn, folder)
+            except ImapError:
+                # Let mbsync deal with (and report) a folder STATUS can't see.
+                changed.append(folder)
+                continue
+            statuses[folder] = status
+            cached, synced_at = cache.get(acct.name, folder)
+            if cached != status or now - synced_at >= max_age:
+                changed.append(folder)
+    finally:
+        imap.close(conn)
+    return changed, statuses
+
+
+def probe_changes(
+    config: Config,
+    cache: StatusCache,
+    *,
+    account: str | None = None,
+    password: str | None = None,
+) -> ProbeResult:
+    """Probe the accounts (or only ``account``) concurrently.
+
+    Fails open: if an account can't be probed, all its folders are
+    reported as changed so mbsync still runs for it.
+    """
+    assert config.sync is not None
+    names = [account] if account else list(config.accounts)
+    result = ProbeResult()
+    now = time.time()
+    workers = max(1, min(config.sync.concurrency, len(names)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            name: pool.submit(
+                _probe_account,
+                config.accounts[name],
+                cache,
+                max_age=config.sync.probe_max_age,
+                now=now,
+                password=password,
+            )
+            for name in names
+        }
+        for name, fut in futures.items():
+            try:
+                changed, statuses = fut.result()
+            except ImapError as e:
+                result.errors[name] = str(e)
+                result.changed[name] = list(config.accounts[name].folders)
+                continue
+            result.changed[name] = changed
+            for folder, status in statuses.items():
+                result.statuses[(name, folder)] = status
+    return result
@@ -0,0 +1,276 @@
+"""Live mbsync progress: per-target transfer counters and throughput.
+
+mbsync reports progress as a counter line it rewrites with ``\\r``::
+
+    C: 1/2  B: 3/10  F: +0/0 *0/0 #0/0 -0/0  N: +120/500 *4/4 #0/0 -0/0
+
+``C`` and ``B`` are channels and boxes done/total; each side (``F``/``N``
+for far/near, ``M``/``S`` for master/slave before mbsync 1.4) lists new
+messages ``+``, flag updates ``*``, trashed ``#`` and expunged ``-``
+messages.  ``N: +`` is therefore what was pulled from the server.  mbsync
+only prints these lines when stdout is a terminal, which is why sync runs
+it under a pty (see :func:`email_archiver.runner.run_command`).
+
+:class:`ProgressSink` parses the stream into a :class:`TransferStats` per
+target and :class:`ProgressBoard` shows them: a one-line status on an
+interactive terminal, and ``<state_dir>/sync-progress.json`` for daemons
+and dashboards.  mbsync doesn't report bytes, so those are counted from
+the files delivered to the Maildir when a target finishes.
+"""
+
+from __future__ import annotations
+
+import re
+import shutil
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, TextIO
+
+from email_archiver.sinks import STDOUT, OutputSink
+from email_archiver.state import save_json
+
+PROGRESS_FILENAME = "sync-progress.json"
+
+# Seconds between redraws of the terminal status line and rewrites of the
+# progress file.
+TTY_INTERVAL = 0.5
+FILE_INTERVAL = 5.0
+
+_PAIR = r"(\d+)/(\d+)"
+_COUNTERS = re.compile(rf"C: {_PAIR}\s+B: {_PAIR}")
+_SIDE = re.compile(rf"\b([FNMS]): \+{_PAIR} \*{_PAIR} #{_PAIR}(?: -{_PAIR})?")
+_PULLED = re.compile(r"pulled (\d+) new messages?")
+_PUSHED = re.compile(r"pushed (\d+) new messages?")
+
+# Sides that are the local Maildir, for mbsync >= 1.4 and older releases.
+_NEAR_SIDES = {"N", "S"}
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    raise AssertionError("unreachable")
+
+
+@dataclass
+class TransferStats:
+    """What one mbsync target has transferred so far."""
+
+    target: str
+    account: str
+    started: float = field(default_factory=time.monotonic)
+    started_ns: int = field(default_factory=time.time_ns)
+    finished: float | None = None
+    channels_done: int = 0
+    channels_total: int = 0
+    boxes_done: int = 0
+    boxes_total: int = 0
+    pulled: int = 0
+    pulled_total: int = 0
+    pushed: int = 0
+    pushed_total: int = 0
+    flags: int = 0
+    expunged: int = 0
+    delivered: int = 0
+    bytes: int = 0
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished if self.finished is not None else time.monotonic()
+        return max(end - self.started, 0.0)
+
+    @property
+    def messages_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.pulled / elapsed if elapsed > 0 else 0.0
+
+    def update(self, line: str) -> bool:
+        """Fold one line of mbsync output into the counters.
+
+        Returns:
+            True if ``line`` was a progress counter line.
+        """
+        m = _COUNTERS.search(line)
+        if m is None:
+            for pattern, attr in ((_PULLED, "pulled"), (_PUSHED, "pushed")):
+                summary = pattern.search(line)
+                if summary:
+                    setattr(self, attr, max(getattr(self, attr), int(summary.group(1))))
+            return False
+        self.channels_done, self.channels_total, self.boxes_done, self.boxes_total = map(
+            int, m.groups()
+        )
+        flags = expunged = 0
+        for side in _SIDE.finditer(line):
+            new, new_total, flag, _, trash, _, expunge, _ = (int(g or 0) for g in side.groups()[1:])
+            if side.group(1) in _NEAR_SIDES:
+                self.pulled, self.pulled_total = new, new_total
+            else:
+                self.pushed, self.pushed_total = new, new_total
+            flags += flag
+            expunged += trash + expunge
+        self.flags, self.expunged = flags, expunged
+        return True
+
+    def summary(self) -> str:
+        total = f"/{self.pulled_total}" if self.pulled_total > self.pulled else ""
+        parts = [f"pulled {self.pulled}{total}", f"{self.messages_per_second:.1f} msg/s"]
+        if self.pushed:
+            parts.append(f"pushed {self.pushed}")
+        if self.flags:
+            parts.append(f"{self.flags} flag update(s)")
+        if self.finished is not None:
+            parts.append(f"{self.delivered} file(s), {_format_bytes(self.bytes)} delivered")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "account": self.account,
+            "running": self.finished is None,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "channels": [self.channels_done, self.channels_total],
+            "boxes": [self.boxes_done, self.boxes_total],
+            "messages_pulled": self.pulled,
+            "messages_to_pull": self.pulled_total,
+            "messages_pushed": self.pushed,
+            "flag_updates": self.flags,
+            "expunged": self.expunged,
+            "messages_per_second": round(self.messages_per_second, 3),
+            "files_delivered": self.delivered,
+            "bytes_delivered": self.bytes,
+        }
+
+
+class ProgressBoard:
+    """Collects the stats of one sync run's targets and shows them live.
+
+    Thread-safe: targets running on worker threads share one board.
+
+    Args:
+        path: Progress file to rewrite every ``FILE_INTERVAL`` seconds, or
+            None to not write one.
+        tty: Stream for the status line (normally ``sys.stderr``), or None.
+    """
+
+    def __init__(self, path: Path | None = None, tty: TextIO | None = None) -> None:
+        self.path = path
+        self.tty = tty
+        self.started = time.time()
+        self.stats: dict[str, TransferStats] = {}
+        self._lock = threading.Lock()
+        self._drawn = 0.0
+        self._written = 0.0
+        self._line = False
+
+    def start(self, target: str, account: str) -> TransferStats:
+        with self._lock:
+            stats = self.stats[target] = TransferStats(target, account)
+            self._clear()
+        self._write(force=True)
+        return stats
+
+    def update(self) -> None:
+        """Redraw and rewrite, at most as often as the intervals allow."""
+        now = time.monotonic()
+        with self._lock:
+            if self.tty is not None and now - self._drawn >= TTY_INTERVAL:
+                self._drawn = now
+                self._draw()
+        self._write()
+
+    def finish(self, stats: TransferStats) -> None:
+        with self._lock:
+            stats.finished = time.monotonic()
+            self._clear()
+        self._write(force=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self._clear()
+        self._write(force=True)
+
+    def render(self, width: int = 120) -> str:
+        running = [s for s in self.stats.values() if s.finished is None]
+        done = len(self.stats) - len(running)
+        parts = [f"sync {done}/{len(self.stats)} done"]
+        for s in running:
+            total = f"/{s.pulled_total}" if s.pulled_total else ""
+            boxes = f" box {s.boxes_done}/{s.boxes_total}" if s.boxes_total else ""
+            parts.append(f"{s.target}: {s.pulled}{total} msgs {s.messages_per_second:.1f}/s{boxes}")
+        line = " | ".join(parts)
+        return line if len(line) <= width else line[: width - 1] + "…"
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "started": self.started,
+            "updated": time.time(),
+            "targets": {name: s.to_dict() for name, s in self.stats.items()},
+        }
+
+    def _draw(self) -> None:
+        assert self.tty is not None
+        width = shutil.get_terminal_size().columns - 1
+        self.tty.write("\r\x1b[K" + self.render(width))
+        self.tty.flush()
+        self._line = True
+
+    def _clear(self) -> None:
+        # Called before other output so it doesn't land after the status line.
+        if self.tty is not None and self._line:
+            self.tty.write("\r\x1b[K")
+            self.tty.flush()
+            self._line = False
+
+    def _write(self, *, force: bool = False) -> None:
+        if self.path is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._written < FILE_INTERVAL:
+                return
+            self._written = now
+            snapshot = self.snapshot()
+        try:
+            save_json(self.path, snapshot)
+        except OSError as e:
+            print(f"Warning: could not write sync progress: {e}")
+            self.path = None
+
+
+def board_for(state_dir: Path, *, enabled: bool, verbose: bool) -> ProgressBoard:
+    """The board for one sync run: a status line only on an interactive,
+    non-verbose terminal (verbose output streams mbsync's own lines)."""
+    if not enabled:
+        return ProgressBoard()
+    tty = sys.stderr if sys.stderr.isatty() and not verbose else None
+    return ProgressBoard(state_dir / PROGRESS_FILENAME, tty)
+
+
+class ProgressSink:
+    """OutputSink that feeds mbsync output into a target's stats.
+
+    Counter lines are consumed (they repeat several times a second);
+    everything else is passed on to ``downstream``, e.g. the sync log.
+    """
+
+    def __init__(
+        self, stats: TransferStats, board: ProgressBoard, downstream: list[OutputSink]
+    ) -> None:
+        self.stats = stats
+        self.board = board
+        self.downstream = downstream
+
+    def write(self, stream: str, line: str) -> None:
+        if stream == STDOUT and self.stats.update(line):
+            self.board.update()
+            return
+        for sink in self.downstream:
+            sink.write(stream, line)
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,217 @@
+"""Remote vs local completeness check per folder (``verify --remote``).
+
+The regular verification proves that every local file is indexed, but not
+that every message on the server has a local file.  This module asks the
+server for every UID of each configured folder and reconciles them with
+what mbsync recorded and what is on disk:
+
+- ``<maildir>/.mbsyncstate`` maps each server ("far") UID to the UID of
+  its local ("near") copy, which mbsync writes into the file name as
+  ``,U=<uid>``;
+- a server UID is *archived* when its near UID names a file in the
+  folder's ``cur/`` or ``new/`` (as recorded in the manifest).
+
+Server UIDs that are not archived and not above ``MaxPulledUid`` are
+*missing*: mbsync pulled them once and the local copy is gone, or never
+arrived.  UIDs above it arrived since the last sync and are only reported
+as *unsynced*.  A UIDVALIDITY change means the state file no longer
+describes the folder, which fails as well.
+
+Folders can hold hundreds of thousands of messages, so UIDs are kept in
+sorted ``array('I')`` buffers (4 bytes each), compared by binary search
+and a linear merge, and reported as IMAP sequence sets (``1:400,402``).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from email_archiver import imap
+from email_archiver.config import Config
+from email_archiver.generate import local_folder_name
+from email_archiver.imap import ImapError, format_sequence_set
+from email_archiver.manifest import Manifest
+
+MBSYNC_STATE_FILENAME = ".mbsyncstate"
+
+_NEAR_UID = re.compile(r",U=(\d+)")
+
+
+@dataclass
+class MbsyncState:
+    """The parts of an mbsync ``.mbsyncstate`` file needed to reconcile a folder.
+
+    ``far`` and ``near`` are parallel arrays of the UID pairs that have a
+    local copy, sorted by far UID.
+    """
+
+    far_uidvalidity: int | None = None
+    max_pulled: int = 0
+    far: array = field(default_factory=lambda: array("I"))
+    near: array = field(default_factory=lambda: array("I"))
+    # A journal next to the state file means a sync is running or crashed.
+    journal: bool = False
+
+
+def read_mbsync_state(folder_dir: Path) -> MbsyncState | None:
+    """Parse ``folder_dir/.mbsyncstate``; None if the folder was never synced.
+
+    Handles both the current (``FarUidValidity``) and the pre-1.4
+    (``MasterUidValidity``) header names.
+    """
+    path = folder_dir / MBSYNC_STATE_FILENAME
+    try:
+        f = path.open(encoding="ascii", errors="replace")
+    except FileNotFoundError:
+        return None
+    state = MbsyncState(journal=(folder_dir / (MBSYNC_STATE_FILENAME + ".journal")).exists())
+    pairs: list[tuple[int, int]] = []
+    with f:
+        for line in f:
+            key, _, value = line.strip().partition(" ")
+            if not key:
+                break
+            if key in ("FarUidValidity", "MasterUidValidity"):
+                state.far_uidvalidity = int(value)
+            elif key == "MaxPulledUid":
+                state.max_pulled = int(value)
+        for line in f:
+            parts = line.split()
+            if len(parts) < 2:
+                continue
+            far, near = int(parts[0]), int(parts[1])
+            if far > 0 and near > 0:
+                pairs.append((far, near))
+    pairs.sort()
+    state.far = array("I", (far for far, _ in pairs))
+    state.near = array("I", (near for _, near in pairs))
+    return state
+
+
+def near_uids(names: Iterator[str]) -> array:
+    """Sorted near UIDs (``,U=<uid>``) of the given Maildir file names."""
+    uids = array("I")
+    for name in names:
+        m = _NEAR_UID.search(name)
+        if m:
+            uids.append(int(m.group(1)))
+    return array("I", sorted(uids))
+
+
+def _contains(sorted_uids: array, uid: int) -> bool:
+    i = bisect_left(sorted_uids, uid)
+    return i < len(sorted_uids) and sorted_uids[i] == uid
+
+
+def _difference(a: array, b: array) -> array:
+    """UIDs of sorted ``a`` that are not in sorted ``b``, by a linear merge."""
+    out = array("I")
+    j, n = 0, len(b)
+    for uid in a:
+        while j < n and b[j] < uid:
+            j += 1
+        if j == n or b[j] != uid:
+            out.append(uid)
+    return out
+
+
+def reconcile_folder(
+    server_uids: array, uidvalidity: int, state: MbsyncState | None, local: array
+) -> dict[str, Any]:
+    """Compare one folder's server UIDs with its mbsync state and local UIDs.
+
+    Args:
+        server_uids: Every UID on the server, sorted.
+        uidvalidity: The folder's UIDVALIDITY on the server.
+        state: The folder's mbsync state, or None if there is none.
+        local: The near UIDs of the local files, sorted.
+
+    Returns:
+        The folder's ``remote`` report section.
+    """
+    report: dict[str, Any] = {
+        "server_messages": len(server_uids),
+        "archived": 0,
+        "missing": 0,
+        "missing_uids": "",
+        "unsynced": 0,
+        "unsynced_uids": "",
+        "problems": [],
+    }
+    if state is None:
+        if server_uids:
+            report["problems"].append("never synced (no .mbsyncstate)")
+            report["unsynced"] = len(server_uids)
+            report["unsynced_uids"] = format_sequence_set(server_uids)
+        return report
+    if state.journal:
+        report["sync_in_progress"] = True
+    if state.far_uidvalidity is not None and state.far_uidvalidity != uidvalidity:
+        report["problems"].append(
+            f"UIDVALIDITY changed on the server ({state.far_uidvalidity} → {uidvalidity})"
+        )
+        return report
+
+    archived = array(
+        "I", (far for far, near in zip(state.far, state.near) if _contains(local, near))
+    )
+    not_archived = _difference(server_uids, archived)
+    cut = bisect_left(not_archived, state.max_pulled + 1)
+    missing, unsynced = not_archived[:cut], not_archived[cut:]
+    report["archived"] = len(server_uids) - len(not_archived)
+    report["missing"] = len(missing)
+    report["missing_uids"] = format_sequence_set(missing)
+    report["unsynced"] = len(unsynced)
+    report["unsynced_uids"] = format_sequence_set(unsynced)
+    if missing:
+        report["problems"].append(f"{len(missing)} server message(s) missing locally")
+    return report
+
+
+def _local_uids(manifest: Manifest, rel_folder: str) -> array:
+    return near_uids(os.path.basename(path) for path in manifest.folder_paths(rel_folder))
+
+
+def reconcile_account(
+    config: Config, account: str, *, password: str | None = None
+) -> dict[str, dict[str, Any]]:
+    """Reconcile every configured folder of ``account`` over one IMAP connection.
+
+    The manifest must be up to date (``run_verify`` updates it first).
+    Fails closed: a folder that can't be listed, or every folder if the
+    server can't be reached, is reported with a problem.
+
+    Returns:
+        The ``remote`` report section of each folder, by folder name.
+    """
+    assert config.paths is not None
+    acct = config.accounts[account]
+    try:
+        conn = imap.connect(acct, password=password)
+    except ImapError as e:
+        return {folder: {"problems": [str(e)]} for folder in acct.folders}
+
+    results: dict[str, dict[str, Any]] = {}
+    try:
+        with Manifest.open(config.paths.state_dir, config.paths.maildir_root) as manifest:
+            for folder in acct.folders:
+                rel = f"{account}/{local_folder_name(folder)}"
+                try:
+                    status, uids = imap.folder_uids(conn, folder)
+                except ImapError as e:
+                    results[folder] = {"problems": [str(e)]}
+                    continue
+                state = read_mbsync_state(config.paths.maildir_root / rel)
+                results[folder] = reconcile_folder(
+                    uids, status.uidvalidity, state, _local_uids(manifest, rel)
+                )
+    finally:
+        imap.close(conn)
+    return results
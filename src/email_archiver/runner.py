@@ -2,9 +2,33 @@
 
 from __future__ import annotations
 
+import asyncio
+import errno
+import os
+import re
+import selectors
+import signal
 import subprocess
 import time
-from dataclasses import dataclass
+from collections import deque
+from collections.abc import Coroutine
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from email_archiver.sinks import STDERR, STDOUT, ConsoleSink, OutputSink
+
+# Lines of each stream kept in RunResult when output is streamed.
+DEFAULT_TAIL_LINES = 1000
+
+# A "line" longer than this is flushed to sinks in pieces.
+_MAX_LINE_BYTES = 64 * 1024
+
+# Seconds to wait after SIGTERM before SIGKILL on timeout.
+_KILL_GRACE_SECONDS = 5.0
+
+_LINE_END = re.compile(rb"\r\n|\r|\n")
+
+T = TypeVar("T")
 
 
 @dataclass
@@ -16,6 +40,9 @@ class RunResult:
     stdout: str
     stderr: str
     duration_seconds: float
+    # Lines dropped from stdout/stderr when only a bounded tail was kept.
+    stdout_dropped: int = 0
+    stderr_dropped: int = 0
 
     @property
     def ok(self) -> bool:
@@ -26,6 +53,207 @@ class RunResult:
         return f"[{status}] {' '.join(self.command)} ({self.duration_seconds:.1f}s)"
 
 
+@dataclass
+class AggregateResult:
+    """Combined result of several external commands run as one logical step.
+
+    ``results`` maps a target label (account, channel, …) to its RunResult.
+    """
+
+    results: dict[str, RunResult] = field(default_factory=dict)
+    duration_seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(r.ok for r in self.results.values())
+
+    @property
+    def exit_code(self) -> int:
+        """0 if every command succeeded, else the first non-zero exit code."""
+        for r in self.results.values():
+            if not r.ok:
+                return r.exit_code if r.exit_code > 0 else 1
+        return 0
+
+    @property
+    def failed(self) -> list[str]:
+        return [name for name, r in self.results.items() if not r.ok]
+
+    def summary(self) -> str:
+        status = "OK" if self.ok else f"FAILED ({len(self.failed)}/{len(self.results)})"
+        return f"[{status}] {len(self.results)} command(s) ({self.duration_seconds:.1f}s)"
+
+
+class _LineSplitter:
+    """Split a byte stream into lines on ``\\n``, ``\\r\\n`` or a bare ``\\r``.
+
+    Treating ``\\r`` as a terminator means progress counters that redraw one
+    terminal line are seen as separate updates rather than one huge line.
+    """
+
+    def __init__(self) -> None:
+        self._buf = b""
+
+    def feed(self, data: bytes) -> list[str]:
+        self._buf += data
+        lines: list[str] = []
+        pos = 0
+        for m in _LINE_END.finditer(self._buf):
+            # A trailing \r might be the first half of \r\n: wait for more data.
+            if m.group() == b"\r" and m.end() == len(self._buf):
+                break
+            lines.append(self._buf[pos : m.start()].decode("utf-8", errors="replace"))
+            pos = m.end()
+        self._buf = self._buf[pos:]
+        while len(self._buf) > _MAX_LINE_BYTES:
+            lines.append(self._buf[:_MAX_LINE_BYTES].decode("utf-8", errors="replace"))
+            self._buf = self._buf[_MAX_LINE_BYTES:]
+        return lines
+
+    def flush(self) -> list[str]:
+        rest = self._buf.rstrip(b"\r")
+        self._buf = b""
+        return [rest.decode("utf-8", errors="replace")] if rest else []
+
+
+def _terminate(proc: subprocess.Popen[bytes]) -> None:
+    """Stop a child: SIGTERM, then SIGKILL if it doesn't exit in time."""
+    proc.terminate()
+    try:
+        proc.wait(timeout=_KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def _open_pty() -> tuple[int, int] | None:
+    """Return a ``(master, slave)`` pseudo-terminal pair, or None if unavailable."""
+    try:
+        return os.openpty()
+    except OSError:
+        return None
+
+
+def _read_output(fd: int) -> bytes:
+    """Read from a pipe or pty master; a pty whose child has exited reads as EOF."""
+    try:
+        return os.read(fd, 65536)
+    except OSError as e:
+        if e.errno == errno.EIO:
+            return b""
+        raise
+
+
+def _run_streaming(
+    cmd: list[str],
+    *,
+    env: dict[str, str] | None,
+    cwd: str | None,
+    timeout: float | None,
+    sinks: list[OutputSink],
+    tail_lines: int,
+    pty: bool = False,
+) -> RunResult:
+    """Run ``cmd``, pushing output lines to ``sinks`` as they arrive.
+
+    stdout and stderr are multiplexed with ``selectors`` so a child that
+    fills its stderr pipe can't deadlock us while we wait on stdout.  Only
+    the last ``tail_lines`` lines of each stream are retained, and the
+    timeout is enforced while reading, not just after the child exits.
+    If a sink raises, the child is stopped before the error propagates.
+    """
+    start = time.monotonic()
+    deadline = start + timeout if timeout is not None else None
+    terminal = _open_pty() if pty else None
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=terminal[1] if terminal else subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            cwd=cwd,
+        )
+    except BaseException:
+        if terminal:
+            os.close(terminal[0])
+        raise
+    finally:
+        if terminal:
+            os.close(terminal[1])
+    stdout_fd = terminal[0] if terminal else proc.stdout.fileno()  # type: ignore[union-attr]
+    assert proc.stderr is not None
+
+    tails: dict[str, deque[str]] = {
+        STDOUT: deque(maxlen=tail_lines),
+        STDERR: deque(maxlen=tail_lines),
+    }
+    totals = {STDOUT: 0, STDERR: 0}
+    splitters = {STDOUT: _LineSplitter(), STDERR: _LineSplitter()}
+
+    def emit(name: str, lines: list[str]) -> None:
+        for line in lines:
+            tails[name].append(line)
+            totals[name] += 1
+            for sink in sinks:
+                sink.write(name, line)
+
+    timed_out = False
+    try:
+        with selectors.DefaultSelector() as sel:
+            sel.register(stdout_fd, selectors.EVENT_READ, STDOUT)
+            sel.register(proc.stderr, selectors.EVENT_READ, STDERR)
+            while sel.get_map():
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        timed_out = True
+                        break
+                for key, _ in sel.select(timeout=remaining):
+                    name = key.data
+                    data = _read_output(key.fd)
+                    if data:
+                        emit(name, splitters[name].feed(data))
+                    else:
+                        sel.unregister(key.fileobj)
+                        emit(name, splitters[name].flush())
+
+        if timed_out:
+            _terminate(proc)
+        else:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                proc.wait(timeout=remaining)
+            except subprocess.TimeoutExpired:
+                # Child closed its pipes but kept running.
+                timed_out = True
+                _terminate(proc)
+    finally:
+        # Reached with the child still running only if a sink (or a signal) raised.
+        if proc.poll() is None:
+            _terminate(proc)
+        if terminal:
+            os.close(terminal[0])
+        else:
+            proc.stdout.close()  # type: ignore[union-attr]
+        proc.stderr.close()
+
+    stdout = "".join(line + "\n" for line in tails[STDOUT])
+    stderr = "".join(line + "\n" for line in tails[STDERR])
+    if timed_out:
+        stderr += f"Command timed out after {timeout}s"
+    return RunResult(
+        command=cmd,
+        exit_code=-1 if timed_out else proc.returncode,
+        stdout=stdout,
+        stderr=stderr,
+        duration_seconds=time.monotonic() - start,
+        stdout_dropped=totals[STDOUT] - len(tails[STDOUT]),
+        stderr_dropped=totals[STDERR] - len(tails[STDERR]),
+    )
+
+
 def run_command(
     cmd: list[str],
     *,
@@ -33,15 +261,30 @@ def run_command(
     cwd: str | None = None,
     timeout: float | None = None,
     stream: bool = False,
+    sinks: list[OutputSink] | None = None,
+    tail_lines: int = DEFAULT_TAIL_LINES,
+    pty: bool = False,
 ) -> RunResult:
     """Run an external command and capture its output.
 
+    Without ``stream`` or ``sinks`` the full output is captured in memory,
+    which suits short query commands whose output is parsed afterwards.
+    Otherwise output is streamed line by line to the sinks and only the
+    last ``tail_lines`` lines of each stream are kept in the RunResult.
+
+    With ``pty`` (streaming only) the child's stdout is a pseudo-terminal,
+    for tools such as mbsync that print progress only to a TTY.  It falls
+    back to a pipe where no pty can be allocated.
+
     Args:
         cmd: Command and arguments.
         env: Optional environment variables (merged with current env).
         cwd: Optional working directory.
         timeout: Optional timeout in seconds.
         stream: If True, also print output to stdout/stderr in real time.
+        sinks: Extra line sinks (log files, parsers) fed while the command runs.
+        tail_lines: Lines per stream retained when streaming.
+        pty: Give the child a pseudo-terminal as stdout.
 
     Returns:
         A RunResult with captured output and timing.
@@ -49,47 +292,30 @@ def run_command(
     start = time.monotonic()
 
     try:
-        if stream:
-            # Stream output in real time while also capturing it
-            proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                env=env,
-                cwd=cwd,
-                text=True,
-            )
-            stdout_parts: list[str] = []
-            stderr_parts: list[str] = []
-
-            # Read stdout line by line
-            assert proc.stdout is not None
-            assert proc.stderr is not None
-            for line in proc.stdout:
-                print(line, end="")
-                stdout_parts.append(line)
-            # Collect remaining stderr
-            stderr_data = proc.stderr.read()
-            if stderr_data:
-                print(stderr_data, end="")
-                stderr_parts.append(stderr_data)
-
-            proc.wait(timeout=timeout)
-            stdout = "".join(stdout_parts)
-            stderr = "".join(stderr_parts)
-            returncode = proc.returncode
-        else:
-            result = subprocess.run(
+        if stream or sinks:
+            all_sinks: list[OutputSink] = [ConsoleSink()] if stream else []
+            all_sinks.extend(sinks or [])
+            return _run_streaming(
                 cmd,
-                capture_output=True,
-                text=True,
                 env=env,
                 cwd=cwd,
                 timeout=timeout,
+                sinks=all_sinks,
+                tail_lines=tail_lines,
+                pty=pty,
             )
-            stdout = result.stdout
-            stderr = result.stderr
-            returncode = result.returncode
+
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=cwd,
+            timeout=timeout,
+        )
+        stdout = result.stdout
+        stderr = result.stderr
+        returncode = result.returncode
 
     except subprocess.TimeoutExpired:
         elapsed = time.monotonic() - start
@@ -118,3 +344,179 @@ def run_command(
         stderr=stderr,
         duration_seconds=elapsed,
     )
+
+
+# -- asyncio counterpart ---------------------------------------------------
+
+
+async def _async_terminate(proc: asyncio.subprocess.Process) -> None:
+    """Stop a child: SIGTERM, then SIGKILL if it doesn't exit in time."""
+    if proc.returncode is not None:
+        return
+    try:
+        proc.terminate()
+        await asyncio.wait_for(proc.wait(), _KILL_GRACE_SECONDS)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+
+
+async def async_run_command(
+    cmd: list[str],
+    *,
+    env: dict[str, str] | None = None,
+    cwd: str | None = None,
+    timeout: float | None = None,
+    stream: bool = False,
+    sinks: list[OutputSink] | None = None,
+    tail_lines: int | None = None,
+    pty: bool = False,
+) -> RunResult:
+    """Run an external command from a coroutine.
+
+    Behaves like :func:`run_command`, with both pipes read concurrently on
+    the event loop.  If the calling task is cancelled the child gets SIGTERM
+    (then SIGKILL after a grace period) before the cancellation propagates,
+    so no process outlives the pipeline that started it.
+
+    Args:
+        tail_lines: Lines per stream retained in the result.  Defaults to
+            all of them, or DEFAULT_TAIL_LINES when streaming.
+        pty: Give the child a pseudo-terminal as stdout (see run_command).
+
+    Returns:
+        A RunResult with captured output and timing.
+    """
+    start = time.monotonic()
+    all_sinks: list[OutputSink] = [ConsoleSink()] if stream else []
+    all_sinks.extend(sinks or [])
+    if tail_lines is None and all_sinks:
+        tail_lines = DEFAULT_TAIL_LINES
+
+    terminal = _open_pty() if pty else None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=terminal[1] if terminal else asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            cwd=cwd,
+        )
+    except BaseException as e:
+        # Nothing reads the pty if the child never started (or we were
+        # cancelled while starting it).
+        if terminal:
+            os.close(terminal[0])
+        if not isinstance(e, OSError):
+            raise
+        if isinstance(e, FileNotFoundError):
+            stderr = f"Command not found: {cmd[0]}"
+        else:
+            stderr = f"Could not run {cmd[0]}: {e}"
+        return RunResult(
+            command=cmd,
+            exit_code=-1,
+            stdout="",
+            stderr=stderr,
+            duration_seconds=time.monotonic() - start,
+        )
+    finally:
+        if terminal:
+            os.close(terminal[1])
+
+    tails: dict[str, deque[str]] = {
+        STDOUT: deque(maxlen=tail_lines),
+        STDERR: deque(maxlen=tail_lines),
+    }
+    totals = {STDOUT: 0, STDERR: 0}
+
+    stdout = proc.stdout
+    transport: asyncio.ReadTransport | None = None
+    if terminal:
+        stdout = asyncio.StreamReader()
+        transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(stdout),
+            os.fdopen(terminal[0], "rb", buffering=0),
+        )
+
+    async def pump(name: str, reader: asyncio.StreamReader) -> None:
+        splitter = _LineSplitter()
+        while True:
+            try:
+                data = await reader.read(65536)
+            except OSError as e:
+                # A pty master reads EIO once the child side is closed.
+                if e.errno != errno.EIO:
+                    raise
+                data = b""
+            lines = splitter.feed(data) if data else splitter.flush()
+            for line in lines:
+                tails[name].append(line)
+                totals[name] += 1
+                for sink in all_sinks:
+                    sink.write(name, line)
+            if not data:
+                return
+
+    assert stdout is not None
+    assert proc.stderr is not None
+    timed_out = False
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(pump(STDOUT, stdout), pump(STDERR, proc.stderr), proc.wait()),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        timed_out = True
+        await _async_terminate(proc)
+    except BaseException:
+        # Cancelled, or a sink raised: don't leave the child running.
+        await asyncio.shield(_async_terminate(proc))
+        raise
+    finally:
+        if transport is not None:
+            transport.close()
+
+    stdout = "".join(line + "\n" for line in tails[STDOUT])
+    stderr = "".join(line + "\n" for line in tails[STDERR])
+    if timed_out:
+        stderr += f"Command timed out after {timeout}s"
+    return RunResult(
+        command=cmd,
+        exit_code=-1 if timed_out else proc.returncode,
+        stdout=stdout,
+        stderr=stderr,
+        duration_seconds=time.monotonic() - start,
+        stdout_dropped=totals[STDOUT] - len(tails[STDOUT]),
+        stderr_dropped=totals[STDERR] - len(tails[STDERR]),
+    )
+
+
+def run_async(main: Coroutine[Any, Any, T]) -> T:
+    """Run ``main`` on a fresh event loop, cancelling it on SIGTERM/SIGINT.
+
+    Cancellation unwinds through every running :func:`async_run_command`,
+    which terminates its child, so a signal to this process reaches every
+    mbsync/notmuch/backup process it started.
+
+    Raises:
+        asyncio.CancelledError: If a signal interrupted the run.
+    """
+
+    async def runner() -> T:
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        assert task is not None
+        signals = (signal.SIGTERM, signal.SIGINT)
+        for sig in signals:
+            loop.add_signal_handler(sig, task.cancel)
+        try:
+            return await main
+        finally:
+            for sig in signals:
+                loop.remove_signal_handler(sig)
+
+    return asyncio.run(runner())
@@ -0,0 +1,102 @@
+"""Line sinks that receive a command's output while it runs.
+
+A sink gets every line of stdout/stderr as soon as it is read (see
+``run_command(..., sinks=...)``), so output can be shown, logged or parsed
+without keeping it all in memory.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Protocol, TextIO
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+
+class OutputSink(Protocol):
+    def write(self, stream: str, line: str) -> None:
+        """Receive one line (without its terminator) from ``stream``."""
+
+    def close(self) -> None:
+        """Flush and release resources; called by whoever created the sink."""
+
+
+class ConsoleSink:
+    """Echo lines to this process's stdout/stderr, optionally prefixed.
+
+    The prefix keeps interleaved output of parallel commands readable.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, prefix: str = "") -> None:
+        self.prefix = prefix
+
+    def write(self, stream: str, line: str) -> None:
+        out: TextIO = sys.stderr if stream == STDERR else sys.stdout
+        with self._lock:
+            print(f"{self.prefix}{line}", file=out, flush=True)
+
+    def close(self) -> None:
+        pass
+
+
+class CallbackSink:
+    """Forward each line to ``callback(stream, line)`` — e.g. a progress parser."""
+
+    def __init__(self, callback: Callable[[str, str], None]) -> None:
+        self.callback = callback
+
+    def write(self, stream: str, line: str) -> None:
+        self.callback(stream, line)
+
+    def close(self) -> None:
+        pass
+
+
+class RotatingFileSink:
+    """Append lines to a log file, rotating it once it exceeds ``max_bytes``.
+
+    Rotated files are renamed ``<name>.1`` … ``<name>.<backups>``; the
+    oldest is dropped.  stderr lines are prefixed with ``[stderr]``.
+    """
+
+    def __init__(self, path: Path, *, max_bytes: int = 10 * 1024 * 1024, backups: int = 3) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(path, "a", encoding="utf-8")
+        self._size = self._fh.tell()
+
+    def write(self, stream: str, line: str) -> None:
+        text = f"[stderr] {line}\n" if stream == STDERR else f"{line}\n"
+        if self._size + len(text) > self.max_bytes and self._size > 0:
+            self._rotate()
+        self._fh.write(text)
+        self._size += len(text.encode("utf-8", errors="replace"))
+
+    def write_raw(self, text: str) -> None:
+        """Write text verbatim (headers/footers around the command output)."""
+        self._fh.write(text)
+        self._size += len(text.encode("utf-8", errors="replace"))
+
+    def _rotate(self) -> None:
+        self._fh.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                src.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._size = 0
+
+    def close(self) -> None:
+        self._fh.close()
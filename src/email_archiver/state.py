@@ -0,0 +1,39 @@
+"""Helpers for small persisted state files under ``state_dir``."""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """Write ``text`` to ``path`` atomically (temp file + rename).
+
+    A crash mid-write leaves the previous version intact rather than a
+    truncated file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def load_json(path: Path, default: Any) -> Any:
+    """Load a JSON state file, returning ``default`` if it is missing or corrupt."""
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return default
+
+
+def save_json(path: Path, data: Any) -> None:
+    """Atomically write ``data`` as pretty-printed JSON."""
+    atomic_write_text(path, json.dumps(data, indent=2, sort_keys=True) + "\n")
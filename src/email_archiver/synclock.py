@@ -0,0 +1,72 @@
+"""A lock that keeps rewrites of Maildir files from racing with mbsync.
+
+mbsync renames message files whenever their flags change.  A command
+that replaces message files (``dedupe --link``) checks that each file is
+still the one it read and then replaces it; a rename by mbsync between
+those two steps would leave two files with the same UID.  Every sync
+therefore holds ``<state_dir>/sync.lock`` shared while its mbsync
+processes run, and such commands hold it exclusively.  A sync that starts
+meanwhile waits for them; they refuse to start while a sync is running.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fcntl
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import IO
+
+LOCK_FILENAME = "sync.lock"
+
+# How often an async sync retries a lock held exclusively.
+_POLL_SECONDS = 1.0
+
+
+class SyncRunning(Exception):
+    """Raised by :func:`exclusive` while a sync holds the lock."""
+
+
+def _open(state_dir: Path) -> IO[str]:
+    state_dir.mkdir(parents=True, exist_ok=True)
+    return open(state_dir / LOCK_FILENAME, "a")
+
+
+def _try(f: IO[str], op: int) -> bool:
+    try:
+        fcntl.flock(f, op | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+@contextmanager
+def shared(state_dir: Path) -> Iterator[None]:
+    """Hold the lock for a sync, waiting while it is held exclusively."""
+    with _open(state_dir) as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        yield
+
+
+@asynccontextmanager
+async def async_shared(state_dir: Path) -> AsyncIterator[None]:
+    """Coroutine version of :func:`shared`; waits without blocking the loop."""
+    with _open(state_dir) as f:
+        while not _try(f, fcntl.LOCK_SH):
+            await asyncio.sleep(_POLL_SECONDS)
+        yield
+
+
+@contextmanager
+def exclusive(state_dir: Path) -> Iterator[None]:
+    """Hold the lock with no sync running.
+
+    Raises:
+        SyncRunning: If a sync (``sync``, ``run``, ``watch`` or the daemon)
+            is running.
+    """
+    with _open(state_dir) as f:
+        if not _try(f, fcntl.LOCK_EX):
+            raise SyncRunning(f"a sync is running ({state_dir / LOCK_FILENAME} is held)")
+        yield
@@ -0,0 +1,197 @@
+"""A tiny in-process IMAP server for tests of the change-detection code.
+
+It understands just enough of IMAP4rev1 for imaplib: CAPABILITY, LOGIN,
+STATUS, SELECT/EXAMINE, UID SEARCH (optionally ESEARCH), IDLE/DONE, NOOP
+and LOGOUT, over plain TCP.
+"""
+
+from __future__ import annotations
+
+import re
+import socketserver
+import threading
+from dataclasses import dataclass, field
+
+from email_archiver.imap import format_sequence_set
+
+
+@dataclass
+class Mailbox:
+    messages: int = 0
+    uidnext: int = 1
+    uidvalidity: int = 1
+    expunged: set[int] = field(default_factory=set)
+
+    def uids(self, lo: int = 1, hi: int | None = None) -> list[int]:
+        last = self.uidnext - 1 if hi is None else min(hi, self.uidnext - 1)
+        return [uid for uid in range(lo, last + 1) if uid not in self.expunged]
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, folders: list[str], password: str = "secret") -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.password = password
+        self.mailboxes = {name: Mailbox() for name in folders}
+        self.lock = threading.Condition()
+        self.commands: list[str] = []
+        self.searches: list[str] = []
+        self.logins = 0
+        self.idling = 0
+        self.refuse_logins = False
+        self.esearch = False
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self) -> FakeImapServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def deliver(self, folder: str, count: int = 1) -> None:
+        """Add ``count`` messages to ``folder`` and wake IDLE sessions."""
+        with self.lock:
+            box = self.mailboxes[folder]
+            box.messages += count
+            box.uidnext += count
+            self.lock.notify_all()
+
+    def expunge(self, folder: str, uids: list[int]) -> None:
+        with self.lock:
+            box = self.mailboxes[folder]
+            box.expunged.update(uids)
+            box.messages -= len(uids)
+
+
+_COMMAND = re.compile(r"^(\S+) (\S+)(?: (.*))?$")
+
+
+def _unquote(arg: str) -> str:
+    arg = arg.strip()
+    if arg.startswith('"') and arg.endswith('"'):
+        return arg[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return arg
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: FakeImapServer
+
+    def send(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        self.selected: str | None = None
+        self.send(f"* OK [CAPABILITY {self.capabilities()}] fake server ready")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            m = _COMMAND.match(raw.decode().rstrip("\r\n"))
+            if not m:
+                self.send("* BAD parse error")
+                continue
+            tag, command, args = m.group(1), m.group(2).upper(), m.group(3) or ""
+            self.server.commands.append(command)
+            if not self.dispatch(tag, command, args):
+                return
+
+    def capabilities(self) -> str:
+        return "IMAP4rev1 IDLE" + (" ESEARCH" if self.server.esearch else "")
+
+    def dispatch(self, tag: str, command: str, args: str) -> bool:
+        server = self.server
+        if command == "CAPABILITY":
+            self.send(f"* CAPABILITY {self.capabilities()}")
+        elif command == "LOGIN":
+            user, _, password = args.partition(" ")
+            if server.refuse_logins or _unquote(password) != server.password:
+                self.send(f"{tag} NO [AUTHENTICATIONFAILED] invalid credentials")
+                return True
+            server.logins += 1
+        elif command == "STATUS":
+            name = _unquote(args[: args.rindex(" (")])
+            box = server.mailboxes.get(name)
+            if box is None:
+                self.send(f"{tag} NO no such mailbox")
+                return True
+            self.send(
+                f'* STATUS "{name}" (MESSAGES {box.messages} UIDNEXT {box.uidnext}'
+                f" UIDVALIDITY {box.uidvalidity})"
+            )
+        elif command in ("SELECT", "EXAMINE"):
+            name = _unquote(args)
+            box = server.mailboxes.get(name)
+            if box is None:
+                self.send(f"{tag} NO no such mailbox")
+                return True
+            self.selected = name
+            self.send(f"* {box.messages} EXISTS")
+            self.send(f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid")
+            self.send(f"{tag} OK [READ-ONLY] {command} completed")
+            return True
+        elif command == "UID" and self.selected is not None:
+            self.uid_search(tag, args)
+            return True
+        elif command == "IDLE":
+            self.idle(tag)
+            return True
+        elif command == "LOGOUT":
+            self.send("* BYE logging out")
+            self.send(f"{tag} OK LOGOUT completed")
+            return False
+        elif command != "NOOP":
+            self.send(f"{tag} BAD unknown command")
+            return True
+        self.send(f"{tag} OK {command} completed")
+        return True
+
+    def uid_search(self, tag: str, args: str) -> None:
+        box = self.server.mailboxes[self.selected]
+        words = args.upper().split()
+        self.server.searches.append(" ".join(words[1:]))
+        if words[:4] == ["SEARCH", "RETURN", "(ALL)", "UID"] and self.server.esearch:
+            lo, _, hi = words[4].partition(":")
+            uids = box.uids(int(lo), int(hi))
+            ranges = format_sequence_set(uids)
+            self.send(f'* ESEARCH (TAG "{tag}") UID' + (f" ALL {ranges}" if uids else ""))
+        elif words[:2] == ["SEARCH", "UID"]:
+            lo, _, hi = words[2].partition(":")
+            self.send("* SEARCH" + "".join(f" {u}" for u in box.uids(int(lo), int(hi))))
+        else:
+            self.send(f"{tag} BAD unsupported UID command")
+            return
+        self.send(f"{tag} OK UID completed")
+
+    def idle(self, tag: str) -> None:
+        assert self.selected is not None
+        server = self.server
+        self.send("+ idling")
+        box = server.mailboxes[self.selected]
+        seen = box.messages
+        done = threading.Event()
+
+        def wait_for_done() -> None:
+            self.rfile.readline()
+            done.set()
+            with server.lock:
+                server.lock.notify_all()
+
+        threading.Thread(target=wait_for_done, daemon=True).start()
+        with server.lock:
+            server.idling += 1
+            while not done.is_set():
+                if box.messages != seen:
+                    seen = box.messages
+                    self.send(f"* {seen} EXISTS")
+                server.lock.wait(0.05)
+            server.idling -= 1
+        self.send(f"{tag} OK IDLE terminated")
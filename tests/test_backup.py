@@ -0,0 +1,322 @@
+"""Tests for email_archiver.commands.backup."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from email_archiver.commands.backup import _store_files, async_run_backup, run_backup
+from email_archiver.commands.restore import run_restore
+from email_archiver.config import AccountConfig, BackupConfig, Config, PathsConfig
+from email_archiver.packstore import PackStore, StoreError, new_snapshot
+from email_archiver.runner import AggregateResult
+
+OLD = 1_600_000_000
+
+
+def deliver(config: Config, rel: str) -> Path:
+    path = config.paths.maildir_root / rel
+    for sub in ("cur", "new", "tmp"):
+        (path.parent.parent / sub).mkdir(parents=True, exist_ok=True)
+    path.write_text(f"Message-ID: <{rel}@x>\n\nbody\n")
+    for dirpath, _, _ in os.walk(config.paths.maildir_root):
+        os.utime(dirpath, (OLD, OLD))
+    return path
+
+
+def touch(path: Path, tick: int) -> None:
+    os.utime(path, (OLD + tick, OLD + tick))
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    out = tmp_path / "out"
+    out.mkdir()
+    return Config(
+        accounts={
+            "work": AccountConfig("work", "w@b.com", "imap.b.com", "w@b.com"),
+            "home": AccountConfig("home", "h@b.com", "imap.b.com", "h@b.com"),
+        },
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=tmp_path / "state",
+            logs_dir=tmp_path / "state" / "logs",
+            verification_dir=tmp_path / "state" / "verification",
+        ),
+        backup=BackupConfig(
+            mode="incremental",
+            command=(
+                f"sh -c 'cat {{files_from}} > {out}/files; cat {{removed_from}} > {out}/removed'"
+            ),
+        ),
+    )
+
+
+def listed(config: Config, name: str) -> list[str]:
+    out = config.paths.state_dir.parent / "out" / name
+    return out.read_text().splitlines()
+
+
+class TestIncrementalBackup:
+    def test_first_backup_lists_everything_then_only_changes(self, config: Config):
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        deliver(config, "home/INBOX/cur/2.b:2,")
+        assert run_backup(config).ok
+        assert listed(config, "files") == ["home/INBOX/cur/2.b:2,", "work/INBOX/cur/1.a:2,S"]
+
+        cur = config.paths.maildir_root / "work" / "INBOX" / "cur"
+        (cur / "1.a:2,S").rename(cur / "1.a:2,RS")
+        deliver(config, "work/INBOX/cur/3.c:2,")
+        touch(cur, 1)
+        assert run_backup(config).ok
+        assert listed(config, "files") == ["work/INBOX/cur/1.a:2,RS", "work/INBOX/cur/3.c:2,"]
+        assert listed(config, "removed") == ["work/INBOX/cur/1.a:2,S"]
+        assert not list(config.paths.state_dir.glob("backup-*"))
+
+    def test_nothing_changed_skips_the_command(
+        self, config: Config, capsys: pytest.CaptureFixture[str]
+    ):
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        run_backup(config)
+        result = run_backup(config)
+        assert result.ok
+        assert "Nothing changed since the last backup" in capsys.readouterr().out
+
+    def test_failed_backup_is_retried_in_full(self, config: Config):
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        command = config.backup.command
+        config.backup.command = "sh -c 'exit 3' {files_from}"
+        assert run_backup(config).exit_code == 3
+        config.backup.command = command
+        assert run_backup(config).ok
+        assert listed(config, "files") == ["work/INBOX/cur/1.a:2,S"]
+
+    def test_per_account_watermarks(self, config: Config):
+        config.backup.command += " {account}"
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        deliver(config, "home/INBOX/cur/2.b:2,")
+        assert run_backup(config, account="work").ok
+        assert listed(config, "files") == ["work/INBOX/cur/1.a:2,S"]
+
+        deliver(config, "home/INBOX/cur/3.c:2,")
+        touch(config.paths.maildir_root / "home" / "INBOX" / "cur", 1)
+        assert run_backup(config, account="home").ok
+        assert listed(config, "files") == ["home/INBOX/cur/2.b:2,", "home/INBOX/cur/3.c:2,"]
+
+    def test_async(self, config: Config):
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        assert asyncio.run(async_run_backup(config)).ok
+        assert listed(config, "files") == ["work/INBOX/cur/1.a:2,S"]
+
+
+class TestNativeBackup:
+    @pytest.fixture()
+    def native(self, config: Config, tmp_path: Path) -> Config:
+        config.backup = BackupConfig(mode="native", repository=tmp_path / "repo")
+        return config
+
+    def test_stores_each_message_once_and_restores(self, native: Config, tmp_path: Path):
+        a = deliver(native, "work/INBOX/cur/1.a:2,S")
+        deliver(native, "work/Archive/cur/2.b:2,S").write_bytes(a.read_bytes())
+        deliver(native, "home/INBOX/cur/3.c:2,")
+
+        result = run_backup(native)
+        assert result.ok
+        assert "3 files" in result.stdout and "2 new" in result.stdout
+
+        deliver(native, "home/INBOX/cur/4.d:2,")
+        touch(native.paths.maildir_root / "home" / "INBOX" / "cur", 1)
+        assert "1 new" in run_backup(native).stdout
+
+        target = tmp_path / "restored"
+        assert run_restore(native, target) == 0
+        for rel in ("work/INBOX/cur/1.a:2,S", "work/Archive/cur/2.b:2,S", "home/INBOX/cur/4.d:2,"):
+            assert (target / rel).read_bytes() == (native.paths.maildir_root / rel).read_bytes()
+        assert (target / "home" / "INBOX" / "tmp").is_dir()
+
+    def test_account_scope(self, native: Config, tmp_path: Path):
+        deliver(native, "work/INBOX/cur/1.a:2,S")
+        deliver(native, "home/INBOX/cur/2.b:2,")
+        assert "1 files" in run_backup(native, account="home").stdout
+        target = tmp_path / "restored"
+        # Only home was backed up: a plain restore or one of work finds nothing.
+        assert run_restore(native, target) == 1
+        assert run_restore(native, target, account="work") == 1
+        assert run_restore(native, target, account="home") == 0
+        assert (target / "home" / "INBOX" / "cur" / "2.b:2,").exists()
+        assert not (target / "work").exists()
+
+    def test_latest_skips_snapshots_of_other_accounts(self, native: Config, tmp_path: Path):
+        deliver(native, "work/INBOX/cur/1.a:2,S")
+        deliver(native, "home/INBOX/cur/2.b:2,")
+        assert run_backup(native).ok
+        assert run_backup(native, account="home").ok
+        target = tmp_path / "restored"
+        assert run_restore(native, target) == 0
+        assert (target / "work" / "INBOX" / "cur" / "1.a:2,S").exists()
+        assert run_restore(native, target, account="nobody") == 1
+
+    def test_list_and_missing_repository(self, native: Config, capsys: pytest.CaptureFixture[str]):
+        assert run_restore(native, None, list_only=True) == 1
+        deliver(native, "work/INBOX/cur/1.a:2,S")
+        run_backup(native)
+        capsys.readouterr()
+        assert run_restore(native, None, list_only=True) == 0
+        assert "1 files" in capsys.readouterr().out
+        # Listing doesn't wait for a backup that is writing.
+        with PackStore(native.backup.repository):
+            assert run_restore(native, None, list_only=True) == 0
+
+    def test_deadline_stops_the_snapshot(self, native: Config, tmp_path: Path):
+        deliver(native, "work/INBOX/cur/1.a:2,S")
+        entries = [("work/INBOX/cur/1.a:2,S", 10, "ab" * 32)]
+        with PackStore(tmp_path / "repo") as store:
+            files = _store_files(
+                store, native.paths.maildir_root, entries, new_snapshot("all"), 1, deadline=0.0
+            )
+            with pytest.raises(StoreError, match="timed out"):
+                list(files)
+
+
+class TestTargets:
+    @pytest.fixture()
+    def out(self, tmp_path: Path) -> Path:
+        return tmp_path / "out"
+
+    def test_targets_run_concurrently(self, config: Config, out: Path):
+        config.backup = BackupConfig(
+            targets={
+                name: BackupConfig(command=f"sh -c 'sleep 0.5; touch {out}/{name}'")
+                for name in ("restic", "mirror")
+            }
+        )
+        started = time.monotonic()
+        result = run_backup(config)
+        assert time.monotonic() - started < 0.9
+        assert isinstance(result, AggregateResult) and result.ok
+        assert set(result.results) == {"restic", "mirror"}
+        assert (out / "restic").exists() and (out / "mirror").exists()
+
+    def test_retries_and_independent_failures(self, config: Config, out: Path):
+        # Fails the first time, succeeds on the retry.
+        flaky = f"sh -c 'test -e {out}/tried || {{ touch {out}/tried; exit 2; }}'"
+        config.backup = BackupConfig(
+            targets={
+                "flaky": BackupConfig(command=flaky, retries=1, retry_delay=0),
+                "broken": BackupConfig(command="sh -c 'exit 3'", retries=1, retry_delay=0),
+            }
+        )
+        result = run_backup(config)
+        assert result.failed == ["broken"]
+        assert result.exit_code == 3
+
+    def test_timeout_and_bandwidth_limit(self, config: Config, out: Path):
+        config.backup = BackupConfig(
+            targets={
+                "slow": BackupConfig(command="sleep 5", timeout=1),
+                "limited": BackupConfig(
+                    command=f"sh -c 'echo {{bwlimit}} > {out}/bwlimit'", bandwidth_limit=500
+                ),
+            }
+        )
+        result = run_backup(config)
+        assert result.failed == ["slow"]
+        assert "timed out" in result.results["slow"].stderr
+        assert (out / "bwlimit").read_text() == "500\n"
+
+    def test_incremental_watermark_per_target(self, config: Config, out: Path):
+        def target(name: str) -> BackupConfig:
+            return BackupConfig(
+                mode="incremental", command=f"sh -c 'cat {{files_from}} > {out}/{name}'"
+            )
+
+        config.backup = BackupConfig(targets={"a": target("a"), "b": target("b")})
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        assert run_backup(config).ok
+        command = config.backup.targets["b"].command
+        config.backup.targets["b"].command = "sh -c 'exit 1' {files_from}"
+
+        deliver(config, "work/INBOX/cur/2.b:2,")
+        touch(config.paths.maildir_root / "work" / "INBOX" / "cur", 1)
+        assert run_backup(config).failed == ["b"]
+        assert (out / "a").read_text().splitlines() == ["work/INBOX/cur/2.b:2,"]
+
+        config.backup.targets["b"].command = command
+        assert run_backup(config).ok
+        assert (out / "b").read_text().splitlines() == ["work/INBOX/cur/2.b:2,"]
+
+    def test_per_account_and_async(self, config: Config, out: Path):
+        config.backup = BackupConfig(
+            targets={
+                name: BackupConfig(command=f"touch {out}/{name}-{{account}}")
+                for name in ("restic", "mirror")
+            }
+        )
+        result = run_backup(config)
+        assert set(result.results) == {
+            "work:restic",
+            "work:mirror",
+            "home:restic",
+            "home:mirror",
+        }
+        for path in out.iterdir():
+            path.unlink()
+        assert asyncio.run(async_run_backup(config, account="home")).ok
+        assert sorted(p.name for p in out.iterdir()) == ["mirror-home", "restic-home"]
+
+
+class TestSnapshot:
+    @pytest.fixture()
+    def out(self, tmp_path: Path) -> Path:
+        return tmp_path / "out"
+
+    def test_hardlink_snapshot_is_backed_up_and_released(
+        self, config: Config, out: Path, tmp_path: Path
+    ):
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        snapshots = tmp_path / "snapshots"
+        config.backup = BackupConfig(
+            command=f"sh -c 'echo {{source}} > {out}/source; find {{source}} -type f > {out}/ls'",
+            snapshot="hardlink",
+            snapshot_dir=snapshots,
+        )
+        assert run_backup(config).ok
+        assert (out / "source").read_text().strip() == str(snapshots / "all")
+        assert (
+            str(snapshots / "all" / "work" / "INBOX" / "cur" / "1.a:2,S")
+            in (out / "ls").read_text()
+        )
+        assert not (snapshots / "all").exists()
+
+    def test_incremental_backup_runs_in_the_snapshot(
+        self, config: Config, out: Path, tmp_path: Path
+    ):
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        deliver(config, "home/INBOX/cur/2.b:2,")
+        config.backup.command = f"sh -c 'cat {{files_from}} > {out}/files; pwd > {out}/cwd'"
+        config.backup.snapshot = "hardlink"
+        config.backup.snapshot_dir = tmp_path / "snapshots"
+        assert asyncio.run(async_run_backup(config, account="work")).ok
+        assert listed(config, "files") == ["work/INBOX/cur/1.a:2,S"]
+        assert (out / "cwd").read_text().strip() == str(tmp_path / "snapshots" / "work")
+
+    def test_hooks(self, config: Config, out: Path, tmp_path: Path):
+        deliver(config, "work/INBOX/cur/1.a:2,S")
+        config.backup = BackupConfig(
+            command=f"cp -r {{source}} {out}/copy",
+            snapshot="hook",
+            snapshot_dir=tmp_path / "snapshots",
+            snapshot_create="cp -a {source} {snapshot}",
+            snapshot_release="rm -r {snapshot}",
+        )
+        assert run_backup(config).ok
+        assert (out / "copy" / "work" / "INBOX" / "cur" / "1.a:2,S").exists()
+        assert not (tmp_path / "snapshots" / "all").exists()
+
+        config.backup.snapshot_create = "sh -c 'exit 4'"
+        result = run_backup(config)
+        assert result.exit_code == 4
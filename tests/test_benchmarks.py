@@ -0,0 +1,140 @@
+"""Tests for the benchmark suite and its synthetic Maildir generator."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+
+import pytest
+
+from benchmarks.maildir import MaildirSpec, add_messages, cached_maildir, generate_maildir
+from benchmarks.suite import (
+    STATUS_OK,
+    STATUS_SKIPPED,
+    BenchResult,
+    find_regressions,
+    load_results,
+    main,
+    parse_size,
+    run_suite,
+)
+from email_archiver.manifest import Manifest, read_message_id
+
+
+def tree_digest(root: Path) -> str:
+    digest = hashlib.sha256()
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        digest.update(str(path.relative_to(root)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class TestGenerateMaildir:
+    def test_reproducible(self, tmp_path: Path):
+        spec = MaildirSpec(messages=200, accounts=2, attachment_ratio=0.2)
+        generate_maildir(tmp_path / "a", spec)
+        generate_maildir(tmp_path / "b", spec)
+        assert tree_digest(tmp_path / "a") == tree_digest(tmp_path / "b")
+
+    def test_layout_and_counts(self, tmp_path: Path):
+        spec = MaildirSpec(messages=300, accounts=2, folders=8, new_ratio=0.1)
+        archive = generate_maildir(tmp_path, spec)
+        files = [p for p in tmp_path.rglob("*") if p.is_file()]
+        assert archive.messages == len(files) == 300
+        assert archive.bytes == sum(p.stat().st_size for p in files)
+        assert set(archive.folders) == {"acct00", "acct01"}
+        assert (tmp_path / "acct01" / "Lists-dev" / "tmp").is_dir()
+        assert any(p.parent.name == "new" for p in files)
+        # Zipf-like fan-out: the first folder is the largest.
+        inbox = len(list((tmp_path / "acct00" / "INBOX").rglob("*.B[0-9]*")))
+        last = len(list((tmp_path / "acct00" / "Folder007").rglob("*.B[0-9]*")))
+        assert inbox > last > 0
+
+    def test_messages_parse(self, tmp_path: Path):
+        generate_maildir(tmp_path, MaildirSpec(messages=50, attachment_ratio=0.5))
+        ids = {read_message_id(p) for p in tmp_path.rglob("*.B[0-9]*")}
+        assert len(ids) == 50
+        with Manifest.open(tmp_path / "state", tmp_path) as manifest:
+            assert len(manifest.update().added) == 50
+
+    def test_duplicates(self, tmp_path: Path):
+        generate_maildir(tmp_path, MaildirSpec(messages=200, duplicate_ratio=0.3))
+        ids = [read_message_id(p) for p in tmp_path.rglob("*.B[0-9]*")]
+        assert 100 < len(set(ids)) < 200
+
+    def test_cached_and_add_messages(self, tmp_path: Path):
+        spec = MaildirSpec(messages=40)
+        archive = cached_maildir(tmp_path, spec)
+        assert not archive.cached
+        again = cached_maildir(tmp_path, spec)
+        assert again.cached and again.messages == 40 and again.root == archive.root
+
+        added = add_messages(archive, 5)
+        assert len(added) == 5 and all(p.exists() for p in added)
+        assert len(list(archive.root.rglob("*.B[0-9]*"))) == 45
+
+
+class TestSuite:
+    def test_parse_size(self):
+        assert parse_size("10k") == 10_000
+        assert parse_size("1M") == 1_000_000
+        assert parse_size("2500") == 2500
+        with pytest.raises(ValueError):
+            parse_size("0")
+
+    def test_run_suite(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr("shutil.which", lambda name: None)
+        results = run_suite(
+            [100],
+            ["generate", "manifest-noop", "manifest-delta", "index", "backup"],
+            tmp_path,
+            backup_command="tar -cf {workdir}/backup.tar -C {maildir} .",
+        )
+        by_stage = {r.stage: r for r in results}
+        assert by_stage["generate"].detail == {"cached": False}
+        assert by_stage["manifest-noop"].detail["added"] == 0
+        # The fresh tree is backdated past the racy window: nothing is rescanned.
+        assert by_stage["manifest-noop"].detail["dirs_scanned"] == 0
+        assert by_stage["manifest-delta"].detail["added"] == 1
+        assert by_stage["index"].status == STATUS_SKIPPED
+        assert by_stage["backup"].status == STATUS_OK
+        # The delivered messages are removed again, so the cache stays valid.
+        assert len(list(tmp_path.rglob("*.B[0-9]*"))) == 100
+
+    def test_find_regressions(self):
+        baseline = {
+            ("verify", 1000): {"status": "ok", "seconds": 2.0},
+            ("index", 1000): {"status": "ok", "seconds": 0.01},
+        }
+        results = [
+            BenchResult("verify", 1000, seconds=3.0),
+            BenchResult("index", 1000, seconds=0.03),  # within the noise floor
+            BenchResult("backup", 1000, seconds=9.0),  # no baseline
+        ]
+        (regression,) = find_regressions(results, baseline, 0.25)
+        assert regression.startswith("verify @ 1000")
+
+    def test_main_writes_jsonl(self, tmp_path: Path, capsys: pytest.CaptureFixture[str]):
+        output = tmp_path / "results.jsonl"
+        argv = ["--sizes", "50", "--stages", "manifest-cold", "--workdir", str(tmp_path)]
+        assert main([*argv, "--output", str(output)]) == 0
+        (row,) = [json.loads(line) for line in output.read_text().splitlines()]
+        assert row["stage"] == "manifest-cold"
+        assert row["messages"] == 50
+        assert row["status"] == "ok"
+        assert json.loads(capsys.readouterr().out) == row
+
+        assert main([*argv, "--baseline", str(output)]) == 0
+        assert main(["--stages", "nope"]) == 2
+
+    def test_baseline_is_keyed_on_the_spec(self, tmp_path: Path):
+        path = tmp_path / "results.jsonl"
+        rows = [
+            {"stage": "verify", "messages": 100, "spec": "a", "seconds": 1.0},
+            {"stage": "verify", "messages": 100, "spec": "b", "seconds": 9.0},
+        ]
+        path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+        assert load_results(path, "a")[("verify", 100)]["seconds"] == 1.0
+        assert load_results(path, "b")[("verify", 100)]["seconds"] == 9.0
+        assert load_results(path, "c") == {}
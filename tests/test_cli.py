@@ -50,6 +50,13 @@ class TestBuildParser:
         assert args.command == "run"
         assert args.account == "primary"
 
+    def test_import_mbox_subcommand(self):
+        parser = build_parser()
+        args = parser.parse_args(["import-mbox", "a.mbox", "b.mbox", "--folder", "Takeout"])
+        assert args.command == "import-mbox"
+        assert args.mbox == [Path("a.mbox"), Path("b.mbox")]
+        assert args.folder == "Takeout"
+
 
 class TestMain:
     def test_no_command_returns_1(self):
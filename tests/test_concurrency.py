@@ -0,0 +1,238 @@
+"""Tests for email_archiver.concurrency."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+from email_archiver.concurrency import (
+    AdaptiveLimiter,
+    RateLimiter,
+    Task,
+    async_run_scheduled,
+    run_scheduled,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestAdaptiveLimiter:
+    def test_fixed_never_moves(self):
+        limiter = AdaptiveLimiter.fixed(3)
+        for _ in range(20):
+            limiter.record(False)
+        assert limiter.limit == 3
+
+    def test_increases_while_throughput_holds(self):
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(2, maximum=5, window=2, clock=clock)
+        for _ in range(3):
+            clock.now += 1.0
+            limiter.record(True)
+            limiter.record(True)
+        assert limiter.limit == 5
+
+    def test_halves_on_errors(self):
+        limiter = AdaptiveLimiter(8, maximum=8, window=4)
+        for ok in (False, False, True, True):
+            limiter.record(ok)
+        assert limiter.limit == 4
+
+    def test_backs_off_when_throughput_drops(self):
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(3, maximum=10, window=2, clock=clock)
+        clock.now += 1.0
+        limiter.record(True, 10.0)
+        limiter.record(True, 10.0)
+        assert limiter.limit == 4
+        clock.now += 10.0
+        limiter.record(True, 1.0)
+        limiter.record(True, 1.0)
+        assert limiter.limit == 3
+
+    def test_never_below_minimum(self):
+        limiter = AdaptiveLimiter(2, maximum=4, window=1)
+        for _ in range(5):
+            limiter.record(False)
+        assert limiter.limit == 1
+
+
+class TestRateLimiter:
+    def test_paces_to_rate(self):
+        clock = FakeClock()
+        sleeps: list[float] = []
+
+        def sleep(seconds: float) -> None:
+            sleeps.append(seconds)
+            clock.now += seconds
+
+        limiter = RateLimiter(100, clock=clock, sleep=sleep)
+        limiter.acquire(50)  # first call goes straight through
+        limiter.acquire(100)
+        limiter.acquire(100)
+        assert sleeps == [0.5, 1.0]
+
+        clock.now += 10  # idle time is not saved up as a burst
+        limiter.acquire(100)
+        limiter.acquire(100)
+        assert sleeps == [0.5, 1.0, 1.0]
+
+    def test_zero_rate_is_unlimited(self):
+        limiter = RateLimiter(0, sleep=lambda s: (_ for _ in ()).throw(AssertionError))
+        limiter.acquire(10**9)
+
+
+def fail(task: Task, error: Exception):
+    raise error
+
+
+class TestRunScheduled:
+    def test_records_errors_as_results(self):
+        def boom() -> int:
+            raise RuntimeError("boom")
+
+        tasks = [Task(name="bad", key="h", fn=boom)]
+        tasks += [Task(name=str(i), key="h", fn=lambda i=i: i) for i in range(3)]
+        limiter = AdaptiveLimiter.fixed(2)
+        results = run_scheduled(
+            tasks,
+            limiter=limiter,
+            per_key_limit=2,
+            is_ok=lambda r: r >= 0,
+            on_error=lambda task, e: -1,
+        )
+        assert results == {"bad": -1, "0": 0, "1": 1, "2": 2}
+
+    def test_runs_all_tasks(self):
+        tasks = [Task(name=str(i), key="h", fn=lambda i=i: i * 2) for i in range(10)]
+        results = run_scheduled(
+            tasks,
+            limiter=AdaptiveLimiter.fixed(3),
+            per_key_limit=3,
+            is_ok=lambda r: True,
+            on_error=fail,
+        )
+        assert results == {str(i): i * 2 for i in range(10)}
+
+    def test_starts_in_priority_order(self):
+        started: list[str] = []
+
+        def make(name: str):
+            def fn() -> str:
+                started.append(name)
+                return name
+
+            return fn
+
+        tasks = [Task(name=n, key="h", fn=make(n)) for n in ["big", "medium", "small"]]
+        run_scheduled(
+            tasks, limiter=AdaptiveLimiter.fixed(1), per_key_limit=1, is_ok=bool, on_error=fail
+        )
+        assert started == ["big", "medium", "small"]
+
+    def test_capped_key_does_not_block_other_keys(self):
+        lock = threading.Lock()
+        active = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+
+        def make(key: str):
+            def fn() -> bool:
+                with lock:
+                    active[key] += 1
+                    peak[key] = max(peak[key], active[key])
+                time.sleep(0.02)
+                with lock:
+                    active[key] -= 1
+                return True
+
+            return fn
+
+        tasks = [Task(name=f"a{i}", key="a", fn=make("a")) for i in range(4)]
+        tasks += [Task(name=f"b{i}", key="b", fn=make("b")) for i in range(4)]
+        run_scheduled(
+            tasks, limiter=AdaptiveLimiter.fixed(4), per_key_limit=1, is_ok=bool, on_error=fail
+        )
+        assert peak == {"a": 1, "b": 1}
+
+
+class TestAsyncRunScheduled:
+    def test_records_errors_as_results(self):
+        async def boom() -> str:
+            raise OSError("gone")
+
+        async def fine() -> str:
+            return "ok"
+
+        tasks = [Task(name="bad", key="h", fn=boom), Task(name="good", key="h", fn=fine)]
+        results = asyncio.run(
+            async_run_scheduled(
+                tasks,
+                limiter=AdaptiveLimiter.fixed(2),
+                per_key_limit=2,
+                is_ok=lambda r: r == "ok",
+                on_error=lambda task, e: f"{task.name}: {e}",
+            )
+        )
+        assert results == {"bad": "bad: gone", "good": "ok"}
+
+    def test_respects_per_key_cap(self):
+        active = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+
+        def make(key: str):
+            async def fn() -> bool:
+                active[key] += 1
+                peak[key] = max(peak[key], active[key])
+                await asyncio.sleep(0.01)
+                active[key] -= 1
+                return True
+
+            return fn
+
+        tasks = [Task(name=f"{k}{i}", key=k, fn=make(k)) for k in "ab" for i in range(4)]
+        results = asyncio.run(
+            async_run_scheduled(
+                tasks, limiter=AdaptiveLimiter.fixed(4), per_key_limit=2, is_ok=bool, on_error=fail
+            )
+        )
+        assert len(results) == 8
+        assert peak == {"a": 2, "b": 2}
+
+    def test_cancellation_cancels_running_tasks(self):
+        cancelled: list[str] = []
+
+        def make(name: str):
+            async def fn() -> bool:
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(name)
+                    raise
+                return True
+
+            return fn
+
+        async def main() -> None:
+            tasks = [Task(name=n, key=n, fn=make(n)) for n in ["x", "y"]]
+            job = asyncio.ensure_future(
+                async_run_scheduled(
+                    tasks,
+                    limiter=AdaptiveLimiter.fixed(2),
+                    per_key_limit=1,
+                    is_ok=bool,
+                    on_error=fail,
+                )
+            )
+            await asyncio.sleep(0.05)
+            job.cancel()
+            await asyncio.gather(job, return_exceptions=True)
+
+        asyncio.run(main())
+        assert sorted(cancelled) == ["x", "y"]
@@ -32,6 +32,11 @@ state_dir = "/tmp/test-state"
 logs_dir = "/tmp/test-state/logs"
 verification_dir = "/tmp/test-state/verification"
 
+[sync]
+concurrency = 8
+max_connections_per_host = 3
+per_channel = true
+
 [backup]
 mode = "command"
 command = "echo backup"
@@ -125,6 +130,211 @@ imap_user = "u"
         assert cfg.orchestration.backup_after_verify is False
         assert cfg.paths is not None
         assert cfg.paths.logs_dir == Path("/tmp/test-state/logs")
+        assert cfg.sync is not None
+        assert cfg.sync.concurrency == 8
+        assert cfg.sync.max_connections_per_host == 3
+        assert cfg.sync.per_channel is True
+
+    def test_sync_defaults(self, config_file: Path):
+        cfg = load_config(config_file)
+        assert cfg.sync is not None
+        assert cfg.sync.concurrency == 4
+        assert cfg.sync.per_channel is False
+
+    def test_invalid_sync_concurrency(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n[sync]\nconcurrency = 0\n")
+        with pytest.raises(ConfigError, match="concurrency"):
+            load_config(p)
+
+    def test_sync_probe(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n[sync]\nprobe = true\nprobe_max_age = 600\n")
+        cfg = load_config(p)
+        assert cfg.sync is not None
+        assert cfg.sync.probe is True
+        assert cfg.sync.probe_max_age == 600
+        assert cfg.sync.progress is True
+
+    def test_sync_progress_off(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n[sync]\nprogress = false\n")
+        cfg = load_config(p)
+        assert cfg.sync is not None
+        assert cfg.sync.progress is False
+
+    def test_index_section(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n[index]\ntargeted = false\nfull_interval = 3600\n")
+        cfg = load_config(p)
+        assert cfg.index is not None
+        assert cfg.index.targeted is False
+        assert cfg.index.full_interval == 3600
+
+    def test_index_defaults(self, config_file: Path):
+        cfg = load_config(config_file)
+        assert cfg.index is not None
+        assert cfg.index.targeted is True
+        assert cfg.index.bulk is True
+        assert cfg.index.batch_size == 1000
+        assert cfg.index.workers == 0
+
+    def test_verify_defaults(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n[verify]\ndeep_rate_limit = 50\n")
+        cfg = load_config(p)
+        assert cfg.verify is not None
+        assert cfg.verify.deep_rate_limit == 50
+        assert cfg.verify.deep_workers == 0
+        assert cfg.verify.checkpoint_interval == 30
+        assert cfg.verify.remote is False
+
+    def test_incremental_backup_needs_files_from(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(
+            MINIMAL_CONFIG + '\n[backup]\nmode = "incremental"\ncommand = "restic backup"\n'
+        )
+        with pytest.raises(ConfigError, match="files_from"):
+            load_config(p)
+        p.write_text(
+            MINIMAL_CONFIG
+            + '\n[backup]\nmode = "incremental"\ncommand = "rsync --files-from={files_from}"\n'
+        )
+        with pytest.raises(ConfigError, match="removed_from"):
+            load_config(p)
+
+    def test_incremental_backup_rejects_snapshotting_tools(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(
+            MINIMAL_CONFIG
+            + '\n[backup]\nmode = "incremental"\n'
+            + 'command = "restic backup --files-from {files_from} --exclude-file {removed_from}"\n'
+        )
+        with pytest.raises(ConfigError, match="restic"):
+            load_config(p)
+
+    def test_native_backup_needs_repository(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + '\n[backup]\nmode = "native"\n')
+        with pytest.raises(ConfigError, match="repository"):
+            load_config(p)
+        p.write_text(MINIMAL_CONFIG + '\n[backup]\nmode = "native"\nrepository = "~/backup"\n')
+        cfg = load_config(p)
+        assert cfg.backup.repository == Path.home() / "backup"
+        assert cfg.backup.pack_size == 64
+
+    def test_backup_targets_inherit_defaults(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(
+            MINIMAL_CONFIG
+            + "\n[backup]\nretries = 2\ntimeout = 600\n"
+            + '[backup.target.restic]\ncommand = "restic backup --limit-upload {bwlimit}"\n'
+            + "bandwidth_limit = 500\n"
+            + '[backup.target.mirror]\nmode = "native"\nrepository = "/mnt/mail"\nretries = 0\n'
+        )
+        cfg = load_config(p)
+        restic, mirror = cfg.backup.targets["restic"], cfg.backup.targets["mirror"]
+        assert (restic.retries, restic.timeout, restic.bandwidth_limit) == (2, 600, 500)
+        assert (mirror.mode, mirror.retries, mirror.timeout) == ("native", 0, 600)
+
+    @pytest.mark.parametrize(
+        ("targets", "match"),
+        [
+            ('[backup.target.a]\ncommand = "rsync -a src dst"\nbandwidth_limit = 10\n', "bwlimit"),
+            (
+                '[backup.target.a]\ncommand = "restic backup {account}"\n'
+                '[backup.target.b]\ncommand = "restic backup"\n',
+                "account",
+            ),
+            ('[backup.target.a]\nmode = "native"\n', "repository"),
+            ("[backup]\ntarget = 1\n", "tables"),
+        ],
+    )
+    def test_invalid_backup_targets(self, tmp_path: Path, targets: str, match: str):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n" + targets)
+        with pytest.raises(ConfigError, match=match):
+            load_config(p)
+
+    def test_backup_snapshot(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(
+            MINIMAL_CONFIG
+            + '\n[backup]\nsnapshot = "hardlink"\ncommand = "restic backup {source}"\n'
+        )
+        cfg = load_config(p)
+        assert cfg.backup.snapshot == "hardlink"
+        assert cfg.backup.snapshot_dir == Path("/tmp/.test-maildir-snapshots")
+
+    @pytest.mark.parametrize(
+        ("backup", "match"),
+        [
+            ('snapshot = "zfs"\n', "snapshot"),
+            ('snapshot = "hook"\ncommand = "restic backup {source}"\n', "snapshot_create"),
+            ('snapshot = "hardlink"\ncommand = "restic backup /tmp/test-maildir"\n', "source"),
+            ('snapshot = "hardlink"\nsnapshot_dir = "/tmp/test-maildir/.snap"\n', "outside"),
+        ],
+    )
+    def test_invalid_backup_snapshot(self, tmp_path: Path, backup: str, match: str):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n[backup]\n" + backup)
+        with pytest.raises(ConfigError, match=match):
+            load_config(p)
+
+    def test_index_batch_size_must_be_positive(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n[index]\nbatch_size = 0\n")
+        with pytest.raises(ConfigError, match="batch_size"):
+            load_config(p)
+
+    def test_metrics_defaults(self, config_file: Path):
+        cfg = load_config(config_file)
+        assert cfg.metrics.enabled is True
+        assert cfg.metrics.textfile == cfg.paths.state_dir / "metrics" / "email_archiver.prom"
+
+    def test_metrics_section(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + '\n[metrics]\ntextfile = "/var/lib/node/ea.prom"\n')
+        assert load_config(p).metrics.textfile == Path("/var/lib/node/ea.prom")
+
+    def test_daemon_defaults(self, config_file: Path):
+        cfg = load_config(config_file)
+        assert cfg.daemon.interval == 3600
+        assert cfg.daemon.socket_path == cfg.paths.state_dir / "daemon.sock"
+        assert cfg.accounts["primary"].sync_interval is None
+
+    def test_daemon_and_account_interval(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(
+            MINIMAL_CONFIG.replace(
+                'imap_user = "user@example.com"\n', 'imap_user = "u"\nsync_interval = 300\n'
+            )
+            + "\n[daemon]\ninterval = 900\njitter = 0\n"
+        )
+        cfg = load_config(p)
+        assert cfg.accounts["primary"].sync_interval == 300
+        assert cfg.daemon.interval == 900
+        assert cfg.daemon.jitter == 0
+
+    def test_watch_section(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + '\n[watch]\nmode = "poll"\npoll_interval = 30\n')
+        cfg = load_config(p)
+        assert cfg.watch.mode == "poll"
+        assert cfg.watch.poll_interval == 30
+        assert cfg.watch.idle_folders == ["INBOX"]
+
+    def test_invalid_watch_mode(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + '\n[watch]\nmode = "push"\n')
+        with pytest.raises(ConfigError, match="mode"):
+            load_config(p)
+
+    def test_invalid_daemon_jitter(self, tmp_path: Path):
+        p = tmp_path / "config.toml"
+        p.write_text(MINIMAL_CONFIG + "\n[daemon]\njitter = -1\n")
+        with pytest.raises(ConfigError, match="jitter"):
+            load_config(p)
 
     def test_generated_config_dir_defaults(self, config_file: Path):
         cfg = load_config(config_file)
@@ -0,0 +1,321 @@
+"""Tests for email_archiver.commands.daemon."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import socket
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from email_archiver.commands.daemon import (
+    AccountSchedule,
+    DaemonRunning,
+    Scheduler,
+    _serve_control,
+    send_control,
+)
+from email_archiver.config import (
+    AccountConfig,
+    BackupConfig,
+    Config,
+    DaemonConfig,
+    OrchestrationConfig,
+    PathsConfig,
+    SyncConfig,
+)
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    accounts = {
+        name: AccountConfig(
+            name=name,
+            email=f"{name}@example.com",
+            imap_host="imap.example.com",
+            imap_user=f"{name}@example.com",
+        )
+        for name in ["a", "b"]
+    }
+    return Config(
+        accounts=accounts,
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=tmp_path / "state",
+            logs_dir=tmp_path / "state" / "logs",
+            verification_dir=tmp_path / "state" / "verification",
+        ),
+        sync=SyncConfig(),
+        backup=BackupConfig(),
+        orchestration=OrchestrationConfig(),
+        daemon=DaemonConfig(interval=3600, jitter=0),
+    )
+
+
+def finish(sched: AccountSchedule, started: float, now: float, code: int) -> None:
+    sched.finish(started, now, code, jitter=0, max_backoff=1000, rng=random.Random(0))
+
+
+class TestAccountSchedule:
+    def test_cadence_anchored_to_start(self):
+        sched = AccountSchedule("a", interval=100, next_due=0, running=True)
+        finish(sched, 0, 30, 0)
+        assert sched.next_due == 100
+        assert not sched.running
+
+    def test_skips_slots_missed_while_running(self):
+        sched = AccountSchedule("a", interval=100, next_due=0)
+        finish(sched, 0, 250, 0)
+        assert sched.next_due == 300
+
+    def test_backs_off_after_failures(self):
+        sched = AccountSchedule("a", interval=100, next_due=0)
+        finish(sched, 0, 10, 1)
+        assert sched.next_due == 210
+        finish(sched, 210, 220, 1)
+        assert sched.next_due == 220 + 400
+        finish(sched, 620, 630, 1)
+        assert sched.next_due == 630 + 800
+        finish(sched, 1430, 1440, 1)
+        assert sched.next_due == 1440 + 1000  # capped at max_backoff
+        finish(sched, 2440, 2450, 0)
+        assert sched.failures == 0
+        assert sched.next_due == 2540
+
+
+class FakeRuns:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        self.release = asyncio.Event()
+        self.block = False
+
+    async def __call__(self, account: str) -> int:
+        self.calls.append(account)
+        if self.block:
+            await self.release.wait()
+        return 0
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+class TestScheduler:
+    def test_runs_due_accounts_and_triggers(self, config: Config):
+        async def main() -> list[str]:
+            runs = FakeRuns()
+            scheduler = Scheduler(config, run_account=runs)
+            loop_task = asyncio.ensure_future(scheduler.run_forever())
+            await settle()
+            assert sorted(runs.calls) == ["a", "b"]
+            assert scheduler.trigger("a")["triggered"] == ["a"]
+            await settle()
+            scheduler.stop()
+            await loop_task
+            return runs.calls
+
+        assert sorted(asyncio.run(main())) == ["a", "a", "b"]
+
+    def test_does_not_overlap_runs(self, config: Config):
+        async def main() -> None:
+            runs = FakeRuns()
+            runs.block = True
+            scheduler = Scheduler(config, run_account=runs)
+            loop_task = asyncio.ensure_future(scheduler.run_forever())
+            await settle()
+            response = scheduler.trigger()
+            assert sorted(response["running"]) == ["a", "b"]
+            await settle()
+            assert sorted(runs.calls) == ["a", "b"]
+            assert scheduler.status()["accounts"]["a"]["running"]
+            runs.release.set()
+            await settle()
+            assert scheduler.status()["accounts"]["a"]["runs"] == 1
+            scheduler.stop()
+            await loop_task
+
+        asyncio.run(main())
+
+    def test_backs_up_once_when_no_account_is_running(self, config: Config):
+        async def main() -> None:
+            runs = FakeRuns()
+            runs.block = True
+            backups: list[int] = []
+
+            async def backup() -> int:
+                backups.append(len(runs.calls))
+                return 0
+
+            scheduler = Scheduler(config, run_account=runs, run_backup=backup)
+            loop_task = asyncio.ensure_future(scheduler.run_forever())
+            await settle()
+            assert backups == []
+            runs.release.set()
+            await settle()
+            # Both accounts finished: one backup covers them.
+            assert backups == [2]
+            assert scheduler.status()["backup"] == {"pending": False, "running": False}
+            scheduler.stop()
+            await loop_task
+
+        asyncio.run(main())
+
+    def test_backup_waits_for_running_accounts(self, config: Config):
+        async def main() -> None:
+            release = {"a": asyncio.Event(), "b": asyncio.Event()}
+            backups: list[str] = []
+
+            async def run(account: str) -> int:
+                await release[account].wait()
+                return 0
+
+            async def backup() -> int:
+                backups.append("backup")
+                return 0
+
+            scheduler = Scheduler(config, run_account=run, run_backup=backup)
+            loop_task = asyncio.ensure_future(scheduler.run_forever())
+            await settle()
+            release["a"].set()
+            await settle()
+            assert backups == []
+            assert scheduler.status()["backup"]["pending"]
+            release["b"].set()
+            await settle()
+            assert backups == ["backup"]
+            scheduler.stop()
+            await loop_task
+
+        asyncio.run(main())
+
+    def test_snapshot_backup_does_not_wait(self, config: Config):
+        config.backup.snapshot = "hardlink"
+
+        async def main() -> None:
+            release = {"a": asyncio.Event(), "b": asyncio.Event()}
+            backups: list[str] = []
+
+            async def run(account: str) -> int:
+                await release[account].wait()
+                return 0
+
+            async def backup() -> int:
+                backups.append("backup")
+                return 0
+
+            scheduler = Scheduler(config, run_account=run, run_backup=backup)
+            loop_task = asyncio.ensure_future(scheduler.run_forever())
+            await settle()
+            release["a"].set()
+            await settle()
+            # b is still running, but the backup works from a snapshot.
+            assert backups == ["backup"]
+            release["b"].set()
+            await settle()
+            assert backups == ["backup", "backup"]
+            scheduler.stop()
+            await loop_task
+
+        asyncio.run(main())
+
+    def test_unknown_account(self, config: Config):
+        scheduler = Scheduler(config, run_account=FakeRuns())
+        assert not scheduler.trigger("missing")["ok"]
+
+    def test_failure_counts(self, config: Config):
+        async def failing(account: str) -> int:
+            raise RuntimeError("boom")
+
+        async def main() -> Scheduler:
+            scheduler = Scheduler(config, run_account=failing)
+            loop_task = asyncio.ensure_future(scheduler.run_forever())
+            await settle()
+            scheduler.stop()
+            await loop_task
+            return scheduler
+
+        scheduler = asyncio.run(main())
+        assert scheduler.schedules["a"].failures == 1
+        assert scheduler.schedules["a"].last_exit_code == 1
+
+
+class TestControlSocket:
+    def test_round_trip(self, config: Config):
+        # AF_UNIX paths are length-limited, so keep the socket path short.
+        with tempfile.TemporaryDirectory(dir="/tmp") as tmp:
+            socket_path = Path(tmp) / "d.sock"
+
+            async def main() -> tuple[dict, dict]:
+                scheduler = Scheduler(config, run_account=FakeRuns())
+                server = await _serve_control(scheduler, socket_path)
+                try:
+                    status = await asyncio.to_thread(send_control, socket_path, "status")
+                    bad = await asyncio.to_thread(send_control, socket_path, "bogus")
+                finally:
+                    server.close()
+                    await server.wait_closed()
+                return status, bad
+
+            status, bad = asyncio.run(main())
+        assert status["ok"]
+        assert set(status["accounts"]) == {"a", "b"}
+        assert not bad["ok"]
+
+    def test_refuses_to_take_over_a_live_socket(self, config: Config):
+        with tempfile.TemporaryDirectory(dir="/tmp") as tmp:
+            socket_path = Path(tmp) / "d.sock"
+
+            async def main() -> dict:
+                first = await _serve_control(Scheduler(config, run_account=FakeRuns()), socket_path)
+                try:
+                    with pytest.raises(DaemonRunning):
+                        await _serve_control(Scheduler(config), socket_path)
+                    return await asyncio.to_thread(send_control, socket_path, "status")
+                finally:
+                    first.close()
+                    await first.wait_closed()
+
+            # The first daemon still owns the socket.
+            assert asyncio.run(main())["ok"]
+
+    def test_replaces_a_stale_socket(self, config: Config):
+        with tempfile.TemporaryDirectory(dir="/tmp") as tmp:
+            socket_path = Path(tmp) / "d.sock"
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(str(socket_path))
+            stale.close()
+
+            async def main() -> dict:
+                server = await _serve_control(
+                    Scheduler(config, run_account=FakeRuns()), socket_path
+                )
+                try:
+                    return await asyncio.to_thread(send_control, socket_path, "status")
+                finally:
+                    server.close()
+                    await server.wait_closed()
+
+            assert asyncio.run(main())["ok"]
+
+    def test_truncated_reply_is_reported_as_unreachable(self, config: Config):
+        with tempfile.TemporaryDirectory(dir="/tmp") as tmp:
+            socket_path = Path(tmp) / "d.sock"
+
+            async def main() -> None:
+                async def hang_up(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+                    await reader.readline()
+                    writer.write(b'{"ok": tr')
+                    writer.close()
+
+                server = await asyncio.start_unix_server(hang_up, path=str(socket_path))
+                try:
+                    with pytest.raises(OSError, match="invalid reply"):
+                        await asyncio.to_thread(send_control, socket_path, "status")
+                finally:
+                    server.close()
+                    await server.wait_closed()
+
+            asyncio.run(main())
@@ -0,0 +1,128 @@
+"""Tests for the dedupe command."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from email_archiver import hashindex, synclock
+from email_archiver.commands import dedupe
+from email_archiver.commands.dedupe import run_dedupe
+from email_archiver.config import BackupConfig, Config, OrchestrationConfig, PathsConfig, SyncConfig
+
+MESSAGE = b"Message-ID: <a@example.com>\nSubject: hi\n\nsame body\n"
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    state = tmp_path / "state"
+    return Config(
+        accounts={},
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=state,
+            logs_dir=state / "logs",
+            verification_dir=state / "verification",
+        ),
+        sync=SyncConfig(),
+        backup=BackupConfig(),
+        orchestration=OrchestrationConfig(),
+    )
+
+
+def deliver(config: Config, rel: str, data: bytes = MESSAGE) -> Path:
+    path = config.paths.maildir_root / rel
+    for sub in ("cur", "new", "tmp"):
+        (path.parent.parent / sub).mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+class TestDedupe:
+    def test_reports_duplicates_across_accounts(self, config: Config):
+        deliver(config, "work/INBOX/cur/1:2,S")
+        deliver(config, "work/Archive/cur/2:2,S")
+        deliver(config, "home/INBOX/cur/3:2,")
+        deliver(config, "home/INBOX/cur/4:2,", b"Message-ID: <b@example.com>\n\nother\n")
+
+        report = run_dedupe(config)
+        assert report.files == 4
+        assert len(report.groups) == 1
+        assert report.redundant_files == 2
+        assert report.reclaimable_bytes == 2 * len(MESSAGE)
+        assert report.linked == 0
+
+    def test_different_headers_are_duplicates_but_not_linked(self, config: Config):
+        deliver(config, "work/INBOX/cur/1:2,S")
+        deliver(config, "home/INBOX/cur/2:2,S", b"Received: by mx\n" + MESSAGE)
+        report = run_dedupe(config, link=True)
+        assert report.redundant_files == 1
+        assert report.reclaimable_bytes == 0
+        assert report.linked == 0
+
+    def test_without_message_id_needs_identical_bytes(self, config: Config):
+        deliver(config, "work/INBOX/cur/1:2,S", b"Subject: a\n\nok\n")
+        deliver(config, "work/INBOX/cur/2:2,S", b"Subject: b\n\nok\n")
+        assert run_dedupe(config).groups == []
+
+    def test_link_replaces_copies(self, config: Config, capsys: pytest.CaptureFixture[str]):
+        a = deliver(config, "work/INBOX/cur/1:2,S")
+        b = deliver(config, "work/Archive/cur/2:2,S")
+        c = deliver(config, "home/INBOX/cur/3:2,")
+
+        run_dedupe(config, link=True, dry_run=True)
+        assert "[dry-run] Would link" in capsys.readouterr().out
+        assert os.stat(a).st_nlink == 1
+
+        report = run_dedupe(config, link=True)
+        assert report.ok and report.linked == 2
+        assert report.linked_bytes == 2 * len(MESSAGE)
+        assert os.stat(a).st_ino == os.stat(b).st_ino == os.stat(c).st_ino
+        assert b.read_bytes() == MESSAGE
+        assert not list(b.parent.glob(".*dedupe-tmp"))
+
+        # Already linked: nothing left to reclaim, and nothing to hash again.
+        again = run_dedupe(config, link=True, verbose=True)
+        assert again.reclaimable_bytes == 0 and again.linked == 0
+        assert "Hashed 0 new files, 3 known" in capsys.readouterr().out
+
+    def test_skips_files_renamed_meanwhile(self, config: Config, monkeypatch):
+        deliver(config, "work/INBOX/cur/1:2,S")
+        b = deliver(config, "work/Archive/cur/2:2,S")
+        real = dedupe._digest_all
+
+        def digest_then_rename(*args):
+            digests = real(*args)
+            b.rename(b.with_name("2:2,RS"))
+            return digests
+
+        monkeypatch.setattr(dedupe, "_digest_all", digest_then_rename)
+        report = run_dedupe(config, link=True)
+        assert report.ok and report.skipped == 1
+        assert not b.exists()
+        assert os.stat(b.with_name("2:2,RS")).st_nlink == 1
+
+    def test_link_refused_while_syncing(self, config: Config):
+        a = deliver(config, "work/INBOX/cur/1:2,S")
+        deliver(config, "work/Archive/cur/2:2,S")
+        with synclock.shared(config.paths.state_dir):
+            report = run_dedupe(config, link=True)
+        assert not report.ok and report.linked == 0
+        assert "a sync is running" in report.errors[0]
+        assert os.stat(a).st_nlink == 1
+        assert run_dedupe(config, link=True).linked == 1
+
+    def test_account_limits_the_scan(self, config: Config):
+        deliver(config, "work/INBOX/cur/1:2,S")
+        deliver(config, "home/INBOX/cur/2:2,S")
+        assert run_dedupe(config, account="work").files == 1
+
+    def test_hashes_in_worker_processes(self, config: Config, monkeypatch):
+        monkeypatch.setattr(hashindex, "_POOL_MIN_FILES", 1)
+        for i in range(5):
+            deliver(config, f"work/INBOX/cur/{i}:2,S")
+        report = run_dedupe(config, workers=2)
+        assert report.files == 5
+        assert report.redundant_files == 4
@@ -66,6 +66,11 @@ class TestGenerateMbsyncrc:
         assert f'PassCmd "cat {PASSWORD_FILE}"' in rc
         assert "TLSType IMAPS" in rc
 
+    def test_port_only_when_set(self, config: Config):
+        assert "Port " not in generate_mbsyncrc(config)
+        config.accounts["primary"].imap_port = 1993
+        assert "Port 1993" in generate_mbsyncrc(config)
+
     def test_contains_stores(self, config: Config):
         rc = generate_mbsyncrc(config)
         assert "IMAPStore primary-remote" in rc
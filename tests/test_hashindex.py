@@ -0,0 +1,87 @@
+"""Tests for email_archiver.hashindex."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from email_archiver import hashindex
+from email_archiver.hashindex import HashIndex, hash_message
+
+
+def write(
+    root: Path, rel: str, data: bytes = b"Message-ID: <a@b>\n\nbody\n"
+) -> tuple[str, os.stat_result]:
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return rel, os.stat(path)
+
+
+@pytest.fixture()
+def index(tmp_path: Path):
+    with HashIndex.open(tmp_path / "state") as idx:
+        yield idx
+
+
+class TestHashMessage:
+    def test_splits_headers_and_body(self, tmp_path: Path):
+        write(tmp_path, "m", b"Message-ID: <x@y>\r\nSubject: s\r\n\r\nbody\r\n")
+        write(tmp_path, "b", b"body\r\n")
+        h = hash_message(str(tmp_path / "m"))
+        assert h is not None and h.message_id == "x@y"
+        assert h.body_sha256 == hash_message(str(tmp_path / "b")).sha256
+
+    def test_empty_and_missing_files(self, tmp_path: Path):
+        write(tmp_path, "empty", b"")
+        assert hash_message(str(tmp_path / "empty")).size == 0
+        assert hash_message(str(tmp_path / "gone")) is None
+
+
+class TestHashIndex:
+    def test_known_files_are_not_read_again(self, tmp_path: Path, index: HashIndex):
+        files = [write(tmp_path, "INBOX/cur/1.abc:2,S")]
+        first = index.hashes(tmp_path, files)
+        assert index.hashed == 1
+
+        # A flag rename keeps the unique name, size and mtime.
+        old = tmp_path / "INBOX/cur/1.abc:2,S"
+        new = old.with_name("1.abc:2,RS")
+        old.rename(new)
+        second = index.hashes(tmp_path, [("INBOX/cur/1.abc:2,RS", os.stat(new))])
+        assert index.hashed == 1
+        assert second["INBOX/cur/1.abc:2,RS"] == first["INBOX/cur/1.abc:2,S"]
+
+    def test_changed_files_are_hashed_again(self, tmp_path: Path, index: HashIndex):
+        index.hashes(tmp_path, [write(tmp_path, "cur/1")])
+        rel, st = write(tmp_path, "cur/1", b"Message-ID: <c@d>\n\nlonger body\n")
+        assert index.get(tmp_path, rel, st).message_id == "c@d"
+        assert index.hashed == 2
+
+    def test_shared_between_instances(self, tmp_path: Path, index: HashIndex):
+        files = [write(tmp_path, "cur/1"), write(tmp_path, "cur/2", b"x\n\ny\n")]
+        index.hashes(tmp_path, files)
+        with HashIndex.open(tmp_path / "state") as other:
+            assert set(other.hashes(tmp_path, files)) == {"cur/1", "cur/2"}
+            assert other.hashed == 0
+
+    def test_vanished_files_are_left_out(self, tmp_path: Path, index: HashIndex):
+        rel, st = write(tmp_path, "cur/1")
+        (tmp_path / rel).unlink()
+        assert index.hashes(tmp_path, [(rel, st)]) == {}
+
+    def test_prune(self, tmp_path: Path, index: HashIndex):
+        index.hashes(tmp_path, [write(tmp_path, "cur/1:2,S"), write(tmp_path, "cur/2:2,S")])
+        assert index.prune(["1"]) == 1
+        (n,) = index.conn.execute("SELECT COUNT(*) FROM hashes").fetchone()
+        assert n == 1
+
+    def test_hashes_in_worker_processes(self, tmp_path: Path, index, monkeypatch):
+        monkeypatch.setattr(hashindex, "_POOL_MIN_FILES", 1)
+        files = [
+            write(tmp_path, f"cur/{i}", f"Message-ID: <{i}@x>\n\n{i}\n".encode()) for i in range(5)
+        ]
+        found = index.hashes(tmp_path, files, workers=2)
+        assert [found[f"cur/{i}"].message_id for i in range(5)] == [f"{i}@x" for i in range(5)]
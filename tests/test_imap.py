@@ -0,0 +1,283 @@
+"""Tests for email_archiver.imap and the IMAP watcher."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+from email_archiver import imap
+from email_archiver.commands import watch
+from email_archiver.commands.watch import Watcher, run_watch
+from email_archiver.config import (
+    AccountConfig,
+    Config,
+    PathsConfig,
+    SyncConfig,
+    WatchConfig,
+)
+from email_archiver.imap import FolderStatus, ImapError
+from email_archiver.probe import StatusCache
+from email_archiver.runner import AggregateResult, RunResult
+from tests.fake_imap import FakeImapServer
+
+FOLDERS = ["INBOX", "Archive", "Sent Items"]
+
+
+@pytest.fixture()
+def server():
+    with FakeImapServer(FOLDERS) as srv:
+        yield srv
+
+
+def make_account(port: int) -> AccountConfig:
+    return AccountConfig(
+        name="acct",
+        email="u@example.com",
+        imap_host="127.0.0.1",
+        imap_user="u",
+        tls_type="None",
+        imap_port=port,
+        folders=list(FOLDERS),
+    )
+
+
+def make_config(tmp_path: Path, port: int, mode: str = "idle") -> Config:
+    return Config(
+        accounts={"acct": make_account(port)},
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=tmp_path / "state",
+            logs_dir=tmp_path / "state" / "logs",
+            verification_dir=tmp_path / "state" / "verification",
+        ),
+        sync=SyncConfig(),
+        watch=WatchConfig(mode=mode, poll_interval=1, idle_timeout=5, debounce=0),
+    )
+
+
+class TestSequenceSets:
+    def test_parse(self):
+        assert list(imap.parse_sequence_set(b"1:3,7,10:9")) == [1, 2, 3, 7, 9, 10]
+        assert list(imap.parse_sequence_set("")) == []
+
+    def test_format(self):
+        assert imap.format_sequence_set([1, 2, 3, 7, 9, 10]) == "1:3,7,9:10"
+        assert imap.format_sequence_set([]) == ""
+
+    def test_round_trip_large(self):
+        uids = [uid for uid in range(1, 500_001) if uid % 1000]
+        text = imap.format_sequence_set(uids)
+        assert imap.parse_sequence_set(text).tolist() == uids
+
+
+class TestMailboxNames:
+    def test_ascii_unchanged(self):
+        assert imap.encode_mailbox("INBOX") == "INBOX"
+
+    def test_ampersand(self):
+        assert imap.encode_mailbox("R&D") == "R&-D"
+
+    def test_non_ascii(self):
+        assert imap.encode_mailbox("Entwürfe") == "Entw&APw-rfe"
+
+    def test_quoting(self):
+        assert imap.quote_mailbox('Sent "Items"') == '"Sent \\"Items\\""'
+
+
+class TestClient:
+    def test_status(self, server: FakeImapServer):
+        server.deliver("Archive", 3)
+        conn = imap.connect(make_account(server.port), password="secret")
+        try:
+            assert imap.folder_status(conn, "Archive") == FolderStatus(3, 4, 1)
+            assert imap.folder_status(conn, "Sent Items") == FolderStatus(0, 1, 1)
+        finally:
+            imap.close(conn)
+
+    def test_missing_folder(self, server: FakeImapServer):
+        conn = imap.connect(make_account(server.port), password="secret")
+        try:
+            with pytest.raises(ImapError):
+                imap.folder_status(conn, "Nope")
+        finally:
+            imap.close(conn)
+
+    @pytest.mark.parametrize("esearch", [False, True])
+    def test_folder_uids(self, server: FakeImapServer, monkeypatch, esearch: bool):
+        monkeypatch.setattr(imap, "_SEARCH_CHUNK", 3)
+        server.esearch = esearch
+        server.deliver("Archive", 8)
+        server.expunge("Archive", [2, 5, 6])
+        conn = imap.connect(make_account(server.port), password="secret")
+        try:
+            status, uids = imap.folder_uids(conn, "Archive")
+            assert status.messages == 5
+            assert uids.tolist() == [1, 3, 4, 7, 8]
+            # Searched in chunks of UID ranges, with or without ESEARCH.
+            prefix = "RETURN (ALL) UID" if esearch else "UID"
+            assert server.searches == [f"{prefix} 1:3", f"{prefix} 4:6", f"{prefix} 7:8"]
+            assert imap.folder_uids(conn, "INBOX")[1].tolist() == []
+        finally:
+            imap.close(conn)
+
+    def test_bad_login(self, server: FakeImapServer):
+        with pytest.raises(ImapError, match="Login"):
+            imap.connect(make_account(server.port), password="wrong")
+
+    def test_idle_times_out_quietly(self, server: FakeImapServer):
+        conn = imap.connect(make_account(server.port), password="secret")
+        try:
+            imap.examine(conn, "INBOX")
+            assert imap.idle(conn, 0.2) == []
+            # The connection is still usable afterwards.
+            assert imap.folder_status(conn, "INBOX").messages == 0
+        finally:
+            imap.close(conn)
+
+    def test_idle_wakes_on_new_mail(self, server: FakeImapServer):
+        conn = imap.connect(make_account(server.port), password="secret")
+        try:
+            imap.examine(conn, "INBOX")
+            threading.Timer(0.2, server.deliver, args=("INBOX",)).start()
+            events = imap.idle(conn, 5)
+            assert events == [b"* 1 EXISTS"]
+        finally:
+            imap.close(conn)
+
+
+class RecordingWatcher(Watcher):
+    def __init__(self, config: Config, cache: StatusCache | None = None) -> None:
+        self.seen: list[tuple[str, str]] = []
+        super().__init__(
+            config, lambda a, f: self.seen.append((a, f)), password="secret", cache=cache
+        )
+
+
+async def collect_changes(
+    watcher: RecordingWatcher, server: FakeImapServer, action, *, until: int
+) -> list[tuple[str, str]]:
+    task = asyncio.ensure_future(watcher.run())
+    idle_folders = sum(len(idle) for idle, _ in watcher.plan.values())
+    try:
+        # Wait for the baseline STATUS of every folder and for IDLE to start.
+        for _ in range(200):
+            if len(watcher.known) == len(FOLDERS) and server.idling >= idle_folders:
+                break
+            await asyncio.sleep(0.02)
+        await asyncio.to_thread(action)
+        for _ in range(100):
+            if len(watcher.seen) >= until:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return watcher.seen
+
+
+class TestWatcher:
+    def test_plan(self, tmp_path: Path):
+        watcher = RecordingWatcher(make_config(tmp_path, 1))
+        assert watcher.plan == {"acct": (["INBOX"], ["Archive", "Sent Items"])}
+        watcher = RecordingWatcher(make_config(tmp_path, 1, mode="poll"))
+        assert watcher.plan == {"acct": ([], FOLDERS)}
+
+    def test_idle_reports_inbox(self, tmp_path: Path, server: FakeImapServer):
+        watcher = RecordingWatcher(make_config(tmp_path, server.port))
+        seen = asyncio.run(
+            collect_changes(watcher, server, lambda: server.deliver("INBOX"), until=1)
+        )
+        assert seen == [("acct", "INBOX")]
+
+    def test_poll_reports_changed_folder_only(self, tmp_path: Path, server: FakeImapServer):
+        watcher = RecordingWatcher(make_config(tmp_path, server.port))
+        seen = asyncio.run(
+            collect_changes(watcher, server, lambda: server.deliver("Sent Items"), until=1)
+        )
+        assert seen == [("acct", "Sent Items")]
+
+    def test_reports_folders_changed_since_last_sync(self, tmp_path: Path, server: FakeImapServer):
+        config = make_config(tmp_path, server.port)
+        conn = imap.connect(make_account(server.port), password="secret")
+        try:
+            inbox = imap.folder_status(conn, "INBOX")
+            archive = imap.folder_status(conn, "Archive")
+        finally:
+            imap.close(conn)
+        cache = StatusCache.load(tmp_path / "state")
+        cache.record("acct", "INBOX", inbox, 1.0)
+        cache.record("acct", "Archive", archive, 1.0)
+        server.deliver("Archive")
+        watcher = RecordingWatcher(config, cache)
+        seen = asyncio.run(collect_changes(watcher, server, lambda: None, until=2))
+        # Archive changed while nothing watched; Sent Items was never synced.
+        assert sorted(seen) == [("acct", "Archive"), ("acct", "Sent Items")]
+
+    def test_reconnects_after_failure(self, tmp_path: Path, server: FakeImapServer):
+        server.refuse_logins = True
+        watcher = RecordingWatcher(make_config(tmp_path, server.port, mode="poll"))
+        watcher.reconnect_min = 0.1
+
+        async def main() -> list[tuple[str, str]]:
+            task = asyncio.ensure_future(watcher.run())
+            await asyncio.sleep(0.3)
+            server.refuse_logins = False
+            await asyncio.sleep(0.5)
+            server.deliver("Archive")
+            for _ in range(60):
+                if watcher.seen:
+                    break
+                await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return watcher.seen
+
+        assert asyncio.run(main()) == [("acct", "Archive")]
+        assert server.logins >= 1
+
+    def test_run_watch_stops_when_the_watcher_dies(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys
+    ):
+        async def broken(self: Watcher) -> None:
+            raise ValueError("file descriptor out of range in select()")
+
+        monkeypatch.setattr(Watcher, "run", broken)
+        config = make_config(tmp_path, 1)
+        assert run_watch(config) == 1
+        assert "Watch failed: ValueError" in capsys.readouterr().out
+
+    def test_run_watch_retries_failed_folders(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys
+    ):
+        synced: list[dict[str, list[str]]] = []
+
+        async def sync(config: Config, *, folders: dict[str, list[str]], **kwargs):
+            synced.append(folders)
+            code = 1 if len(synced) == 1 else 0
+            name = "acct-INBOX"
+            return AggregateResult(results={name: RunResult(["mbsync"], code, "", "", 0.0)})
+
+        async def changes(self: Watcher) -> None:
+            self.known[("acct", "INBOX")] = FolderStatus(3, 4, 1)
+            self.on_change("acct", "INBOX")
+            while len(synced) < 2:
+                await asyncio.sleep(0.01)
+
+        async def index_since(*args) -> None:
+            pass
+
+        monkeypatch.setattr(watch, "async_run_sync", sync)
+        monkeypatch.setattr(watch, "_RESYNC_MIN", 0.01)
+        monkeypatch.setattr(Watcher, "run", changes)
+        monkeypatch.setattr(watch.IndexCoalescer, "index_since", index_since)
+        assert run_watch(make_config(tmp_path, 1)) == 0
+        # The folder whose sync failed was synced again without a new change.
+        assert synced == [{"acct": ["INBOX"]}, {"acct": ["INBOX"]}]
+        assert "sync failed for acct/INBOX" in capsys.readouterr().out
+        # Only the successful sync saved the status for the next start.
+        cached = StatusCache.load(tmp_path / "state").get("acct", "INBOX")
+        assert cached[0] == FolderStatus(3, 4, 1)
+        assert cached[1] > 0
@@ -0,0 +1,197 @@
+"""Tests for the import-mbox command."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from email_archiver.commands import import_mbox
+from email_archiver.commands.import_mbox import iter_mbox, run_import_mbox
+from email_archiver.config import AccountConfig, Config, PathsConfig
+from email_archiver.manifest import read_message_id
+from email_archiver.runner import RunResult
+
+
+def message(n: int, body: str = "body", labels: str = "Inbox") -> str:
+    return f"Message-ID: <{n}@example.com>\nX-Gmail-Labels: {labels}\nSubject: {n}\n\n{body}\n"
+
+
+def mbox(path: Path, *messages: str, newline: str = "\n") -> Path:
+    parts = [f"From 123@xxx Mon Jan 01 00:00:00 +0000 2024\n{m}\n" for m in messages]
+    path.write_bytes("".join(parts).replace("\n", newline).encode())
+    return path
+
+
+class TestIterMbox:
+    def test_splits_on_from_lines(self, tmp_path: Path):
+        path = mbox(tmp_path / "a.mbox", message(1), message(2, "a\n>From here\n>>From there"))
+        assert list(iter_mbox(path)) == [
+            message(1).encode(),
+            message(2, "a\nFrom here\n>From there").encode(),
+        ]
+
+    def test_crlf(self, tmp_path: Path):
+        path = mbox(tmp_path / "a.mbox", message(1), message(2), newline="\r\n")
+        assert [m.replace(b"\r\n", b"\n") for m in iter_mbox(path)] == [
+            message(1).encode(),
+            message(2).encode(),
+        ]
+
+    def test_releases_consumed_pages(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(import_mbox, "_RELEASE_STEP", 4096)
+        messages = [message(n, "x" * 3000) for n in range(20)]
+        path = mbox(tmp_path / "a.mbox", *messages)
+        assert list(iter_mbox(path)) == [m.encode() for m in messages]
+
+    def test_empty_and_invalid(self, tmp_path: Path):
+        (tmp_path / "empty").write_bytes(b"")
+        assert list(iter_mbox(tmp_path / "empty")) == []
+        (tmp_path / "text").write_bytes(b"hello\n")
+        with pytest.raises(ValueError, match="not an mbox"):
+            list(iter_mbox(tmp_path / "text"))
+
+
+class TestHeaders:
+    def test_message_id_and_unread_label(self, tmp_path: Path):
+        data = b"Message-Id:  <abc@def> \nSubject: Unread mail\nX-Gmail-Labels: Inbox\n\nbody\n"
+        assert import_mbox._headers(data) == ("abc@def", True)
+        # The key is the one the manifest reads from the delivered file.
+        (tmp_path / "m").write_bytes(data)
+        assert read_message_id(tmp_path / "m") == "abc@def"
+        unread = message(1, labels="Inbox,Unread").encode()
+        assert import_mbox._headers(unread) == ("1@example.com", False)
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    state = tmp_path / "state"
+    return Config(
+        accounts={"gmail": AccountConfig("gmail", "u@gmail.com", "imap.gmail.com", "u")},
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=state,
+            logs_dir=state / "logs",
+            verification_dir=state / "verification",
+        ),
+    )
+
+
+@pytest.fixture()
+def indexed(monkeypatch: pytest.MonkeyPatch) -> list[list[str]]:
+    calls: list[list[str]] = []
+
+    def fake_index(config: Config, *, verbose: bool, accounts: list[str]) -> RunResult:
+        calls.append(accounts)
+        return RunResult(["notmuch"], 0, "", "", 0.0)
+
+    monkeypatch.setattr(import_mbox, "run_index", fake_index)
+    return calls
+
+
+def imported(config: Config) -> list[str]:
+    cur = config.paths.maildir_root / "gmail" / "Imported" / "cur"
+    return sorted(p.read_text().split("\n", 1)[0] for p in cur.iterdir())
+
+
+class TestRunImportMbox:
+    def test_imports_dedupes_and_indexes(
+        self, config: Config, tmp_path: Path, indexed: list[list[str]]
+    ):
+        inbox = config.paths.maildir_root / "gmail" / "INBOX"
+        for sub in ("cur", "new", "tmp"):
+            (inbox / sub).mkdir(parents=True)
+        (inbox / "cur" / "1.a:2,S").write_text(message(1))
+        path = mbox(
+            tmp_path / "takeout.mbox",
+            message(1),
+            message(2, labels="Inbox,Unread"),
+            message(3),
+            message(3),
+        )
+
+        assert run_import_mbox(config, [path]) == 0
+        assert imported(config) == ["Message-ID: <2@example.com>", "Message-ID: <3@example.com>"]
+        cur = config.paths.maildir_root / "gmail" / "Imported" / "cur"
+        assert sorted(p.name.split(":")[1] for p in cur.iterdir()) == ["2,", "2,S"]
+        assert not list((cur.parent / "tmp").iterdir())
+        assert indexed == [["gmail"]]
+
+        # Running it again finds everything already archived.
+        assert run_import_mbox(config, [path], account="gmail") == 0
+        assert len(imported(config)) == 2
+        assert indexed == [["gmail"]]
+
+    def test_many_messages(self, config: Config, tmp_path: Path, indexed: list[list[str]]):
+        path = mbox(tmp_path / "a.mbox", *(message(n) for n in range(1000)))
+        assert run_import_mbox(config, [path], folder="All Mail") == 0
+        cur = config.paths.maildir_root / "gmail" / "All Mail" / "cur"
+        assert len(list(cur.iterdir())) == 1000
+
+    def test_dedupes_messages_without_message_id_by_content(
+        self, config: Config, tmp_path: Path, indexed: list[list[str]]
+    ):
+        anonymous = "Subject: no id\n\nhello\n"
+        inbox = config.paths.maildir_root / "gmail" / "INBOX"
+        for sub in ("cur", "new", "tmp"):
+            (inbox / sub).mkdir(parents=True)
+        (inbox / "cur" / "1.a:2,S").write_text(anonymous)
+        other = "Subject: other\n\nhello\n"
+        path = mbox(tmp_path / "a.mbox", anonymous, other, other)
+
+        assert run_import_mbox(config, [path]) == 0
+        assert imported(config) == ["Subject: other"]
+
+    def test_bounds_read_ahead_by_bytes(
+        self, config: Config, tmp_path: Path, indexed: list[list[str]], monkeypatch
+    ):
+        monkeypatch.setattr(import_mbox, "_READ_AHEAD_BYTES", 10_000)
+        peak = 0
+        real_add = import_mbox._MaildirWriter.add
+
+        def add(writer, data: bytes, seen: bool) -> None:
+            nonlocal peak
+            real_add(writer, data, seen)
+            peak = max(peak, writer.inflight_bytes)
+
+        monkeypatch.setattr(import_mbox._MaildirWriter, "add", add)
+        path = mbox(tmp_path / "a.mbox", *(message(n, "x" * 3000) for n in range(50)))
+        assert run_import_mbox(config, [path]) == 0
+        assert len(imported(config)) == 50
+        assert 0 < peak <= 10_000
+
+    def test_write_failure_stops_the_import(
+        self, config: Config, tmp_path: Path, indexed: list[list[str]], monkeypatch, capsys
+    ):
+        monkeypatch.setattr(import_mbox, "_BATCH", 2)
+        real_write = import_mbox._write
+        writes = 0
+
+        def write(path: Path, data: bytes) -> None:
+            nonlocal writes
+            writes += 1
+            if writes > 4:
+                raise OSError(28, "No space left on device")
+            real_write(path, data)
+
+        monkeypatch.setattr(import_mbox, "_write", write)
+        path = mbox(tmp_path / "a.mbox", *(message(n) for n in range(20)))
+        assert run_import_mbox(config, [path]) == 1
+        out = capsys.readouterr().out
+        assert "Import stopped: Writing to" in out and "No space left" in out
+        # Whole batches already delivered stay; nothing is left in tmp/.
+        assert len(imported(config)) == 4
+        assert not list((config.paths.maildir_root / "gmail" / "Imported" / "tmp").iterdir())
+        assert indexed == [["gmail"]]
+
+    def test_dry_run_and_errors(
+        self, config: Config, tmp_path: Path, indexed: list[list[str]], capsys
+    ):
+        path = mbox(tmp_path / "a.mbox", message(1))
+        assert run_import_mbox(config, [path], dry_run=True) == 0
+        assert "Would import 1 messages" in capsys.readouterr().out
+        assert not (config.paths.maildir_root / "gmail" / "Imported").exists()
+
+        assert run_import_mbox(config, [path], account="other") == 1
+        assert run_import_mbox(config, [tmp_path / "missing.mbox"]) == 1
+        assert indexed == []
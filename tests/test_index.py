@@ -0,0 +1,279 @@
+"""Tests for the index command (targeted indexing and its fallbacks)."""
+
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+from email_archiver.commands import index
+from email_archiver.commands.index import run_index
+from email_archiver.config import (
+    AccountConfig,
+    BackupConfig,
+    Config,
+    IndexConfig,
+    OrchestrationConfig,
+    PathsConfig,
+    SyncConfig,
+)
+from email_archiver.index_state import IndexState
+from email_archiver.runner import RunResult
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    state = tmp_path / "state"
+    root = tmp_path / "mail"
+    (root / ".notmuch").mkdir(parents=True)
+    return Config(
+        accounts={
+            name: AccountConfig(
+                name=name,
+                email=f"{name}@example.com",
+                imap_host="imap.example.com",
+                imap_user=name,
+            )
+            for name in ("work", "home")
+        },
+        paths=PathsConfig(
+            maildir_root=root,
+            state_dir=state,
+            logs_dir=state / "logs",
+            verification_dir=state / "verification",
+        ),
+        sync=SyncConfig(),
+        index=IndexConfig(),
+        backup=BackupConfig(),
+        orchestration=OrchestrationConfig(),
+    )
+
+
+def deliver(config: Config, rel: str) -> Path:
+    path = config.paths.maildir_root / rel
+    for sub in ("cur", "new", "tmp"):
+        (path.parent.parent / sub).mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"Subject: x\n\nbody\n")
+    return path
+
+
+class FakeTags(set):
+    def from_maildir_flags(self) -> None:
+        self.discard("unread")  # every test message is flagged seen
+
+
+class FakeBindings:
+    """Minimal stand-in for the writable parts of ``notmuch2``."""
+
+    messages: dict[str, FakeTags] = {}
+    log: list[tuple[str, str]] = []
+    transactions = 0
+    fail = False
+
+    class Database:
+        class MODE:
+            READ_WRITE = 1
+
+        def __init__(self, *, mode, config):
+            assert mode == 1
+
+        @classmethod
+        def create(cls, *, path, config):
+            Path(path, ".notmuch").mkdir()
+            FakeBindings.log.append(("create", path))
+            return cls(mode=1, config=config)
+
+        def close(self):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        @contextmanager
+        def atomic(self):
+            FakeBindings.transactions += 1
+            yield
+
+        def add(self, filename):
+            if FakeBindings.fail:
+                raise RuntimeError("database locked")
+            FakeBindings.log.append(("add", filename))
+            unique = os.path.basename(filename).split(":")[0]
+            duplicate = unique in FakeBindings.messages
+            tags = FakeBindings.messages.setdefault(unique, FakeTags())
+
+            class Msg:
+                pass
+
+            msg = Msg()
+            msg.tags = tags
+            return msg, duplicate
+
+        def remove(self, filename):
+            FakeBindings.log.append(("remove", filename))
+            return False
+
+
+@pytest.fixture()
+def bindings(monkeypatch: pytest.MonkeyPatch) -> type[FakeBindings]:
+    FakeBindings.messages = {}
+    FakeBindings.log = []
+    FakeBindings.transactions = 0
+    FakeBindings.fail = False
+    monkeypatch.setattr(index, "_load_bindings", lambda: FakeBindings)
+    return FakeBindings
+
+
+@pytest.fixture()
+def notmuch_runs(monkeypatch: pytest.MonkeyPatch) -> list[list[str]]:
+    runs: list[list[str]] = []
+
+    def fake_run(cmd, **kwargs):
+        runs.append(cmd)
+        return RunResult(cmd, 0, "Added 1 new message to the database.\n", "", 1.0)
+
+    monkeypatch.setattr(index, "run_command", fake_run)
+    return runs
+
+
+def backdate_full(config: Config, seconds: float) -> None:
+    with IndexState.open(config.paths.state_dir, config.paths.maildir_root) as state:
+        state.conn.execute(
+            "UPDATE meta SET value = ? WHERE key = 'last_full'", (str(time.time() - seconds),)
+        )
+        state.conn.commit()
+
+
+class TestTargetedIndex:
+    def test_first_run_without_bulk_is_full(self, config: Config, bindings, notmuch_runs):
+        config.index.bulk = False
+        deliver(config, "work/INBOX/cur/1:2,S")
+        assert run_index(config).ok
+        assert notmuch_runs == [["notmuch", "new"]]
+        assert bindings.log == []
+
+    def test_then_only_changes_are_indexed(self, config: Config, bindings, notmuch_runs):
+        config.index.bulk = False
+        old = deliver(config, "work/INBOX/cur/1:2,S")
+        run_index(config)
+
+        deliver(config, "work/INBOX/new/2")
+        old.rename(old.with_name("1:2,RS"))
+        result = run_index(config)
+        assert result.ok
+        assert result.command == index.TARGETED_COMMAND
+        assert len(notmuch_runs) == 1
+        root = config.paths.maildir_root
+        # Adds come before removes so the renamed message keeps its tags.
+        assert bindings.log == [
+            ("add", str(root / "work/INBOX/cur/1:2,RS")),
+            ("add", str(root / "work/INBOX/new/2")),
+            ("remove", str(root / "work/INBOX/cur/1:2,S")),
+        ]
+        assert bindings.messages["2"] == {"inbox"}
+        assert "Added 2 new messages" in result.stdout
+        assert "Detected 1 file rename" in result.stdout
+
+        bindings.log.clear()
+        assert run_index(config).stdout == "No new mail.\n"
+        assert bindings.log == []
+
+    def test_accounts_limit_the_scan(self, config: Config, bindings, notmuch_runs):
+        run_index(config)
+        deliver(config, "work/INBOX/cur/1:2,S")
+        deliver(config, "home/INBOX/cur/2:2,S")
+        run_index(config, accounts=["home"])
+        assert [os.path.basename(f) for _, f in bindings.log] == ["2:2,S"]
+        run_index(config)
+        assert [os.path.basename(f) for _, f in bindings.log] == ["2:2,S", "1:2,S"]
+
+    def test_periodic_full_pass(self, config: Config, bindings, notmuch_runs):
+        run_index(config)
+        assert notmuch_runs == []
+        backdate_full(config, config.index.full_interval + 1)
+        run_index(config)
+        assert len(notmuch_runs) == 1
+        run_index(config)
+        assert len(notmuch_runs) == 1
+        run_index(config, full=True)
+        assert len(notmuch_runs) == 2
+
+    def test_falls_back_when_bindings_fail(self, config: Config, bindings, notmuch_runs):
+        run_index(config)
+        deliver(config, "work/INBOX/cur/1:2,S")
+        bindings.fail = True
+        assert run_index(config).ok
+        assert len(notmuch_runs) == 1
+        bindings.fail = False
+        assert run_index(config).stdout == "No new mail.\n"
+
+    def test_without_bindings_runs_notmuch_new(
+        self, config: Config, notmuch_runs, monkeypatch: pytest.MonkeyPatch
+    ):
+        monkeypatch.setattr(index, "_load_bindings", lambda: None)
+        run_index(config)
+        run_index(config)
+        assert notmuch_runs == [["notmuch", "new"], ["notmuch", "new"]]
+        # Every run is a full pass: no directory state is kept.
+        assert not (config.paths.state_dir / "index-state.sqlite3").exists()
+
+    def test_failed_notmuch_new_is_not_committed(
+        self, config: Config, bindings, monkeypatch: pytest.MonkeyPatch
+    ):
+        config.index.bulk = False
+        monkeypatch.setattr(index, "run_command", lambda cmd, **kw: RunResult(cmd, 1, "", "", 0))
+        deliver(config, "work/INBOX/cur/1:2,S")
+        assert not run_index(config).ok
+        with IndexState.open(config.paths.state_dir, config.paths.maildir_root) as state:
+            assert state.last_full is None
+
+    def test_disabled(self, config: Config, bindings, notmuch_runs):
+        config.index.targeted = False
+        run_index(config)
+        run_index(config)
+        assert len(notmuch_runs) == 2
+        assert not (config.paths.state_dir / "index-state.sqlite3").exists()
+
+
+class TestBulkIndex:
+    def test_creates_empty_database_and_imports(
+        self, config: Config, bindings, notmuch_runs, monkeypatch: pytest.MonkeyPatch
+    ):
+        (config.paths.maildir_root / ".notmuch").rmdir()
+        config.index.batch_size = 2
+        for i in range(5):
+            deliver(config, f"work/INBOX/cur/{i}:2,S")
+
+        result = run_index(config)
+        assert notmuch_runs == []
+        assert bindings.log[0] == ("create", str(config.paths.maildir_root))
+        assert "Added 5 new messages" in result.stdout
+        # Three batches of adds, then the removals.
+        assert bindings.transactions == 4
+        with IndexState.open(config.paths.state_dir, config.paths.maildir_root) as state:
+            assert state.last_full is not None
+
+    def test_skips_non_mail_files(self, config: Config, bindings, notmuch_runs):
+        deliver(config, "work/INBOX/cur/1:2,S")
+        (config.paths.maildir_root / "work/INBOX/cur/junk").write_bytes(b"\x00\x01 not mail")
+        (config.paths.maildir_root / "work/INBOX/new/empty").write_bytes(b"")
+        result = run_index(config)
+        assert [os.path.basename(f) for _, f in bindings.log] == ["1:2,S"]
+        assert "Ignored 2 non-mail files" in result.stdout
+
+    def test_reads_ahead_in_worker_processes(self, config: Config, monkeypatch):
+        monkeypatch.setattr(index, "_POOL_MIN_FILES", 1)
+        paths = [f"work/INBOX/cur/{i}:2,S" for i in range(7)]
+        for rel in paths:
+            deliver(config, rel)
+        paths.append("work/INBOX/cur/gone")
+        batches = list(index._batches(config.paths.maildir_root, paths, 3, workers=2))
+        assert [len(b) for b in batches] == [3, 3, 2]
+        flat = [item for batch in batches for item in batch]
+        assert flat == [(rel, True) for rel in paths[:-1]] + [("work/INBOX/cur/gone", None)]
@@ -0,0 +1,93 @@
+"""Tests for email_archiver.index_state."""
+
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from pathlib import Path
+
+from email_archiver.index_state import IndexState
+
+
+def deliver(root: Path, rel: str, data: bytes = b"Subject: x\n\nbody\n") -> None:
+    path = root / rel
+    for sub in ("cur", "new", "tmp"):
+        (path.parent.parent / sub).mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def age(root: Path) -> None:
+    """Backdate every directory so its mtime is outside the racy window."""
+    past = time.time_ns() - 60_000_000_000
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, ns=(past, past))
+
+
+def test_first_plan_lists_everything(tmp_path: Path):
+    deliver(tmp_path, "work/INBOX/cur/1:2,S")
+    deliver(tmp_path, "home/INBOX/new/2")
+    with IndexState.open(tmp_path / "state", tmp_path) as state:
+        assert state.last_full is None
+        plan = state.plan()
+        assert plan.added == ["home/INBOX/new/2", "work/INBOX/cur/1:2,S"]
+        assert plan.removed == []
+        assert plan.dirs_total == 4
+
+
+def test_only_changed_dirs_after_commit(tmp_path: Path):
+    deliver(tmp_path, "work/INBOX/cur/1:2,S")
+    deliver(tmp_path, "work/Archive/cur/2:2,S")
+    age(tmp_path)
+    with IndexState.open(tmp_path / "state", tmp_path) as state:
+        state.commit(state.plan(), full=True)
+        assert state.last_full is not None
+        assert state.plan().empty
+
+        deliver(tmp_path, "work/INBOX/new/3")
+        os.rename(tmp_path / "work/INBOX/cur/1:2,S", tmp_path / "work/INBOX/cur/1:2,RS")
+        plan = state.plan()
+        assert plan.added == ["work/INBOX/cur/1:2,RS", "work/INBOX/new/3"]
+        assert plan.removed == ["work/INBOX/cur/1:2,S"]
+        assert plan.renamed == 1
+        assert set(plan.listings) == {"work/INBOX/cur", "work/INBOX/new"}
+
+
+def test_uncommitted_plan_is_planned_again(tmp_path: Path):
+    deliver(tmp_path, "work/INBOX/cur/1:2,S")
+    with IndexState.open(tmp_path / "state", tmp_path) as state:
+        state.plan()
+        assert state.plan().added == ["work/INBOX/cur/1:2,S"]
+
+
+def test_accounts_limit_the_scan(tmp_path: Path):
+    deliver(tmp_path, "work/INBOX/cur/1:2,S")
+    deliver(tmp_path, "home/INBOX/cur/2:2,S")
+    with IndexState.open(tmp_path / "state", tmp_path) as state:
+        plan = state.plan(["work"])
+        assert plan.added == ["work/INBOX/cur/1:2,S"]
+        state.commit(plan)
+        # home was not scanned, and is not treated as vanished either.
+        assert state.plan(["work", "home"]).added == ["home/INBOX/cur/2:2,S"]
+
+
+def test_vanished_folder(tmp_path: Path):
+    deliver(tmp_path, "work/Old/cur/1:2,S")
+    age(tmp_path)
+    with IndexState.open(tmp_path / "state", tmp_path) as state:
+        state.commit(state.plan())
+        shutil.rmtree(tmp_path / "work" / "Old")
+        plan = state.plan(["work"])
+        assert plan.removed == ["work/Old/cur/1:2,S"]
+        assert sorted(plan.vanished_dirs) == ["work/Old/cur", "work/Old/new"]
+        state.commit(plan)
+        assert state.plan().empty
+
+
+def test_recent_dirs_are_listed_again(tmp_path: Path):
+    deliver(tmp_path, "work/INBOX/cur/1:2,S")
+    with IndexState.open(tmp_path / "state", tmp_path) as state:
+        state.commit(state.plan())
+        plan = state.plan()
+        # Still inside the racy window: listed, but nothing differs.
+        assert plan.listings and not plan.added and not plan.removed
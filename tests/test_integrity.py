@@ -0,0 +1,158 @@
+"""Tests for email_archiver.integrity (verify --deep)."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+
+import pytest
+
+from email_archiver import integrity
+from email_archiver.config import (
+    BackupConfig,
+    Config,
+    OrchestrationConfig,
+    PathsConfig,
+    VerifyConfig,
+)
+from email_archiver.integrity import DEEP_CHECKPOINT_FILENAME, check_file, deep_check
+from email_archiver.manifest import Manifest
+
+GOOD = b"From: a@b\nDate: Mon, 1 Jan 2024 00:00:00 +0000\nMessage-ID: <m@x>\n\nbody\n"
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    state = tmp_path / "state"
+    return Config(
+        accounts={},
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=state,
+            logs_dir=state / "logs",
+            verification_dir=state / "verification",
+        ),
+        verify=VerifyConfig(checkpoint_interval=1),
+        backup=BackupConfig(),
+        orchestration=OrchestrationConfig(),
+    )
+
+
+def archive(config: Config, count: int) -> list[Path]:
+    folder = config.paths.maildir_root / "work" / "INBOX"
+    for sub in ("cur", "new", "tmp"):
+        (folder / sub).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        p = folder / "cur" / f"{i:03d}.x:2,S"
+        p.write_bytes(GOOD.replace(b"body", f"body {i}".encode()))
+        paths.append(p)
+    with Manifest.open(config.paths.state_dir, config.paths.maildir_root) as m:
+        m.update("work")
+    return paths
+
+
+class TestCheckFile:
+    def test_good_message(self, tmp_path: Path):
+        p = tmp_path / "m"
+        p.write_bytes(GOOD)
+        assert check_file(str(p), len(GOOD), sha(GOOD), strict=True) == []
+
+    def test_truncated_message(self, tmp_path: Path):
+        p = tmp_path / "m"
+        p.write_bytes(GOOD[:20])
+        problems = check_file(str(p), len(GOOD), sha(GOOD))
+        assert problems == [
+            f"size is 20 bytes, recorded {len(GOOD)}",
+            "content differs from the recorded SHA-256",
+        ]
+
+    def test_garbage_and_empty(self, tmp_path: Path):
+        p = tmp_path / "m"
+        p.write_bytes(b"\x00\x01\x02")
+        assert "no parseable headers" in check_file(str(p), 3, sha(b"\x00\x01\x02"))
+        p.write_bytes(b"")
+        assert check_file(str(p), 0, sha(b"")) == ["file is empty"]
+
+    def test_vanished(self, tmp_path: Path):
+        assert check_file(str(tmp_path / "gone"), 1, "") is None
+
+    def test_strict(self, tmp_path: Path):
+        data = b"Subject: x\n\n" + b"a" * 1200 + b"\n"
+        p = tmp_path / "m"
+        p.write_bytes(data)
+        assert check_file(str(p), len(data), sha(data)) == []
+        assert check_file(str(p), len(data), sha(data), strict=True) == [
+            "missing From header",
+            "missing Date header",
+            "line longer than 998 octets",
+        ]
+
+
+class TestDeepCheck:
+    def test_clean_archive(self, config: Config):
+        archive(config, 3)
+        report = deep_check(config, ["work"])
+        assert report["status"] == "PASS"
+        assert report["files_checked"] == 3
+        assert not (config.paths.state_dir / DEEP_CHECKPOINT_FILENAME).exists()
+
+    def test_resumes_after_interruption(self, config: Config, monkeypatch):
+        paths = archive(config, 5)
+        paths[3].write_bytes(b"corrupt")
+        monkeypatch.setattr(integrity, "_BATCH_FILES", 2)
+        real = integrity._check_batch
+        calls = []
+
+        def interrupt_second_batch(*args):
+            calls.append(args[1])
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return real(*args)
+
+        monkeypatch.setattr(integrity, "_check_batch", interrupt_second_batch)
+        with pytest.raises(KeyboardInterrupt):
+            deep_check(config, ["work"])
+        saved = json.loads((config.paths.state_dir / DEEP_CHECKPOINT_FILENAME).read_text())
+        assert saved["checked"] == 2
+        assert saved["position"] == "work/INBOX/cur/001.x:2,S"
+
+        calls.clear()
+        monkeypatch.setattr(integrity, "_check_batch", real)
+        report = deep_check(config, ["work"])
+        assert report["sessions"] == 2
+        assert report["files_checked"] == 5
+        assert list(report["problems"]) == ["work/INBOX/cur/003.x:2,S"]
+
+    def test_restart_ignores_checkpoint(self, config: Config):
+        archive(config, 2)
+        state = config.paths.state_dir / DEEP_CHECKPOINT_FILENAME
+        state.write_text(
+            json.dumps(
+                {
+                    "accounts": ["work"],
+                    "strict": False,
+                    "started": "x",
+                    "position": "work/zzz",
+                    "checked": 7,
+                }
+            )
+        )
+        assert deep_check(config, ["work"], restart=True)["files_checked"] == 2
+
+    def test_other_accounts_are_skipped(self, config: Config):
+        archive(config, 2)
+        assert deep_check(config, ["home"])["files_checked"] == 0
+
+    def test_worker_processes(self, config: Config, monkeypatch):
+        archive(config, 5)
+        monkeypatch.setattr(integrity, "_POOL_MIN_FILES", 1)
+        monkeypatch.setattr(integrity, "_BATCH_FILES", 2)
+        config.verify.deep_workers = 2
+        report = deep_check(config, ["work"])
+        assert report["files_checked"] == 5 and report["status"] == "PASS"
@@ -0,0 +1,221 @@
+"""Tests for email_archiver.manifest."""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import os
+from pathlib import Path
+
+import pytest
+
+from email_archiver import manifest as manifest_module
+from email_archiver.manifest import Manifest, describe_file, read_message_id, unique_name
+
+OLD = 1_600_000_000
+_ticks = itertools.count(OLD + 100)
+
+
+def make_maildir(path: Path) -> Path:
+    for sub in ("cur", "new", "tmp"):
+        (path / sub).mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def deliver(folder: Path, name: str, message_id: str | None = "x@example.com", sub="cur") -> Path:
+    header = f"Message-ID: <{message_id}>\n" if message_id else ""
+    p = folder / sub / name
+    p.write_text(f"{header}Subject: hi\n\nbody of {name}\n")
+    return p
+
+
+def settle(root: Path) -> None:
+    """Backdate directory mtimes so they're outside the racy window."""
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (OLD, OLD))
+
+
+@pytest.fixture()
+def root(tmp_path: Path) -> Path:
+    root = tmp_path / "mail"
+    inbox = make_maildir(root / "acct" / "INBOX")
+    deliver(inbox, "1.a:2,S", "one@example.com")
+    deliver(inbox, "2.b:2,", "two@example.com")
+    settle(root)
+    return root
+
+
+@pytest.fixture()
+def manifest(tmp_path: Path, root: Path):
+    with Manifest.open(tmp_path / "state", root) as m:
+        yield m
+
+
+def touch_dir(path: Path) -> None:
+    """Give a directory a new (but not racy-recent) mtime."""
+    t = next(_ticks)
+    os.utime(path, (t, t))
+
+
+class TestHelpers:
+    def test_unique_name(self):
+        assert unique_name("1700000000.M1P2.host:2,RS") == "1700000000.M1P2.host"
+        assert unique_name("1700000000.M1P2.host") == "1700000000.M1P2.host"
+
+    def test_read_message_id(self, tmp_path: Path):
+        p = tmp_path / "m"
+        p.write_bytes(b"From: a@b\r\nMessage-Id:  <abc@def> \r\n\r\nMessage-ID: <no@no>\r\n")
+        assert read_message_id(p) == "abc@def"
+
+    def test_read_message_id_missing(self, tmp_path: Path):
+        p = tmp_path / "m"
+        p.write_bytes(b"Subject: x\n\nbody\n")
+        assert read_message_id(p) is None
+
+    def test_describe_new_file_reads_it_once(self, tmp_path: Path, monkeypatch):
+        data = b"Subject: x\n\nbody\n"
+        (tmp_path / "m").write_bytes(data)
+        opened: list[Path] = []
+
+        def counting_open(path, *args, **kwargs):
+            opened.append(path)
+            return open(path, *args, **kwargs)
+
+        monkeypatch.setattr(manifest_module, "open", counting_open, raising=False)
+        entry = describe_file(tmp_path, "m", (tmp_path / "m").stat())
+        assert entry.message_id == f"notmuch-sha1-{hashlib.sha1(data).hexdigest()}"
+        assert entry.sha256 == hashlib.sha256(data).hexdigest()
+        assert opened == [tmp_path / "m"]
+
+
+class TestManifest:
+    def test_initial_scan(self, manifest: Manifest):
+        delta = manifest.update()
+        assert sorted(delta.added) == ["acct/INBOX/cur/1.a:2,S", "acct/INBOX/cur/2.b:2,"]
+        assert delta.dirs_total == 2
+        assert manifest.count() == 2
+
+    def test_unchanged_dirs_are_skipped(self, manifest: Manifest):
+        manifest.update()
+        delta = manifest.update()
+        assert delta.dirs_scanned == 0
+        assert delta.added == [] and delta.removed == []
+
+    def test_recent_dirs_are_rescanned(self, manifest: Manifest, root: Path):
+        manifest.update()
+        os.utime(root / "acct" / "INBOX" / "cur")  # now
+        manifest.update()
+        assert manifest.update().dirs_scanned == 1
+
+    def test_detects_addition_and_removal(self, manifest: Manifest, root: Path):
+        manifest.update()
+        cur = root / "acct" / "INBOX" / "cur"
+        deliver(root / "acct" / "INBOX", "3.c:2,", "three@example.com")
+        (cur / "1.a:2,S").unlink()
+        touch_dir(cur)
+        delta = manifest.update()
+        assert delta.added == ["acct/INBOX/cur/3.c:2,"]
+        assert delta.removed == ["acct/INBOX/cur/1.a:2,S"]
+        assert delta.dirs_scanned == 1
+
+    def test_flag_rename_keeps_hash(self, manifest: Manifest, root: Path):
+        manifest.update()
+        manifest.mark_indexed(["acct/INBOX/cur/1.a:2,S"])
+        cur = root / "acct" / "INBOX" / "cur"
+        (cur / "1.a:2,S").rename(cur / "1.a:2,RS")
+        touch_dir(cur)
+        delta = manifest.update()
+        assert delta.added == [] and delta.removed == []
+        assert delta.renamed == 1
+        pending = [p for p, _ in manifest.unindexed()]
+        assert "acct/INBOX/cur/1.a:2,RS" not in pending
+
+    def test_new_to_cur_move_is_rename(self, manifest: Manifest, root: Path):
+        inbox = root / "acct" / "INBOX"
+        deliver(inbox, "4.d", "four@example.com", sub="new")
+        settle(root)
+        manifest.update()
+        (inbox / "new" / "4.d").rename(inbox / "cur" / "4.d:2,S")
+        touch_dir(inbox / "new")
+        touch_dir(inbox / "cur")
+        delta = manifest.update()
+        assert delta.renamed == 1
+        assert delta.added == [] and delta.removed == []
+
+    def test_folder_move_reuses_stored_hash(self, manifest: Manifest, root: Path):
+        manifest.update()
+        archive = make_maildir(root / "acct" / "Archive")
+        (root / "acct" / "INBOX" / "cur" / "1.a:2,S").rename(archive / "cur" / "1.a:2,S")
+        settle(root)
+        before = manifest.hashes.hashed
+        delta = manifest.update()
+        assert delta.added == ["acct/Archive/cur/1.a:2,S"]
+        assert manifest.hashes.hashed == before
+
+    def test_missing_message_id_uses_notmuch_synthetic_id(self, manifest: Manifest, root: Path):
+        deliver(root / "acct" / "INBOX", "5.e:2,", None)
+        settle(root)
+        manifest.update()
+        ids = dict(manifest.unindexed())
+        assert ids["acct/INBOX/cur/5.e:2,"].startswith("notmuch-sha1-")
+
+    def test_removed_folder(self, manifest: Manifest, root: Path):
+        manifest.update()
+        for p in (root / "acct" / "INBOX").rglob("*"):
+            if p.is_file():
+                p.unlink()
+        for sub in ("cur", "new", "tmp"):
+            (root / "acct" / "INBOX" / sub).rmdir()
+        delta = manifest.update()
+        assert len(delta.removed) == 2
+        assert manifest.count() == 0
+
+    def test_prefix_scopes_scan(self, manifest: Manifest, root: Path):
+        other = make_maildir(root / "other" / "INBOX")
+        deliver(other, "9.z:2,", "nine@example.com")
+        settle(root)
+        delta = manifest.update("other")
+        assert delta.added == ["other/INBOX/cur/9.z:2,"]
+        assert manifest.count("other") == 1
+        assert manifest.count("acct") == 0
+        assert manifest.update("acct").dirs_total == 2
+
+    def test_mark_indexed(self, manifest: Manifest):
+        manifest.update()
+        assert len(manifest.unindexed()) == 2
+        manifest.mark_indexed(["acct/INBOX/cur/2.b:2,"])
+        assert manifest.unindexed() == [("acct/INBOX/cur/1.a:2,S", "one@example.com")]
+
+    def test_skips_notmuch_dir(self, manifest: Manifest, root: Path):
+        make_maildir(root / ".notmuch" / "xapian")
+        assert manifest.update().dirs_total == 2
+
+    def test_change_journal(self, manifest: Manifest, root: Path):
+        manifest.update()
+        manifest.register_watermark("backup:all")
+        assert manifest.changes_since("backup:all", manifest.journal_head()) is None
+        manifest.set_watermark("backup:all", manifest.journal_head())
+
+        cur = root / "acct" / "INBOX" / "cur"
+        (cur / "1.a:2,S").rename(cur / "1.a:2,RS")
+        (cur / "2.b:2,").unlink()
+        deliver(root / "acct" / "INBOX", "3.c:2,", "three@example.com")
+        touch_dir(cur)
+        manifest.update()
+        head = manifest.journal_head()
+        delta = manifest.changes_since("backup:all", head)
+        assert delta.added == ["acct/INBOX/cur/1.a:2,RS", "acct/INBOX/cur/3.c:2,"]
+        assert delta.removed == ["acct/INBOX/cur/1.a:2,S", "acct/INBOX/cur/2.b:2,"]
+        assert manifest.changes_since("backup:all", head, "other").added == []
+
+        manifest.set_watermark("backup:all", head)
+        assert manifest.changes_since("backup:all", head).added == []
+        (n,) = manifest.conn.execute("SELECT COUNT(*) FROM journal").fetchone()
+        assert n == 0
+
+    def test_no_journal_without_watermark(self, manifest: Manifest, root: Path):
+        manifest.update()
+        deliver(root / "acct" / "INBOX", "3.c:2,", "three@example.com")
+        touch_dir(root / "acct" / "INBOX" / "cur")
+        manifest.update()
+        assert manifest.journal_head() == 0
@@ -0,0 +1,173 @@
+"""Tests for email_archiver.metrics."""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from email_archiver import metrics
+from email_archiver.commands import index, sync
+from email_archiver.commands.index import run_index
+from email_archiver.commands.sync import run_sync
+from email_archiver.config import (
+    AccountConfig,
+    BackupConfig,
+    Config,
+    MetricsConfig,
+    OrchestrationConfig,
+    PathsConfig,
+    SyncConfig,
+)
+from email_archiver.metrics import StageSample, delivered_since, parse_notmuch_new
+from email_archiver.runner import RunResult
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    state = tmp_path / "state"
+    return Config(
+        accounts={
+            name: AccountConfig(
+                name=name,
+                email=f"{name}@example.com",
+                imap_host="imap.example.com",
+                imap_user=name,
+                folders=["INBOX"],
+            )
+            for name in ("work", "home")
+        },
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=state,
+            logs_dir=state / "logs",
+            verification_dir=state / "verification",
+        ),
+        sync=SyncConfig(),
+        backup=BackupConfig(),
+        orchestration=OrchestrationConfig(),
+        metrics=MetricsConfig(textfile=tmp_path / "textfile" / "email_archiver.prom"),
+    )
+
+
+def history(config: Config) -> list[dict]:
+    path = config.paths.state_dir / metrics.HISTORY_FILENAME
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def make_maildir(root: Path) -> Path:
+    for sub in ("cur", "new", "tmp"):
+        (root / sub).mkdir(parents=True, exist_ok=True)
+    return root
+
+
+class TestParseNotmuchNew:
+    def test_summary(self):
+        out = (
+            "Processed 120 total files in 1s (98 files/sec).\n"
+            "Added 117 new messages to the database. Removed 2 messages. "
+            "Detected 1 file rename.\n"
+        )
+        assert parse_notmuch_new(out) == {
+            "files_processed": 120,
+            "messages_added": 117,
+            "messages_removed": 2,
+            "files_renamed": 1,
+        }
+
+    def test_no_new_mail(self):
+        assert parse_notmuch_new("No new mail.\n") == {"messages_added": 0}
+        assert parse_notmuch_new("") == {}
+
+
+class TestDeliveredSince:
+    def test_counts_only_new_files(self, tmp_path: Path):
+        old = make_maildir(tmp_path / "acct" / "Archive")
+        (old / "cur" / "1:2,S").write_bytes(b"x" * 10)
+        inbox = make_maildir(tmp_path / "acct" / "INBOX")
+        (inbox / "cur" / "2:2,S").write_bytes(b"x" * 10)
+        past = time.time_ns() - 3_600_000_000_000
+        for path in [old / "cur" / "1:2,S", old / "cur", inbox / "cur" / "2:2,S"]:
+            os.utime(path, ns=(past, past))
+
+        since = time.time_ns()
+        (inbox / "new" / "3").write_bytes(b"y" * 25)
+        (inbox / "cur" / "4:2,").write_bytes(b"z" * 5)
+        assert delivered_since(tmp_path / "acct", since) == (2, 30)
+
+
+class TestRecord:
+    def test_history_latest_and_textfile(self, config: Config):
+        metrics.record(
+            config,
+            [
+                StageSample("sync", "work", ok=True, duration_seconds=12.5, values={"x": 3}),
+                StageSample("sync", "home", ok=False, duration_seconds=1.0),
+            ],
+        )
+        rows = history(config)
+        assert [(r["stage"], r["account"], r["ok"]) for r in rows] == [
+            ("sync", "work", True),
+            ("sync", "home", False),
+        ]
+
+        text = config.metrics.textfile.read_text()
+        assert text.count("# TYPE email_archiver_stage_duration_seconds gauge") == 1
+        assert 'email_archiver_stage_duration_seconds{stage="sync",account="work"} 12.5' in text
+        assert 'email_archiver_stage_success{stage="sync",account="home"} 0' in text
+        assert 'email_archiver_sync_x{account="work"} 3' in text
+        assert 'stage_last_success_timestamp_seconds{stage="sync",account="home"}' not in text
+
+    def test_last_success_survives_failure(self, config: Config):
+        metrics.record(config, [StageSample("backup", "all", True, 5.0, timestamp=100.0)])
+        metrics.record(config, [StageSample("backup", "all", False, 1.0, timestamp=200.0)])
+        text = config.metrics.textfile.read_text()
+        assert 'last_success_timestamp_seconds{stage="backup",account="all"} 100' in text
+        assert 'last_run_timestamp_seconds{stage="backup",account="all"} 200' in text
+
+    def test_disabled(self, config: Config):
+        config.metrics.enabled = False
+        metrics.record(config, [StageSample("sync", "work", True, 1.0)])
+        assert not config.paths.state_dir.exists()
+
+
+class TestCommandMetrics:
+    def test_sync_records_delivered_messages(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        def fake_run(cmd, **kwargs):
+            name = cmd[-1]
+            if name == "work":
+                inbox = make_maildir(config.paths.maildir_root / "work" / "INBOX")
+                (inbox / "new" / "1").write_bytes(b"m" * 100)
+                for sink in kwargs["sinks"]:
+                    sink.write(
+                        "stdout", "C: 1/1  B: 1/1  F: +0/0 *0/0 #0/0 -0/0  N: +1/1 *0/0 #0/0 -0/0"
+                    )
+            return RunResult(cmd, 0 if name == "work" else 1, "", "", 0.5)
+
+        monkeypatch.setattr(sync, "run_command", fake_run)
+        run_sync(config)
+        rows = {r["account"]: r for r in history(config)}
+        assert rows["work"]["ok"] is True
+        assert rows["work"]["values"]["messages_added"] == 1
+        assert rows["work"]["values"]["bytes_added"] == 100
+        assert rows["work"]["values"]["messages_pulled"] == 1
+        assert rows["work"]["values"]["messages_per_second"] == 2.0
+        assert rows["home"]["ok"] is False
+        assert rows["all"]["values"]["targets"] == 2
+        assert rows["all"]["values"]["failed_targets"] == 1
+        assert rows["all"]["values"]["messages_added"] == 1
+        assert rows["all"]["values"]["bytes_added"] == 100
+        assert rows["all"]["values"]["messages_pulled"] == 1
+
+    def test_index_records_notmuch_counts(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        (config.paths.maildir_root / ".notmuch").mkdir(parents=True)
+        out = "Added 4 new messages to the database. Removed 1 message.\n"
+        monkeypatch.setattr(index, "run_command", lambda cmd, **kw: RunResult(cmd, 0, out, "", 2.0))
+        run_index(config)
+        (row,) = history(config)
+        assert row["stage"] == "index"
+        assert row["duration_seconds"] == 2.0
+        assert row["values"] == {"messages_added": 4, "messages_removed": 1}
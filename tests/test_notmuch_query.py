@@ -0,0 +1,168 @@
+"""Tests for email_archiver.notmuch_query."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from email_archiver import notmuch_query
+from email_archiver.notmuch_query import (
+    BACKEND_SUBPROCESS,
+    present_message_ids,
+    query_facts,
+    quote_term,
+)
+from email_archiver.runner import RunResult
+
+CFG = Path("/dev/null")
+
+
+class FakeNotmuch:
+    """Stand-in for the notmuch CLI that answers count/search invocations."""
+
+    def __init__(self, counts: dict[str, int], dates: dict[str, tuple[int, int]]) -> None:
+        self.counts = counts
+        self.dates = dates
+        self.calls: list[list[str]] = []
+
+    def __call__(self, cmd, **kwargs) -> RunResult:
+        self.calls.append(cmd)
+        if cmd[1] == "count":
+            queries = Path(cmd[-1].split("=", 1)[1]).read_text().splitlines()
+            out = "".join(f"{self.counts.get(q, 0)}\n" for q in queries)
+            return RunResult(cmd, 0, out, "", 0.0)
+        query = cmd[-1]
+        oldest, newest = self.dates[query]
+        ts = oldest if "--sort=oldest-first" in cmd else newest
+        return RunResult(cmd, 0, f'[{{"timestamp": {ts}}}]', "", 0.0)
+
+
+@pytest.fixture()
+def fake(monkeypatch: pytest.MonkeyPatch) -> FakeNotmuch:
+    fake = FakeNotmuch(
+        counts={"*": 5, 'path:"a/**"': 3, 'path:"b/**"': 0},
+        dates={"*": (0, 86400), 'path:"a/**"': (3600, 7200)},
+    )
+    monkeypatch.setattr(notmuch_query, "_load_bindings", lambda: None)
+    monkeypatch.setattr(notmuch_query, "run_command", fake)
+    return fake
+
+
+class TestQuoteTerm:
+    def test_plain(self):
+        assert quote_term("id", "abc@x") == 'id:"abc@x"'
+
+    def test_embedded_quote(self):
+        assert quote_term("folder", 'a"b') == 'folder:"a""b"'
+
+
+class TestQueryFacts:
+    def test_all_counts_in_one_process(self, fake: FakeNotmuch):
+        facts = query_facts(
+            CFG, {"all": "*", "a": 'path:"a/**"', "b": 'path:"b/**"'}, boundaries=["all", "a"]
+        )
+        assert facts.backend == BACKEND_SUBPROCESS
+        assert facts.result is not None and facts.result.ok
+        assert [c[1] for c in fake.calls].count("count") == 1
+        assert facts.scopes["all"].count == 5
+        assert facts.scopes["a"].count == 3
+        assert facts.scopes["b"].count == 0
+        assert facts.scopes["a"].oldest == "1970-01-01T01:00:00+00:00"
+        assert facts.scopes["a"].newest == "1970-01-01T02:00:00+00:00"
+
+    def test_no_date_lookups_for_empty_scopes(self, fake: FakeNotmuch):
+        facts = query_facts(CFG, {"b": 'path:"b/**"'})
+        assert facts.scopes["b"].oldest is None
+        assert all(c[1] == "count" for c in fake.calls)
+
+    def test_count_failure_gives_none(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(notmuch_query, "_load_bindings", lambda: None)
+        monkeypatch.setattr(
+            notmuch_query, "run_command", lambda cmd, **kw: RunResult(cmd, 1, "", "err", 0.0)
+        )
+        facts = query_facts(CFG, {"all": "*"})
+        assert facts.scopes["all"].count is None
+        assert facts.result is not None and not facts.result.ok
+
+    def test_falls_back_when_bindings_fail(self, fake: FakeNotmuch, monkeypatch):
+        class Broken:
+            class Database:
+                def __init__(self, *a, **kw):
+                    raise RuntimeError("no database")
+
+        monkeypatch.setattr(notmuch_query, "_load_bindings", lambda: Broken)
+        facts = query_facts(CFG, {"all": "*"})
+        assert facts.backend == BACKEND_SUBPROCESS
+        assert facts.scopes["all"].count == 5
+
+
+class FakeBindings:
+    """Minimal stand-in for the ``notmuch2`` module."""
+
+    class Database:
+        class MODE:
+            READ_ONLY = 0
+
+        class SORT:
+            OLDEST_FIRST = "oldest"
+            NEWEST_FIRST = "newest"
+
+        dates = [300, 100, 200]
+        ids = {"a@x"}
+
+        def __init__(self, *, mode, config):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def count_messages(self, query):
+            return len(self.dates)
+
+        def messages(self, query, *, sort):
+            class Msg:
+                def __init__(self, date):
+                    self.date = date
+
+            ordered = sorted(self.dates, reverse=sort == "newest")
+            return iter(Msg(d) for d in ordered)
+
+        def find(self, mid):
+            if mid not in self.ids:
+                raise LookupError(mid)
+            return object()
+
+
+class TestBindingsBackend:
+    @pytest.fixture(autouse=True)
+    def bindings(self, monkeypatch: pytest.MonkeyPatch):
+        def no_subprocess(cmd, **kw):
+            raise AssertionError("CLI should not be used")
+
+        monkeypatch.setattr(notmuch_query, "_load_bindings", lambda: FakeBindings)
+        monkeypatch.setattr(notmuch_query, "run_command", no_subprocess)
+
+    def test_query_facts_in_process(self):
+        facts = query_facts(CFG, {"all": "*"})
+        assert facts.backend == "bindings"
+        assert facts.scopes["all"].count == 3
+        assert facts.scopes["all"].oldest == "1970-01-01T00:01:40+00:00"
+        assert facts.scopes["all"].newest == "1970-01-01T00:05:00+00:00"
+
+    def test_present_message_ids(self):
+        assert present_message_ids(CFG, ["a@x", "b@x"]) == {"a@x"}
+
+
+class TestPresentMessageIds:
+    def test_batch_lookup(self, fake: FakeNotmuch):
+        fake.counts['id:"a@x"'] = 1
+        assert present_message_ids(CFG, ["a@x", "b@x"]) == {"a@x"}
+        assert len(fake.calls) == 1
+
+    def test_empty(self, fake: FakeNotmuch):
+        assert present_message_ids(CFG, []) == set()
+        assert fake.calls == []
@@ -0,0 +1,95 @@
+"""Tests for email_archiver.packstore."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+
+import pytest
+
+from email_archiver import packstore
+from email_archiver.packstore import PackStore, StoreError, new_snapshot
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def put(store: PackStore, data: bytes) -> str:
+    digest = sha(data)
+    store.add(digest, store.compress(data), len(data))
+    return digest
+
+
+class TestPackStore:
+    def test_round_trip_and_dedup(self, tmp_path: Path):
+        with PackStore(tmp_path / "repo") as store:
+            a = put(store, b"Subject: a\n\nhello\n" * 100)
+            assert store.has(a)
+            assert not store.has(sha(b"other"))
+        with PackStore(tmp_path / "repo") as store:
+            assert store.has(a)
+            assert store.read(a) == b"Subject: a\n\nhello\n" * 100
+            packs = list((tmp_path / "repo" / "packs").glob("*/*.pack"))
+            assert len(packs) == 1
+
+    def test_packs_roll_over_at_pack_size(self, tmp_path: Path):
+        with PackStore(tmp_path / "repo", pack_size=64) as store:
+            messages = [os.urandom(100) for _ in range(5)]
+            digests = [put(store, data) for data in messages]
+        with PackStore(tmp_path / "repo") as store:
+            assert [store.read(d) for d in digests] == messages
+        assert len(list((tmp_path / "repo" / "packs").glob("*/*.pack"))) == 5
+
+    def test_damaged_pack_is_detected(self, tmp_path: Path):
+        with PackStore(tmp_path / "repo") as store:
+            digest = put(store, b"x" * 1000)
+        (pack,) = (tmp_path / "repo" / "packs").glob("*/*.pack")
+        raw = bytearray(pack.read_bytes())
+        raw[-3] ^= 0xFF
+        pack.write_bytes(bytes(raw))
+        with PackStore(tmp_path / "repo") as store, pytest.raises(StoreError, match="damaged"):
+            store.read(digest)
+
+    def test_failed_backup_leaves_no_pack(self, tmp_path: Path):
+        with pytest.raises(RuntimeError), PackStore(tmp_path / "repo") as store:
+            digest = put(store, b"lost")
+            raise RuntimeError
+        with PackStore(tmp_path / "repo") as store:
+            assert not store.has(digest)
+        assert not list((tmp_path / "repo" / "packs").rglob("*.pack*"))
+
+    def test_snapshots(self, tmp_path: Path):
+        with PackStore(tmp_path / "repo") as store:
+            digest = put(store, b"body")
+            snapshot = new_snapshot("all")
+            snapshot.files = 2
+            store.write_snapshot(snapshot, [("a/INBOX/cur/1:2,S", 4, digest), ("b/x", 4, digest)])
+            assert [s.id for s in store.snapshots()] == [snapshot.id]
+            assert list(store.snapshot_entries(snapshot.id)) == [
+                ("a/INBOX/cur/1:2,S", 4, digest),
+                ("b/x", 4, digest),
+            ]
+
+    def test_single_writer(self, tmp_path: Path):
+        with PackStore(tmp_path / "repo"):
+            with pytest.raises(StoreError, match="in use"):
+                PackStore(tmp_path / "repo")
+
+    def test_read_only_open_during_a_backup(self, tmp_path: Path):
+        with PackStore(tmp_path / "repo") as store:
+            digest = put(store, b"body")
+        with PackStore(tmp_path / "repo") as writer:
+            put(writer, b"unsealed")
+            with PackStore(tmp_path / "repo", read_only=True) as reader:
+                assert reader.read(digest) == b"body"
+                assert not reader.has(sha(b"unsealed"))
+                with pytest.raises(StoreError, match="read-only"):
+                    put(reader, b"more")
+
+    def test_zstd_repository_needs_zstandard(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(packstore, "_load_zstd", lambda: None)
+        assert packstore.default_codec() == "zlib"
+        with pytest.raises(StoreError, match="zstandard"):
+            PackStore(tmp_path / "repo", codec="zstd")
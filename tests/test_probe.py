@@ -0,0 +1,138 @@
+"""Tests for email_archiver.probe."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from email_archiver import imap
+from email_archiver.commands import sync
+from email_archiver.commands.sync import run_sync
+from email_archiver.config import (
+    AccountConfig,
+    BackupConfig,
+    Config,
+    OrchestrationConfig,
+    PathsConfig,
+    SyncConfig,
+)
+from email_archiver.imap import FolderStatus
+from email_archiver.probe import StatusCache, probe_changes
+from email_archiver.runner import RunResult
+from tests.fake_imap import FakeImapServer
+
+FOLDERS = ["INBOX", "Archive", "Sent"]
+
+
+@pytest.fixture()
+def server():
+    with FakeImapServer(FOLDERS) as srv:
+        yield srv
+
+
+@pytest.fixture()
+def config(tmp_path: Path, server: FakeImapServer) -> Config:
+    return Config(
+        accounts={
+            "acct": AccountConfig(
+                name="acct",
+                email="u@example.com",
+                imap_host="127.0.0.1",
+                imap_user="u",
+                tls_type="None",
+                imap_port=server.port,
+                folders=list(FOLDERS),
+            )
+        },
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=tmp_path / "state",
+            logs_dir=tmp_path / "state" / "logs",
+            verification_dir=tmp_path / "state" / "verification",
+        ),
+        sync=SyncConfig(probe=True),
+        backup=BackupConfig(),
+        orchestration=OrchestrationConfig(),
+    )
+
+
+def remember_all(cache: StatusCache, probe, synced_at: float) -> None:
+    for (account, folder), status in probe.statuses.items():
+        cache.record(account, folder, status, synced_at)
+
+
+class TestProbeChanges:
+    def test_everything_changed_on_first_run(self, config: Config, server: FakeImapServer):
+        cache = StatusCache.load(config.paths.state_dir)
+        probe = probe_changes(config, cache, password="secret")
+        assert probe.changed == {"acct": FOLDERS}
+        assert probe.statuses[("acct", "INBOX")] == FolderStatus(0, 1, 1)
+
+    def test_only_changed_folders(self, config: Config, server: FakeImapServer):
+        cache = StatusCache.load(config.paths.state_dir)
+        remember_all(cache, probe_changes(config, cache, password="secret"), 1e12)
+        assert probe_changes(config, cache, password="secret").changed == {"acct": []}
+
+        server.deliver("Archive")
+        probe = probe_changes(config, cache, password="secret")
+        assert probe.changed == {"acct": ["Archive"]}
+        assert probe.unchanged == 2
+
+    def test_stale_folders_resynced(self, config: Config, server: FakeImapServer):
+        cache = StatusCache.load(config.paths.state_dir)
+        remember_all(cache, probe_changes(config, cache, password="secret"), 0)
+        assert probe_changes(config, cache, password="secret").changed == {"acct": FOLDERS}
+
+    def test_fails_open(self, config: Config, server: FakeImapServer):
+        cache = StatusCache.load(config.paths.state_dir)
+        probe = probe_changes(config, cache, password="wrong")
+        assert probe.changed == {"acct": FOLDERS}
+        assert "acct" in probe.errors
+
+    def test_cache_round_trip(self, tmp_path: Path):
+        cache = StatusCache.load(tmp_path)
+        cache.record("a", "INBOX", FolderStatus(1, 2, 3), 42.0)
+        cache.save()
+        assert StatusCache.load(tmp_path).get("a", "INBOX") == (FolderStatus(1, 2, 3), 42.0)
+        assert StatusCache.load(tmp_path).get("a", "Other") == (None, 0.0)
+
+
+class TestRunSyncWithProbe:
+    def test_skips_unchanged_folders(
+        self, config: Config, server: FakeImapServer, monkeypatch: pytest.MonkeyPatch
+    ):
+        monkeypatch.setattr(imap, "read_password", lambda: "secret")
+        seen: list[str] = []
+
+        def fake_run(cmd, **kwargs):
+            seen.append(cmd[-1])
+            return RunResult(cmd, 0, "", "", 0.01)
+
+        monkeypatch.setattr(sync, "run_command", fake_run)
+        assert run_sync(config).ok
+        assert seen == ["acct"]  # first run: the whole Group
+
+        seen.clear()
+        assert run_sync(config).ok
+        assert seen == []
+
+        server.deliver("Sent")
+        run_sync(config)
+        assert seen == ["acct-Sent"]
+
+    def test_failed_sync_is_retried(
+        self, config: Config, server: FakeImapServer, monkeypatch: pytest.MonkeyPatch
+    ):
+        monkeypatch.setattr(imap, "read_password", lambda: "secret")
+        monkeypatch.setattr(sync, "run_command", lambda cmd, **kw: RunResult(cmd, 1, "", "", 0.0))
+        run_sync(config)
+        seen: list[str] = []
+
+        def fake_run(cmd, **kwargs):
+            seen.append(cmd[-1])
+            return RunResult(cmd, 0, "", "", 0.01)
+
+        monkeypatch.setattr(sync, "run_command", fake_run)
+        run_sync(config)
+        assert seen == ["acct"]
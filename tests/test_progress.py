@@ -0,0 +1,102 @@
+"""Tests for email_archiver.progress."""
+
+from __future__ import annotations
+
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from email_archiver import progress
+from email_archiver.progress import ProgressBoard, ProgressSink, TransferStats
+from email_archiver.sinks import STDERR, STDOUT, CallbackSink
+
+COUNTERS_14 = "C: 1/2  B: 3/10  F: +1/1 *2/2 #0/0 -0/0  N: +120/500 *4/4 #1/1 -2/2"
+COUNTERS_13 = "C: 0/1  B: 1/4  M: +0/0 *0/0 #0/0  S: +7/9 *1/1 #0/0"
+
+
+class TestTransferStats:
+    def test_far_near_counters(self):
+        stats = TransferStats("work", "work")
+        assert stats.update(COUNTERS_14)
+        assert (stats.channels_done, stats.channels_total) == (1, 2)
+        assert (stats.boxes_done, stats.boxes_total) == (3, 10)
+        assert (stats.pulled, stats.pulled_total) == (120, 500)
+        assert (stats.pushed, stats.pushed_total) == (1, 1)
+        assert stats.flags == 6
+        assert stats.expunged == 3
+
+    def test_master_slave_counters(self):
+        stats = TransferStats("work", "work")
+        assert stats.update(COUNTERS_13)
+        assert (stats.pulled, stats.pulled_total) == (7, 9)
+        assert stats.pushed == 0
+
+    def test_summary_lines(self):
+        stats = TransferStats("work", "work")
+        assert not stats.update("Processed 4 box(es) in 1 channel(s),")
+        assert not stats.update("pulled 12 new message(s) and 3 flag update(s),")
+        assert not stats.update("pushed 1 new message(s) and 0 flag update(s).")
+        assert (stats.pulled, stats.pushed) == (12, 1)
+
+    def test_rate_and_summary(self):
+        stats = TransferStats("work", "work", started=100.0, finished=110.0)
+        stats.update(COUNTERS_14)
+        stats.delivered, stats.bytes = 120, 3 * 1024 * 1024
+        assert stats.messages_per_second == 12.0
+        assert stats.summary() == (
+            "pulled 120/500, 12.0 msg/s, pushed 1, 6 flag update(s), 120 file(s), 3.0 MiB delivered"
+        )
+
+
+class TestProgressSink:
+    def test_consumes_counter_lines(self):
+        board = ProgressBoard()
+        stats = board.start("work", "work")
+        seen: list[tuple[str, str]] = []
+        sink = ProgressSink(stats, board, [CallbackSink(lambda s, line: seen.append((s, line)))])
+        sink.write(STDOUT, "Channel work")
+        sink.write(STDOUT, COUNTERS_14)
+        sink.write(STDERR, COUNTERS_14)
+        assert seen == [(STDOUT, "Channel work"), (STDERR, COUNTERS_14)]
+        assert stats.pulled == 120
+
+
+class TestProgressBoard:
+    def test_status_line(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(progress, "TTY_INTERVAL", 0.0)
+        tty = io.StringIO()
+        board = ProgressBoard(tty=tty)
+        work = board.start("work", "work")
+        board.start("home", "home")
+        work.update(COUNTERS_14)
+        board.update()
+        assert tty.getvalue().startswith("\r\x1b[Ksync 0/2 done | work: 120/500 msgs ")
+        assert tty.getvalue().endswith("box 3/10 | home: 0 msgs 0.0/s")
+
+        board.finish(work)
+        assert tty.getvalue().endswith("\r\x1b[K")
+        assert board.render().startswith("sync 1/2 done | home:")
+        assert len(board.render(width=20)) == 20
+
+    def test_progress_file(self, tmp_path: Path):
+        path = tmp_path / progress.PROGRESS_FILENAME
+        board = ProgressBoard(path)
+        stats = board.start("work", "work")
+        assert json.loads(path.read_text())["targets"]["work"]["running"] is True
+
+        stats.update(COUNTERS_14)
+        board.update()  # throttled: not rewritten yet
+        assert json.loads(path.read_text())["targets"]["work"]["messages_pulled"] == 0
+
+        board.finish(stats)
+        target = json.loads(path.read_text())["targets"]["work"]
+        assert target["running"] is False
+        assert target["messages_pulled"] == 120
+
+    def test_board_for(self, tmp_path: Path):
+        assert progress.board_for(tmp_path, enabled=False, verbose=False).path is None
+        board = progress.board_for(tmp_path, enabled=True, verbose=True)
+        assert board.path == tmp_path / progress.PROGRESS_FILENAME
+        assert board.tty is None
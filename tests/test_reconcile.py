@@ -0,0 +1,152 @@
+"""Tests for email_archiver.reconcile."""
+
+from __future__ import annotations
+
+from array import array
+from pathlib import Path
+
+import pytest
+
+from email_archiver.config import AccountConfig, Config, PathsConfig
+from email_archiver.manifest import Manifest
+from email_archiver.reconcile import (
+    MbsyncState,
+    read_mbsync_state,
+    reconcile_account,
+    reconcile_folder,
+)
+from tests.fake_imap import FakeImapServer
+
+FOLDERS = ["INBOX", "Archive"]
+
+
+def uids(*values: int) -> array:
+    return array("I", values)
+
+
+def write_state(folder: Path, pairs: list[tuple[int, int]], uidvalidity: int = 1) -> None:
+    lines = [f"FarUidValidity {uidvalidity}", "NearUidValidity 7", "MaxPulledUid 10", ""]
+    lines += [f"{far} {near} S" for far, near in pairs]
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / ".mbsyncstate").write_text("\n".join(lines) + "\n")
+
+
+def deliver(folder: Path, near: int) -> None:
+    for sub in ("cur", "new", "tmp"):
+        (folder / sub).mkdir(parents=True, exist_ok=True)
+    (folder / "cur" / f"1700000000.{near}_1.host,U={near}:2,S").write_text(
+        f"Message-ID: <{near}@x>\n\nbody\n"
+    )
+
+
+class TestReadMbsyncState:
+    def test_parses_header_and_pairs(self, tmp_path: Path):
+        (tmp_path / ".mbsyncstate").write_text(
+            "MasterUidValidity 42\nSlaveUidValidity 7\nMaxPulledUid 9\nMaxPushedUid 3\n\n"
+            "5 3 S\n2 1 \n8 0 \n9 -4 \n"
+        )
+        state = read_mbsync_state(tmp_path)
+        assert state is not None
+        assert state.far_uidvalidity == 42
+        assert state.max_pulled == 9
+        assert state.far.tolist() == [2, 5]
+        assert state.near.tolist() == [1, 3]
+        assert not state.journal
+
+    def test_missing_and_journal(self, tmp_path: Path):
+        assert read_mbsync_state(tmp_path) is None
+        write_state(tmp_path, [])
+        (tmp_path / ".mbsyncstate.journal").write_text("3\n")
+        assert read_mbsync_state(tmp_path).journal
+
+
+class TestReconcileFolder:
+    def state(self, pairs: list[tuple[int, int]], max_pulled: int = 10) -> MbsyncState:
+        return MbsyncState(
+            far_uidvalidity=1,
+            max_pulled=max_pulled,
+            far=array("I", (f for f, _ in pairs)),
+            near=array("I", (n for _, n in pairs)),
+        )
+
+    def test_everything_archived(self):
+        state = self.state([(1, 1), (2, 2), (4, 3)])
+        report = reconcile_folder(uids(1, 2, 4), 1, state, uids(1, 2, 3))
+        assert report["archived"] == 3
+        assert report["problems"] == []
+
+    def test_missing_and_unsynced(self):
+        # 3 was never pulled, 5's local file is gone, 11 and 12 arrived after the sync.
+        state = self.state([(1, 1), (2, 2), (4, 3), (5, 4)])
+        report = reconcile_folder(uids(1, 2, 3, 4, 5, 11, 12), 1, state, uids(1, 2, 3))
+        assert report["missing"] == 2
+        assert report["missing_uids"] == "3,5"
+        assert report["unsynced_uids"] == "11:12"
+        assert report["problems"] == ["2 server message(s) missing locally"]
+
+    def test_uidvalidity_change(self):
+        report = reconcile_folder(uids(1), 2, self.state([(1, 1)]), uids(1))
+        assert report["problems"] == ["UIDVALIDITY changed on the server (1 → 2)"]
+
+    def test_never_synced(self):
+        assert reconcile_folder(uids(), 1, None, uids())["problems"] == []
+        report = reconcile_folder(uids(1, 2), 1, None, uids())
+        assert report["problems"] == ["never synced (no .mbsyncstate)"]
+        assert report["unsynced_uids"] == "1:2"
+
+    def test_large_folder(self):
+        n = 500_000
+        pairs = [(far, far) for far in range(1, n + 1)]
+        local = array("I", range(1, n + 1))
+        local.remove(250_000)
+        report = reconcile_folder(array("I", range(1, n + 1)), 1, self.state(pairs, n), local)
+        assert report["missing_uids"] == "250000"
+        assert report["archived"] == n - 1
+
+
+@pytest.fixture()
+def server():
+    with FakeImapServer(FOLDERS) as srv:
+        yield srv
+
+
+@pytest.fixture()
+def config(tmp_path: Path, server: FakeImapServer) -> Config:
+    account = AccountConfig(
+        name="acct",
+        email="u@example.com",
+        imap_host="127.0.0.1",
+        imap_user="u",
+        tls_type="None",
+        imap_port=server.port,
+        folders=list(FOLDERS),
+    )
+    return Config(
+        accounts={"acct": account},
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=tmp_path / "state",
+            logs_dir=tmp_path / "state" / "logs",
+            verification_dir=tmp_path / "state" / "verification",
+        ),
+    )
+
+
+class TestReconcileAccount:
+    def test_reports_missing_uids(self, config: Config, server: FakeImapServer):
+        server.deliver("INBOX", 3)
+        inbox = config.paths.maildir_root / "acct" / "INBOX"
+        write_state(inbox, [(1, 1), (2, 2), (3, 3)])
+        deliver(inbox, 1)
+        deliver(inbox, 3)
+        with Manifest.open(config.paths.state_dir, config.paths.maildir_root) as manifest:
+            manifest.update()
+
+        results = reconcile_account(config, "acct", password="secret")
+        assert results["INBOX"]["missing_uids"] == "2"
+        assert results["Archive"]["problems"] == []
+
+    def test_fails_closed_without_server(self, config: Config, server: FakeImapServer):
+        results = reconcile_account(config, "acct", password="wrong")
+        assert set(results) == set(FOLDERS)
+        assert all(r["problems"] for r in results.values())
@@ -0,0 +1,141 @@
+"""Tests for email_archiver.commands.run."""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from email_archiver.commands import run
+from email_archiver.commands.run import run_all
+from email_archiver.config import (
+    AccountConfig,
+    BackupConfig,
+    Config,
+    OrchestrationConfig,
+    PathsConfig,
+    SyncConfig,
+)
+from email_archiver.runner import AggregateResult, RunResult
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    accounts = {
+        name: AccountConfig(
+            name=name,
+            email=f"{name}@example.com",
+            imap_host="imap.example.com",
+            imap_user=f"{name}@example.com",
+        )
+        for name in ["big", "small"]
+    }
+    return Config(
+        accounts=accounts,
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=tmp_path / "state",
+            logs_dir=tmp_path / "state" / "logs",
+            verification_dir=tmp_path / "state" / "verification",
+        ),
+        sync=SyncConfig(),
+        backup=BackupConfig(command="backup-tool {account}"),
+        orchestration=OrchestrationConfig(),
+    )
+
+
+class FakePipeline:
+    """Stand-ins for the async stages that record the order of events."""
+
+    def __init__(self, sync_delays: dict[str, float], failing: set[str] | None = None) -> None:
+        self.sync_delays = sync_delays
+        self.failing = failing or set()
+        self.events: list[str] = []
+        self.index_runs = 0
+        self.indexed_accounts: list[list[str] | None] = []
+
+    async def sync(self, config, *, on_account_done, **kwargs) -> AggregateResult:
+        async def one(name: str) -> None:
+            await asyncio.sleep(self.sync_delays[name])
+            self.events.append(f"synced {name}")
+            code = 1 if name in self.failing else 0
+            on_account_done(name, AggregateResult({name: RunResult([name], code, "", "", 0.0)}))
+
+        await asyncio.gather(*(one(n) for n in self.sync_delays))
+        return AggregateResult()
+
+    async def index(self, config, *, accounts=None, **kwargs) -> RunResult:
+        self.index_runs += 1
+        self.indexed_accounts.append(accounts)
+        await asyncio.sleep(0.01)
+        return RunResult(["notmuch", "new"], 0, "", "", 0.01)
+
+    async def verify(self, config, *, account, **kwargs) -> dict:
+        self.events.append(f"verified {account}")
+        return {"status": "PASS", "accounts": {}}
+
+    async def backup(self, config, *, account=None, **kwargs) -> RunResult:
+        self.events.append(f"backed up {account}")
+        return RunResult(["backup-tool"], 0, "", "", 0.0)
+
+    def install(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(run, "async_run_sync", self.sync)
+        monkeypatch.setattr(run, "async_run_index", self.index)
+        monkeypatch.setattr(run, "async_run_verify", self.verify)
+        monkeypatch.setattr(run, "async_run_backup", self.backup)
+
+
+class TestRunAll:
+    def test_small_account_finishes_before_big_sync(
+        self, config: Config, monkeypatch: pytest.MonkeyPatch
+    ):
+        fake = FakePipeline({"big": 0.3, "small": 0.0})
+        fake.install(monkeypatch)
+        assert run_all(config) == 0
+        assert fake.events.index("backed up small") < fake.events.index("synced big")
+        assert fake.events[-1] == "backed up big"
+
+    def test_index_runs_are_coalesced(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        config.accounts["other"] = AccountConfig(
+            name="other", email="o@example.com", imap_host="h", imap_user="o"
+        )
+        fake = FakePipeline({"big": 0.0, "small": 0.0, "other": 0.0})
+        fake.install(monkeypatch)
+        assert run_all(config) == 0
+        # The first run covers the first account only; the rest share one.
+        assert fake.index_runs == 2
+        first, rest = fake.indexed_accounts
+        assert len(first) == 1
+        assert sorted(first + rest) == ["big", "other", "small"]
+
+    def test_failed_sync_skips_only_that_account(
+        self, config: Config, monkeypatch: pytest.MonkeyPatch
+    ):
+        fake = FakePipeline({"big": 0.0, "small": 0.0}, failing={"big"})
+        fake.install(monkeypatch)
+        assert run_all(config) == 1
+        assert "verified small" in fake.events
+        assert "verified big" not in fake.events
+
+    def test_whole_archive_backup_waits_for_every_account(
+        self, config: Config, monkeypatch: pytest.MonkeyPatch
+    ):
+        config.backup.command = "backup-tool"
+        fake = FakePipeline({"big": 0.1, "small": 0.0})
+        fake.install(monkeypatch)
+        assert run_all(config) == 0
+        assert fake.events[-1] == "backed up None"
+        assert fake.events.count("backed up None") == 1
+
+    def test_no_backup_after_failed_verify(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        fake = FakePipeline({"big": 0.0, "small": 0.0})
+
+        async def verify(config, *, account, **kwargs):
+            return {"status": "FAIL" if account == "big" else "PASS", "accounts": {}}
+
+        fake.install(monkeypatch)
+        monkeypatch.setattr(run, "async_run_verify", verify)
+        assert run_all(config) == 1
+        assert fake.events.count("backed up small") == 1
+        assert "backed up big" not in fake.events
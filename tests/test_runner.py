@@ -2,7 +2,22 @@
 
 from __future__ import annotations
 
-from email_archiver.runner import RunResult, run_command
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from email_archiver.runner import RunResult, async_run_command, run_command
+from email_archiver.sinks import STDERR, STDOUT, CallbackSink, RotatingFileSink
+
+# Prints whether stdout is a terminal, then progress-style \r updates.
+TTY_CHILD = (
+    "import sys; print(f'tty={sys.stdout.isatty()}'); "
+    "sys.stdout.write('1/2\\r2/2\\n'); sys.stdout.flush(); print('err', file=sys.stderr)"
+)
 
 
 class TestRunResult:
@@ -59,3 +74,192 @@ class TestRunCommand:
     def test_captures_duration(self):
         result = run_command(["sleep", "0.1"])
         assert result.duration_seconds >= 0.1
+
+
+class TestStreaming:
+    def test_sinks_receive_lines(self):
+        seen: list[tuple[str, str]] = []
+        result = run_command(
+            ["sh", "-c", "echo out; echo err >&2"],
+            sinks=[CallbackSink(lambda stream, line: seen.append((stream, line)))],
+        )
+        assert result.ok
+        assert (STDOUT, "out") in seen
+        assert (STDERR, "err") in seen
+        assert result.stdout == "out\n"
+
+    def test_stderr_flood_does_not_deadlock(self):
+        # Far more than a pipe buffer on stderr before anything on stdout.
+        script = (
+            "import sys\nfor _ in range(5000): sys.stderr.write('x' * 100 + '\\n')\nprint('done')"
+        )
+        result = run_command(
+            [sys.executable, "-c", script],
+            sinks=[CallbackSink(lambda stream, line: None)],
+            timeout=10,
+        )
+        assert result.ok
+        assert result.stdout == "done\n"
+
+    def test_keeps_bounded_tail(self):
+        result = run_command(
+            ["sh", "-c", "for i in $(seq 1 50); do echo $i; done"],
+            sinks=[CallbackSink(lambda stream, line: None)],
+            tail_lines=10,
+        )
+        assert result.stdout.splitlines() == [str(i) for i in range(41, 51)]
+        assert result.stdout_dropped == 40
+
+    def test_carriage_return_splits_progress(self):
+        seen: list[str] = []
+        run_command(
+            ["printf", "a\\rb\\r\\nc"], sinks=[CallbackSink(lambda stream, line: seen.append(line))]
+        )
+        assert seen == ["a", "b", "c"]
+
+    def test_timeout_while_streaming(self):
+        result = run_command(
+            ["sh", "-c", "echo started; sleep 10"],
+            sinks=[CallbackSink(lambda stream, line: None)],
+            timeout=0.3,
+        )
+        assert result.exit_code == -1
+        assert result.stdout == "started\n"
+        assert "timed out" in result.stderr.lower()
+        assert result.duration_seconds < 5
+
+    def test_failing_sink_stops_child(self, tmp_path: Path):
+        pid_file = tmp_path / "pid"
+
+        def broken(stream: str, line: str) -> None:
+            raise OSError("disk full")
+
+        start = time.monotonic()
+        with pytest.raises(OSError, match="disk full"):
+            run_command(
+                ["sh", "-c", f"echo $$ > {pid_file}; echo started; exec sleep 10"],
+                sinks=[CallbackSink(broken)],
+                pty=True,
+            )
+        assert time.monotonic() - start < 5
+        pid = int(pid_file.read_text())
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            pass
+        else:
+            raise AssertionError(f"child {pid} still running")
+
+    def test_pty_makes_stdout_a_terminal(self):
+        seen: list[tuple[str, str]] = []
+        result = run_command(
+            [sys.executable, "-c", TTY_CHILD],
+            sinks=[CallbackSink(lambda stream, line: seen.append((stream, line)))],
+            pty=True,
+        )
+        assert result.ok
+        assert [line for stream, line in seen if stream == STDOUT] == ["tty=True", "1/2", "2/2"]
+        assert [line for stream, line in seen if stream == STDERR] == ["err"]
+
+
+class TestRotatingFileSink:
+    def test_rotates_past_max_bytes(self, tmp_path: Path):
+        path = tmp_path / "log" / "sync.log"
+        sink = RotatingFileSink(path, max_bytes=100, backups=2)
+        for i in range(30):
+            sink.write(STDOUT, f"line {i:03d}")
+        sink.close()
+        assert path.exists()
+        assert (tmp_path / "log" / "sync.log.1").exists()
+        assert (tmp_path / "log" / "sync.log.2").exists()
+        assert not (tmp_path / "log" / "sync.log.3").exists()
+        assert path.read_text().splitlines()[-1] == "line 029"
+
+    def test_marks_stderr(self, tmp_path: Path):
+        sink = RotatingFileSink(tmp_path / "x.log")
+        sink.write(STDERR, "oops")
+        sink.close()
+        assert (tmp_path / "x.log").read_text() == "[stderr] oops\n"
+
+
+class TestAsyncRunCommand:
+    def test_successful_command(self):
+        result = asyncio.run(async_run_command(["sh", "-c", "echo out; echo err >&2"]))
+        assert result.ok
+        assert result.stdout == "out\n"
+        assert result.stderr == "err\n"
+
+    def test_command_not_found(self):
+        result = asyncio.run(async_run_command(["nonexistent_binary_xyz"]))
+        assert result.exit_code == -1
+        assert "not found" in result.stderr.lower()
+
+    @pytest.mark.parametrize("pty", [False, True])
+    def test_command_not_executable(self, tmp_path: Path, pty: bool):
+        script = tmp_path / "script"
+        script.write_text("#!/bin/sh\n")
+        fds = len(os.listdir("/proc/self/fd"))
+        result = asyncio.run(async_run_command([str(script)], pty=pty))
+        assert result.exit_code == -1
+        assert "Could not run" in result.stderr
+        # The pseudo-terminal is closed again.
+        assert len(os.listdir("/proc/self/fd")) == fds
+
+    def test_timeout(self):
+        result = asyncio.run(async_run_command(["sleep", "10"], timeout=0.2))
+        assert result.exit_code == -1
+        assert "timed out" in result.stderr.lower()
+        assert result.duration_seconds < 5
+
+    def test_pty(self):
+        result = asyncio.run(async_run_command([sys.executable, "-c", TTY_CHILD], pty=True))
+        assert result.ok
+        assert result.stdout == "tty=True\n1/2\n2/2\n"
+        assert result.stderr == "err\n"
+
+    def test_cancellation_terminates_child(self, tmp_path: Path):
+        pid_file = tmp_path / "pid"
+
+        async def main() -> None:
+            task = asyncio.ensure_future(
+                async_run_command(["sh", "-c", f"echo $$ > {pid_file}; exec sleep 10"])
+            )
+            while not pid_file.exists() or not pid_file.read_text().strip():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            assert task.cancelled()
+
+        start = time.monotonic()
+        asyncio.run(main())
+        assert time.monotonic() - start < 5
+        pid = int(pid_file.read_text())
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            pass
+        else:
+            raise AssertionError(f"child {pid} still running")
+
+    def test_failing_sink_stops_child(self, tmp_path: Path):
+        pid_file = tmp_path / "pid"
+
+        def broken(stream: str, line: str) -> None:
+            raise OSError("disk full")
+
+        start = time.monotonic()
+        with pytest.raises(OSError, match="disk full"):
+            asyncio.run(
+                async_run_command(
+                    ["sh", "-c", f"echo $$ > {pid_file}; echo started; exec sleep 10"],
+                    sinks=[CallbackSink(broken)],
+                )
+            )
+        assert time.monotonic() - start < 5
+        pid = int(pid_file.read_text())
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            pass
+        else:
+            raise AssertionError(f"child {pid} still running")
@@ -0,0 +1,64 @@
+"""Tests for email_archiver.snapshot."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from email_archiver.manifest import Manifest
+from email_archiver.snapshot import link_tree, remove_tree
+
+OLD = 1_600_000_000
+
+
+def maildir(root: Path) -> None:
+    for rel in ("acct/INBOX/cur/1.a:2,S", "acct/INBOX/new/2.b", "acct/Sent/cur/3.c:2,S"):
+        path = root / rel
+        for sub in ("cur", "new", "tmp"):
+            (path.parent.parent / sub).mkdir(parents=True, exist_ok=True)
+        path.write_text(f"Message-ID: <{rel}@x>\n\nbody\n")
+    (root / "acct" / "INBOX" / ".mbsyncstate").write_text("FarUidValidity 1\n\n")
+    (root / ".notmuch" / "xapian").mkdir(parents=True)
+    (root / ".notmuch" / "xapian" / "postlist.glass").write_text("db")
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (OLD, OLD))
+
+
+def test_links_every_file_and_keeps_directory_times(tmp_path: Path):
+    live, snap = tmp_path / "mail", tmp_path / "snap" / "all"
+    maildir(live)
+    assert link_tree(live, snap, workers=4) == 4
+
+    original = live / "acct" / "INBOX" / "cur" / "1.a:2,S"
+    linked = snap / "acct" / "INBOX" / "cur" / "1.a:2,S"
+    assert os.path.samefile(original, linked)
+    assert (snap / "acct" / "INBOX" / ".mbsyncstate").exists()
+    assert (snap / "acct" / "INBOX" / "tmp").is_dir()
+    assert not (snap / ".notmuch").exists()
+    assert (snap / "acct" / "INBOX" / "cur").stat().st_mtime == OLD
+
+    # The snapshot doesn't follow later renames in the live tree.
+    original.rename(original.with_name("1.a:2,RS"))
+    assert linked.exists()
+
+
+def test_manifest_sees_the_same_tree(tmp_path: Path):
+    live, snap, state = tmp_path / "mail", tmp_path / "snap", tmp_path / "state"
+    maildir(live)
+    with Manifest.open(state, live) as manifest:
+        manifest.update()
+    link_tree(live, snap)
+    with Manifest.open(state, snap) as manifest:
+        delta = manifest.update()
+    assert delta.dirs_scanned == 0 and not delta.added and not delta.removed
+
+
+def test_replaces_a_leftover_snapshot(tmp_path: Path):
+    live, snap = tmp_path / "mail", tmp_path / "snap"
+    maildir(live)
+    (snap / "stale").mkdir(parents=True)
+    link_tree(live, snap)
+    assert not (snap / "stale").exists()
+    remove_tree(snap)
+    assert not snap.exists()
+    assert (live / "acct" / "INBOX" / "cur" / "1.a:2,S").exists()
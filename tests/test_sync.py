@@ -0,0 +1,275 @@
+"""Tests for email_archiver.commands.sync."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from email_archiver.commands import sync
+from email_archiver.commands.sync import async_run_sync, build_targets, run_sync
+from email_archiver.config import (
+    AccountConfig,
+    BackupConfig,
+    Config,
+    OrchestrationConfig,
+    PathsConfig,
+    SyncConfig,
+)
+from email_archiver.history import SyncHistory
+from email_archiver.runner import RunResult
+
+
+@pytest.fixture()
+def config(tmp_path: Path) -> Config:
+    accounts = {
+        f"acct{i}": AccountConfig(
+            name=f"acct{i}",
+            email=f"a{i}@example.com",
+            imap_host="imap.example.com" if i < 3 else "imap.other.com",
+            imap_user=f"a{i}@example.com",
+            folders=["INBOX", "Archive"],
+        )
+        for i in range(5)
+    }
+    return Config(
+        accounts=accounts,
+        paths=PathsConfig(
+            maildir_root=tmp_path / "mail",
+            state_dir=tmp_path / "state",
+            logs_dir=tmp_path / "state" / "logs",
+            verification_dir=tmp_path / "state" / "verification",
+        ),
+        sync=SyncConfig(concurrency=4, max_connections_per_host=2),
+        backup=BackupConfig(),
+        orchestration=OrchestrationConfig(),
+    )
+
+
+class TestBuildTargets:
+    def test_one_target_per_account(self, config: Config):
+        targets = build_targets(config)
+        assert [t.name for t in targets] == ["acct0", "acct1", "acct2", "acct3", "acct4"]
+
+    def test_per_channel(self, config: Config):
+        config.sync.per_channel = True
+        targets = build_targets(config, "acct0")
+        assert [t.name for t in targets] == ["acct0-INBOX", "acct0-Archive"]
+        assert all(t.account == "acct0" for t in targets)
+
+    def test_selected_folders_become_channels(self, config: Config):
+        targets = build_targets(config, folders={"acct0": ["Archive"], "acct1": []})
+        assert [t.name for t in targets] == ["acct0-Archive"]
+
+    def test_all_folders_selected_use_group(self, config: Config):
+        targets = build_targets(config, folders={"acct2": ["INBOX", "Archive"]})
+        assert [t.name for t in targets] == ["acct2"]
+
+    def test_unknown_account(self, config: Config):
+        with pytest.raises(KeyError):
+            build_targets(config, "missing")
+
+
+class TestRunSync:
+    def test_syncs_every_account(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        seen: list[str] = []
+
+        def fake_run(cmd, **kwargs):
+            seen.append(cmd[-1])
+            return RunResult(cmd, 0, "", "", 0.01)
+
+        monkeypatch.setattr(sync, "run_command", fake_run)
+        result = run_sync(config)
+        assert result.ok
+        assert sorted(seen) == sorted(config.accounts)
+        assert set(result.results) == set(config.accounts)
+
+    def test_respects_per_host_cap(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        lock = threading.Lock()
+        active: dict[str, int] = {}
+        peak: dict[str, int] = {}
+
+        def fake_run(cmd, **kwargs):
+            host = config.accounts[cmd[-1]].imap_host
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.05)
+            with lock:
+                active[host] -= 1
+            return RunResult(cmd, 0, "", "", 0.05)
+
+        monkeypatch.setattr(sync, "run_command", fake_run)
+        run_sync(config)
+        assert peak["imap.example.com"] <= 2
+        assert peak["imap.other.com"] <= 2
+
+    def test_aggregates_failures(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        def fake_run(cmd, **kwargs):
+            code = 1 if cmd[-1] == "acct2" else 0
+            return RunResult(cmd, code, "", "boom" if code else "", 0.01)
+
+        monkeypatch.setattr(sync, "run_command", fake_run)
+        result = run_sync(config)
+        assert not result.ok
+        assert result.failed == ["acct2"]
+        assert result.exit_code == 1
+
+    def test_crashed_target_fails_alone(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        def fake_run(cmd, **kwargs):
+            if cmd[-1] == "acct2":
+                raise OSError("out of pty devices")
+            return RunResult(cmd, 0, "", "", 0.01)
+
+        monkeypatch.setattr(sync, "run_command", fake_run)
+        result = run_sync(config)
+        assert result.failed == ["acct2"]
+        assert "out of pty devices" in result.results["acct2"].stderr
+        history = SyncHistory.load(config.paths.state_dir)
+        assert history.expected_duration("acct0") is not None
+
+    def test_writes_log_per_account(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(sync, "run_command", lambda cmd, **kw: RunResult(cmd, 0, "", "", 0.0))
+        run_sync(config, account="acct1")
+        assert list((config.paths.logs_dir / "acct1").glob("sync-*.log"))
+
+    def test_unknown_account_fails(self, config: Config):
+        result = run_sync(config, account="missing", dry_run=True)
+        assert not result.ok
+
+    def test_starts_longest_first_from_history(
+        self, config: Config, monkeypatch: pytest.MonkeyPatch
+    ):
+        config.sync.concurrency = 1
+        history = SyncHistory.load(config.paths.state_dir)
+        for i, name in enumerate(config.accounts):
+            history.record(name, float(i), 0)
+        history.save()
+
+        seen: list[str] = []
+
+        def fake_run(cmd, **kwargs):
+            seen.append(cmd[-1])
+            return RunResult(cmd, 0, "", "", 0.01)
+
+        monkeypatch.setattr(sync, "run_command", fake_run)
+        run_sync(config)
+        assert seen == ["acct4", "acct3", "acct2", "acct1", "acct0"]
+
+    def test_records_history(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(sync, "run_command", lambda cmd, **kw: RunResult(cmd, 0, "", "", 2.0))
+        run_sync(config, account="acct0")
+        history = SyncHistory.load(config.paths.state_dir)
+        assert history.expected_duration("acct0") == 2.0
+
+    def test_dry_run(self, config: Config, capsys: pytest.CaptureFixture[str]):
+        result = run_sync(config, dry_run=True)
+        assert result.ok
+        assert capsys.readouterr().out.count("[dry-run]") == len(config.accounts)
+
+
+class TestAsyncRunSync:
+    def test_syncs_every_account(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        seen: list[str] = []
+
+        async def fake_run(cmd, **kwargs):
+            seen.append(cmd[-1])
+            await asyncio.sleep(0.01)
+            return RunResult(cmd, 1 if cmd[-1] == "acct3" else 0, "", "", 0.01)
+
+        monkeypatch.setattr(sync, "async_run_command", fake_run)
+        result = asyncio.run(async_run_sync(config))
+        assert sorted(seen) == sorted(config.accounts)
+        assert result.failed == ["acct3"]
+        assert SyncHistory.load(config.paths.state_dir).stats["acct3"].failures == 1
+
+    def test_crashed_target_still_finishes_its_account(
+        self, config: Config, monkeypatch: pytest.MonkeyPatch
+    ):
+        async def fake_run(cmd, **kwargs):
+            if cmd[-1] == "acct1":
+                raise OSError("out of pty devices")
+            return RunResult(cmd, 0, "", "", 0.01)
+
+        done: dict[str, bool] = {}
+        monkeypatch.setattr(sync, "async_run_command", fake_run)
+        result = asyncio.run(
+            async_run_sync(config, on_account_done=lambda name, r: done.update({name: r.ok}))
+        )
+        assert result.failed == ["acct1"]
+        assert done == {name: name != "acct1" for name in config.accounts}
+
+    def test_passes_timeout(self, config: Config, monkeypatch: pytest.MonkeyPatch):
+        timeouts: list[float | None] = []
+
+        async def fake_run(cmd, **kwargs):
+            timeouts.append(kwargs.get("timeout"))
+            return RunResult(cmd, 0, "", "", 0.0)
+
+        monkeypatch.setattr(sync, "async_run_command", fake_run)
+        asyncio.run(async_run_sync(config, account="acct0", timeout=30.0))
+        assert timeouts == [30.0]
+
+    def test_shared_host_slots_cap_concurrent_syncs(
+        self, config: Config, monkeypatch: pytest.MonkeyPatch
+    ):
+        config.sync.per_channel = True
+        config.sync.probe = False
+        running: dict[str, int] = {}
+        peak: dict[str, int] = {}
+
+        async def fake_run(cmd, **kwargs):
+            host = "other" if cmd[-1].startswith(("acct3", "acct4")) else "example"
+            running[host] = running.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), running[host])
+            await asyncio.sleep(0.05)
+            running[host] -= 1
+            return RunResult(cmd, 0, "", "", 0.01)
+
+        async def main() -> None:
+            slots: dict[str, asyncio.Semaphore] = {}
+            # One sync per account, as the daemon runs them.
+            await asyncio.gather(
+                *(
+                    async_run_sync(config, account=name, host_slots=slots)
+                    for name in config.accounts
+                )
+            )
+
+        monkeypatch.setattr(sync, "async_run_command", fake_run)
+        asyncio.run(main())
+        assert peak == {"example": 2, "other": 2}
+
+
+class TestSyncHistory:
+    def test_unknown_targets_first(self, tmp_path: Path):
+        history = SyncHistory.load(tmp_path)
+        history.record("small", 1.0, 0)
+        history.record("big", 100.0, 0)
+        assert history.order(["small", "new", "big"]) == ["new", "big", "small"]
+
+    def test_smooths_durations(self, tmp_path: Path):
+        history = SyncHistory.load(tmp_path)
+        history.record("x", 10.0, 0)
+        history.record("x", 20.0, 0)
+        assert history.expected_duration("x") == 15.0
+
+    def test_failures_do_not_change_duration(self, tmp_path: Path):
+        history = SyncHistory.load(tmp_path)
+        history.record("x", 10.0, 0)
+        history.record("x", 0.1, 1)
+        assert history.expected_duration("x") == 10.0
+        assert history.stats["x"].failures == 1
+
+    def test_round_trip(self, tmp_path: Path):
+        history = SyncHistory.load(tmp_path)
+        history.record("x", 3.0, 0)
+        history.save()
+        assert SyncHistory.load(tmp_path).expected_duration("x") == 3.0
+
+    def test_corrupt_file_ignored(self, tmp_path: Path):
+        (tmp_path / "sync-history.json").write_text("{not json")
+        assert SyncHistory.load(tmp_path).stats == {}
@@ -0,0 +1,39 @@
+"""Tests for email_archiver.synclock."""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from email_archiver import synclock
+
+
+def test_syncs_share_the_lock(tmp_path: Path):
+    with synclock.shared(tmp_path), synclock.shared(tmp_path):
+        with pytest.raises(synclock.SyncRunning):
+            with synclock.exclusive(tmp_path):
+                pass
+    with synclock.exclusive(tmp_path):
+        pass
+
+
+def test_async_sync_waits_for_exclusive_holder(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(synclock, "_POLL_SECONDS", 0.01)
+
+    async def main() -> list[str]:
+        events: list[str] = []
+
+        async def sync() -> None:
+            async with synclock.async_shared(tmp_path):
+                events.append("sync")
+
+        with synclock.exclusive(tmp_path):
+            task = asyncio.ensure_future(sync())
+            await asyncio.sleep(0.05)
+            events.append("released")
+        await task
+        return events
+
+    assert asyncio.run(main()) == ["released", "sync"]
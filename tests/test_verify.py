@@ -3,15 +3,20 @@
 from __future__ import annotations
 
 import json
+import sqlite3
 from pathlib import Path
 
 import pytest
 
+from email_archiver import notmuch_query
+from email_archiver.commands import verify
 from email_archiver.commands.verify import (
     STATUS_FAIL,
     STATUS_PASS,
     _build_report,
+    _check_manifest,
     _write_report,
+    run_verify,
 )
 from email_archiver.config import (
     AccountConfig,
@@ -19,6 +24,7 @@ from email_archiver.config import (
     Config,
     OrchestrationConfig,
     PathsConfig,
+    VerifyConfig,
 )
 from email_archiver.runner import RunResult
 
@@ -81,6 +87,68 @@ class TestBuildReport:
         report = _build_report(mock_config, "test", count_result, None, None, None)
         assert report["status"] == STATUS_FAIL
 
+    def test_fail_when_files_unindexed(self, mock_config: Config):
+        count_result = RunResult(["notmuch", "count"], 0, "10\n", "", 0.1)
+        manifest = {"unindexed": 2, "error": None}
+        report = _build_report(
+            mock_config, "test", count_result, 10, "2020-01-01", "2024-01-01", manifest
+        )
+        assert report["status"] == STATUS_FAIL
+        assert report["manifest"]["unindexed"] == 2
+
+    def test_fail_when_manifest_check_errored(self, mock_config: Config):
+        count_result = RunResult(["notmuch", "count"], 0, "10\n", "", 0.1)
+        manifest = {"unindexed": 0, "error": "could not query notmuch"}
+        report = _build_report(
+            mock_config, "test", count_result, 10, "2020-01-01", "2024-01-01", manifest
+        )
+        assert report["status"] == STATUS_FAIL
+
+
+def _deliver(mock_config: Config, name: str, message_id: str) -> None:
+    folder = mock_config.paths.maildir_root / "test" / "INBOX"
+    for sub in ("cur", "new", "tmp"):
+        (folder / sub).mkdir(parents=True, exist_ok=True)
+    (folder / "cur" / name).write_text(f"Message-ID: <{message_id}>\n\nbody\n")
+
+
+class TestCheckManifest:
+    def test_confirms_indexed_files(self, mock_config: Config, monkeypatch: pytest.MonkeyPatch):
+        _deliver(mock_config, "1.a:2,", "one@x")
+        _deliver(mock_config, "2.b:2,", "two@x")
+        queries: list[str] = []
+
+        def fake_run(cmd, **kwargs):
+            text = Path(cmd[-1].split("=", 1)[1]).read_text()
+            queries.extend(text.splitlines())
+            counts = ["1" if "one@x" in q else "0" for q in text.splitlines()]
+            return RunResult(cmd, 0, "\n".join(counts) + "\n", "", 0.0)
+
+        monkeypatch.setattr(notmuch_query, "_load_bindings", lambda: None)
+        monkeypatch.setattr(notmuch_query, "run_command", fake_run)
+        result = _check_manifest(mock_config, Path("/dev/null"))
+        assert result["files"] == 2
+        assert result["unindexed"] == 1
+        assert result["unindexed_sample"] == ["test/INBOX/cur/2.b:2,"]
+        assert sorted(queries) == ['id:"one@x"', 'id:"two@x"']
+
+        # Second run only re-checks the file that was missing.
+        queries.clear()
+        _check_manifest(mock_config, Path("/dev/null"))
+        assert queries == ['id:"two@x"']
+
+    def test_notmuch_failure_fails_closed(
+        self, mock_config: Config, monkeypatch: pytest.MonkeyPatch
+    ):
+        _deliver(mock_config, "1.a:2,", "one@x")
+        monkeypatch.setattr(notmuch_query, "_load_bindings", lambda: None)
+        monkeypatch.setattr(
+            notmuch_query, "run_command", lambda cmd, **kw: RunResult(cmd, 1, "", "db error", 0.0)
+        )
+        result = _check_manifest(mock_config, Path("/dev/null"))
+        assert result["error"] is not None
+        assert result["unindexed"] == 1
+
 
 class TestWriteReport:
     def test_writes_json_and_text(self, mock_config: Config):
@@ -105,3 +173,123 @@ class TestWriteReport:
         text = text_path.read_text()
         assert "PASS" in text
         assert "100" in text
+
+
+class TestRunVerify:
+    @pytest.fixture()
+    def two_accounts(self, mock_config: Config) -> Config:
+        mock_config.accounts = {
+            "good": AccountConfig("good", "g@b.com", "imap.b.com", "g@b.com", folders=["INBOX"]),
+            "bad": AccountConfig("bad", "b@b.com", "imap.b.com", "b@b.com", folders=["INBOX"]),
+        }
+        (mock_config.paths.maildir_root / ".notmuch").mkdir(parents=True)
+        for name in ("good", "bad"):
+            folder = mock_config.paths.maildir_root / name / "INBOX"
+            for sub in ("cur", "new", "tmp"):
+                (folder / sub).mkdir(parents=True)
+        (mock_config.paths.maildir_root / "good" / "INBOX" / "cur" / "1.a:2,").write_text(
+            "Message-ID: <one@x>\n\nbody\n"
+        )
+        return mock_config
+
+    @pytest.fixture()
+    def fake_notmuch(self, monkeypatch: pytest.MonkeyPatch) -> list[list[str]]:
+        counts = {'path:"good/**"': 1, 'folder:"good/INBOX"': 1, 'id:"one@x"': 1}
+        calls: list[list[str]] = []
+
+        def fake_run(cmd, **kwargs):
+            calls.append(cmd)
+            if cmd[1] == "count":
+                queries = Path(cmd[-1].split("=", 1)[1]).read_text().splitlines()
+                out = "".join(f"{counts.get(q, 0)}\n" for q in queries)
+                return RunResult(cmd, 0, out, "", 0.0)
+            return RunResult(cmd, 0, '[{"timestamp": 1700000000}]', "", 0.0)
+
+        monkeypatch.setattr(notmuch_query, "_load_bindings", lambda: None)
+        monkeypatch.setattr(notmuch_query, "run_command", fake_run)
+        return calls
+
+    def test_failure_in_one_account_is_visible(self, two_accounts: Config, fake_notmuch):
+        summary = run_verify(two_accounts, notmuch_config_path=Path("/dev/null"))
+        assert summary["status"] == STATUS_FAIL
+        assert summary["accounts"]["good"]["status"] == STATUS_PASS
+        assert summary["accounts"]["bad"]["status"] == STATUS_FAIL
+        assert summary["accounts"]["good"]["folders"]["INBOX"]["message_count"] == 1
+
+    def test_writes_per_account_and_consolidated(self, two_accounts: Config, fake_notmuch):
+        run_verify(two_accounts, notmuch_config_path=Path("/dev/null"))
+        vdir = two_accounts.paths.verification_dir
+        assert list(vdir.glob("verify-*.json"))
+        assert list((vdir / "good").glob("verify-*.json"))
+        assert list((vdir / "bad").glob("verify-*.json"))
+
+    def test_single_account(self, two_accounts: Config, fake_notmuch):
+        summary = run_verify(two_accounts, account="good", notmuch_config_path=Path("/dev/null"))
+        assert summary["status"] == STATUS_PASS
+        assert list(summary["accounts"]) == ["good"]
+        run_verify(two_accounts, account="bad", notmuch_config_path=Path("/dev/null"))
+        # Per-account runs in the same second keep separate summaries.
+        vdir = two_accounts.paths.verification_dir
+        assert len(list(vdir.glob("verify-good-*.json"))) == 1
+        assert len(list(vdir.glob("verify-bad-*.json"))) == 1
+        batch = next(c for c in fake_notmuch if c[1] == "count")
+        queries = Path(batch[-1].split("=", 1)[1])
+        assert not queries.exists()  # temp file cleaned up
+
+    def test_deep_check_finds_corruption(self, two_accounts: Config, fake_notmuch):
+        summary = run_verify(
+            two_accounts, account="good", deep=True, notmuch_config_path=Path("/dev/null")
+        )
+        assert summary["status"] == STATUS_PASS
+        assert summary["deep"]["files_checked"] == 1
+
+        msg = two_accounts.paths.maildir_root / "good" / "INBOX" / "cur" / "1.a:2,"
+        msg.write_text("Message-ID: <one@x>\n\nbodY\n")
+        summary = run_verify(
+            two_accounts, account="good", deep=True, notmuch_config_path=Path("/dev/null")
+        )
+        assert summary["status"] == STATUS_FAIL
+        assert summary["deep"]["problems"] == {
+            "good/INBOX/cur/1.a:2,": ["content differs from the recorded SHA-256"]
+        }
+        text = sorted(two_accounts.paths.verification_dir.glob("verify-*.txt"))[-1]
+        assert "content differs" in text.read_text()
+
+    def test_remote_problems_fail_the_folder(
+        self, two_accounts: Config, fake_notmuch, monkeypatch: pytest.MonkeyPatch
+    ):
+        missing = {"problems": ["2 server message(s) missing locally"], "missing_uids": "4:5"}
+        monkeypatch.setattr(verify, "reconcile_account", lambda config, account: {"INBOX": missing})
+        summary = run_verify(
+            two_accounts, account="good", remote=True, notmuch_config_path=Path("/dev/null")
+        )
+        assert summary["status"] == STATUS_FAIL
+        inbox = summary["accounts"]["good"]["folders"]["INBOX"]
+        assert inbox["status"] == STATUS_FAIL
+        assert inbox["remote"]["missing_uids"] == "4:5"
+
+        two_accounts.verify = VerifyConfig(remote=False)
+        summary = run_verify(two_accounts, account="good", notmuch_config_path=Path("/dev/null"))
+        assert summary["status"] == STATUS_PASS
+
+    def test_crashed_account_fails_without_losing_the_summary(
+        self, two_accounts: Config, fake_notmuch, monkeypatch: pytest.MonkeyPatch
+    ):
+        def reconcile(config: Config, account: str) -> dict:
+            if account == "bad":
+                raise sqlite3.OperationalError("database is locked")
+            return {"INBOX": {"problems": []}}
+
+        monkeypatch.setattr(verify, "reconcile_account", reconcile)
+        summary = run_verify(two_accounts, remote=True, notmuch_config_path=Path("/dev/null"))
+        assert summary["status"] == STATUS_FAIL
+        assert summary["accounts"]["good"]["status"] == STATUS_PASS
+        bad = summary["accounts"]["bad"]
+        assert bad["status"] == STATUS_FAIL
+        assert bad["error"] == "OperationalError: database is locked"
+        (text,) = two_accounts.paths.verification_dir.glob("verify-*.txt")
+        assert "database is locked" in text.read_text()
+
+    def test_unknown_account(self, two_accounts: Config, fake_notmuch):
+        summary = run_verify(two_accounts, account="nope", notmuch_config_path=Path("/dev/null"))
+        assert summary["status"] == STATUS_FAIL